@@ -37,9 +37,8 @@ and 2.5 | 2.5 | 2.5 | 2.5 for 1 | 2 | 3 | 4 mers respectively if you use an over
 import os
 import sys
 import argparse
-from roblib import read_fasta
 
-import substitution_rules
+from window_scores import WindowScores
 
 __author__ = 'Rob Edwards'
 
@@ -48,32 +47,13 @@ if __name__ == "__main__":
     parser.add_argument('-f', help='fasta file of sequence alignments', required=True)
     parser.add_argument('-m', help='minimum size of kmers to count (default=1)', default=1, type=int)
     parser.add_argument('-s', help='maximum size of kmers to count (default=3)', default=3, type=int)
+    parser.add_argument('-o', help='write the scores to this .npy file instead of printing them')
+    parser.add_argument('-p', help='number of processes (default=1)', default=1, type=int)
     args = parser.parse_args()
 
-    fa = read_fasta(args.f)
-    for sid in fa:
-        fa[sid] = fa[sid].upper()
-
-    sm = [""] # there is no point counting for size = 0, but it makes it easier if we are 0 indexed :)
-    for i in range(args.m, args.s+1):
-        sm.append(substitution_rules.score(i))
-
     # score all pairwise comparisons
-    seqs = list(fa.keys())
-    for i, seqid1 in enumerate(seqs):
-        for j in range(i+1, len(seqs)):
-            seqid2 = seqs[j]
-            s1 = fa[seqid1]
-            s2 = fa[seqid2]
-            scores = []
-            for sublen in range(args.m, args.s+1):
-                score = 0
-                posn = 0
-                while posn + sublen < len(s1):
-                    score += sm[sublen][s1[posn:posn+sublen]][s2[posn:posn+sublen]]
-                    posn += sublen
-                scores.append(score)
-            sys.stdout.write("{}\t{}\t".format(seqid1, seqid2))
-            sys.stdout.write("\t".join(map(str, scores)))
-            sys.stdout.write("\n")
-            #print("{}\t{}\t{}\t{}\t{}".format(seqid1, seqid2, *scores))
\ No newline at end of file
+    ws = WindowScores.from_fasta(args.f, args.m, args.s)
+    if args.o:
+        ws.condensed('score', args.o, args.p)
+    else:
+        ws.write(sys.stdout, 'score', args.p)
@@ -12,6 +12,7 @@ import matplotlib.colors
 import matplotlib.pyplot as plt
 from mpl_toolkits.mplot3d import Axes3D
 import pickle
+import numpy as np
 
 import tkinter as tk
 from tkinter import filedialog
@@ -29,16 +30,15 @@ if __name__ == '__main__':
     root.withdraw()
     filename = filedialog.askopenfilename()
 
-    x = []
-    y = []
-    z = []
     legends = ['seq1', 'seq2', '1-mer', '2-mer', '3-mer']
-    with open(filename, 'r') as fin:
-        for l in fin:
-            p = l.strip().split("\t")
-            x.append(float(p[2]))
-            y.append(float(p[3]))
-            z.append(float(p[4]))
+    # a .npy file from window_scores.py has one row per pair, otherwise this is the tsv from alignment_score.py
+    if filename.endswith('.npy'):
+        data = np.load(filename, mmap_mode='r')
+    else:
+        data = np.loadtxt(filename, delimiter="\t", usecols=(2, 3, 4), ndmin=2)
+    x = data[:, 0]
+    y = data[:, 1]
+    z = data[:, 2]
 
     fig = plt.figure()
     ax = fig.add_subplot(111, projection='3d')
@@ -20,6 +20,23 @@ from itertools import product
 __author__ = 'Rob Edwards'
 
 
+def substitution(base1, base2):
+    """
+    Score one pair of bases
+    :param base1: the first base
+    :param base2: the second base
+    :return: 0 if they are the same, 0.5 for A <-> T or G <-> C, and 1 for anything else
+    """
+
+    if base1 == base2:
+        return 0
+    if (base1 == 'A' and base2 == 'T') or (base1 == 'T' and base2 == 'A'):
+        return 0.5
+    if (base1 == 'G' and base2 == 'C') or (base1 == 'C' and base2 == 'G'):
+        return 0.5
+    return 1
+
+
 def score(length, alphabet={'A', 'T', 'G', 'C', '-'}):
     """
     Calculate the scoring matrix
@@ -40,22 +57,7 @@ def score(length, alphabet={'A', 'T', 'G', 'C', '-'}):
             seq2 = "".join(poss[j])
             scores[seq1][seq2] = 0
             for position in range(length):
-                base1 = tple[position]
-                base2 = poss[j][position]
-
-                if base1 == base2:
-                    # increment by 0
-                    continue
-
-                if (base1 == 'A' and base2 == 'T') or (base1 == 'T' and base2 == 'A'):
-                    scores[seq1][seq2]+=0.5
-                    continue
-
-                if (base1 == 'G' and base2 == 'C') or (base1 == 'C' and base2 == 'G'):
-                    scores[seq1][seq2] += 0.5
-                    continue
-
-                scores[seq1][seq2] += 1
+                scores[seq1][seq2] += substitution(tple[position], poss[j][position])
 
     # now we just need to create the other half of the matrix
     for s in scores:
@@ -0,0 +1,276 @@
+"""
+Score every pair of sequences in an alignment, a window of k bases at a time, for all the window sizes at once.
+
+The alignment is encoded once as a matrix, and for each block of pairs we compare the sequences once with
+numpy: which positions differ, and the substitution score of each position (using the rules in
+substitution_rules.py). For each window size k, the alignment is cut into windows of k bases
+(starting at the first base, and stopping before the window that would reach the last base, as the original
+scripts do), and we add up the positions in each window.
+
+There are three measures, one for each of the original scripts:
+
+    score:          the sum of the substitution scores in the windows (alignment_score.py)
+    kmer:           the fraction of windows that are not identical (kmer_sim.py)
+    independent:    the number of windows where every position differs (score_independently.py)
+
+    ws = WindowScores.from_fasta('alignment.fasta', 1, 3)
+    ws.write(sys.stdout, 'score')
+    cloud = ws.condensed('score')
+"""
+
+import os
+import sys
+import argparse
+import multiprocessing
+import numpy as np
+from roblib import read_fasta, encode_alignment
+
+import substitution_rules
+
+__author__ = 'Rob Edwards'
+
+MEASURES = ['score', 'kmer', 'independent']
+
+# the approximate number of pairs in each block of work
+BLOCKSIZE = 2 ** 16
+
+# the alignment in each worker process
+_WORKER = {}
+
+
+def substitution_table(matrix):
+    """
+    The substitution score for every pair of characters in the alignment, in half points so they are integers
+    :param matrix: the encoded alignment
+    :return: a 256 x 256 int8 numpy array
+    """
+
+    table = np.full((256, 256), 2, dtype=np.int8)
+    chars = [chr(c) for c in np.unique(matrix).tolist()]
+    for a in chars:
+        for b in chars:
+            table[ord(a), ord(b)] = int(2 * substitution_rules.substitution(a, b))
+    return table
+
+
+def _pair_blocks(n, blocksize=BLOCKSIZE):
+    """
+    Split the rows into blocks with about the same number of pairs (each row and the rows after it) in each block
+    :param n: the number of sequences
+    :param blocksize: the approximate number of pairs in each block
+    :return: a list of (start, end) of the rows in each block
+    """
+
+    blocks = []
+    start = 0
+    pairs = 0
+    for i in range(n):
+        pairs += n - i - 1
+        if pairs >= blocksize:
+            blocks.append((start, i + 1))
+            start = i + 1
+            pairs = 0
+    if start < n:
+        blocks.append((start, n))
+    return blocks
+
+
+def _score_rows(matrix, table, sizes, start, end):
+    """
+    Score the rows from start to end against all the rows after them
+    :param matrix: the encoded alignment
+    :param table: the substitution table from substitution_table()
+    :param sizes: the window sizes
+    :param start: the first row
+    :param end: the row after the last row
+    :return: a dict of numpy arrays with one row per pair and one column per window size:
+        halves: the substitution score in half points
+        half_subs: the number of half point substitutions
+        differ: the number of windows that are not identical
+        all_differ: the number of windows where every position differs
+    """
+
+    n, length = matrix.shape
+    results = {m: [] for m in ['halves', 'half_subs', 'differ', 'all_differ']}
+    for i in range(start, end):
+        others = matrix[i + 1:]
+        pairs = len(others)
+        different = np.zeros((pairs, length + 1), dtype=np.int32)
+        np.cumsum(others != matrix[i], axis=1, out=different[:, 1:])
+        subs = table[matrix[i], others]
+        halves = np.zeros((pairs, length + 1), dtype=np.int32)
+        np.cumsum(subs, axis=1, out=halves[:, 1:])
+        half_subs = np.zeros((pairs, length + 1), dtype=np.int32)
+        np.cumsum(subs == 1, axis=1, out=half_subs[:, 1:])
+        row = {m: np.zeros((pairs, len(sizes)), dtype=np.int64) for m in results}
+        for s, k in enumerate(sizes):
+            windows = max(0, (length - 1) // k)
+            covered = windows * k
+            row['halves'][:, s] = halves[:, covered]
+            row['half_subs'][:, s] = half_subs[:, covered]
+            # the number of differences in each window
+            w = np.diff(different[:, 0:covered + 1:k], axis=1)
+            row['differ'][:, s] = np.count_nonzero(w, axis=1)
+            row['all_differ'][:, s] = np.count_nonzero(w == k, axis=1)
+        for m in results:
+            results[m].append(row[m])
+    return {m: np.concatenate(v) if v else np.zeros((0, len(sizes)), dtype=np.int64) for m, v in results.items()}
+
+
+def _init_worker(matrix, table, sizes):
+    _WORKER['matrix'] = matrix
+    _WORKER['table'] = table
+    _WORKER['sizes'] = sizes
+
+
+def _worker(block):
+    start, end = block
+    return start, end, _score_rows(_WORKER['matrix'], _WORKER['table'], _WORKER['sizes'], start, end)
+
+
+class WindowScores(object):
+    """
+    Window scores for all the pairs of sequences in an alignment
+
+    :param ids: the sequence ids
+    :param sequences: the aligned sequences, in the same order
+    :param minsize: the smallest window size
+    :param maxsize: the largest window size
+    """
+
+    def __init__(self, ids, sequences, minsize=1, maxsize=3):
+        if len(ids) != len(sequences):
+            raise ValueError(f"We have {len(ids)} ids but {len(sequences)} sequences")
+        if minsize < 1 or maxsize < minsize:
+            raise ValueError(f"The window sizes must be 1 <= minsize <= maxsize, not {minsize} and {maxsize}")
+        self.ids = list(ids)
+        self.sizes = list(range(minsize, maxsize + 1))
+        self.matrix = encode_alignment([s.upper() for s in sequences])
+        self.table = substitution_table(self.matrix)
+        length = self.matrix.shape[1]
+        self.windows = np.array([max(0, (length - 1) // k) for k in self.sizes], dtype=np.int64)
+
+    @classmethod
+    def from_fasta(cls, fastafile, minsize=1, maxsize=3):
+        """
+        Read an alignment from a fasta file, keeping the sequences in the order of the file
+        :param fastafile: the fasta alignment file
+        :param minsize: the smallest window size
+        :param maxsize: the largest window size
+        :return: the WindowScores
+        """
+
+        fa = read_fasta(fastafile)
+        return cls(list(fa.keys()), list(fa.values()), minsize, maxsize)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def blocks(self, processes=1, blocksize=BLOCKSIZE):
+        """
+        Score the pairs a block of rows at a time
+        :param processes: the number of processes to use
+        :param blocksize: the approximate number of pairs in each block
+        :return: a generator of the first row, the row after the last row, and the dict of scores from
+        _score_rows for each row against all the rows after it
+        """
+
+        blocks = _pair_blocks(len(self), blocksize)
+        if processes < 2 or len(blocks) < 2:
+            for start, end in blocks:
+                yield start, end, _score_rows(self.matrix, self.table, self.sizes, start, end)
+            return
+        ctx = multiprocessing.get_context('spawn')
+        with ctx.Pool(processes, initializer=_init_worker, initargs=(self.matrix, self.table, self.sizes)) as pool:
+            for result in pool.imap(_worker, blocks):
+                yield result
+
+    def measure(self, scores, measure):
+        """
+        Convert a block of scores to one of the measures
+        :param scores: the dict of scores from blocks()
+        :param measure: one of MEASURES
+        :return: a float64 numpy array with one row per pair and one column per window size
+        """
+
+        if measure == 'score':
+            return scores['halves'] / 2
+        if measure == 'kmer':
+            with np.errstate(divide='ignore', invalid='ignore'):
+                return scores['differ'] / self.windows
+        if measure == 'independent':
+            return scores['all_differ'].astype(np.float64)
+        raise ValueError(f"The measure must be one of {MEASURES}, not {measure}")
+
+    def condensed(self, measure='score', outfile=None, processes=1, blocksize=BLOCKSIZE):
+        """
+        The scores for every pair, in the same order as scipy's pdist
+        :param measure: one of MEASURES
+        :param outfile: write the scores to this .npy file and memory map it, rather than keeping them in memory
+        :param processes: the number of processes to use
+        :param blocksize: the approximate number of pairs in each block
+        :return: a numpy array with one row per pair and one column per window size
+        """
+
+        n = len(self)
+        shape = (n * (n - 1) // 2, len(self.sizes))
+        if outfile:
+            out = np.lib.format.open_memmap(outfile, mode='w+', dtype=np.float64, shape=shape)
+        else:
+            out = np.empty(shape, dtype=np.float64)
+        for start, end, scores in self.blocks(processes, blocksize):
+            offset = start * (2 * n - start - 1) // 2
+            values = self.measure(scores, measure)
+            out[offset:offset + len(values)] = values
+        if outfile:
+            out.flush()
+        return out
+
+    def write(self, outfile, measure='score', processes=1, blocksize=BLOCKSIZE):
+        """
+        Write the scores as id1, id2, and a column for each window size
+        :param outfile: the file name, or an open file handle
+        :param measure: one of MEASURES
+        :param processes: the number of processes to use
+        :param blocksize: the approximate number of pairs in each block
+        :return: nothing
+        """
+
+        fh = open(outfile, 'w') if isinstance(outfile, str) else outfile
+        ids = self.ids
+        for start, end, scores in self.blocks(processes, blocksize):
+            if measure == 'score':
+                # the original scripts added ints and floats, so the score is only a float if it had a half point
+                values = [[str(h // 2) if not s else str(h / 2) for h, s in zip(hr, sr)]
+                          for hr, sr in zip(scores['halves'].tolist(), scores['half_subs'].tolist())]
+            elif measure == 'independent':
+                values = [list(map(str, r)) for r in scores['all_differ'].tolist()]
+            else:
+                values = [list(map(str, r)) for r in self.measure(scores, measure).tolist()]
+            out = []
+            p = 0
+            for i in range(start, end):
+                for j in range(i + 1, len(ids)):
+                    out.append(f"{ids[i]}\t{ids[j]}\t" + "\t".join(values[p]) + "\n")
+                    p += 1
+            fh.write("".join(out))
+        if isinstance(outfile, str):
+            fh.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Score all pairs of sequences in an alignment in windows')
+    parser.add_argument('-f', help='fasta alignment file', required=True)
+    parser.add_argument('-m', help='minimum size of windows (default=1)', default=1, type=int)
+    parser.add_argument('-s', help='maximum size of windows (default=3)', default=3, type=int)
+    parser.add_argument('-t', help=f'the measure: one of {MEASURES} (default=score)', default='score',
+                        choices=MEASURES)
+    parser.add_argument('-o', help='output file. A .npy file has one row per pair. Default: tsv to stdout')
+    parser.add_argument('-p', help='number of processes (default=1)', default=1, type=int)
+    args = parser.parse_args()
+
+    ws = WindowScores.from_fasta(args.f, args.m, args.s)
+    if args.o and args.o.endswith('.npy'):
+        ws.condensed(args.t, args.o, args.p)
+    else:
+        ws.write(args.o if args.o else sys.stdout, args.t, args.p)
@@ -6,40 +6,28 @@ import os
 import sys
 
 import argparse
-import pysam
+
+from roblib.coverage import reference_depths, pooled_depth
+from roblib.compression import THREADS
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description="Read a bamfile and create coverage depth (# reads that map)")
     parser.add_argument('-f', help='bamfile', required=True)
-    parser.add_argument('-l', help='genome length', required=True, type=int)
-    parser.add_argument('-s', help='start position (default = 0)', default=0, type=int)
-    parser.add_argument('-e', help='end position (default = all)', type=int)
+    parser.add_argument('-l', help='genome length (default = the reference length)', type=int)
+    parser.add_argument('-s', help='start position (default = 1)', default=1, type=int)
+    parser.add_argument('-e', help='end position, included (default = all)', type=int)
     parser.add_argument('-r', help="refefence name for the pileup (optional)", default=None)
+    parser.add_argument('-a', help='report each reference separately', action='store_true')
+    parser.add_argument('-p', help=f'number of processes for -a (default = {THREADS})', type=int, default=THREADS)
     parser.add_argument('-t', help='print a title that includes the name of the file (e.g. if you want to merge multiple outputs)', action='store_true')
     args = parser.parse_args()
 
-    coverage = []
-    for i in range(args.l+1):
-        coverage.append(0)
-
-    bam = pysam.AlignmentFile(args.f, 'rb')
-    for pu in bam.pileup(reference=args.r):
-        if pu.reference_pos > args.l:
-            sys.stderr.write("Warning {} is larger than you genome size of {}\n".format(pu.reference_pos, args.l))
-            continue
-        try:
-            coverage[pu.reference_pos] += pu.nsegments
-        except:
-            sys.stderr.write("Can't add to position {}\n".format(pu.reference_pos))
-
-    start = 1
-    end = args.l+1
-    if args.s:
-        start = args.s
-    if args.e:
-        end = args.e+1
-
-    if args.r:
-        print("{}\t{}\t{}".format(args.f, args.r, (1.0 * sum(coverage[start:end]) / (end - start))))
+    depths = reference_depths(args.f, [args.r] if args.r else None, args.p)
+    if args.a or args.r:
+        for ref, depth in depths.items():
+            end = args.e if args.e else len(depth)
+            print("{}\t{}\t{}".format(args.f, ref, depth[max(1, args.s)-1:end].mean()))
     else:
-        print("{}\t{}".format(args.f, (1.0*sum(coverage[start:end])/(end-start))))
+        coverage = pooled_depth(depths, args.l)
+        end = args.e if args.e else len(coverage)
+        print("{}\t{}".format(args.f, coverage[max(1, args.s)-1:end].mean()))
@@ -6,14 +6,15 @@ import os
 import sys
 
 import argparse
-import pysam
+
+from roblib.coverage import reference_depths, pooled_depth
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description="Read a bamfile and create coverage depth (# reads that map)")
     parser.add_argument('-f', help='bamfile', required=True)
-    parser.add_argument('-l', help='genome length', required=True, type=int)
-    parser.add_argument('-s', help='start position (default = 0)', default=0, type=int)
-    parser.add_argument('-e', help='end position (default = all)', type=int)
+    parser.add_argument('-l', help='genome length (default = the reference length)', type=int)
+    parser.add_argument('-s', help='start position (default = 1)', default=1, type=int)
+    parser.add_argument('-e', help='end position, included (default = all)', type=int)
     parser.add_argument('-r', help="refefence name for the pileup (optional)", default=None)
     parser.add_argument('-m', help='include a column with the sum of hits after the name', action='store_true')
     parser.add_argument('-x', help='transpose the output and ommit position information. Use this if you want to combine multiple outputs', action='store_true')
@@ -21,30 +22,13 @@ if __name__ == '__main__':
     parser.add_argument('-z', help='print entries with no hits. Default is to skip those', action='store_true')
     args = parser.parse_args()
 
-    coverage = []
-    for i in range(args.l+1):
-        coverage.append(0)
-
-    bam = pysam.AlignmentFile(args.f, 'rb')
-    for pu in bam.pileup(reference=args.r):
-        if pu.reference_pos > args.l:
-            sys.stderr.write("Warning {} is larger than you genome size of {}\n".format(pu.reference_pos, args.l))
-            continue
-        try:
-            coverage[pu.reference_pos] += pu.nsegments
-        except:
-            sys.stderr.write("Can't add to position {}\n".format(pu.reference_pos))
+    # the depth at each position. Position i (1-based) is coverage[i-1]
+    coverage = pooled_depth(reference_depths(args.f, [args.r] if args.r else None), args.l)
 
-    start = 1
-    end = args.l+1
-    if args.s:
-        start = args.s
-    if args.e:
-        end = args.e
-
-    sum = 0
-    for i in range(start, end):
-        sum += coverage[i]
+    start = max(1, args.s)
+    end = args.e if args.e else len(coverage)
+    region = coverage[start-1:end]
+    sum = int(region.sum())
 
     if not args.z and 0 == sum:
         sys.exit(0)
@@ -59,14 +43,11 @@ if __name__ == '__main__':
             if args.m:
                 sys.stdout.write("{}".format(sum))
 
-        for i in range(start, end):
-            sys.stdout.write("\t{}".format(coverage[i]))
+        sys.stdout.write("".join("\t{}".format(c) for c in region.tolist()))
         sys.stdout.write("\n")
     else:
         if args.t:
             print("Position\t{}".format(args.f))
         if args.m:
             print("Sum\t{}".format(sum))
-        for i in range(start, end):
-            print("{}\t{}".format(i, coverage[i]))
-
+        sys.stdout.write("".join("{}\t{}\n".format(i, c) for i, c in enumerate(region.tolist(), start)))
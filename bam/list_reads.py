@@ -6,12 +6,17 @@ import os
 import sys
 import argparse
 import pysam
+from roblib import ReadIdSet
 
 parser = argparse.ArgumentParser(description="List all the reads in a bam file")
 parser.add_argument('-b', help='bam file', required=True)
+parser.add_argument('-o', help='save the read names as a read id set (for fastq_not_in_bam.py -i) instead of printing them')
 parser.add_argument('-v', help='verbose output', action="store_true")
 args = parser.parse_args()
 
-bamfile = pysam.AlignmentFile(args.b, "rb")
-for read in bamfile.fetch(until_eof=True):
-    print(read.query_name)
+if args.o:
+    ReadIdSet.from_bam(args.b, verbose=args.v).save(args.o)
+else:
+    bamfile = pysam.AlignmentFile(args.b, "rb")
+    for read in bamfile.fetch(until_eof=True):
+        print(read.query_name)
@@ -5,7 +5,7 @@ Count features in a genbank file or directory of files
 import os
 import sys
 import argparse
-from roblib import message, genbank_seqio
+from roblib import message, scan_genbank
 
 __author__ = 'Rob Edwards'
 __copyright__ = 'Copyright 2020, Rob Edwards'
@@ -20,7 +20,7 @@ def count_feats(gbkf, verbose=False):
         message(f"Reading {gbkf}", "BLUE")
 
     count = {}
-    for seq in genbank_seqio(gbkf):
+    for seq in scan_genbank(gbkf, sequence=False):
         for feat in seq.features:
             count[feat.type] = count.get(feat.type, 0) + 1
     return count
@@ -5,8 +5,8 @@ Convert a genbank file to sequences
 import os
 import sys
 import argparse
-from roblib import genbank_to_faa, genbank_to_fna, genbank_to_orfs, genbank_to_ptt, genbank_to_functions
-from roblib import genbank
+from roblib import convert_genbank, make_writers
+from roblib.genbank import BACKENDS
 
 __author__ = 'Rob Edwards'
 __copyright__ = 'Copyright 2020, Rob Edwards'
@@ -27,89 +27,28 @@ if __name__ == '__main__':
     parser.add_argument('-f', '--functions', help='output file for two column table of [protein id, function]')
     parser.add_argument('--phage_finder', help='make a phage finder file')
     parser.add_argument('--separate', help='separate genbank entries into different files. In this case the ID is prepended to whatever you provide', action='store_true')
+    parser.add_argument('-b', '--backend', help='how to read the genbank file: biopython, or the faster scanner (default: biopython)',
+                        default='biopython', choices=BACKENDS)
     parser.add_argument('-v', help='verbose output', action='store_true')
     args = parser.parse_args()
 
-    did = False
+    outputs = {}
     if args.nucleotide:
-        if args.separate:
-            lastid = None
-            out = None
-            for sid, seq in genbank_to_fna(args.genbank):
-                if sid != lastid:
-                    if out:
-                        out.close()
-                    out = open(f"{args.nucleotide}.{sid}.fna", 'w')
-                    lastid = sid
-                out.write(f">{sid}\n{seq}\n")
-            if out:
-                out.close()
-        else:
-            with open(f"{args.nucleotide}.fna", 'w') as out:
-                for sid, seq in genbank_to_fna(args.genbank):
-                    out.write(f">{sid}\n{seq}\n")
-        did = True
-
+        outputs['fna'] = f"{args.nucleotide}.{{}}.fna" if args.separate else f"{args.nucleotide}.fna"
     if args.aminoacids:
-        if args.separate:
-            lastid = None
-            out = None
-            for seqid, sid, seq in genbank_to_faa(args.genbank, args.complex, args.v):
-                if seqid != lastid:
-                    if out:
-                        out.close()
-                    out = open(f"{args.aminoacids}.{seqid}.faa", 'w')
-                    lastid = seqid
-                out.write(f">{sid}\n{seq}\n")
-            if out:
-                out.close()
-        else:
-            with open(f"{args.aminoacids}.faa", 'w') as out:
-                for seqid, sid, seq in genbank_to_faa(args.genbank, args.complex, args.v):
-                    out.write(f">{sid}\n{seq}\n")
-        did = True
-
+        outputs['faa'] = f"{args.aminoacids}.{{}}.faa" if args.separate else f"{args.aminoacids}.faa"
     if args.orfs:
-        if args.separate:
-            lastid = None
-            out = None
-            for seqid, sid, seq in genbank_to_orfs(args.genbank, args.complex, args.v):
-                if seqid != lastid:
-                    if out:
-                        out.close()
-                    out = open(f"{args.orfs}.{seqid}.orfs", 'w')
-                    lastid = seqid
-                out.write(f">{sid}\n{seq}\n")
-            if out:
-                out.close()
-        else:
-            with open(f"{args.orfs}.orfs", 'w') as out:
-                for seqid, sid, seq in genbank_to_orfs(args.genbank, args.complex, args.v):
-                    out.write(f">{sid}\n{seq}\n")
-        did = True
-
-
+        outputs['orfs'] = f"{args.orfs}.{{}}.orfs" if args.separate else f"{args.orfs}.orfs"
     if args.ptt:
-        r = genbank_to_ptt(args.genbank, False, args.v)
-        with open(args.ptt, 'w') as out:
-            for l in r:
-                out.write("\t".join(map(str, l)))
-                out.write("\n")
-        did = True
-
+        outputs['ptt'] = args.ptt
     if args.functions:
-        with open(args.functions, 'w') as out:
-            for pid, prod in genbank_to_functions(args.genbank, args.v):
-                out.write(f"{pid}\t{prod}\n")
-        did = True
-
+        outputs['functions'] = args.functions
     if args.phage_finder:
-        with open(args.phage_finder, 'w') as out:
-            for tple in genbank.genbank_to_phage_finder(args.genbank, args.v):
-                out.write("\t".join(map(str, tple)) + "\n")
-        did = True
+        outputs['phage_finder'] = args.phage_finder
 
-    if not did:
+    if not outputs:
         sys.stderr.write("Please provide either a -n, -a, -o, -p, -f output file! (or all)\n")
+        sys.exit(1)
 
-
+    # read the genbank file once and write all the outputs
+    convert_genbank(args.genbank, make_writers(outputs, args.separate, args.complex), args.backend, args.v)
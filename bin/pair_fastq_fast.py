@@ -1,77 +1,39 @@
 """
 An alternate method to pair fastq files
+
+This used to read the whole left file into a dict. Now it uses roblib.pair_fastq, which streams through
+the files if they are in the same order, and otherwise partitions them on disk so that we never use more
+than -m GB of memory.
+
+pair_fastq_bloom.py and pair_fastq_lowmem.py are other names for this script.
 """
 
-import os
 import sys
 
 import argparse
-
-import gzip
-
-def stream_fastq(fqfile):
-    """Read a fastq file and provide an iterable of the sequence ID, the
-    full header, the sequence, and the quaity scores.
-
-    Note that the sequence ID is the header up until the first space,
-    while the header is the whole header.
-    """
-
-    if fqfile.endswith('.gz'):
-        qin = gzip.open(fqfile, 'rb')
-    else:
-        qin = open(fqfile, 'r')
-
-    while True:
-        header = qin.readline()
-        if not header:
-            break
-        header = header.strip()
-        seqidparts = header.split(' ')
-        seqid = seqidparts[0]
-        seq = qin.readline()
-        seq = seq.strip()
-        qualheader = qin.readline()
-        qualscores = qin.readline()
-        qualscores = qualscores.strip()
-        header = header.replace('@', '', 1)
-        yield seqid, header, seq, qualscores
+from roblib import pair_fastq
 
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description="Pair fastq files, writing all the pairs to separate files and the unmapped reads to separate files")
-    parser.add_argument('-l', help='Pair #1 reads file')
-    parser.add_argument('-r', help='Pair #2 reads file')
+    parser.add_argument('-l', help='Pair #1 reads file', required=True)
+    parser.add_argument('-r', help='Pair #2 reads file', required=True)
+    parser.add_argument('-m', help='maximum memory to use for reads waiting for their mate, in GB (default: 2)', type=float, default=2)
+    parser.add_argument('-t', help='directory for temporary files if the reads are not in the same order')
+    parser.add_argument('-z', help='compress the output files (the output is BGZF for gz)', choices=['gz', 'zst'])
+    parser.add_argument('-v', help='verbose output', action='store_true')
     args = parser.parse_args()
-
-
-    # read the first file into a data structure
-    seqs = {}
-    for (seqid, header, seq, qual) in stream_fastq(args.l):
-        seqid = seqid.replace('.1', '')
-        seqs[seqid] = [header, seq, qual]
-
-    lp = open("{}.paired.fastq".format(args.l.replace('.fastq', '').replace('.gz', '')), 'w')
-    lu = open("{}.singles.fastq".format(args.l.replace('.fastq', '').replace('.gz', '')), 'w')
-    rp = open("{}.paired.fastq".format(args.r.replace('.fastq', '').replace('.gz', '')), 'w')
-    ru = open("{}.singles.fastq".format(args.r.replace('.fastq', '').replace('.gz', '')), 'w')
-
-    # read the first file into a data structure
-    seen = set()
-    for (seqid, header, seq, qual) in stream_fastq(args.r):
-        seqid = seqid.replace('.2', '')
-        seen.add(seqid)
-        if seqid in seqs:
-            lp.write("@" + seqs[seqid][0] + "\n" + seqs[seqid][1] + "\n+\n" + seqs[seqid][2] + "\n")
-            rp.write("@" + header + "\n" + seq + "\n+\n" + qual + "\n")
-        else:
-            ru.write("@" + header + "\n" + seq + "\n+\n" + qual + "\n")
-
-    for seqid in seqs:
-        if seqid not in seen:
-            lu.write("@" + seqs[seqid][0] + "\n" + seqs[seqid][1] + "\n+\n" + seqs[seqid][2] + "\n")
-
-    lp.close()
-    lu.close()
-    rp.close()
-    ru.close()
\ No newline at end of file
+    if args.m <= 0:
+        parser.error(f"-m must be more than 0 GB, not {args.m}")
+
+    suffix = ".fastq"
+    if args.z:
+        suffix += "." + args.z
+
+    lbase = args.l.replace('.fastq', '').replace('.gz', '')
+    rbase = args.r.replace('.fastq', '').replace('.gz', '')
+    counts = pair_fastq(args.l, args.r, f"{lbase}.paired{suffix}", f"{rbase}.paired{suffix}",
+                        f"{lbase}.singles{suffix}", f"{rbase}.singles{suffix}",
+                        memory=int(args.m * 1024 ** 3), tmpdir=args.t, verbose=args.v)
+    sys.stderr.write(f"Paired: {counts['paired']}\tLeft singles: {counts['left_singles']}\t" +
+                     f"Right singles: {counts['right_singles']}\n")
@@ -10,15 +10,29 @@ import os
 import sys
 import argparse
 import re
-from taxon import get_taxonomy_db, get_taxonomy
+from taxon import get_taxonomy_db, get_taxonomy, TaxidMap
 
 
-def id_from_blastfile(blastfile, evalue, verbose=False):
+def subject_key(subject):
+    """
+    The GI or accession of a subject, e.g. from gi|15674171|ref|NP_268346.1| or ref|NP_268346.1|
+    :param subject: the subject id
+    :return: the GI or accession
+    """
+    m = re.search('gi\|(\d+)', subject)
+    if m:
+        return m.groups()[0]
+    parts = [x for x in subject.split('|') if x]
+    return parts[-1] if parts else subject
+
+
+def id_from_blastfile(blastfile, evalue, verbose=False, taxmap=None):
     """
     Read the blast file and yield a single sequence as a query and the match to its taxonomy id
     :param blastfile: the blast file to read
     :param evalue: the minimum evalue (col 10)
     :param verbose: more output
+    :param taxmap: a TaxidMap to get the taxonomy ID from the GI or accession of the subject, instead of the fig id
     :return: yields a query ID and a taxonomy ID
     """
 
@@ -31,6 +45,13 @@ def id_from_blastfile(blastfile, evalue, verbose=False):
         p = l.strip().split("\t")
         if float(p[10]) > evalue:
             continue
+        if taxmap:
+            tid = taxmap.get(subject_key(p[1]))
+            if not tid:
+                sys.stderr.write("Can't find a taxonomy for {}\n".format(p[1]))
+                continue
+            yield p[0], tid, float(p[10])
+            continue
         m = re.search('fig\|(\d+)\.\d+', p[1])
         if not m:
             sys.stderr.write("Can't parse a taxonomy from {}\n".format(p[1]))
@@ -71,12 +92,13 @@ def tid_to_tax_set(tid, verbose=False):
     return taxonomy
 
 
-def taxa_sets(blastf, eval, verbose):
+def taxa_sets(blastf, eval, verbose, taxmap=None):
     """
     Define the taxonomy sets for a blast file
     :param blastf: the blast file to parse
     :param eval: the maximum evalue
     :param verbose: print more stuff
+    :param taxmap: a TaxidMap to get the taxonomy IDs from the GIs or accessions
     :return: prints the id and set each time a new id is found
     """
 
@@ -84,7 +106,7 @@ def taxa_sets(blastf, eval, verbose):
     lastquery = None
     wanted_levels = ['superkingdom', 'phylum', 'class', 'order', 'family', 'genus', 'species', 'subspecies']
 
-    for query, tid, myeval in id_from_blastfile(blastfile=blastf, evalue=eval, verbose=verbose):
+    for query, tid, myeval in id_from_blastfile(blastfile=blastf, evalue=eval, verbose=verbose, taxmap=taxmap):
         if myeval > eval:
             sys.stderr.write("Yielded an eval of {}\n".format(myeval))
             continue
@@ -123,9 +145,12 @@ if __name__ == '__main__':
     parser = argparse.ArgumentParser(description="Do some taxonomy-fu on blast from patric")
     parser.add_argument('-b', help='blast output file', required=True)
     parser.add_argument('-e', help='E value threshold default 1e-5', type=float, default=1e-5)
+    parser.add_argument('-m', help='taxid map (from taxon/taxid_map.py) to use the GI or accession of the subject rather than the fig id')
     parser.add_argument('-v', help='verbose output', action="store_true")
     args = parser.parse_args()
 
+    taxmap = TaxidMap(args.m) if args.m else None
+
 
     print("\t".join(['sequence ID', 'superkingdom', 'phylum', 'class', 'order', 'family', 'genus', 'species', 'subspecies']))
-    taxa_sets(args.b, args.e, args.v)
\ No newline at end of file
+    taxa_sets(args.b, args.e, args.v, taxmap)
\ No newline at end of file
@@ -7,7 +7,7 @@ Filter a fastq file from a blast results file. The fastq file must be the query
 import os
 import sys
 import argparse
-from roblib import stream_blast_results, stream_fastq, bcolors
+from roblib import stream_blast_chunks, filter_blast, bcolors, ReadIdSet, filter_fastq_by_ids
 
 __author__ = 'Rob Edwards'
 
@@ -19,47 +19,27 @@ def read_blast(blastf, maxeval, minlen, minid, verbose=False):
     :param minlen: minimum length to keep
     :param minid: minimum % id to keep
     :param verbose: more output
-    :return: a set of matches
+    :return: a ReadIdSet of the queries that match
     """
 
-    results = set()
+    def queries():
+        for df in stream_blast_chunks(blastf, verbose=verbose):
+            yield from filter_blast(df, maxeval=maxeval, minid=minid, minlen=minlen)['query'].unique()
 
-    for b in stream_blast_results(blastf, verbose=verbose):
-        if b.alignment_length < minlen:
-            continue
-        if b.evalue > maxeval:
-            continue
-        if b.percent_id < minid:
-            continue
-
-        results.add(b.query)
-    return results
+    return ReadIdSet(queries(), verbose=verbose)
 
 def filter_fastq(fqf, br, matchout=None, nomatchout=None, verbose=False):
     """
     Filter the fastq file and print out matches or no matches
     :param fqf: The fastq file to filter
-    :param br: the set of query blast results
+    :param br: the ReadIdSet of query blast results
     :param matchout: The file to write matches to
     :param nomatchout: the file to write no matches to
     :param verbose: more output
     :return: nothing
     """
 
-    mo = open(matchout, 'w')
-    nmo = open(nomatchout, 'w')
-
-    matches = 0
-    nonmatches = 0
-    for sid, allid, seq, qual in stream_fastq(fqf):
-        if sid in br:
-            if matchout:
-                mo.write(f"@{allid}\n{seq}\n+\n{qual}\n")
-            matches += 1
-        else:
-            if nomatchout:
-                nmo.write(f"@{allid}\n{seq}\n+\n{qual}\n")
-                nonmatches += 1
+    matches, nonmatches = filter_fastq_by_ids(fqf, br, matchout, nomatchout, verbose)
     sys.stderr.write(f"{bcolors.GREEN}FINISHED:{bcolors.ENDC} Sequences Matched: {matches} Sequences without match {nonmatches}\n")
 
 
@@ -69,12 +49,12 @@ if __name__ == "__main__":
     minid   = 75
     parser = argparse.ArgumentParser(description='Filter fastq files based on blast results')
     parser.add_argument('-f', help='fastq file to filter', required=True)
-    parser.add_argument('-b', help='blast output file (using -outfmt 6 std)', required=True)
+    parser.add_argument('-b', help='blast output file (using -outfmt 6 std or 7, optionally with qlen slen)', required=True)
     parser.add_argument('-m', help='file to write the sequences that match the blast file to')
     parser.add_argument('-n', help='file to write the sequences that DO NOT match the blast file to')
-    parser.add_argument('-e', help='Maximum E value cut off (default={})'.format(maxeval), default=maxeval)
-    parser.add_argument('-l', help='Minimum alignment length cut off (default={})'.format(minlen), default=minlen)
-    parser.add_argument('-i', help='Minimum percent id cut off (default={})'.format(minid), default=minid)
+    parser.add_argument('-e', help='Maximum E value cut off (default={})'.format(maxeval), default=maxeval, type=float)
+    parser.add_argument('-l', help='Minimum alignment length cut off (default={})'.format(minlen), default=minlen, type=int)
+    parser.add_argument('-i', help='Minimum percent id cut off (default={})'.format(minid), default=minid, type=float)
     parser.add_argument('-v', help='verbose output', action='store_true')
     args = parser.parse_args()
 
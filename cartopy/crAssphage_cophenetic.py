@@ -1,5 +1,6 @@
 """
-Read a cophenetic matrix to plot the distances. You can make the matrix using ete3 and tree_to_cophenetic_matrix.py
+Read a cophenetic matrix to plot the distances. You can make the matrix using tree_to_cophenetic_matrix.py, or
+use -t to calculate the closest leaves straight from the tree.
 """
 
 import os
@@ -14,6 +15,7 @@ import math
 
 import cartopy.crs as ccrs
 import re
+from roblib import read_newick, CopheneticDistances
 
 def get_lon_lat(idf, maxtoget=50000):
     """
@@ -144,6 +146,28 @@ def closest_dna_dist(matrixfile):
         sys.stderr.write("Done\n")
     return closest
 
+def closest_tree_dist(treefile):
+    """
+    Read the tree and get the id of the leaf with the closest distance that is not ourself
+    :param treefile: The tree file to read
+    :return: a dict of a node and its closest leaf
+    """
+
+    global verbose
+    if verbose:
+        sys.stderr.write("Getting closest distances\n")
+    cd = CopheneticDistances(read_newick(treefile))
+    closest, distance = cd.closest()
+    closest_leaves = {}
+    for i, name in enumerate(cd.names):
+        closest_leaves[name] = {}
+        if closest[i] >= 0:
+            closest_leaves[name][cd.names[closest[i]]] = float(distance[i])
+
+    if verbose:
+        sys.stderr.write("Done\n")
+    return closest_leaves
+
 def plotmap(ll, dd, outputfile, maxdist=1, maxlinewidth=3):
     """
     Plot the map of the dna distances and lat longs
@@ -222,7 +246,8 @@ def plotmap(ll, dd, outputfile, maxdist=1, maxlinewidth=3):
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description='Plot a map using ete and lat lon')
     parser.add_argument('-i', help='id.map file with lat/lon information', required=True)
-    parser.add_argument('-m', help='cophenetic map file with same ids as id.map', required=True)
+    parser.add_argument('-m', help='cophenetic map file with same ids as id.map')
+    parser.add_argument('-t', help='tree file with same ids as id.map (instead of -m)')
     parser.add_argument('-o', help='output file name', required=True)
     parser.add_argument('-v', help='verbose output', action='store_true')
     args = parser.parse_args()
@@ -234,5 +259,11 @@ if __name__ == '__main__':
 
     lonlat = get_lon_lat(args.i)
     # dist = best_dna_dist(get_dna_distance(args.t))
-    dist = closest_dna_dist(args.m)
+    if args.t:
+        dist = closest_tree_dist(args.t)
+    elif args.m:
+        dist = closest_dna_dist(args.m)
+    else:
+        sys.stderr.write("Please provide either a cophenetic matrix (-m) or a tree (-t)\n")
+        sys.exit(-1)
     plotmap(lonlat, dist, args.o)
\ No newline at end of file
@@ -10,7 +10,6 @@ import matplotlib
 matplotlib.use('Agg')
 import matplotlib.pyplot as plt
 import numpy as np
-import math
 
 
 
@@ -38,29 +37,15 @@ if __name__ == '__main__':
             genomelength = len(p) - args.n
             if len(p) > args.n:
                 row_labels.append(p[0])
-                s = [int(x) for x in p[args.n:]]
-                counter = 0
-                total = 0
-                thisrow = []
-                for i in range(args.n, len(s)):
-                    total += s[i]
-                    counter += 1
-                    if counter == args.w:
-                        n = 1.0 * total/counter
-                        if args.m and n > args.m:
-                            n = args.m
-                        if n:
-                            if args.l:
-                                thisrow.append(1.0 * math.log(n)/math.log(10))
-                            else:
-                                thisrow.append(n)
-                        else:
-                            if args.l:
-                                thisrow.append(eps)
-                            else:
-                                thisrow.append(0)
-                        counter = 0
-                        total = 0
+                s = np.array([int(x) for x in p[args.n:]], dtype=np.float64)
+                # the mean of each complete window
+                windows = len(s) // args.w
+                row = s[:windows * args.w].reshape(windows, args.w).mean(axis=1)
+                if args.m:
+                    row = np.minimum(row, args.m)
+                if args.l:
+                    row = np.where(row > 0, np.log10(np.where(row > 0, row, 1)), eps)
+                thisrow = row.tolist()
                 data.append(thisrow)
 
 
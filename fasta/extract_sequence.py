@@ -5,7 +5,7 @@ Extract a sequence from a fasta file
 import os
 import sys
 import argparse
-from roblib import stream_fasta
+from roblib import stream_fasta, index_sequences, SequenceIndex
 
 
 
@@ -13,9 +13,22 @@ if __name__ == '__main__':
     parser = argparse.ArgumentParser(description=" ")
     parser.add_argument('-f', help='fasta file', required=True)
     parser.add_argument('-i', help='sequence id, (multiple allowed)', nargs='+')
+    parser.add_argument('-x', help='use (and make if needed) an index of the fasta file. Use this if you extract sequences from the same file often. The ids are matched to the first word of the fasta ids', action='store_true')
     parser.add_argument('-v', help='verbose output', action='store_true')
     args = parser.parse_args()
 
+    # only use the index when we are asked to: it matches the first word of the id, not the whole id
+    if args.x:
+        if not os.path.exists(args.f + ".ridx"):
+            index_sequences(args.f, verbose=args.v)
+        idx = SequenceIndex(args.f, verbose=args.v)
+        for seqid, rec in zip(args.i, idx.get_many(args.i)):
+            if rec:
+                print(f">{rec[0]}\n{rec[1]}\n")
+            elif args.v:
+                sys.stderr.write(f"{seqid} was not found in {args.f}\n")
+        sys.exit(0)
+
     for seqid, seq in stream_fasta(args.f):
         if seqid in args.i:
             print(f">{seqid}\n{seq}\n")
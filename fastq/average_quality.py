@@ -6,7 +6,7 @@ import os
 import sys
 import argparse
 
-from roblib import stream_fastq, qual_to_numbers
+from roblib import stream_fastq_batches
 
 __author__ = 'Rob Edwards'
 __copyright__ = 'Copyright 2020, Rob Edwards'
@@ -23,7 +23,6 @@ if __name__ == '__main__':
     args = parser.parse_args()
 
     print("SeqID\tLength\tAverage Qual")
-    for sid, seqid, seq, qual in stream_fastq(args.f):
-        q2n =  list(qual_to_numbers(qual))
-        av = sum(q2n)/len(q2n)
-        print(f"{sid}\t{len(seq)}\t{av}")
\ No newline at end of file
+    for batch in stream_fastq_batches(args.f):
+        for sid, seqlen, av in zip(batch.ids, batch.lengths.tolist(), batch.mean_quality().tolist()):
+            print(f"{sid}\t{seqlen}\t{av}")
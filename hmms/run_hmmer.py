@@ -3,18 +3,33 @@ Rub hmmer and print the results.
 
 This is really test code for PhiSpy, but may be useful elsewhere!
 
-Now it has turned into timing tests!
+Now it has turned into timing tests! Each strategy searches the proteins in some genbank files against an hmm
+file and returns the number of hits, and we time each of them a few times:
+
+    hmmscan_one_at_a_time   hmmscan on each protein, parsing the text output with SearchIO
+    hmmscan_all_at_once     hmmscan on all the proteins at once, streamed on stdin
+    hmmscan_tempfile        hmmscan on a temporary fasta file, parsing the text output file
+    hmmsearch_tempfile      hmmsearch on a temporary fasta file, parsing the text output file
+    hmmsearch_parse         hmmsearch on a temporary fasta file, parsing the text output from stdout
+    batched_domtbl          roblib.run_hmmer: batches of proteins in parallel, reading --domtblout
+    batched_tbl             roblib.run_hmmer: batches of proteins in parallel, reading --tblout
+
+You can't stream proteins to hmmsearch on stdin, as it can't rewind the sequences. You either need to use
+hmmscan (slow) or a temp file (fast!)
+
+With the PhiSpy hmms, hmmscan takes about 3000 seconds and hmmsearch about 600 seconds.
 """
 
 import os
 import sys
 import argparse
-from roblib import colours, genbank_seqio, feature_id
 import subprocess
 from Bio import SearchIO
 from io import StringIO
 import timeit
 from tempfile import NamedTemporaryFile
+from roblib import genbank_proteins, run_hmmer
+from roblib.compression import THREADS
 
 __author__ = 'Rob Edwards'
 __copyright__ = 'Copyright 2020, Rob Edwards'
@@ -24,275 +39,135 @@ __maintainer__ = 'Rob Edwards'
 __email__ = 'raedwards@gmail.com'
 
 
-def run_hmmscan_oat(gbkf, hmmf):
+def _count_searchio(handle):
+    """
+    Parse hmmer text output with SearchIO and count the hits
+    :param handle: the output file name or a file handle
+    :return: the number of hits
+    """
 
     allhits = {}
     hitcount = 0
-    rescount = 0
-    for seq in genbank_seqio(gbkf):
-        for feat in seq.features:
-            if feat.type != 'CDS':
-                continue
-            aa = ""
-            if 'translation' in feat.qualifiers:
-                aa = feat.qualifiers['translation'][0]
-            else:
-                aa = str(feat.extract(seq).translate().seq)
-
-            search = subprocess.Popen(["hmmscan", '--cpu', '6', '-E', '1e-10', '--domE', '1e-5', '--noali', hmmf, '-'],
-                                      stdin=subprocess.PIPE, stdout=subprocess.PIPE)
-            hmmresult = search.communicate(input=f">{feat.id}\n{aa}\n".encode())[0]
-
-            results = SearchIO.parse(StringIO(hmmresult.decode()), 'hmmer3-text')
-            for res in results:
-                allhits[res.id] = {}
-                rescount += 1
-                for hit in res:
-                    allhits[res.id][hit.id] = hit.evalue
-                    hitcount += 1
+    for res in SearchIO.parse(handle, 'hmmer3-text'):
+        allhits[res.id] = {}
+        for hit in res:
+            allhits[res.id][hit.id] = hit.evalue
+            hitcount += 1
+    return hitcount
 
-    print(f"Using hmmscan and streaming one at time there were {rescount} results and {hitcount} hits, and our dict has {len(allhits)} entries")
 
+def _hmmer(program, cpu, hmmf, seqs, output=None):
+    """
+    The hmmer command we use for all the SearchIO strategies
+    """
 
-def run_hmmscan_aao(gbkf, hmmf):
+    cmd = [program, '--cpu', str(cpu), '-E', '1e-10', '--domE', '1e-5', '--noali']
+    if output:
+        cmd += ['-o', output]
+    return cmd + [hmmf, seqs]
 
 
-    allhits = {}
-    hitcount = 0
-    rescount = 0
-    for seq in genbank_seqio(gbkf):
-        prots = []
-        for feat in seq.features:
-            if feat.type != 'CDS':
-                continue
-            aa = ""
-            if 'translation' in feat.qualifiers:
-                aa = feat.qualifiers['translation'][0]
-            else:
-                aa = str(feat.extract(seq).translate().seq)
-            myid = feature_id(seq, feat)
-            prots.append(f">{myid}\n{aa}")
-
-        search = subprocess.Popen(["hmmscan", '--cpu', '6', '-E', '1e-10', '--domE', '1e-5', '--noali', hmmf, '-'],
-                                  stdin=subprocess.PIPE, stdout=subprocess.PIPE)
-        hmmresult = search.communicate(input="\n".join(prots).encode())[0]
-
-        results = SearchIO.parse(StringIO(hmmresult.decode()), 'hmmer3-text')
-        for res in results:
-            allhits[res.id] = {}
-            rescount += 1
-            for hit in res:
-                allhits[res.id][hit.id] = hit.evalue
-                hitcount += 1
-
-    print(f"Using hmmscan and streaming all at once there were {rescount} results and {hitcount} hits, and our dict has {len(allhits)} entries")
-
-def hmmscan_print_then_run(gbkf, hmmf):
-    aaout = NamedTemporaryFile(mode='w+t', delete=False)
-    sys.stderr.write(f"Writing the amino acids to {aaout.name}\n")
-    aaout.seek(0)
-    for seq in genbank_seqio(gbkf):
-        for feat in seq.features:
-            if feat.type != 'CDS':
-                continue
-            aa = ""
-            if 'translation' in feat.qualifiers:
-                aa = feat.qualifiers['translation'][0]
-            else:
-                aa = str(feat.extract(seq).translate().seq)
-            myid = feature_id(seq, feat)
-            aaout.write(f">{myid}\n{aa}\n")
+def _write_proteins(gbkfs):
+    """
+    Write the proteins to a temporary fasta file
+    :return: the file name
+    """
 
+    aaout = NamedTemporaryFile(mode='w+t', suffix='.faa', delete=False)
+    for pid, aa in genbank_proteins(gbkfs):
+        aaout.write(f">{pid}\n{aa}\n")
     aaout.close()
-
-    hmmout = NamedTemporaryFile(mode='w+t', delete=False)
-    hmmout.close()
-    sys.stderr.write(f"hmmscan output will be in {hmmout.name}\n")
-    try:
-        search = subprocess.run(["hmmscan", '--cpu', '6', '-E', '1e-10', '--domE', '1e-5', '--noali', '-o', hmmout.name, hmmf, aaout.name])
-    except subprocess.CalledProcessError as e:
-        sys.stderr.write(f"Error running hmmscan:\n{e}\n")
-        sys.exit(-1)
+    return aaout.name
 
 
-    results = SearchIO.parse(hmmout.name, 'hmmer3-text')
-    allhits = {}
+def hmmscan_one_at_a_time(gbkfs, hmmf, cpu=6, processes=THREADS):
     hitcount = 0
-    rescount = 0
-    for res in results:
-        allhits[res.id] = {}
-        rescount += 1
-        for hit in res:
-            allhits[res.id][hit.id] = hit.evalue
-            hitcount += 1
+    for pid, aa in genbank_proteins(gbkfs):
+        search = subprocess.Popen(_hmmer('hmmscan', cpu, hmmf, '-'), stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+        hmmresult = search.communicate(input=f">{pid}\n{aa}\n".encode())[0]
+        hitcount += _count_searchio(StringIO(hmmresult.decode()))
+    return hitcount
 
-    print(f"Using hmmscan and tempfiles there were {rescount} results and {hitcount} hits, and our dict has {len(allhits)} entries")
-
-
-def hmmsearch_print_then_run(gbkf, hmmf):
-    aaout = NamedTemporaryFile(mode='w+t', delete=False)
-    sys.stderr.write(f"Writing the amino acids to {aaout.name}\n")
-    aaout.seek(0)
-    for seq in genbank_seqio(gbkf):
-        for feat in seq.features:
-            if feat.type != 'CDS':
-                continue
-            aa = ""
-            if 'translation' in feat.qualifiers:
-                aa = feat.qualifiers['translation'][0]
-            else:
-                aa = str(feat.extract(seq).translate().seq)
-            myid = feature_id(seq, feat)
-            aaout.write(f">{myid}\n{aa}\n")
 
-    aaout.close()
+def hmmscan_all_at_once(gbkfs, hmmf, cpu=6, processes=THREADS):
+    prots = [f">{pid}\n{aa}\n" for pid, aa in genbank_proteins(gbkfs)]
+    search = subprocess.Popen(_hmmer('hmmscan', cpu, hmmf, '-'), stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+    hmmresult = search.communicate(input="".join(prots).encode())[0]
+    return _count_searchio(StringIO(hmmresult.decode()))
+
 
+def _tempfile_search(program, gbkfs, hmmf, cpu):
+    aaf = _write_proteins(gbkfs)
     hmmout = NamedTemporaryFile(mode='w+t', delete=False)
     hmmout.close()
-    sys.stderr.write(f"hmmsearch output will be in {hmmout.name}\n")
     try:
-        search = subprocess.run(["hmmsearch", '--cpu', '6', '-E', '1e-10', '--domE', '1e-5', '--noali', '-o', hmmout.name, hmmf, aaout.name])
+        subprocess.run(_hmmer(program, cpu, hmmf, aaf, hmmout.name), check=True)
+        return _count_searchio(hmmout.name)
     except subprocess.CalledProcessError as e:
-        sys.stderr.write(f"Error running hmmscan:\n{e}\n")
+        sys.stderr.write(f"Error running {program}:\n{e}\n")
         sys.exit(-1)
+    finally:
+        os.unlink(aaf)
+        os.unlink(hmmout.name)
 
 
-    results = SearchIO.parse(hmmout.name, 'hmmer3-text')
-    allhits = {}
-    hitcount = 0
-    rescount = 0
-    for res in results:
-        allhits[res.id] = {}
-        rescount += 1
-        for hit in res:
-            allhits[res.id][hit.id] = hit.evalue
-            hitcount += 1
-
-    print(f"Using hmmsearch and tempfiles there were {rescount} results and {hitcount} hits, and our dict has {len(allhits)} entries")
+def hmmscan_tempfile(gbkfs, hmmf, cpu=6, processes=THREADS):
+    return _tempfile_search('hmmscan', gbkfs, hmmf, cpu)
 
 
+def hmmsearch_tempfile(gbkfs, hmmf, cpu=6, processes=THREADS):
+    return _tempfile_search('hmmsearch', gbkfs, hmmf, cpu)
 
-def hmmsearch_print_then_parse(gbkf, hmmf):
-    aaout = NamedTemporaryFile(mode='w+t', delete=False)
-    sys.stderr.write(f"Writing the amino acids to {aaout.name}\n")
-    aaout.seek(0)
-    for seq in genbank_seqio(gbkf):
-        for feat in seq.features:
-            if feat.type != 'CDS':
-                continue
-            aa = ""
-            if 'translation' in feat.qualifiers:
-                aa = feat.qualifiers['translation'][0]
-            else:
-                aa = str(feat.extract(seq).translate().seq)
-            myid = feature_id(seq, feat)
-            aaout.write(f">{myid}\n{aa}\n")
-
-    aaout.close()
 
-    sys.stderr.write("Searching\n")
+def hmmsearch_parse(gbkfs, hmmf, cpu=6, processes=THREADS):
+    aaf = _write_proteins(gbkfs)
     try:
-        search = subprocess.Popen(["hmmsearch", '--cpu', '6', '-E', '1e-10', '--domE', '1e-5', '--noali', hmmf, aaout.name], stdout=subprocess.PIPE)
-    except subprocess.CalledProcessError as e:
-        sys.stderr.write(f"Error running hmmscan:\n{e}\n")
-        sys.exit(-1)
-
-    sys.stderr.write("Parsing\n")
-    hmmresult = search.communicate()[0]
-    results = SearchIO.parse(StringIO(hmmresult.decode()), 'hmmer3-text')
-    allhits = {}
-    hitcount = 0
-    rescount = 0
-    for res in results:
-        allhits[res.id] = {}
-
-        rescount += 1
-        for hit in res:
-            allhits[res.id][hit.id] = hit.evalue
-            # print(f"Result: {res.id}: Hit: {hit.id} Eval: {hit.evalue}")
-            hitcount += 1
+        search = subprocess.Popen(_hmmer('hmmsearch', cpu, hmmf, aaf), stdout=subprocess.PIPE)
+        hmmresult = search.communicate()[0]
+        return _count_searchio(StringIO(hmmresult.decode()))
+    finally:
+        os.unlink(aaf)
 
-    print(f"Using hmmsearch and tempfiles there were {rescount} results and {hitcount} hits, and our dict has {len(allhits)} entries")
 
+def batched_domtbl(gbkfs, hmmf, cpu=1, processes=THREADS):
+    hits = run_hmmer(hmmf, genbank_proteins(gbkfs), processes, cpu, table='domtbl')
+    return sum(len(m) for m in hits.hits_by_protein().values())
 
 
-def stream_hmmsearch(gbkf, hmmf):
-    """
-    NOTE: THIS DOES NOT WORK!!
+def batched_tbl(gbkfs, hmmf, cpu=1, processes=THREADS):
+    hits = run_hmmer(hmmf, genbank_proteins(gbkfs), processes, cpu, table='tbl')
+    return sum(len(m) for m in hits.hits_by_protein().values())
 
-    You can't stream against hmmsearch as it can't rewind the sequences. You either need to use hmmscan (slow) or a temp file
-    (fast!)
 
-    :param gbkf:
-    :param hmmf:
-    :return:
-    """
-    allhits = {}
-    hitcount = 0
-    rescount = 0
-    for seq in genbank_seqio(gbkf):
-        prots = []
-        for feat in seq.features:
-            if feat.type != 'CDS':
-                continue
-            aa = ""
-            if 'translation' in feat.qualifiers:
-                aa = feat.qualifiers['translation'][0]
-            else:
-                aa = str(feat.extract(seq).translate().seq)
-            myid = feature_id(seq, feat)
-            prots.append(f">{myid}\n{aa}")
-
-
-        search = subprocess.Popen(["hmmsearch", '--cpu', '6', '-E', '1e-10', '--domE', '1e-5', '--noali', hmmf, '-'],
-                                  stdin=subprocess.PIPE, stdout=subprocess.PIPE)
-        hmmresult = search.communicate(input="\n".join(prots).encode())[0]
-
-        results = SearchIO.parse(StringIO(hmmresult.decode()), 'hmmer3-text')
-        for res in results:
-            allhits[res.id] = {}
-            rescount += 1
-            for hit in res:
-                allhits[res.id][hit.id] = hit.evalue
-                hitcount += 1
-
-    print(
-        f"Using hmmsearch and streaming all at once there were {rescount} results and {hitcount} hits, and our dict has {len(allhits)} entries")
+STRATEGIES = {
+    'hmmscan_one_at_a_time': hmmscan_one_at_a_time,
+    'hmmscan_all_at_once': hmmscan_all_at_once,
+    'hmmscan_tempfile': hmmscan_tempfile,
+    'hmmsearch_tempfile': hmmsearch_tempfile,
+    'hmmsearch_parse': hmmsearch_parse,
+    'batched_domtbl': batched_domtbl,
+    'batched_tbl': batched_tbl,
+}
 
 
 if __name__ == '__main__':
-    parser = argparse.ArgumentParser(description=" ")
-    parser.add_argument('-g', help='genbank file', required=True)
+    parser = argparse.ArgumentParser(description="Time different ways of running hmmer")
+    parser.add_argument('-g', help='genbank file(s)', nargs='+', required=True)
     parser.add_argument('-m', help='hmmer file', required=True)
+    parser.add_argument('-s', help='strategies to time (default: the hmmsearch and batched ones)', nargs='+',
+                        choices=list(STRATEGIES),
+                        default=['hmmsearch_parse', 'hmmsearch_tempfile', 'batched_domtbl', 'batched_tbl'])
+    parser.add_argument('-n', help='number of times to run each strategy (default: 3)', type=int, default=3)
+    parser.add_argument('-c', help='threads for each hmmer process (default: 6 for the single process ' +
+                                   'strategies and 1 for the batched ones)', type=int)
+    parser.add_argument('-p', help=f'number of hmmer processes for the batched strategies (default: {THREADS})',
+                        type=int, default=THREADS)
     args = parser.parse_args()
 
-
-    print("Timing Search then parse")
-    print(timeit.timeit('hmmsearch_print_then_parse(args.g, args.m)', setup="from __main__ import hmmsearch_print_then_parse, args", number=3))
-    # takes about 600 seconds
-
-    print("Timing hmmsearch using temporary files")
-    print(timeit.timeit('hmmsearch_print_then_run(args.g, args.m)', setup="from __main__ import hmmsearch_print_then_run, args", number=3))
-    # takes about 600 seconds
-    exit(0)
-
-    print("Timing hmmsearch")
-    print(timeit.timeit('stream_hmmsearch(args.g, args.m)', setup="from __main__ import stream_hmmsearch, args", number=3))
-    # Does not work (see note above)
-
-    print("Timing run all at once")
-    print(timeit.timeit('run_hmmscan_aao(args.g, args.m)', setup="from __main__ import run_hmmscan_aao, args", number=3))
-    # takes about 3000 seconds
-
-    print("Timing run one at a time")
-    print(timeit.timeit('run_hmmscan_oat(args.g, args.m)', setup="from __main__ import run_hmmscan_oat, args", number=3))
-    # takes about 3000 seconds
-
-    print("Timing hmmscan using temporary files")
-    print(timeit.timeit('hmmscan_print_then_run(args.g, args.m)', setup="from __main__ import hmmscan_print_then_run, args", number=3))
-    # takes about 3000 seconds
-
-    print("Timing hmmsearch using temporary files")
-    print(timeit.timeit('hmmsearch_print_then_run(args.g, args.m)', setup="from __main__ import hmmsearch_print_then_run, args", number=3))
-    # takes about 600 seconds
-
+    print("\t".join(['Strategy', 'Hits', 'Best time (s)', 'Mean time (s)']))
+    for name in args.s:
+        hmmer = STRATEGIES[name]
+        cpus = args.c or (1 if name.startswith('batched') else 6)
+        hits = []
+        times = timeit.repeat(lambda: hits.append(hmmer(args.g, args.m, cpus, args.p)), number=1, repeat=args.n)
+        print(f"{name}\t{hits[-1]}\t{min(times):.2f}\t{sum(times) / len(times):.2f}", flush=True)
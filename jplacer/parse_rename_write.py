@@ -7,25 +7,24 @@ import os
 import sys
 import argparse
 
-import json
 import re
 
 from ete3 import Tree
 from ete3.parser.newick import NewickError
 
+from roblib import PlacementIndex
+
 from taxon import get_taxonomy_db, get_taxonomy
 
-def load_jplacer(jpf):
+def load_jplacer(jpf, verbose=False):
     """
-    load the jplacer file and return the tree
+    load the jplacer file and return the placements
     :param jpf: The jplacer file
-    :return: the data structure of the tree
+    :param verbose: more output
+    :return: the PlacementIndex of the placements. The tree and fields are in the header
     """
 
-    with open(jpf, 'r') as f:
-        data = json.load(f)
-
-    return data
+    return PlacementIndex(jpf, verbose)
 
 
 def explore_jplacer(data):
@@ -38,9 +37,9 @@ def explore_jplacer(data):
 
     # print("{}\n".format(data.keys()))
     # sys.exit()
-    print("{}".format(data['fields']))
+    print("{}".format(data.fields))
 
-    print("{}".format(data['placements']))
+    print("{}".format(data.edge_counts()))
     sys.exit(0)
 
     """
@@ -76,37 +75,20 @@ def get_placements(data, distmeasure):
 
     For this purposes we multiple the distance measure by the modifier for each entry
 
-    TODO: we have not implemented the approach for a single insertion as we don't have an example of that (yet!)
+    Placements with names (n) rather than names and multiplicities (nm) have a multiplicity of 1.
 
-    :param data: the parsed jplacer tree
+    :param data: the PlacementIndex from load_jplacer
     :param distmeasure: the distance measure to use
     :return: a dict of placement edge_numbers and sets of ids to add
     """
 
-    # first make sure the tree fields are in the correct order!
-    posn = data['fields'].index('edge_num')
-    if distmeasure not in data['fields']:
-        sys.stderr.write("Crap. We do not have {} in our possible fields: {}\n".format(distmeasure, data['fields']))
+    if distmeasure not in data.fields:
+        sys.stderr.write("Crap. We do not have {} in our possible fields: {}\n".format(distmeasure, data.fields))
         sys.exit(-1)
-    distn = data['fields'].index(distmeasure)
-    placements = {}
 
-    for pl in data['placements']:
-        multiplier = {}
-        if 'n' in pl:
-            sys.stderr.write("Crap, not sure what to do because I've never seen an example. You should be able to figure out from what I did with nm\n")
-            sys.exit(-1)
-        if 'nm' in pl:
-            for i in pl['nm']:
-                multiplier[i[0].replace(' ', '_')] = i[1]
-        for p in pl['p']:
-            edge_num = p[posn]
-            distance = p[distn]
-            if edge_num not in placements:
-                placements[edge_num] = {}
-            for thisid in multiplier:
-                newid = clean_newick_id(thisid)
-                placements[edge_num][newid] = multiplier[thisid] * distance * 1.0
+    placements = {}
+    for edge_num, dists in data.placements_by_edge(distmeasure).items():
+        placements[edge_num] = {clean_newick_id(thisid): dists[thisid] for thisid in dists}
 
     return placements
 
@@ -114,15 +96,15 @@ def get_placements(data, distmeasure):
 def parse_jplacer_tree(data):
     """
     Extract the tree from the jplacer data structure and make it into an ete3 object
-    :param data: the jplacer data structure
+    :param data: the PlacementIndex from load_jplacer
     :return:
     """
 
 
     try:
-        tree = Tree(data['tree'], quoted_node_names=True, format=1)
+        tree = Tree(data.header['tree'], quoted_node_names=True, format=1)
     except NewickError as n:
-        tt = re.sub(r'(\:[\d\.]+){\d+}', r'\1', data['tree'])
+        tt = re.sub(r'(\:[\d\.]+){\d+}', r'\1', data.header['tree'])
         tt = re.sub(r'{\d+};$', ';', tt)
         tree = Tree(tt, quoted_node_names=True, format=1)
 
@@ -337,7 +319,7 @@ if __name__ == '__main__':
         sys.exit()
 
 
-    data = load_jplacer(args.j)
+    data = load_jplacer(args.j, args.v)
 
     tree = parse_jplacer_tree(data)
 
@@ -5,25 +5,25 @@ Count the 11mers in a sequence
 import os
 import sys
 import argparse
-from itertools import product
-from roblib import read_fasta
-from roblib import median
+import numpy as np
+from roblib import stream_fasta, count_kmers
 
 parser = argparse.ArgumentParser(description='Count the kmers in a fasta file')
 parser.add_argument('-f', help='fasta file', required=True)
 parser.add_argument('-s', help='K-mer size, (default=11)', type=int, default=11)
 args = parser.parse_args()
 
-fa = read_fasta(args.f)
+# the statistics are over all 4^k possible kmers, including the ones we don't see
+n = 4 ** args.s
 
-for id in fa:
-    count = []
-    for k in product("ATGC", repeat=args.s):
-        sk = "".join(k)
-        count.append(fa[id].upper().count(sk))
+for id, seq in stream_fasta(args.f):
+    counts = np.sort(count_kmers(seq, args.s).counts)
+    total = int(counts.sum())
+    # the median of all n counts, remembering that the ones we didn't see are zero
+    zeros = n - len(counts)
+    med = 0 if n // 2 < zeros else int(counts[n // 2 - zeros])
+    mx = int(counts[-1]) if len(counts) else 0
 
     print("id: {} len(seq): {} sum: {}  n: {} average: {} median: {} max: {}".format(
-        id, len(fa[id]), sum(count), len(count), (1.0 * sum(count) / len(count)), median(count), max(count)
+        id, len(seq), total, n, (1.0 * total / n), med, mx
     ))
-
-
@@ -6,15 +6,14 @@ k-mers should be trimmed
 import os
 import sys
 import argparse
-from roblib import bcolors,stream_fastq
+import numpy as np
+from roblib import bcolors, stream_fastq_batches, positional_base_counts
 __author__ = 'Rob Edwards'
 
-k = {"A" : 0, "G" : 1, "C" : 2, "T" : 3,
- "a" : 0, "g" : 1, "c" : 2, "t" : 3}
-
 def count_kmers(fqf, kmer, verbose=False):
     """ 
-    Count hte frequency of bases in the first k-mer bp of a sequences
+    Count the frequency of bases in the first k-mer bp of the sequences. Sequences shorter than
+    k-mer bp or with an N are skipped.
     :param fqf: fastq file
     :param kmer: length to count
     :param verbose: more output
@@ -22,21 +21,11 @@ def count_kmers(fqf, kmer, verbose=False):
 
     if verbose:
         sys.stderr.write(f"{bcolors.GREEN}Reading {fqf}{bcolors.ENDC}\n");
-    counts = [[0,0,0,0] for x in range(kmer)]
-    for sid, seqid, seq, qual in stream_fastq(fqf):
-        if len(seq) < kmer:
-            continue
-        if 'N' in seq  or 'n' in seq:
-            continue
-        for x in range(kmer):
-            try:
-                counts[x][k[seq[x]]] += 1
-            except KeyError as e:
-                base = e.args[0]
-                if base.upper() != "N":
-                    sys.stderr.write(f'{bcolors.PINK}Unknown base {base}{bcolors.ENDC}\n')
-
-    return counts
+    counts = np.zeros((kmer, 4), dtype=np.int64)
+    for batch in stream_fastq_batches(fqf):
+        counts += positional_base_counts(batch, kmer, from_end=False)
+    # positional_base_counts is in ACGT order, and we use AGCT
+    return counts[:, [0, 2, 1, 3]].tolist()
 
 def predict(counts, cutoff=0.5, verbose=False):
     """
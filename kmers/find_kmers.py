@@ -6,8 +6,8 @@ import os
 import sys
 import argparse
 from random import randint
-from itertools import product
-from statistics import median
+import numpy as np
+from roblib import count_kmers
 
 __author__ = 'Rob Edwards'
 
@@ -28,14 +28,11 @@ def generate_random_seq(length):
 
 #seq = generate_random_seq(1000000)
 seq = generate_random_seq(4194304)
-count = []
-for k in product("ATGC", repeat=11):
-    sk="".join(k)
-    count.append(seq.count(sk))
+# the counts of all 4^11 kmers, including the ones that are not in the sequence
+count = count_kmers(seq, 11).dense_counts()
 
 
 
 print("sum: {}  n: {} average: {} median: {}".format(
-    sum(count), len(count), (1.0*sum(count)/len(count)), median(count)
+    count.sum(), len(count), (1.0*count.sum()/len(count)), np.median(count)
 ))
-
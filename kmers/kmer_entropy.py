@@ -6,51 +6,46 @@ import os
 import sys
 import argparse
 
-from roblib import bcolors
-from itertools import product
-
 import json
-from math import log2
-from roblib import stream_fasta, rc, bcolors, stream_fastq
+import tempfile
+from roblib import bcolors, stream_fasta_batches, stream_fastq_batches
+from roblib import KmerCounts, KmerCountFile, count_kmers_to_file
+from roblib import count_kmers as kmer_counter
 
-def count_kmers(faf, type, k, jsonout=None, verbose=False):
+def count_kmers(faf, type, k, jsonout=None, verbose=False, processes=1, countfile=None):
     """
-    Count the kmers
+    Count the kmers on both strands. Kmers that contain anything other than A, C, G, or T are ignored.
     :param faf: fasta file
     :param type: str either fasta or fastq
     :param k: kmer size
     :param verbose: more output
-    :return: a dict of kmers
+    :param processes: the number of processes to count with
+    :param countfile: save the counts to this file so we can reuse them
+    :return: a KmerCounts object
     """
 
     if verbose:
         sys.stderr.write(f"{bcolors.GREEN}Counting kmers (k={k}) in {faf}\n")
 
-    kmers = {}
-
-    if type == "fasta":
-        for id, seq in stream_fasta(faf):
-            rcseq = rc(seq)
-            posn = 0
-            while posn < len(seq) - k - 1:
-                kmers[seq[posn:posn+k]] = kmers.get(seq[posn:posn+k], 0) + 1
-                kmers[rcseq[posn:posn + k]] = kmers.get(rcseq[posn:posn + k], 0) + 1
-                posn += 1
-
-    if type == "fastq":
-        for id, fullid, seq, qual in stream_fastq(faf):
-            rcseq = rc(seq)
-            posn = 0
-            while posn < len(seq) - k - 1:
-                kmers[seq[posn:posn+k]] = kmers.get(seq[posn:posn+k], 0) + 1
-                kmers[rcseq[posn:posn + k]] = kmers.get(rcseq[posn:posn + k], 0) + 1
-                posn += 1
+    if countfile:
+        count_kmers_to_file(faf, countfile, k, both_strands=True, processes=processes, verbose=verbose)
+        kmers = KmerCountFile(countfile)
+    elif processes > 1:
+        with tempfile.TemporaryDirectory() as tmpdir:
+            count_kmers_to_file(faf, os.path.join(tmpdir, 'kmers.kmc'), k, both_strands=True,
+                                processes=processes, verbose=verbose)
+            kmers = KmerCounts(k, dense=False)
+            kmers.merge(KmerCountFile(os.path.join(tmpdir, 'kmers.kmc')))
+    elif type == "fasta":
+        kmers = kmer_counter(stream_fasta_batches(faf), k, both_strands=True)
+    else:
+        kmers = kmer_counter(stream_fastq_batches(faf), k, both_strands=True)
 
     if jsonout:
         if verbose:
             sys.stderr.write(f"{bcolors.BLUE}\tWriting to {jsonout}\n")
         with open(jsonout, 'w') as out:
-            json.dump({faf : kmers}, out)
+            json.dump({faf : kmers.to_dict()}, out)
 
     if verbose:
         sys.stderr.write(f"{bcolors.BLUE}\tDone counting kmers (k={k}) in {faf}\n")
@@ -60,24 +55,19 @@ def count_kmers(faf, type, k, jsonout=None, verbose=False):
 def shannon(kmers, verbose=False):
     """
     Calculate the shannon entropy
-    :param kmers: the kmer dictionary
+    :param kmers: the KmerCounts
     :param verbose: more output
     :return: the shannon entropy of the kmers
     """
 
     if verbose:
         sys.stderr.write(f"{bcolors.GREEN}Calculating Shannon's Entropy\n")
-    t = sum(kmers.values())
-    H = 0
-    for x in kmers:
-        H += (kmers[x] / t) * (log2(kmers[x]/t))
-
-    return -H
+    return kmers.shannon()
 
 def evenness(kmers, H=None, verbose=False):
     """
     Calculate the evenness
-    :param kmers: the kmer dictionary
+    :param kmers: the KmerCounts
     :param H: shannon entropy (optional). If provided, we won't recalculate
     :param verbose: more output
     :return: the evenness of the kmers
@@ -85,22 +75,36 @@ def evenness(kmers, H=None, verbose=False):
 
     if not H:
         H = shannon(kmers, verbose)
-    S = len(kmers.keys())
-    return H/log2(S)
+    return kmers.evenness(H)
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description='Count the kmers in a file and report entropy and eveness')
     parser.add_argument('-f', help='fasta file to count the entropy/evenness')
     parser.add_argument('-q', help='fastq file to count the entropy/evenness')
-    parser.add_argument('-k', help='kmer size', required=True, type=int)
+    parser.add_argument('-c', help='k-mer count file(s) saved with -o. We report the entropy/evenness without recounting', nargs='+')
+    parser.add_argument('-k', help='kmer size (not needed with -c)', type=int)
     parser.add_argument('-j', help='json output for kmer counts')
+    parser.add_argument('-o', help='save the k-mer counts to this file so you can reuse them with -c')
+    parser.add_argument('-p', help='number of processes to count with (default=1)', type=int, default=1)
     parser.add_argument('-v', help='verbose output', action='store_true')
     args = parser.parse_args()
 
+    if args.c:
+        for cf in args.c:
+            kmers = KmerCountFile(cf)
+            H = shannon(kmers, args.v)
+            e = evenness(kmers, H, args.v)
+            print(f"{cf}\t{kmers.k}\t{H}\t{e}")
+        sys.exit(0)
+
+    if not args.k:
+        sys.stderr.write(f"{bcolors.RED}FATAL: Please supply the kmer size with -k{bcolors.ENDC}\n")
+        sys.exit(-1)
+
     if args.f:
-        kmers = count_kmers(args.f, 'fasta', args.k, args.j, args.v)
+        kmers = count_kmers(args.f, 'fasta', args.k, args.j, args.v, args.p, args.o)
     elif args.q:
-        kmers = count_kmers(args.q, 'fastq', args.k, args.j, args.v)
+        kmers = count_kmers(args.q, 'fastq', args.k, args.j, args.v, args.p, args.o)
     else:
         sys.stderr.write(f"{bcolors.RED}FATAL: Please supply either a fasta file or a fastq file{bcolors.ENDC}\n")
         sys.exit(-1)
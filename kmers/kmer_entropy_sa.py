@@ -190,23 +190,62 @@ def evenness(kmers, H=None, verbose=False):
     :param kmers: the kmer dictionary
     :param H: shannon entropy (optional). If provided, we won't recalculate
     :param verbose: more output
-    :return: the evenness of the kmers
+    :return: the evenness of the kmers, and log2 of the number of kmers. Both are 0 if there are fewer than
+    two different kmers
     """
 
+    S = len(kmers.keys())
+    if S <= 1:
+        return 0, 0
     if not H:
         H = shannon(kmers, verbose)
-    S = len(kmers.keys())
     return H/log2(S), log2(S)
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description='Count the kmers in a file and report entropy and eveness')
     parser.add_argument('-f', help='fasta file to count the entropy/evenness')
     parser.add_argument('-q', help='fastq file to count the entropy/eveness')
-    parser.add_argument('-k', help='kmer size', required=True, type=int)
+    parser.add_argument('-k', help='kmer size', type=int)
     parser.add_argument('-t', help='print field titles in output', action='store_true')
+    parser.add_argument('-p', help='count with this many processes. This needs roblib', type=int, default=1)
+    parser.add_argument('-o', help='save the k-mer counts to this file for use with -c. This needs roblib')
+    parser.add_argument('-c', help='k-mer count file(s) saved with -o. This needs roblib', nargs='+')
     parser.add_argument('-v', help='verbose output', action='store_true')
     args = parser.parse_args()
 
+    if args.t:
+        print("File\tK-mer size\tShannon's Entropy\tRichness\tEvenness")
+
+    if args.c or args.o or args.p > 1:
+        # the parallel counting and count files need roblib, so we only import it here
+        import tempfile
+        from math import log2
+        from roblib import KmerCountFile, count_kmers_to_file
+
+        countfiles = args.c or []
+        filename = args.q or args.f
+        if not countfiles:
+            if not filename or not args.k:
+                sys.stderr.write(f"{RED}FATAL: -k and either -f (fasta) or -q (fastq) must be specified\n{ENDC}")
+                sys.exit(2)
+            if not os.path.exists(filename):
+                sys.stderr.write(f"{RED}FATAL: {filename} does not exist\n{ENDC}")
+                sys.exit(2)
+            tmpdir = tempfile.TemporaryDirectory()
+            outfile = args.o or os.path.join(tmpdir.name, 'kmers.kmc')
+            count_kmers_to_file(filename, outfile, args.k, both_strands=True, processes=args.p, verbose=args.v)
+            countfiles = [outfile]
+        for cf in countfiles:
+            kmers = KmerCountFile(cf)
+            H = kmers.shannon()
+            s = log2(kmers.distinct()) if kmers.distinct() > 1 else 0
+            print(f"{filename or cf}\t{kmers.k}\t{H}\t{s}\t{kmers.evenness(H)}")
+        sys.exit(0)
+
+    if not args.k:
+        sys.stderr.write(f"{RED}FATAL: The k-mer size (-k) must be specified\n{ENDC}")
+        sys.exit(2)
+
     filename = None
     if args.q:
         kmers = count_kmers_fastq(args.q, args.k, args.v)
@@ -221,6 +260,4 @@ if __name__ == '__main__':
     H = shannon(kmers, args.v)
     e,s = evenness(kmers, H, args.v)
 
-    if args.t:
-        print("File\tK-mer size\tShannon's Entropy\tRichness\tEvenness")
     print(f"{filename}\t{args.k}\t{H}\t{s}\t{e}")
\ No newline at end of file
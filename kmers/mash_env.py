@@ -5,7 +5,9 @@ Print out all combinations of mash distances and environments
 import os
 import sys
 import argparse
-import gzip
+from itertools import combinations
+from math import log
+from roblib import open_compressed, KmerCountFile, kmer_jaccard
 
 def read_env(f):
     """
@@ -28,7 +30,7 @@ def read_mash(f, env):
     :return:
     """
 
-    i=gzip.open(f)
+    i=open_compressed(f)
     for l in i:
         p=l.strip().split("\t")
         g1 = p[0].split("/")[-1].replace(".fna", '')
@@ -38,15 +40,43 @@ def read_mash(f, env):
             print("{}\t{}\t{}".format(env[g1], env[g2], dist))
 
 
+def count_distances(files, env):
+    """
+    Calculate the mash distances between genomes from k-mer count files (made with
+    count_kmers_to_file) rather than reading them from the mash output. The genome id is the
+    count file name without the directory and .kmc
+    :param files: the k-mer count files
+    :param env: the environment hash from read_env
+    :return:
+    """
+
+    counts = {}
+    for f in files:
+        g = f.split("/")[-1].replace(".kmc", '')
+        if g in env:
+            counts[g] = KmerCountFile(f)
+
+    for g1, g2 in combinations(sorted(counts), 2):
+        j = kmer_jaccard(counts[g1], counts[g2])
+        # the mash distance from the Jaccard index
+        dist = 1 if j == 0 else -1 / counts[g1].k * log(2 * j / (1 + j))
+        print("{}\t{}\t{}".format(env[g1], env[g2], dist))
 
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description="")
-    parser.add_argument('-f', help='mash file', required=True)
+    parser.add_argument('-f', help='mash file')
+    parser.add_argument('-c', help='k-mer count files to calculate the distances from (instead of -f)', nargs='+')
     parser.add_argument('-e', help='environments file', required=True)
     parser.add_argument('-v', help='verbose output')
     args = parser.parse_args()
 
     env = read_env(args.e)
-    read_mash(args.f, env)
+    if args.c:
+        count_distances(args.c, env)
+    elif args.f:
+        read_mash(args.f, env)
+    else:
+        sys.stderr.write("Please provide either a mash file (-f) or k-mer count files (-c)\n")
+        sys.exit(-1)
     
\ No newline at end of file
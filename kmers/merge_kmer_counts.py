@@ -0,0 +1,31 @@
+"""
+Merge k-mer count files (e.g. from several SRA runs) into one count file, or look up some k-mers in
+a count file.
+"""
+
+import os
+import sys
+import argparse
+from roblib import merge_kmer_files, KmerCountFile
+
+__author__ = 'Rob Edwards'
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Merge or query k-mer count files')
+    parser.add_argument('-c', help='k-mer count files', required=True, nargs='+')
+    parser.add_argument('-o', help='merge the count files into this file')
+    parser.add_argument('-k', help='k-mers to look up. You can either specify multiple -k or use a comma separated list', action='append')
+    parser.add_argument('-v', help='verbose output', action='store_true')
+    args = parser.parse_args()
+
+    if args.o:
+        merge_kmer_files(args.c, args.o, args.v)
+
+    if args.k:
+        kmers = []
+        for k in args.k:
+            kmers.extend(k.split(","))
+        print("K-mer\t{}".format("\t".join(args.c)))
+        counts = [KmerCountFile(c) for c in args.c]
+        for k in kmers:
+            print("{}\t{}".format(k, "\t".join(str(c[k]) for c in counts)))
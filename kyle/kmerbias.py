@@ -5,7 +5,8 @@ Calculate the k-mer bias for Kyle because he doesn't understand perl
 import os
 import sys
 import argparse
-from itertools import combinations
+from itertools import combinations, product
+from roblib import stream_fasta, count_kmers
 
 def repN(n, original, sample, khash, verbose=False):
     """
@@ -54,6 +55,29 @@ def read_kmer_counts(infile, verbose=False):
     return khash
 
 
+def kmer_frequencies(fastafile, maxk, verbose=False):
+    """
+    Count the k-mers directly from a fasta file rather than using GetNucFrequency_PerSeq_varK.pl. Each
+    sequence is a sample, and we calculate the frequency of every k-mer of length 1 to maxk
+    :param fastafile: the fasta file to read
+    :param maxk: the longest k-mer to count
+    :param verbose: more output, but it is written to stderr
+    :return: a dict of dicts
+    """
+
+    khash = {}
+    for seqid, seq in stream_fasta(fastafile):
+        if verbose:
+            sys.stderr.write(f"Counting k-mers in {seqid}\n")
+        khash[seqid] = {}
+        for ksize in range(1, maxk+1):
+            counts = count_kmers(seq, ksize).dense_counts()
+            total = counts.sum() or 1
+            for kmer, c in zip(product("ACGT", repeat=ksize), counts / total):
+                khash[seqid]["".join(kmer)] = float(c)
+    return khash
+
+
 def process_all_kmers(kmers, khash, verbose=False):
     """
     Process and normalize all the k-mers
@@ -137,16 +161,23 @@ __author__ = 'Rob Edwards'
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description='Save Kyles butt')
-    parser.add_argument('-f', help='output file from GetNucFrequency_PerSeq_varK.pl', required=True)
+    parser.add_argument('-f', help='output file from GetNucFrequency_PerSeq_varK.pl')
+    parser.add_argument('-s', help='fasta file to count the k-mers in (instead of -f)')
     parser.add_argument('-k', help='kmers to test. You can either specify multiple -k or use a comma separated list', required=True, action='append')
     parser.add_argument('-v', help='verbose output', action='store_true')
     args = parser.parse_args()
 
-    khash = read_kmer_counts(args.f)
-
     # figure out all the kmers
     allkmers = set()
     for k in args.k:
         allkmers.update(k.split(","))
 
+    if args.f:
+        khash = read_kmer_counts(args.f)
+    elif args.s:
+        khash = kmer_frequencies(args.s, max(map(len, allkmers)), args.v)
+    else:
+        sys.stderr.write("Please provide either the k-mer counts file (-f) or a fasta file (-s)\n")
+        sys.exit(-1)
+
     process_all_kmers(allkmers, khash, args.v)
@@ -25,33 +25,46 @@ sys.stderr.write("Reading taxonomy\n")
 taxa=taxon.read_nodes(directory=args.t)
 names,blastname = taxon.read_names(directory=args.t)
 divs = taxon.read_divisions(directory=args.t)
-gi2tax = taxon.read_gi_tax_id(dtype=dbtype, directory=args.t)
+gi2tax = taxon.gi_taxid_map(dtype=dbtype, directory=args.t)
 
 sys.stderr.write("Read taxonomy\n")
 
 want = ['superkingdom', 'phylum', 'class', 'order', 'family', 'genus', 'species']
 
-results = {}
-with open(args.b, 'r') as f:
-    for l in f:
-        p=l.strip().split("\t")
-        m = []
-        if 'gi|' in p[0]:
-            m = re.findall('gi\|(\d+)', p[0])
-        elif 'gi|' in p[1]:
-            m = re.findall('gi\|(\d+)', p[1])
-        if m == []:
+
+def gi_from_line(p):
+    """
+    Get the gi from the query or the subject of a blast line
+    """
+    m = []
+    if 'gi|' in p[0]:
+        m = re.findall('gi\|(\d+)', p[0])
+    elif 'gi|' in p[1]:
+        m = re.findall('gi\|(\d+)', p[1])
+    if m == []:
+        return None
+    return m[0]
+
+
+def print_lines(lines):
+    """
+    Add the taxonomy to a batch of blast lines. We look up all the gi's in the batch at once
+    """
+    gis = [gi_from_line(p) for p in lines]
+    tids = gi2tax.lookup([g if g else 0 for g in gis])
+    for p, gi, tid in zip(lines, gis, tids):
+        if not gi:
             continue
 
-        if m[0] in results:
-            p.append(results[m[0]])
+        if gi in results:
+            p.append(results[gi])
             print("\t".join(p))
             continue
 
-        if m[0] not in gi2tax:
+        if not tid:
             continue
 
-        tid = gi2tax[m[0]]
+        tid = str(tid)
         level = {}
         while tid != '0' and tid != '1' and tid in taxa and taxa[tid].parent != '1':
             if taxa[tid].rank in want:
@@ -68,9 +81,17 @@ with open(args.b, 'r') as f:
             else:
                 p.append("")
                 resultstr  += ""
+        results[gi] = resultstr
 
         print("\t".join(p))
 
 
-
-
+results = {}
+with open(args.b, 'r') as f:
+    lines = []
+    for l in f:
+        lines.append(l.strip().split("\t"))
+        if len(lines) == 100000:
+            print_lines(lines)
+            lines = []
+    print_lines(lines)
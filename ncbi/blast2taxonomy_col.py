@@ -7,7 +7,7 @@ import sys
 import argparse
 import gzip
 from roblib import bcolors
-from taxon import get_taxonomy_db, get_taxonomy, taxonomy_hierarchy, Error
+from taxon import get_taxonomy_db, get_taxonomy, taxonomy_hierarchy, Error, TaxidMap
 from taxon.Error import EntryNotInDatabaseError
 
 taxa = {}
@@ -60,12 +60,13 @@ def taxstring(tid, verbose=False):
     return taxa[tid]
 
 
-def parse_blast(bf, taxcol, verbose=False):
+def parse_blast(bf, taxcol, verbose=False, taxmap=None):
     """
 
     :param bf: the blast output file
-    :param taxcol: the column that contains the taxonomy ID
+    :param taxcol: the column that contains the taxonomy ID (or the GI or accession if we have a taxmap)
     :param verbose: more output
+    :param taxmap: a TaxidMap to convert the GIs or accessions in taxcol to taxonomy IDs
     :return:
     """
 
@@ -74,6 +75,7 @@ def parse_blast(bf, taxcol, verbose=False):
         f = gzip.open(bf, 'rt')
     else:
         f = open(bf, 'r')
+    lines = []
     for l in f:
         p = l.strip().split("\t")
         if lastcol == -1:
@@ -81,16 +83,38 @@ def parse_blast(bf, taxcol, verbose=False):
         if len(p) != lastcol:
             sys.stderr.write(f"{bcolors.RED}FATAL: Uneven number of columns. We had {lastcol} but now {len(p)}\n")
             sys.exit(-1)
+        lines.append(p)
+        if len(lines) == 100000:
+            print_lines(lines, taxcol, verbose, taxmap)
+            lines = []
+    print_lines(lines, taxcol, verbose, taxmap)
+    f.close()
+
+
+def print_lines(lines, taxcol, verbose=False, taxmap=None):
+    """
+    Print a batch of blast lines with their taxonomy. We look up all the GIs or accessions at once
+    :param lines: the lines split into columns
+    :param taxcol: the column that contains the taxonomy ID (or the GI or accession if we have a taxmap)
+    :param verbose: more output
+    :param taxmap: a TaxidMap to convert the GIs or accessions in taxcol to taxonomy IDs
+    """
 
-        t = taxstring(p[taxcol], verbose)
+    if taxmap:
+        tids = [str(t) for t in taxmap.lookup([p[taxcol] for p in lines])]
+    else:
+        tids = [p[taxcol] for p in lines]
+    for p, tid in zip(lines, tids):
+        t = taxstring(tid, verbose)
         print("\t".join(p+t))
-    f.close()
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description='')
     parser.add_argument('-f', help='blast output file', required=True)
     parser.add_argument('-c', help='column that has the taxonomy ID', required=True, type=int)
+    parser.add_argument('-m', help='taxid map (from taxid_map.py). Then column -c has the GI or accession, not the taxonomy ID')
     parser.add_argument('-v', help='verbose output', action='store_true')
     args = parser.parse_args()
 
-    parse_blast(args.f, args.c, args.v)
+    taxmap = TaxidMap(args.m) if args.m else None
+    parse_blast(args.f, args.c, args.v, taxmap)
\ No newline at end of file
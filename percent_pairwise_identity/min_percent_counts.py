@@ -1,33 +1,17 @@
 import sys
+import argparse
 
-sl = [] # sorted list
-with open("RecA_uniprot_pairwise_ids.tsv", 'r') as f:
-#with open("temp", 'r') as f:
-    for l in f:
-        p=l.strip().split("\t")
-        val = float(p[2])
-        added = False
-        for i in range(len(sl)):
-            if sl[i] > val:
-                sl[i:i]=[val]
-                added=True
-                break
-        if not added:
-            sl.append(val)
+from roblib import read_identities, count_below
 
-indices = [-1 for i in range(100)]
-for i in range(len(sl)):
-    ni = int(sl[i])+1
-    sys.stderr.write("Adding {} for {}\n".format(ni, sl[i]))
-    indices[ni]=i
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Count the number of pairs below each percent identity')
+    parser.add_argument('-f', help='percent pairwise ID file (tsv, or a .npy condensed matrix)',
+                        default="RecA_uniprot_pairwise_ids.tsv")
+    args = parser.parse_args()
 
-print(sl)
-
-lastindex=-1
-for i in range(50, 70):
-    if indices[i] == -1:
-        indices[i] = lastindex
-    else:
-        lastindex = indices[i]
-    print("{}\t{}".format(i, indices[i]+1))
+    values = read_identities(args.f)
+    sys.stderr.write("Read {} percent identities\n".format(len(values)))
 
+    percents = list(range(50, 70))
+    for i, c in zip(percents, count_below(values, percents)):
+        print("{}\t{}".format(i, c))
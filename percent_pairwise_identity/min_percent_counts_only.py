@@ -6,39 +6,27 @@ These are text files that have one entry per line which is the percent ID and ar
 is last). They are derived from RecA_uniprot_pairwise_ids.tsv and
 integrase.similarity.tsv by using  cut -f 3 -d$'\t' integrase.similarity.tsv | sort -n
 
-The percent IDs are already sorted, and there is one entry per line.
+The percent IDs do not need to be sorted any more, and you can also use the tsv file or a .npy condensed matrix
+from pairwise_percent_ids.py directly.
 
 """
 
 
 
 import sys
+import argparse
 
-sl = [] # sorted list
-# 220000
-
-counter = 0; oco = 0;
-#with open("RecA_percents_sort.txt", 'r') as f:
-with open("integrase_percent_sort.txt", 'r') as f:
-    sys.stderr.write("File open. Lets go\n")
-    for l in f:
-        counter += 1
-        if (counter % 220000) == 0:
-            oco += 1
-            sys.stderr.write("Read {} : {}\n".format(oco, counter))
-        val = float(l.strip())
-        sl.append(val)
-
-indices = [-1 for i in range(110)]
-for i in range(len(sl)):
-    ni = int(sl[i])+1
-    indices[ni]=i
-
-lastindex=-1
-for i in range(1, 102):
-    if indices[i] == -1:
-        indices[i] = lastindex
-    else:
-        lastindex = indices[i]
-    print("{}\t{}".format(i-1, indices[i]+1))
+from roblib import read_identities, count_below
 
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Count the number of pairs at or below each percent identity')
+    parser.add_argument('-f', help='percent ID file', default="integrase_percent_sort.txt")
+    args = parser.parse_args()
+
+    values = read_identities(args.f)
+    sys.stderr.write("Read {} percent identities\n".format(len(values)))
+
+    # the number of pairs whose integer percent is at most i
+    percents = list(range(0, 101))
+    for i, c in zip(percents, count_below(values, [p + 1 for p in percents])):
+        print("{}\t{}".format(i, c))
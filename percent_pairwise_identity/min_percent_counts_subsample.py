@@ -3,6 +3,9 @@ import os
 import sys
 import argparse
 from random import random
+import numpy as np
+
+from roblib import count_below
 
 __author__ = 'Rob Edwards'
 
@@ -25,38 +28,21 @@ if __name__ == "__main__":
     for repeat in range(int(args.r)):
         sample_every  = 1.0 * int(args.n) / lines_in_file
         lines_in_file = 0
-        sl = [] # sorted list
+        sl = [] # the sampled percents
         with open(args.f, 'r') as f:
             for l in f:
                 lines_in_file+=1
                 if random() < sample_every:
                     p=l.strip().split("\t")
-                    val = float(p[2])
-                    added = False
-                    for i in range(len(sl)):
-                        if sl[i] > val:
-                            sl[i:i]=[val]
-                            added=True
-                            break
-                    if not added:
-                        sl.append(val)
+                    sl.append(float(p[2]))
                 if len(sl) >= int(args.n):
                     break
 
         sys.stderr.write("Repeat {} sampled the file {} times\n".format(repeat, len(sl)))
 
-        indices = [-1 for i in range(100)]
-        for i in range(len(sl)):
-            ni = int(sl[i])+1
-            sys.stderr.write("Adding {} for {}\n".format(ni, sl[i]))
-            indices[ni]=i
+        percents = list(range(50, 70))
+        counts = count_below(np.array(sl), percents)
 
         with open(os.path.join(args.d, "repeat_{}.tsv".format(repeat)), 'w') as out:
-            lastindex=-1
-            for i in range(50, 70):
-                if indices[i] == -1:
-                    indices[i] = lastindex
-                else:
-                    lastindex = indices[i]
-                out.write("{}\t{}\n".format(i, indices[i]+1))
-
+            for i, c in zip(percents, counts):
+                out.write("{}\t{}\n".format(i, c))
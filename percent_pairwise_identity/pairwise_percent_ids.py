@@ -8,47 +8,37 @@ import sys
 
 import argparse
 
+from roblib import PairwiseIdentity
+from roblib.compression import THREADS
 
-def read_fasta(filename):
-    seq = {}
-    seqid = None
-    prot = ''
-    with open(filename, 'r') as f:
-        for l in f:
-            if l.startswith('>'):
-                if seqid:
-                    seq[seqid] = prot
-                prot = ''
-                seqid = l.strip().replace('>', '')
-            else:
-                prot += l.strip()
-    seq[seqid] = prot
-    return seq
-
-
-def pairwise(seqs):
-    allseqs = seqs.keys()
-    allseqs.sort()
-    for i in range(len(allseqs)):
-        for j in range(len(allseqs)):
-            maxp = max(len(seqs[allseqs[i]]), len(seqs[allseqs[j]]))
-            same = 0
-            diff = 0
-            for p in range(maxp):
-                if seqs[allseqs[i]][p] == '-' and seqs[allseqs[j]][p] == '-':
-                    pass
-                if seqs[allseqs[i]][p] == seqs[allseqs[j]][p]:
-                    same += 1
-                else:
-                    diff += 1
-            print("{}\t{}\t{}".format(allseqs[i], allseqs[j], (1.0 * same/(same+diff))*100))
 
+def pairwise(pi, outfile=sys.stdout, unique=False, gap_aware=False, processes=THREADS, verbose=False):
+    """
+    Print the percent identity between all pairs of sequences
+    :param pi: the PairwiseIdentity of the alignment
+    :param outfile: the file to write to
+    :param unique: only print each pair once (otherwise we print both directions and each sequence against itself)
+    :param gap_aware: ignore positions that are gaps in both sequences
+    :param processes: the number of processes to use
+    :param verbose: more output
+    :return: nothing
+    """
+
+    pi.write(outfile, square=not unique, gap_aware=gap_aware, processes=processes, verbose=verbose)
 
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description="Calculate the percent pairwise ID between all pairs of sequences")
     parser.add_argument('-f', help='protein fasta file', required=True)
+    parser.add_argument('-o', help='output file. A .npy file is a condensed matrix of the unique pairs. Default: stdout')
+    parser.add_argument('-u', help='only print each pair once', action='store_true')
+    parser.add_argument('-g', help='ignore positions that are gaps in both sequences', action='store_true')
+    parser.add_argument('-p', help=f'number of processes (default: {THREADS})', type=int, default=THREADS)
+    parser.add_argument('-v', help='verbose output', action='store_true')
     args = parser.parse_args()
 
-    sq = read_fasta(args.f)
-    pairwise(sq)
+    sq = PairwiseIdentity.from_fasta(args.f, verbose=args.v)
+    if args.o and args.o.endswith('.npy'):
+        sq.condensed(args.o, gap_aware=args.g, processes=args.p, verbose=args.v)
+    else:
+        pairwise(sq, args.o if args.o else sys.stdout, args.u, args.g, args.p, args.v)
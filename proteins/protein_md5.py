@@ -1,50 +1,26 @@
 """
 Read one or more protein fasta files and calculate md5sums
+
+We only write each protein once, named by its md5sum, and with -s we keep the md5sums in a store so the next
+run only writes the proteins that are new.
 """
 
 import os
 import sys
 import argparse
-import hashlib
-from roblib import stream_fasta, bcolors
-
-def read_fasta(fafile, idmapfile, minlen=100, verbose=False):
-    """
-    Read a fasta file and return a dict of proteins and their md5 sums
-    :param fafile: fasta file
-    :param minlen: minimum protein sequence length (in amino acids) to be included
-    :param verbose: more output
-    :return:
-    """
-
-    if verbose:
-        sys.stderr.write(f"{bcolors.GREEN}Reading {fafile}{bcolors.ENDC}\n")
-
-    seqs = {}
-    with open(idmapfile, 'a') as idout:
-        for seqid, seq in stream_fasta(fafile):
-            # ignore a sequence with a stop codon
-            if '*' in seq:
-                continue
-            if len(seq) < minlen:
-                continue
-            md5 = hashlib.md5(seq.upper().encode('utf-8')).hexdigest()
-            seqs[md5] = seq
-            idout.write(f"{md5}\t{seqid}\n")
-
-    return seqs
-
-
-
+from roblib import Md5Store, dedup_proteins
+from roblib.compression import THREADS
 
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description=" ")
     parser.add_argument('-f', help='file')
     parser.add_argument('-d', help='directory of fasta files')
-    parser.add_argument('-i', help='id map file to write', required=True)
-    parser.add_argument('-m', help='minimum length of protein sequence to include (in amino acids). Default = 300', type=int, default=100)
+    parser.add_argument('-i', help='id map file to write. With an existing -s store we add to the end of it', required=True)
+    parser.add_argument('-m', help='minimum length of protein sequence to include (in amino acids). Default = 100', type=int, default=100)
     parser.add_argument('-o', help='output file')
+    parser.add_argument('-s', help='md5 store of the proteins we have already seen. It is updated with the new proteins')
+    parser.add_argument('-p', help=f'number of processes to use (default: {THREADS})', type=int, default=THREADS)
     parser.add_argument('-v', help='verbose output', action='store_true')
     args = parser.parse_args()
 
@@ -53,15 +29,18 @@ if __name__ == '__main__':
         sys.stderr.write("One of -f or -d must be provided. Please try again\n")
         sys.exit()
 
-    seqs = {}
+    files = []
     if args.f:
-        seqs.update(read_fasta(args.f, args.i, args.m, args.v))
+        files.append(args.f)
 
     if args.d:
-        for f in os.listdir(args.d):
-            seqs.update(read_fasta(os.path.join(args.d, f), args.i, args.m, args.v))
-
-    if args.o:
-        with open(args.o, 'w') as out:
-            for m in seqs:
-                out.write(f">{m}\n{seqs[m]}\n")
+        files += [os.path.join(args.d, f) for f in os.listdir(args.d)]
+
+    # if we have the store from an earlier run, we add to the id map from that run
+    append = bool(args.s) and os.path.exists(args.s)
+    store = Md5Store.load(args.s) if append else Md5Store()
+    # ignore a sequence with a stop codon
+    dedup_proteins(files, args.o, args.i, store, minlen=args.m, nostop=True, processes=args.p,
+                   append=append, verbose=args.v)
+    if args.s:
+        store.save(args.s)
@@ -1,34 +1,29 @@
 """
 Read a single protein fasta files and calculate md5sums for proteins
 
-NOTE: This is faster (not really fast), but only allows you to run one fasta
+NOTE: This keeps every protein, and hashes them in several processes. Use protein_md5.py to read lots of files
+or skip short proteins.
 """
 
 import os
 import sys
 import argparse
-import hashlib
-from roblib import stream_fasta, bcolors
+from roblib import Md5Store, dedup_proteins
+from roblib.compression import THREADS
 
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description=" ")
     parser.add_argument('-f', help='fasta file')
-    parser.add_argument('-i', help='id map file to write', required=True)
+    parser.add_argument('-i', help='id map file to write. With an existing -s store we add to the end of it', required=True)
     parser.add_argument('-o', help='output file', required=True)
+    parser.add_argument('-s', help='md5 store of the proteins we have already seen. It is updated with the new proteins')
+    parser.add_argument('-p', help=f'number of processes to use (default: {THREADS})', type=int, default=THREADS)
     args = parser.parse_args()
 
-    md5seen = set()
-    idseen = set()
-
-    with open(args.o, 'w') as out, open(args.i, 'w') as idout:
-        for seqid, seq in stream_fasta(args.f):
-            if seqid in idseen:
-                continue
-            idseen.add(seqid)
-            md5 = hashlib.md5(seq.upper().encode('utf-8')).hexdigest()
-            idout.write(f"{md5}\t{seqid}\n")
-            if md5 not in md5seen:
-                out.write(f">{md5}\n{seq}\n")
-            md5seen.add(md5)
-
+    # if we have the store from an earlier run, we add to the id map from that run
+    append = bool(args.s) and os.path.exists(args.s)
+    store = Md5Store.load(args.s) if append else Md5Store()
+    dedup_proteins(args.f, args.o, args.i, store, processes=args.p, append=append)
+    if args.s:
+        store.save(args.s)
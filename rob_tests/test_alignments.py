@@ -0,0 +1,110 @@
+import unittest
+
+import numpy as np
+
+from roblib.alignments import SubstitutionMatrix, align, align_score, align_many, edit_distance
+
+PROTEIN = 'ACDEFGHIKLMNPQRSTVWY'
+
+
+def rescore(a1, a2, matrix, gap_open, gap_extend):
+    """
+    The score of an alignment: each run of gaps in one sequence costs gap_open and then gap_extend per position
+    """
+
+    score = 0
+    gap = None
+    for x, y in zip(a1, a2):
+        if x == '-' or y == '-':
+            side = 1 if x == '-' else 2
+            score -= gap_extend if gap == side else gap_open
+            gap = side
+        else:
+            score += matrix.score(x, y)
+            gap = None
+    return score
+
+
+def gotoh(seq1, seq2, matrix, gap_open, gap_extend, local=False):
+    """
+    The best alignment score, with the textbook three matrix recursion
+    """
+
+    n, m = len(seq1), len(seq2)
+    neg = float('-inf')
+    H = [[neg] * (m + 1) for _ in range(n + 1)]
+    E = [[neg] * (m + 1) for _ in range(n + 1)]
+    F = [[neg] * (m + 1) for _ in range(n + 1)]
+    H[0][0] = 0
+    for i in range(1, n + 1):
+        H[i][0] = 0 if local else -gap_open - (i - 1) * gap_extend
+    for j in range(1, m + 1):
+        H[0][j] = 0 if local else -gap_open - (j - 1) * gap_extend
+    best = 0
+    for i in range(1, n + 1):
+        for j in range(1, m + 1):
+            E[i][j] = max(E[i - 1][j] - gap_extend, H[i - 1][j] - gap_open)
+            F[i][j] = max(F[i][j - 1] - gap_extend, H[i][j - 1] - gap_open)
+            H[i][j] = max(H[i - 1][j - 1] + matrix.score(seq1[i - 1], seq2[j - 1]), E[i][j], F[i][j])
+            if local:
+                H[i][j] = max(H[i][j], 0)
+                best = max(best, H[i][j])
+    return best if local else H[n][m]
+
+
+class AlignmentTestCase(unittest.TestCase):
+    def setUp(self):
+        self.matrix = SubstitutionMatrix()
+        self.rng = np.random.default_rng(7)
+
+    def random_seq(self, n):
+        return ''.join(self.rng.choice(list(PROTEIN), size=n))
+
+    def check(self, seq1, seq2, gap_open, gap_extend, local=False):
+        score, a1, a2 = align(seq1, seq2, self.matrix, gap_open, gap_extend, local)
+        if local:
+            self.assertIn(a1.replace('-', ''), seq1)
+            self.assertIn(a2.replace('-', ''), seq2)
+        else:
+            self.assertEqual(a1.replace('-', ''), seq1)
+            self.assertEqual(a2.replace('-', ''), seq2)
+        self.assertEqual(score, rescore(a1, a2, self.matrix, gap_open, gap_extend), f"{seq1} {seq2}\n{a1}\n{a2}")
+        self.assertEqual(score, gotoh(seq1, seq2, self.matrix, gap_open, gap_extend, local))
+        self.assertEqual(score, align_score(seq1, seq2, self.matrix, gap_open, gap_extend, local))
+
+    def test_long_gaps(self):
+        self.check('W', 'ACDEFGHIKLMNPQRSTVYACDEFGHIKLM', 2, 1)
+        self.check('WW', 'ACDEFGHIKLMNPQRSTVYACDEFGHIKLMNPQRS', 1, 1)
+        self.check('ACDEFGHIKLMNPQRSTVYACDEFGHIKLM', 'W', 2, 1)
+        self.assertEqual(align('W', 'ACDEFGHIKLMNPQRSTVYACDEFGHIKLM', self.matrix, 2, 1)[0], -29)
+
+    def test_random_alignments(self):
+        for _ in range(40):
+            seq1 = self.random_seq(self.rng.integers(1, 25))
+            seq2 = self.random_seq(self.rng.integers(1, 25))
+            for gap_open, gap_extend in ((11, 1), (2, 1), (1, 1), (5, 2)):
+                for local in (False, True):
+                    self.check(seq1, seq2, gap_open, gap_extend, local)
+
+    def test_banded_alignment_rescores(self):
+        for _ in range(20):
+            seq1 = self.random_seq(self.rng.integers(5, 40))
+            seq2 = self.random_seq(self.rng.integers(5, 40))
+            score, a1, a2 = align(seq1, seq2, self.matrix, 3, 1, band=3)
+            self.assertEqual(score, rescore(a1, a2, self.matrix, 3, 1))
+            self.assertEqual(score, align_score(seq1, seq2, self.matrix, 3, 1, band=3))
+            self.assertLessEqual(score, gotoh(seq1, seq2, self.matrix, 3, 1))
+
+    def test_align_many(self):
+        query = self.random_seq(30)
+        targets = [self.random_seq(n) for n in (1, 5, 30, 31, 60)]
+        scores = align_many(query, targets, self.matrix, 4, 1, batchsize=2)
+        self.assertEqual(list(scores), [gotoh(t, query, self.matrix, 4, 1) for t in targets])
+
+    def test_edit_distance(self):
+        self.assertEqual(edit_distance('kitten', 'sitting'), 3)
+        self.assertEqual(edit_distance('', 'abc'), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
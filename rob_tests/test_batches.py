@@ -0,0 +1,32 @@
+import os
+import shutil
+import tempfile
+import unittest
+import warnings
+
+import numpy as np
+
+from roblib import stream_fastq_batches
+
+
+class BatchesTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.fastq = os.path.join(self.tmpdir, 'reads.fastq')
+        with open(self.fastq, 'w') as out:
+            out.write("@r1\nACGT\n+\nIIII\n@r2\n\n+\n\n@r3\nAC\n+\n#I\n")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_mean_quality(self):
+        batch = next(stream_fastq_batches(self.fastq))
+        self.assertEqual(list(batch.lengths), [4, 0, 2])
+        with warnings.catch_warnings():
+            warnings.simplefilter('error')
+            means = batch.mean_quality()
+        self.assertTrue(np.array_equal(means, [40.0, 0.0, 21.0]))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,62 @@
+import io
+import os
+import gzip
+import shutil
+import tempfile
+import unittest
+
+from roblib import stream_blast_results, stream_blast_chunks, read_blast_table, stream_best_hits
+from roblib.blast import _SkipComments
+
+HITS = [
+    "HWI-ST:1:2#0/1\tcontig_1\t98.5\t100\t0\t1\t1\t100\t501\t600\t1e-40\t180.0",
+    "HWI-ST:1:2#0/1\tcontig_2\t90.0\t100\t1\t9\t1\t100\t11\t110\t1e-30\t150.0",
+    "read#2\tcontig_3\t100.0\t50\t0\t0\t1\t50\t1\t50\t1e-20\t99.0",
+    "read3\tcontig#4\t95.0\t80\t0\t4\t3\t82\t81\t2\t1e-25\t120.0",
+]
+
+OUTFMT7 = ["# BLASTN 2.9.0+", "# Query: HWI-ST:1:2#0/1", "# 2 hits found"] + HITS[:2] + \
+          ["# Query: read#2", "# 1 hits found", HITS[2], "# Query: read3", HITS[3], "# BLAST processed 3 queries"]
+
+
+class BlastTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.outfmt6 = os.path.join(self.tmpdir, 'hits.tsv')
+        with open(self.outfmt6, 'w') as out:
+            out.write("\n".join(HITS) + "\n")
+        self.outfmt7 = os.path.join(self.tmpdir, 'hits.outfmt7.tsv.gz')
+        with gzip.open(self.outfmt7, 'wt') as out:
+            out.write("\n".join(OUTFMT7) + "\n")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_hash_in_ids(self):
+        for f in (self.outfmt6, self.outfmt7):
+            df = read_blast_table(f)
+            self.assertEqual(list(df['query']), [h.split("\t")[0] for h in HITS])
+            self.assertEqual(list(df['db']), [h.split("\t")[1] for h in HITS])
+            self.assertEqual(list(df['db_end']), [600, 110, 50, 2])
+            self.assertEqual(df['alignment_length'].dtype, 'int32')
+
+    def test_chunks_match_streaming(self):
+        rows = [(b.query, b.db, b.bitscore) for b in stream_blast_results(self.outfmt7)]
+        chunked = [r for df in stream_blast_chunks(self.outfmt7, chunksize=1)
+                   for r in zip(df['query'], df['db'], df['bitscore'])]
+        self.assertEqual(rows, chunked)
+
+    def test_best_hits(self):
+        best = [r for df in stream_best_hits(self.outfmt7, chunksize=1) for r in zip(df['query'], df['db'])]
+        self.assertEqual(best, [('HWI-ST:1:2#0/1', 'contig_1'), ('read#2', 'contig_3'), ('read3', 'contig#4')])
+
+    def test_skip_comments(self):
+        data = "\n".join(OUTFMT7).encode()
+        expected = b"".join(h.encode() + b"\n" for h in HITS)
+        for blocksize in (1, 7, 64, 2 ** 20):
+            reader = io.BufferedReader(_SkipComments(io.BytesIO(data), blocksize))
+            self.assertEqual(reader.read(), expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
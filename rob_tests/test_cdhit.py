@@ -0,0 +1,105 @@
+import os
+import shutil
+import tempfile
+import unittest
+from contextlib import redirect_stderr
+from io import StringIO
+
+from roblib import CdHitClusters, split_clusters
+
+CLSTR = """>Cluster 0
+0\t300aa, >NC_001416_lambda_gen... *
+1\t298aa, >seq2... at 90.00%
+>Cluster 1
+0\t120aa, >seq3... *
+1\t118aa, >NC_001604_T7_protein... at 80.50%
+2\t110aa, >seq5... at 75.00%
+>Cluster 2
+0\t50aa, >seq6... *
+"""
+
+FASTA = """>seq3 a protein
+MKV
+>NC_001416_lambda_gene_1 terminase
+MSE
+>seq2
+MTT
+>NC_001604_T7_protein_2
+MQQ
+>seq6
+MWW
+>seq4
+MAA
+"""
+
+
+class CdHitTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.clstr = os.path.join(self.tmpdir, 'seqs.clstr')
+        with open(self.clstr, 'w') as out:
+            out.write(CLSTR)
+        self.fasta = os.path.join(self.tmpdir, 'seqs.fasta')
+        with open(self.fasta, 'w') as out:
+            out.write(FASTA)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def read_ids(self, fname):
+        with open(fname) as f:
+            return [l[1:].strip() for l in f if l.startswith('>')]
+
+    def test_clusters(self):
+        cl = CdHitClusters(self.clstr)
+        self.assertEqual(cl.sizes(), {0: 2, 1: 3, 2: 1})
+        self.assertEqual(cl.cluster_of('seq5'), 1)
+        self.assertEqual(cl.members(1), ['seq3', 'NC_001604_T7_protein', 'seq5'])
+        self.assertEqual(cl.representatives()[0], 'NC_001416_lambda_gen')
+
+    def test_split_truncated_ids(self):
+        outdir = os.path.join(self.tmpdir, 'clusters')
+        err = StringIO()
+        with redirect_stderr(err):
+            written = split_clusters(CdHitClusters(self.clstr), self.fasta, outdir, minsize=2)
+        self.assertEqual(written, {0: 2, 1: 2})
+        # the sequences are in the order of the fasta file, with the ids from the .clstr file
+        self.assertEqual(self.read_ids(os.path.join(outdir, '0.fa')), ['NC_001416_lambda_gen', 'seq2'])
+        self.assertEqual(self.read_ids(os.path.join(outdir, '1.fa')), ['seq3', 'NC_001604_T7_protein'])
+        self.assertFalse(os.path.exists(os.path.join(outdir, '2.fa')))
+        # seq5 is not in the fasta file, and we say so even without verbose
+        self.assertIn('1 sequences in the clusters were not found', err.getvalue())
+
+    def test_full_ids(self):
+        outdir = os.path.join(self.tmpdir, 'full')
+        with redirect_stderr(StringIO()):
+            split_clusters(CdHitClusters(self.clstr), self.fasta, outdir, minsize=2, full_ids=True)
+        self.assertEqual(self.read_ids(os.path.join(outdir, '0.fa')),
+                         ['NC_001416_lambda_gene_1 terminase', 'seq2'])
+        self.assertEqual(self.read_ids(os.path.join(outdir, '1.fa')), ['seq3 a protein', 'NC_001604_T7_protein_2'])
+
+    def test_descriptions_in_ids(self):
+        # cd-hit -d 0 keeps the whole definition line in the .clstr file
+        with open(self.clstr, 'w') as out:
+            out.write(">Cluster 0\n0\t300aa, >seq1 desc... *\n1\t298aa, >seq2 other... at 90.00%\n" +
+                      ">Cluster 1\n0\t120aa, >seq3... *\n")
+        with open(self.fasta, 'w') as out:
+            out.write(">seq1 desc\nMKV\n>seq2 other\nMSE\n>seq3 a protein\nMTT\n")
+        outdir = os.path.join(self.tmpdir, 'desc')
+        err = StringIO()
+        with redirect_stderr(err):
+            written = split_clusters(CdHitClusters(self.clstr), self.fasta, outdir)
+        self.assertEqual(written, {0: 2, 1: 1})
+        self.assertEqual(self.read_ids(os.path.join(outdir, '0.fa')), ['seq1 desc', 'seq2 other'])
+        self.assertEqual(self.read_ids(os.path.join(outdir, '1.fa')), ['seq3'])
+        self.assertEqual(err.getvalue(), '')
+
+    def test_whole_ids_only(self):
+        outdir = os.path.join(self.tmpdir, 'whole')
+        with redirect_stderr(StringIO()):
+            written = split_clusters(CdHitClusters(self.clstr), self.fasta, outdir, idlength=0)
+        self.assertEqual(written, {0: 1, 1: 1, 2: 1})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,67 @@
+import os
+import time
+import shutil
+import tempfile
+import unittest
+
+from roblib.compression import open_compressed, _threaded_blocks
+
+
+class _FailingFile(object):
+    """
+    A file that returns a few blocks and then raises an error
+    """
+
+    def __init__(self, blocks):
+        self.blocks = blocks
+        self.closed = False
+
+    def read(self, size):
+        if self.blocks:
+            self.blocks -= 1
+            return b'x' * size
+        raise IOError("the disk went away")
+
+    def close(self):
+        self.closed = True
+
+
+class CompressionTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_round_trip_text(self):
+        text = "café αβγ\n" * 1000
+        for ext in ('', '.gz'):
+            fname = os.path.join(self.tmpdir, 'text.txt' + ext)
+            with open_compressed(fname, 'wt') as out:
+                out.write(text)
+            with open_compressed(fname, 'rt') as f:
+                self.assertEqual(f.encoding, 'utf-8')
+                self.assertEqual(f.read(), text)
+
+    def test_reader_error(self):
+        blocks = _threaded_blocks(_FailingFile(1), 10)
+        self.assertEqual(next(blocks), b'x' * 10)
+        with self.assertRaises(IOError):
+            next(blocks)
+
+    def test_reader_stops_when_the_queue_is_full(self):
+        # the reader fills the queue and then hits an error, but we have stopped reading
+        fh = _FailingFile(5)
+        blocks = _threaded_blocks(fh, 10)
+        next(blocks)
+        time.sleep(0.2)
+        blocks.close()
+        for _ in range(50):
+            if fh.closed:
+                break
+            time.sleep(0.1)
+        self.assertTrue(fh.closed)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,45 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+try:
+    import pysam
+    from roblib.coverage import reference_depth, reference_depths
+except ImportError:
+    pysam = None
+
+
+@unittest.skipIf(pysam is None, "pysam is not installed")
+class CoverageTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.bam = os.path.join(self.tmpdir, 'reads.bam')
+        header = {'HD': {'VN': '1.6', 'SO': 'coordinate'}, 'SQ': [{'SN': 'ref1', 'LN': 20}]}
+        with pysam.AlignmentFile(self.bam, 'wb', header=header) as out:
+            # the third read has no CIGAR string, so it has no reference_end, and the last one is unmapped
+            reads = [(2, '5M', 'ACGTA', 0), (4, '3M2D3M', 'ACGTAC', 0), (5, None, 'ACGTA', 0), (6, '4M', 'ACGT', 4)]
+            for i, (start, cigar, seq, flag) in enumerate(reads):
+                a = pysam.AlignedSegment(out.header)
+                a.query_name = f"read{i}"
+                a.reference_id = 0
+                a.reference_start = start
+                a.mapping_quality = 30
+                a.flag = flag
+                if cigar:
+                    a.cigarstring = cigar
+                a.query_sequence = seq
+                out.write(a)
+        pysam.index(self.bam)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_reads_without_an_end(self):
+        expected = [0, 0, 1, 1, 2, 2, 2, 1, 1, 1, 1, 1, 0] + [0] * 7
+        self.assertEqual(list(reference_depth(self.bam, 'ref1')), expected)
+        self.assertEqual(list(reference_depths(self.bam, processes=1)['ref1']), expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,70 @@
+import os
+import json
+import math
+import shutil
+import tempfile
+import unittest
+
+from roblib import PlacementIndex, stream_placements
+
+JPLACE = {
+    "tree": "((A:0.1{0},B:0.2{1}):0.3{2},C:0.4{3});",
+    "placements": [
+        {"p": [[1, -100.0, 0.75, 0.05, 0.01], [0, -101.0, 0.25, 0.02, 0.03]], "nm": [["read1", 2]]},
+        {"p": [[3, -90.0, None, 0.1, None]], "n": ["read2", "read3"]},
+        {"p": [[1, -95.0, 1.0, 0.1, 0.2]], "nm": [["read4", 1]]}
+    ],
+    "fields": ["edge_num", "likelihood", "like_weight_ratio", "distal_length", "pendant_length"],
+    "version": 3,
+    "metadata": {"invocation": "pplacer"}
+}
+
+
+class JplaceTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.jplace = os.path.join(self.tmpdir, 'reads.jplace')
+        self.write(JPLACE)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def write(self, data):
+        with open(self.jplace, 'w') as out:
+            json.dump(data, out, indent=1)
+
+    def test_stream(self):
+        header = {}
+        placements = list(stream_placements(self.jplace, header))
+        self.assertEqual(placements, JPLACE['placements'])
+        self.assertEqual(header['fields'], JPLACE['fields'])
+        self.assertEqual(header['metadata'], JPLACE['metadata'])
+
+    def test_index(self):
+        pi = PlacementIndex(self.jplace)
+        self.assertEqual(len(pi), 5)
+        self.assertEqual(pi.reads_on_edge(1), ['read1', 'read4'])
+        self.assertEqual(pi.reads_on_edge(3), ['read2', 'read3'])
+        self.assertEqual(pi.reads_on_edge(2), [])
+        self.assertEqual(pi.edge_counts(), {0: 1, 1: 2, 3: 2})
+        self.assertEqual(pi.edge_counts(weighted=True)[1], 2.5)
+        self.assertEqual(pi.placements_by_edge('pendant_length')[1], {'read1': 0.02, 'read4': 0.2})
+
+    def test_null_values(self):
+        pi = PlacementIndex(self.jplace)
+        e = pi.edge(3)
+        self.assertTrue(all(math.isnan(v) for v in e['like_weight_ratio']))
+        self.assertTrue(all(math.isnan(v) for v in e['pendant_length']))
+        self.assertEqual(list(e['distal_length']), [0.1, 0.1])
+
+        JPLACE['placements'].append({"p": [[None, -1.0, 1.0, 0.1, 0.1]], "nm": [["read5", 1]]})
+        try:
+            self.write(JPLACE)
+        finally:
+            JPLACE['placements'].pop()
+        with self.assertRaises(ValueError):
+            PlacementIndex(self.jplace)
+
+
+if __name__ == '__main__':
+    unittest.main()
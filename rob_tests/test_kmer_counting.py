@@ -0,0 +1,63 @@
+import unittest
+
+import numpy as np
+
+from roblib import kmer_counting
+from roblib.kmer_counting import KmerCounts, count_kmers, encode, kmer_ints
+from roblib.dna import kmers, shannon
+
+
+class KmerCountingTestCase(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(42)
+        self.seqs = [''.join(rng.choice(list('ACGTN'), size=n, p=[0.24, 0.24, 0.24, 0.24, 0.04]))
+                     for n in (3, 50, 500, 5000)]
+
+    def test_dense_and_sparse_agree(self):
+        for k in (1, 3, 6):
+            for canonical in (False, True):
+                dense = count_kmers(self.seqs, k, canonical, dense=True)
+                sparse = count_kmers(self.seqs, k, canonical, dense=False)
+                auto = count_kmers(self.seqs, k, canonical)
+                self.assertTrue(dense.dense)
+                self.assertFalse(sparse.dense)
+                for c in (sparse, auto):
+                    self.assertTrue(np.array_equal(dense.kmers, c.kmers))
+                    self.assertTrue(np.array_equal(dense.counts, c.counts))
+                    self.assertTrue(np.array_equal(dense.dense_counts(), c.dense_counts()))
+                    self.assertEqual(dense.to_dict(), c.to_dict())
+                    self.assertAlmostEqual(dense.shannon(), c.shannon())
+
+    def test_auto_switches_to_dense(self):
+        short = count_kmers('ACGTACGTACGT', 8)
+        self.assertFalse(short.dense)
+        self.assertEqual(short['ACGTACGT'], 2)
+        k = 4
+        counts = KmerCounts(k)
+        ints = kmer_ints(encode(self.seqs[-1]), k)
+        counts.add(ints[:4 ** k // kmer_counting.DENSE_FRACTION])
+        self.assertFalse(counts.dense)
+        counts.add(ints[4 ** k // kmer_counting.DENSE_FRACTION:])
+        self.assertTrue(counts.dense)
+        self.assertEqual(counts.total(), len(ints))
+        self.assertTrue(np.array_equal(counts.dense_counts(), np.bincount(ints.astype(np.int64), minlength=4 ** k)))
+
+    def test_merge_dense_into_sparse(self):
+        a = count_kmers(self.seqs[:2], 3, dense=False)
+        b = count_kmers(self.seqs[2:], 3, dense=True)
+        whole = count_kmers(self.seqs, 3, dense=True)
+        a.merge(b)
+        self.assertTrue(np.array_equal(a.dense_counts(), whole.dense_counts()))
+
+    def test_evenness(self):
+        self.assertEqual(count_kmers('', 3).evenness(), 0.0)
+        self.assertEqual(count_kmers('AAAAAA', 3).evenness(), 0.0)
+        self.assertAlmostEqual(count_kmers('ACGT', 1).evenness(), 1.0)
+
+    def test_dna(self):
+        self.assertEqual(kmers('ACGTNacgt', 2), {'AC': 2, 'CG': 2, 'GT': 2})
+        self.assertAlmostEqual(shannon('AACC', 1), np.log(2))
+
+
+if __name__ == '__main__':
+    unittest.main()
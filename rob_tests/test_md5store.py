@@ -0,0 +1,95 @@
+import os
+import shutil
+import hashlib
+import tempfile
+import unittest
+
+import numpy as np
+
+from roblib import Md5Store, dedup_proteins
+from roblib.rob_error import Md5StoreError
+
+
+def md5(seq):
+    return hashlib.md5(seq.upper().encode()).hexdigest()
+
+
+class Md5StoreTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.seqs = ['MKV', 'MSE', 'MTT', 'MQQ', 'MWW']
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_add(self):
+        store = Md5Store()
+        new = store.add([md5(s) for s in ['MKV', 'MSE', 'MKV']])
+        self.assertEqual(list(new), [True, True, False])
+        new = store.add([md5(s) for s in ['MSE', 'MTT', 'MTT']])
+        self.assertEqual(list(new), [False, True, False])
+        self.assertEqual(len(store), 3)
+        self.assertIn(md5('MKV'), store)
+        self.assertNotIn(md5('MQQ'), store)
+        self.assertEqual(list(store), sorted(md5(s) for s in ['MKV', 'MSE', 'MTT']))
+        self.assertEqual(list(store.add([])), [])
+
+    def test_add_bytes(self):
+        digests = b"".join(hashlib.md5(s.encode()).digest() for s in self.seqs)
+        store = Md5Store(digests)
+        self.assertEqual(len(store), len(self.seqs))
+        self.assertTrue(store.contains(digests).all())
+        with self.assertRaises(Md5StoreError):
+            store.add(digests[:-1])
+
+    def test_save_and_load(self):
+        store = Md5Store([md5(s) for s in self.seqs])
+        fname = store.save(os.path.join(self.tmpdir, 'proteins.md5s'))
+        loaded = Md5Store.load(fname)
+        self.assertEqual(list(loaded), list(store))
+        # we can add to a memory mapped store and save it over the file it came from
+        self.assertEqual(list(loaded.add([md5('MAA'), md5('MKV')])), [True, False])
+        loaded.save(fname)
+        self.assertEqual(len(Md5Store.load(fname)), len(self.seqs) + 1)
+        empty = Md5Store().save(os.path.join(self.tmpdir, 'empty.md5s'))
+        self.assertEqual(len(Md5Store.load(empty)), 0)
+
+    def test_load_not_a_store(self):
+        fname = os.path.join(self.tmpdir, 'not.md5s')
+        with open(fname, 'w') as out:
+            out.write("not a store\n")
+        with self.assertRaises(Md5StoreError):
+            Md5Store.load(fname)
+
+    def test_merge(self):
+        a = Md5Store([md5(s) for s in self.seqs[:3]])
+        b = Md5Store([md5(s) for s in self.seqs[2:]])
+        bfile = b.save(os.path.join(self.tmpdir, 'b.md5s'))
+        merged = Md5Store.merge([a, bfile])
+        self.assertEqual(list(merged), sorted(md5(s) for s in self.seqs))
+        self.assertTrue(np.all(merged.digests[:-1] < merged.digests[1:]))
+
+    def test_dedup_proteins(self):
+        fasta = os.path.join(self.tmpdir, 'proteins.faa')
+        with open(fasta, 'w') as out:
+            out.write(">p1\nMKV\n>p2\nmkv\n>p3\nMSE*\n>p4\nMTTT\n")
+        outfile = os.path.join(self.tmpdir, 'nr.faa')
+        idmap = os.path.join(self.tmpdir, 'idmap.tsv')
+        store, kept, new = dedup_proteins(fasta, outfile, idmap, nostop=True, processes=1)
+        self.assertEqual((kept, new, len(store)), (3, 2, 2))
+        with open(outfile) as f:
+            self.assertEqual(f.read(), f">{md5('MKV')}\nMKV\n>{md5('MTTT')}\nMTTT\n")
+
+        # a second run with the same store only writes the new proteins, and adds to the id map
+        with open(fasta, 'w') as out:
+            out.write(">p5\nMKV\n>p6\nMWW\n")
+        store, kept, new = dedup_proteins(fasta, outfile, idmap, store, processes=1, append=True)
+        self.assertEqual((kept, new, len(store)), (2, 1, 3))
+        with open(outfile) as f:
+            self.assertEqual(f.read(), f">{md5('MWW')}\nMWW\n")
+        with open(idmap) as f:
+            self.assertEqual([l.split("\t")[1].strip() for l in f], ['p1', 'p2', 'p4', 'p5', 'p6'])
+
+
+if __name__ == '__main__':
+    unittest.main()
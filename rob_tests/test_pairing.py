@@ -0,0 +1,69 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from roblib import pair_fastq
+from roblib.pairing import pair_key
+
+
+def fastq(ids):
+    return "".join(f"@{i}\nACGT\n+\nIIII\n" for i in ids)
+
+
+class PairingTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def pair(self, left, right, memory=2 ** 20):
+        files = []
+        for side, ids in (('left', left), ('right', right)):
+            files.append(os.path.join(self.tmpdir, f"{side}.fastq"))
+            with open(files[-1], 'w') as out:
+                out.write(fastq(ids))
+        outputs = [os.path.join(self.tmpdir, f"{n}.fastq") for n in ('lp', 'rp', 'ls', 'rs')]
+        counts = pair_fastq(*files, *outputs, memory=memory)
+        ids = []
+        for o in outputs:
+            with open(o) as f:
+                ids.append([l[1:].strip() for i, l in enumerate(f) if i % 4 == 0])
+        return counts, ids
+
+    def test_pair_key(self):
+        self.assertEqual(pair_key(b'r1/1 desc', b'/1'), b'r1')
+        self.assertEqual(pair_key(b'r1/2', b'/1'), b'r1/2')
+        self.assertEqual(pair_key(b'SRR123.1'), b'SRR123.1')
+
+    def test_suffixes(self):
+        for memory in (2 ** 20, 30):
+            counts, (lp, rp, ls, rs) = self.pair(['a/1', 'b/1', 'c/1'], ['b/2', 'c/2', 'd/2'], memory)
+            self.assertEqual(counts['method'], 'streaming' if memory > 30 else 'partitioned')
+            self.assertEqual(counts['paired'], 2)
+            self.assertEqual(sorted(zip(lp, rp)), [('b/1', 'b/2'), ('c/1', 'c/2')])
+            self.assertEqual((ls, rs), (['a/1'], ['d/2']))
+
+    def test_sra_spot_ids(self):
+        # spot 1 is only in the left file, so the first two ids are SRR123.1 and SRR123.2
+        for memory in (2 ** 20, 30):
+            counts, (lp, rp, ls, rs) = self.pair(['SRR123.1', 'SRR123.2', 'SRR123.3'], ['SRR123.2', 'SRR123.3'],
+                                                 memory)
+            self.assertEqual(sorted(zip(lp, rp)), [('SRR123.2', 'SRR123.2'), ('SRR123.3', 'SRR123.3')])
+            self.assertEqual((ls, rs), (['SRR123.1'], []))
+
+    def test_repeated_ids(self):
+        for memory in (2 ** 20, 30):
+            counts, (lp, rp, ls, rs) = self.pair(['x', 'a', 'a', 'b'], ['b', 'y', 'z', 'a'], memory)
+            self.assertEqual(sorted(zip(lp, rp)), [('a', 'a'), ('b', 'b')])
+            self.assertEqual((len(ls), len(rs)), (2, 2))
+            self.assertEqual((counts['left_singles'], counts['right_singles']), (2, 2))
+
+    def test_no_memory(self):
+        with self.assertRaises(ValueError):
+            self.pair(['a'], ['a'], memory=0)
+
+
+if __name__ == '__main__':
+    unittest.main()
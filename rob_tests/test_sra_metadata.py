@@ -0,0 +1,153 @@
+import os
+import gzip
+import shutil
+import tempfile
+import unittest
+
+import pyarrow.parquet as pq
+
+from roblib import stream_biosamples, stream_runs, xml_table
+from roblib.sra_metadata import BIOSAMPLE_COLUMNS, RUN_COLUMNS, parse_sra_sample
+
+BIOSAMPLES = """<?xml version="1.0" encoding="UTF-8"?>
+<BioSampleSet>
+<BioSample access="public" publication_date="2019-01-01T00:00:00.000" last_update="2019-02-01T00:00:00.000"
+    submission_date="2018-12-01T00:00:00.000" id="{id}" accession="SAMN{id}">
+  <Ids>
+    <Id db="BioSample" is_primary="1">SAMN{id}</Id>
+    <Id db_label="Sample name">sample {id}</Id>
+    <Id db="SRA">SRS{id}</Id>
+  </Ids>
+  <Description>
+    <Title>Metagenome {id}</Title>
+    <Organism taxonomy_id="256318" taxonomy_name="metagenome"/>
+    <Comment><Paragraph>A <b>test</b> sample</Paragraph></Comment>
+  </Description>
+  <Owner><Name>Flinders University</Name><Contacts><Contact email="rob@example.com"/></Contacts></Owner>
+  <Status status="live" when="2019-01-01T00:00:00.000"/>
+  <Links><Link type="entrez" target="bioproject" label="PRJNA1">1</Link></Links>
+  <Package>MIMS.me.6.0</Package>
+  <Attributes>
+    <Attribute attribute_name="collection_date" harmonized_name="collection_date">2018</Attribute>
+    <Attribute attribute_name="{attr}">{value}</Attribute>
+    <Attribute attribute_name="{attr}">other</Attribute>
+    <Attribute attribute_name="empty"></Attribute>
+  </Attributes>
+</BioSample>
+</BioSampleSet>
+"""
+
+RUNS = """<?xml version="1.0" encoding="UTF-8"?>
+<RUN_SET>
+  <RUN accession="SRR1" alias="run one" center_name="SDSU" total_spots="100" total_bases="15000" size="9000"
+      published="2019-01-01 00:00:00">
+    <IDENTIFIERS><PRIMARY_ID>SRR1</PRIMARY_ID></IDENTIFIERS>
+    <TITLE>Illumina run</TITLE>
+    <EXPERIMENT_REF accession="SRX1"/>
+    <RUN_ATTRIBUTES>
+      <RUN_ATTRIBUTE><TAG>run_center</TAG><VALUE>SDSU</VALUE></RUN_ATTRIBUTE>
+    </RUN_ATTRIBUTES>
+  </RUN>
+  <RUN accession="SRR2">
+    <IDENTIFIERS><PRIMARY_ID>SRR2</PRIMARY_ID></IDENTIFIERS>
+    <EXPERIMENT_REF><IDENTIFIERS><PRIMARY_ID>SRX2</PRIMARY_ID></IDENTIFIERS></EXPERIMENT_REF>
+  </RUN>
+</RUN_SET>
+"""
+
+SAMPLE = """<?xml version="1.0" encoding="UTF-8"?>
+<SAMPLE_SET>
+  <SAMPLE accession="SRS1">
+    <IDENTIFIERS><PRIMARY_ID>SRS1</PRIMARY_ID></IDENTIFIERS>
+    <TITLE>Coral metagenome</TITLE>
+    <SAMPLE_NAME><TAXON_ID>412755</TAXON_ID><SCIENTIFIC_NAME>coral metagenome</SCIENTIFIC_NAME></SAMPLE_NAME>
+    <SAMPLE_LINKS>
+      <SAMPLE_LINK><XREF_LINK><DB>bioproject</DB><ID>PRJNA1</ID></XREF_LINK></SAMPLE_LINK>
+    </SAMPLE_LINKS>
+    <SAMPLE_ATTRIBUTES>
+      <SAMPLE_ATTRIBUTE><TAG>depth</TAG><VALUE>10 m</VALUE></SAMPLE_ATTRIBUTE>
+    </SAMPLE_ATTRIBUTES>
+  </SAMPLE>
+</SAMPLE_SET>
+"""
+
+
+class SraMetadataTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.biosamples = [os.path.join(self.tmpdir, 'biosample_set.1.xml.gz'),
+                           os.path.join(self.tmpdir, 'biosample_set.2.xml')]
+        with gzip.open(self.biosamples[0], 'wt') as out:
+            out.write(BIOSAMPLES.format(id=1, attr='host', value='Homo sapiens'))
+        with open(self.biosamples[1], 'w') as out:
+            out.write(BIOSAMPLES.format(id=2, attr='depth', value='10 m'))
+        self.runs = os.path.join(self.tmpdir, 'run.xml')
+        with open(self.runs, 'w') as out:
+            out.write(RUNS)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_stream_biosamples(self):
+        rows = list(stream_biosamples(self.biosamples[0]))
+        self.assertEqual(len(rows), 1)
+        row = rows[0]
+        self.assertEqual(row['Accession'], 'SAMN1')
+        self.assertEqual(row['Ids'], 'BioSample|SAMN1; Sample|sample 1; SRA|SRS1')
+        self.assertEqual(row['Comment'], 'A test sample')
+        self.assertEqual((row['Organism'], row['TaxonomyId']), ('metagenome', '256318'))
+        self.assertEqual(row['OwnerEmail'], 'rob@example.com')
+        self.assertEqual(row['Links'], 'bioproject|1')
+        self.assertEqual(row['collection_date'], '2018')
+        self.assertEqual(row['host'], 'Homo sapiens; other')
+        self.assertNotIn('empty', row)
+
+    def test_stream_runs(self):
+        rows = list(stream_runs(self.runs))
+        self.assertEqual([r['Accession'] for r in rows], ['SRR1', 'SRR2'])
+        self.assertEqual([r['Experiment'] for r in rows], ['SRX1', 'SRX2'])
+        self.assertEqual((rows[0]['TotalSpots'], rows[0]['Title'], rows[0]['run_center']),
+                         ('100', 'Illumina run', 'SDSU'))
+        self.assertIsNone(rows[1]['Title'])
+
+    def test_parse_sra_sample(self):
+        sample = os.path.join(self.tmpdir, 'SRA1.sample.xml')
+        with open(sample, 'w') as out:
+            out.write(SAMPLE)
+        self.assertEqual(parse_sra_sample(sample), {'primary_id': 'SRS1', 'title': 'Coral metagenome',
+                                                    'scientific_name': 'coral metagenome', 'taxon_id': '412755',
+                                                    'xref': 'bioproject|PRJNA1', 'depth': '10 m'})
+
+    def test_xml_table(self):
+        tsv = os.path.join(self.tmpdir, 'biosamples.tsv')
+        self.assertEqual(xml_table(self.biosamples, tsv, processes=1), 2)
+        with open(tsv) as f:
+            header = f.readline().rstrip("\n").split("\t")
+            rows = [dict(zip(header, l.rstrip("\n").split("\t"))) for l in f]
+        # the columns from both files, with the attributes after the BioSample columns
+        self.assertEqual(header, BIOSAMPLE_COLUMNS + ['collection_date', 'depth', 'host'])
+        self.assertEqual([(r['Accession'], r['host'], r['depth']) for r in rows],
+                         [('SAMN1', 'Homo sapiens; other', ''), ('SAMN2', '', '10 m; other')])
+
+        parquet = os.path.join(self.tmpdir, 'biosamples.parquet')
+        self.assertEqual(xml_table(self.biosamples, parquet, processes=1, minocc=2, batchsize=1), 2)
+        t = pq.read_table(parquet)
+        self.assertEqual(t.column_names, BIOSAMPLE_COLUMNS + ['collection_date'])
+        self.assertEqual(t.column('Accession').to_pylist(), ['SAMN1', 'SAMN2'])
+
+    def test_empty_table(self):
+        empty = os.path.join(self.tmpdir, 'empty.xml')
+        with open(empty, 'w') as out:
+            out.write('<?xml version="1.0" encoding="UTF-8"?>\n<RUN_SET>\n</RUN_SET>\n')
+        tsv = os.path.join(self.tmpdir, 'runs.tsv')
+        self.assertEqual(xml_table(empty, tsv, kind='run', processes=1), 0)
+        with open(tsv) as f:
+            self.assertEqual(f.read(), "\t".join(RUN_COLUMNS) + "\n")
+        parquet = os.path.join(self.tmpdir, 'runs.parquet')
+        self.assertEqual(xml_table(empty, parquet, kind='run', processes=1), 0)
+        t = pq.read_table(parquet)
+        self.assertEqual((t.column_names, len(t)), (RUN_COLUMNS, 0))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,82 @@
+import os
+import gzip
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+
+import taxon.taxid_map
+from taxon import TaxidMap, build_taxid_map
+
+
+class TaxidMapTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        rng = np.random.default_rng(11)
+        self.gis = rng.permutation(np.arange(1, 5001) * 7)
+        self.taxids = rng.integers(1, 50, size=len(self.gis))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def build(self, lines, name):
+        dump = os.path.join(self.tmpdir, f'{name}.gz')
+        with gzip.open(dump, 'wt') as out:
+            out.write("".join(lines))
+        mapfile = os.path.join(self.tmpdir, f'{name}.taxmap')
+        # small blocks and merge buffers so we merge a lot of sorted runs
+        with mock.patch.object(taxon.taxid_map, 'BLOCKSIZE', 4096), \
+                mock.patch.object(taxon.taxid_map, 'SORT_ENTRIES', 2000):
+            build_taxid_map(dump, mapfile)
+        self.assertEqual(sorted(os.listdir(self.tmpdir)), [f'{name}.gz', f'{name}.taxmap'])
+        return TaxidMap(mapfile)
+
+    def test_gi_map(self):
+        m = self.build([f"{g}\t{t}\n" for g, t in zip(self.gis, self.taxids)], 'gi')
+        self.assertEqual(len(m), len(self.gis))
+        self.assertTrue(np.all(m.keys[1:] > m.keys[:-1]))
+        self.assertEqual(list(m.lookup(self.gis)), list(self.taxids))
+        self.assertEqual(list(m.lookup(['8', 'x', 7])), [0, 0, self.taxids[list(self.gis).index(7)]])
+        self.assertTrue(np.all(m.columns['rev_taxids'][1:] >= m.columns['rev_taxids'][:-1]))
+        for t in (1, 20, 49):
+            self.assertEqual(list(m.keys_for_taxid(t)), sorted(self.gis[self.taxids == t]))
+
+    def test_accession_map(self):
+        acc = [f"{'X' * (i % 9)}P_{g}" for i, g in enumerate(self.gis)]
+        lines = ["accession\taccession.version\ttaxid\tgi\n"]
+        lines += [f"{a}\t{a}.1\t{t}\t{g}\n" for a, g, t in zip(acc, self.gis, self.taxids)]
+        m = self.build(lines, 'acc')
+        self.assertEqual(m.key_type, np.dtype(f'S{max(len(a) for a in acc)}'))
+        self.assertEqual(list(m.lookup([a + '.2' for a in acc])), list(self.taxids))
+        self.assertEqual(list(m.keys_for_taxid(3)), sorted(a.encode() for a, t in zip(acc, self.taxids) if t == 3))
+
+    def test_duplicate_keys(self):
+        # the first entry for a key wins, however the runs are split
+        m = self.build([f"{g % 500}\t{i + 1}\n" for i, g in enumerate(self.gis)], 'dup')
+        first = {}
+        for i, g in enumerate(self.gis):
+            first.setdefault(g % 500, i + 1)
+        self.assertEqual(list(m.lookup(sorted(first))), [first[g] for g in sorted(first)])
+
+    def test_merge_is_stable(self):
+        # the first run has more of the key than fits in its buffer
+        runs = [[np.full(3000, 5, dtype=np.uint64), np.arange(3000, dtype=np.uint32)],
+                [np.array([1, 5, 5, 9], dtype=np.uint64), np.arange(3000, 3004, dtype=np.uint32)]]
+        runs = [taxon.taxid_map._write_run(self.tmpdir, r) for r in runs]
+        keys = np.zeros(3004, dtype=np.uint64)
+        values = np.zeros(3004, dtype=np.uint32)
+        with mock.patch.object(taxon.taxid_map, 'SORT_ENTRIES', 2000):
+            taxon.taxid_map._merge_runs(runs, [keys, values])
+        self.assertEqual(list(keys), [1] + [5] * 3002 + [9])
+        self.assertEqual(list(values), [3000] + list(range(3000)) + [3001, 3002, 3003])
+
+    def test_empty(self):
+        m = self.build([], 'empty')
+        self.assertEqual(len(m), 0)
+        self.assertEqual(list(m.lookup([1, 2])), [0, 0])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,47 @@
+import itertools
+import unittest
+import warnings
+
+from roblib import translate_dna, codon_table, find_orfs
+from roblib.translate import IUPAC_MASKS, encode_bases
+
+try:
+    from Bio.Seq import Seq
+    from Bio.Data.CodonTable import unambiguous_dna_by_id
+except ImportError:
+    Seq = None
+
+IUPAC = sorted(b for b in IUPAC_MASKS if b != 'U')
+
+
+class TranslateTestCase(unittest.TestCase):
+    def test_translate(self):
+        self.assertEqual(translate_dna('ATGAAATAG'), 'MK*')
+        self.assertEqual(translate_dna('atgaaatga', code=4), 'MKW')
+        self.assertEqual(translate_dna('RAYSARMTTNNN'), 'BZJX')
+
+    def test_stop_or_sense(self):
+        self.assertEqual(translate_dna('TAATAGTGA', code=27), 'QQW')
+        self.assertEqual(translate_dna('TAATAGTGA', code=28), 'QQW')
+        self.assertEqual(translate_dna('TAATAGTGA', code=31), 'EEW')
+        ct = codon_table(31)
+        self.assertEqual(list(ct.stop_or_sense[ct.codons(encode_bases('TAATAGTGA'))[::3]]), [True, True, False])
+        self.assertEqual(find_orfs('ATGTAAAAATAG' * 4, code=31, minlen=10), [])
+
+    @unittest.skipIf(Seq is None, "Biopython is not installed")
+    def test_same_as_biopython(self):
+        codons = ["".join(c) for c in itertools.product(IUPAC, repeat=3)]
+        for code in (1, 2, 4, 11, 27, 28, 31):
+            ours = translate_dna("".join(codons), code=code)
+            with warnings.catch_warnings():
+                warnings.simplefilter('ignore')
+                theirs = [str(Seq(c).translate(table=code)) for c in codons]
+            for codon, a, b in zip(codons, ours, theirs):
+                self.assertEqual(a, b, f"{codon} in table {code}")
+            ct = codon_table(code)
+            starts = {c for c in codons if set(c) <= set('ACGT') and ct.starts[ct.codons(encode_bases(c))[0]]}
+            self.assertEqual(starts, set(unambiguous_dna_by_id[code].start_codons), f"start codons in table {code}")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -5,31 +5,69 @@ __author__ = 'Rob Edwards'
 from .stats import mean, median, stdev
 from .sequences import read_fasta, readFasta, stream_fastq, stream_fasta, stream_paired_fastq, stream_gfa_sequences
 from .sequences import write_fastq, qual_to_numbers
+from .compression import open_compressed
+from .batches import SequenceBatch, stream_fastq_batches, stream_fasta_batches
+from .seqindex import index_sequences, SequenceIndex
+from .pairing import pair_fastq
+from .kmer_counting import KmerCounts, count_kmers, count_kmers_in_file, positional_base_counts
+from .kmer_files import count_kmers_to_file, write_kmer_counts, merge_kmer_files, KmerCountFile, kmer_jaccard
 from .dna import rc, shannon
 from .geography import latlon2distance
 from .strings import ascii_clean
 from .functions import is_hypothetical
-from .newick import Newick_Tree
+from .newick import Newick_Tree, NewickTree, parse_newick, read_newick, stream_newick
+from .cophenetic import CopheneticDistances, cophenetic_matrix
+from .jplace import stream_placements, parse_jplace_tree, PlacementIndex
 from .dnadist import parse_dnadist
-from .blast import stream_blast_results
-from .translate import translate_dna
+from .pairwise_identity import PairwiseIdentity, encode_alignment, read_identities, count_below
+from .alignments import SubstitutionMatrix, align, align_score, align_many, edit_distance
+from .cdhit import CdHitClusters, split_clusters
+from .readids import ReadIdSet, filter_fastq_by_ids
+from .md5store import Md5Store, dedup_proteins
+from .sra_metadata import iter_elements, stream_biosamples, stream_runs, xml_table
+from .blast import stream_blast_results, stream_blast_chunks, read_blast_table, filter_blast, best_hits, stream_best_hits
+from .translate import translate_dna, translate_batch, six_frame_translation, find_orfs, stream_orfs, codon_table
+from .translate import CodonTable
 from .bcolors import bcolors
-from .rob_error import SequencePairError, FastqFormatError
+from .rob_error import SequencePairError, FastqFormatError, SequenceIndexError, KmerCountError, NewickError
+from .rob_error import ReadIdError, HmmerError, Md5StoreError
 from .colours import colours, colors, message
 from .genbank import genbank_to_faa, genbank_to_fna, genbank_to_orfs, genbank_seqio
-from .genbank import genbank_to_ptt, genbank_to_functions, feature_id, genbank_to_pandas
+from .genbank import genbank_to_ptt, genbank_to_functions, feature_id, genbank_to_pandas, genbank_records
+from .genbank_scanner import scan_genbank, parse_location
+from .genbank_pipeline import convert_genbank, convert_genbank_files, make_writers, GenbankWriter
+from .hmmer import run_hmmer, HmmerHits, stream_hmmer_table, genbank_proteins, protein_batches
 
 __all__ = [
     'mean', 'median', 'stdev',
     'read_fasta', 'readFasta', 'stream_fastq', 'stream_fasta', 'stream_paired_fastq', 'stream_gfa_sequences',
     'write_fastq', 'qual_to_numbers',
+    'open_compressed',
+    'SequenceBatch', 'stream_fastq_batches', 'stream_fasta_batches',
+    'index_sequences', 'SequenceIndex',
+    'pair_fastq',
+    'KmerCounts', 'count_kmers', 'count_kmers_in_file', 'positional_base_counts',
+    'count_kmers_to_file', 'write_kmer_counts', 'merge_kmer_files', 'KmerCountFile', 'kmer_jaccard',
     'rc', 'shannon',
     'latlon2distance',
-    'ascii_clean', 'is_hypothetical', 'Newick_Tree', 'parse_dnadist',
-    'stream_blast_results',
-    'translate_dna',
+    'ascii_clean', 'is_hypothetical', 'parse_dnadist',
+    'Newick_Tree', 'NewickTree', 'parse_newick', 'read_newick', 'stream_newick',
+    'CopheneticDistances', 'cophenetic_matrix',
+    'stream_placements', 'parse_jplace_tree', 'PlacementIndex',
+    'PairwiseIdentity', 'encode_alignment', 'read_identities', 'count_below',
+    'SubstitutionMatrix', 'align', 'align_score', 'align_many', 'edit_distance',
+    'CdHitClusters', 'split_clusters',
+    'ReadIdSet', 'filter_fastq_by_ids',
+    'Md5Store', 'dedup_proteins',
+    'iter_elements', 'stream_biosamples', 'stream_runs', 'xml_table',
+    'stream_blast_results', 'stream_blast_chunks', 'read_blast_table', 'filter_blast', 'best_hits', 'stream_best_hits',
+    'translate_dna', 'translate_batch', 'six_frame_translation', 'find_orfs', 'stream_orfs', 'codon_table',
+    'CodonTable',
     'bcolors', 'colours', 'colors', 'message',
-    'SequencePairError', 'FastqFormatError',
+    'SequencePairError', 'FastqFormatError', 'SequenceIndexError', 'KmerCountError', 'NewickError', 'ReadIdError',
+    'HmmerError', 'Md5StoreError',
     'genbank_to_faa', 'genbank_to_fna', 'genbank_to_orfs', 'genbank_to_ptt', 'genbank_seqio', 'genbank_to_functions',
-    'feature_id', 'genbank_to_pandas'
+    'feature_id', 'genbank_to_pandas', 'genbank_records', 'scan_genbank', 'parse_location',
+    'convert_genbank', 'convert_genbank_files', 'make_writers', 'GenbankWriter',
+    'run_hmmer', 'HmmerHits', 'stream_hmmer_table', 'genbank_proteins', 'protein_batches'
     ]
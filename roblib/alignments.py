@@ -1,40 +1,401 @@
+"""
+Pairwise sequence alignment with numpy.
+
+Sequences are encoded as integers and scored with a precomputed substitution matrix. We fill the
+dynamic programming matrix a row at a time, so each row is a handful of numpy operations: the
+insertions along the row (which depend on the cell to the left) are calculated with a running maximum.
+A score-only alignment keeps just one row in memory, and you can restrict the alignment to a band around
+the diagonal. align_many aligns one query against a batch of targets at the same time, using a profile of
+the query scored against every residue.
+
+Gaps cost gap_open for the first position and gap_extend for each additional position (with
+gap_open >= gap_extend).
+
+    m = SubstitutionMatrix()                    # BLOSUM62
+    score, a1, a2 = align(seq1, seq2, m)        # global alignment
+    score = align_score(seq1, seq2, m, local=True)
+    scores = align_many(query, targets, m)
+"""
+
+import sys
+import numpy as np
+
 __author__ = 'Rob Edwards'
 
-def ed_neighborsof(i,j, scorematrix):
-    neighbors = []
-
-    if i - 1 >= 0 and j - 1 >= 0:
-        neighbors.append(scorematrix[i-1][j-1])
-        neighbors.append(scorematrix[i-1][j])
-        neighbors.append(scorematrix[i][j-1])
-    elif i - 1 >= 0:
-        neighbors.append(scorematrix[i-1][j])
-        #neighbors.append(j+1)
-    elif j - 1 >= 0:
-        neighbors.append(scorematrix[i][j-1])
-        #neighbors.append(i+1)
-    else:
-        neighbors.append(0)
+# BLOSUM62 from NCBI
+_BLOSUM62 = """
+   A  R  N  D  C  Q  E  G  H  I  L  K  M  F  P  S  T  W  Y  V  B  Z  X  *
+A  4 -1 -2 -2  0 -1 -1  0 -2 -1 -1 -1 -1 -2 -1  1  0 -3 -2  0 -2 -1  0 -4
+R -1  5  0 -2 -3  1  0 -2  0 -3 -2  2 -1 -3 -2 -1 -1 -3 -2 -3 -1  0 -1 -4
+N -2  0  6  1 -3  0  0  0  1 -3 -3  0 -2 -3 -2  1  0 -4 -2 -3  3  0 -1 -4
+D -2 -2  1  6 -3  0  2 -1 -1 -3 -4 -1 -3 -3 -1  0 -1 -4 -3 -3  4  1 -1 -4
+C  0 -3 -3 -3  9 -3 -4 -3 -3 -1 -1 -3 -1 -2 -3 -1 -1 -2 -2 -1 -3 -3 -2 -4
+Q -1  1  0  0 -3  5  2 -2  0 -3 -2  1  0 -3 -1  0 -1 -2 -1 -2  0  3 -1 -4
+E -1  0  0  2 -4  2  5 -2  0 -3 -3  1 -2 -3 -1  0 -1 -3 -2 -2  1  4 -1 -4
+G  0 -2  0 -1 -3 -2 -2  6 -2 -4 -4 -2 -3 -3 -2  0 -2 -2 -3 -3 -1 -2 -1 -4
+H -2  0  1 -1 -3  0  0 -2  8 -3 -3 -1 -2 -1 -2 -1 -2 -2  2 -3  0  0 -1 -4
+I -1 -3 -3 -3 -1 -3 -3 -4 -3  4  2 -3  1  0 -3 -2 -1 -3 -1  3 -3 -3 -1 -4
+L -1 -2 -3 -4 -1 -2 -3 -4 -3  2  4 -2  2  0 -3 -2 -1 -2 -1  1 -4 -3 -1 -4
+K -1  2  0 -1 -3  1  1 -2 -1 -3 -2  5 -1 -3 -1  0 -1 -3 -2 -2  0  1 -1 -4
+M -1 -1 -2 -3 -1  0 -2 -3 -2  1  2 -1  5  0 -2 -1 -1 -1 -1  1 -3 -1 -1 -4
+F -2 -3 -3 -3 -2 -3 -3 -3 -1  0  0 -3  0  6 -4 -2 -2  1  3 -1 -3 -3 -1 -4
+P -1 -2 -2 -1 -3 -1 -1 -2 -2 -3 -3 -1 -2 -4  7 -1 -1 -4 -3 -2 -2 -1 -2 -4
+S  1 -1  1  0 -1  0  0  0 -1 -2 -2  0 -1 -2 -1  4  1 -3 -2 -2  0  0  0 -4
+T  0 -1  0 -1 -1 -1 -1 -2 -2 -1 -1 -1 -1 -2 -1  1  5 -2 -2  0 -1 -1  0 -4
+W -3 -3 -4 -4 -2 -2 -3 -2 -2 -3 -2 -3 -1  1 -4 -3 -2 11  2 -3 -4 -3 -2 -4
+Y -2 -2 -2 -3 -2 -1 -2 -3  2 -1 -1 -2 -1  3 -3 -2 -2  2  7 -1 -3 -2 -1 -4
+V  0 -3 -3 -3 -1 -2 -2 -3 -3  3  1 -2  1 -1 -2 -2  0 -3 -1  4 -3 -2 -1 -4
+B -2 -1  3  4 -3  0  1 -1  0 -3 -4  0 -3 -3 -2  0 -1 -4 -3 -3  4  1 -1 -4
+Z -1  0  0  1 -3  3  4 -2  0 -3 -3  1 -1 -3 -1  0 -1 -3 -2 -2  1  4 -1 -4
+X  0 -1 -1 -1 -2 -1 -1 -1 -1 -1 -1 -1 -1 -1 -2  0  0 -2 -1 -1 -1 -1 -1 -4
+* -4 -4 -4 -4 -4 -4 -4 -4 -4 -4 -4 -4 -4 -4 -4 -4 -4 -4 -4 -4 -4 -4 -4  1
+"""
 
-    return neighbors
+# a score that is never part of an alignment. It is small enough that we can subtract from it without overflow
+NEG = -2 ** 29
+# the traceback bits for each cell: where the match state came from, and whether the gap states opened a gap
+_FROM_E, _FROM_DIAG, _FROM_F, _START = 0, 1, 2, 3
+_E_OPEN = 4
+_F_OPEN = 8
 
-def ed_penalty(acid1, acid2):
-    return 1
 
+def blosum62():
+    """
+    The BLOSUM62 matrix
+    :return: a dict of dicts of the scores
+    """
 
-def edit_distance(seq1, seq2):
+    lines = _BLOSUM62.strip("\n").split("\n")
+    letters = lines[0].split()
+    matrix = {}
+    for l in lines[1:]:
+        p = l.split()
+        matrix[p[0]] = dict(zip(letters, map(int, p[1:])))
+    return matrix
+
+
+class SubstitutionMatrix(object):
+    """
+    A substitution matrix indexed by encoded residues.
+
+    :param matrix: a dict of dicts of scores (e.g. from blosum62()). Default: BLOSUM62
+    :param unknown: the score for any residue that is not in the matrix
+    """
+
+    def __init__(self, matrix=None, unknown=-8):
+        if matrix is None:
+            matrix = blosum62()
+        letters = sorted(set(matrix) | {b for a in matrix for b in matrix[a]})
+        n = len(letters)
+        self.letters = letters
+        # everything we don't know is encoded as n
+        self.lookup = np.full(256, n, dtype=np.uint8)
+        for i, l in enumerate(letters):
+            self.lookup[ord(l.upper())] = i
+            self.lookup[ord(l.lower())] = i
+        self.scores = np.full((n + 1, n + 1), unknown, dtype=np.int32)
+        for i, a in enumerate(letters):
+            for j, b in enumerate(letters):
+                if a in matrix and b in matrix[a]:
+                    self.scores[i, j] = matrix[a][b]
+                elif b in matrix and a in matrix[b]:
+                    self.scores[i, j] = matrix[b][a]
+
+    @classmethod
+    def match_mismatch(cls, match=1, mismatch=-1):
+        """
+        A matrix that scores every identical character as a match and everything else as a mismatch.
+        Upper and lower case are the same.
+        :param match: the score for a match
+        :param mismatch: the score for a mismatch
+        :return: the SubstitutionMatrix
+        """
+
+        sm = cls.__new__(cls)
+        sm.letters = [chr(i) for i in range(256)]
+        sm.lookup = np.frombuffer(bytes(range(256)).upper(), dtype=np.uint8).copy()
+        sm.scores = np.full((256, 256), mismatch, dtype=np.int32)
+        np.fill_diagonal(sm.scores, match)
+        return sm
+
+    def encode(self, seq):
+        """
+        Encode a sequence
+        :param seq: the sequence (str or bytes)
+        :return: a numpy array of the residue codes
+        """
+
+        if isinstance(seq, str):
+            seq = seq.encode('ascii', 'replace')
+        return self.lookup[np.frombuffer(seq, dtype=np.uint8)]
+
+    def score(self, a, b):
+        """
+        The score for two residues
+        """
+
+        return int(self.scores[self.encode(a)[0], self.encode(b)[0]])
+
+
+def _affine_rows(query, targets, lengths, scores, gap_open, gap_extend, local, band, traceback=False):
+    """
+    Fill the alignment matrices for one query against a batch of targets, a row (target residue) at a time.
+    :param query: the encoded query (the columns)
+    :param targets: a 2D array of encoded targets (the rows), padded to the same length
+    :param lengths: the length of each target
+    :param scores: the substitution matrix
+    :param gap_open: the gap open penalty
+    :param gap_extend: the gap extension penalty
+    :param local: local (Smith-Waterman) rather than global (Needleman-Wunsch) alignment
+    :param band: only calculate cells within this distance of the diagonal (None for all the cells)
+    :param traceback: keep the traceback (only for one target)
+    :return: the scores, and if traceback the traceback array, the final rows and the best cell
+    """
+
+    nb, n = targets.shape
+    m = len(query)
+    profile = scores[:, query]
+    cols = np.arange(m + 1, dtype=np.int32)
+    if band is None:
+        band = max(n, m)
+
+    # row 0
+    M = np.full((nb, m + 1), NEG, dtype=np.int32)
+    E = np.full((nb, m + 1), NEG, dtype=np.int32)
+    hi0 = min(m, band)
+    if local:
+        M[:, :hi0 + 1] = 0
+    else:
+        M[:, 0] = 0
+        M[:, 1:hi0 + 1] = -gap_open - (cols[1:hi0 + 1] - 1) * gap_extend
+
+    best = np.zeros(nb, dtype=np.int32) if local else np.full(nb, NEG, dtype=np.int32)
+    best_cell = (0, 0)
+    if not local:
+        best[lengths == 0] = M[lengths == 0, m]
+    ptr = np.zeros((n, m + 1), dtype=np.uint8) if traceback else None
 
-    scorematrix = [[0 for s in seq1] for t in seq2]
+    for i in range(1, n + 1):
+        lo = max(1, i - band)
+        hi = min(m, i + band)
+        Mn = np.full((nb, m + 1), NEG, dtype=np.int32)
+        En = np.full((nb, m + 1), NEG, dtype=np.int32)
+        if i <= band:
+            Mn[:, 0] = 0 if local else -gap_open - (i - 1) * gap_extend
+        if lo <= hi:
+            s = profile[targets[:, i - 1]]
+            e_ext = E[:, lo:hi + 1] - gap_extend
+            e_open = M[:, lo:hi + 1] - gap_open
+            En[:, lo:hi + 1] = np.maximum(e_ext, e_open)
+            diag = M[:, lo - 1:hi] + s[:, lo - 1:hi]
+            h0 = np.maximum(En[:, lo:hi + 1], diag)
+            if local:
+                np.maximum(h0, 0, out=h0)
+            # the insertions along the row: F[j] = max over k < j of H[k] - gap_open - (j - k - 1) * gap_extend
+            g = np.concatenate([Mn[:, lo - 1:lo], h0], axis=1) + cols[lo - 1:hi + 1] * gap_extend
+            np.maximum.accumulate(g, axis=1, out=g)
+            f = g[:, :-1] - gap_open + gap_extend - cols[lo:hi + 1] * gap_extend
+            Mn[:, lo:hi + 1] = np.maximum(h0, f)
 
-    for i in range(0, len(seq2)):
-        for j in range(0, len(seq1)):
-            if seq2[i] == seq1[j]:
-                if i > 0 and j > 0:
-                    scorematrix[i][j] = scorematrix[i-1][j-1]
+            if traceback:
+                mrow = Mn[0, lo:hi + 1]
+                p = np.where(e_open[0] > e_ext[0], _E_OPEN, 0)
+                f_prev = np.concatenate([[NEG], f[0, :-1]])
+                p |= np.where(Mn[0, lo - 1:hi] - gap_open > f_prev - gap_extend, _F_OPEN, 0)
+                if local:
+                    src = np.where(mrow <= 0, _START,
+                                   np.where(diag[0] == mrow, _FROM_DIAG,
+                                            np.where(En[0, lo:hi + 1] == mrow, _FROM_E, _FROM_F)))
                 else:
-                    scorematrix[i][j]= min(ed_neighborsof(i,j,scorematrix))
+                    src = np.where(En[0, lo:hi + 1] == mrow, _FROM_E,
+                                   np.where(diag[0] == mrow, _FROM_DIAG, _FROM_F))
+                ptr[i - 1, lo:hi + 1] = p | src
+
+        if local:
+            rowmax = Mn.max(axis=1)
+            better = (rowmax > best) & (i <= lengths)
+            if traceback and better[0]:
+                best_cell = (i, int(Mn[0].argmax()))
+            best[better] = rowmax[better]
+        else:
+            done = lengths == i
+            best[done] = Mn[done, m]
+        M = Mn
+        E = En
+
+    if traceback:
+        if not local:
+            best_cell = (n, m)
+        return best, ptr, M, E, best_cell
+    return best
+
+
+def _check_gaps(gap_open, gap_extend):
+    if gap_open < gap_extend:
+        raise ValueError(f"The gap open penalty ({gap_open}) must be at least the gap extension penalty ({gap_extend})")
+
+
+def _global_band(band, n, m):
+    """
+    A global alignment has to finish in the last cell, so the band needs to reach it
+    """
+
+    if band is None:
+        return None
+    return max(band, abs(n - m))
+
+
+def align_score(seq1, seq2, matrix=None, gap_open=11, gap_extend=1, local=False, band=None):
+    """
+    Score the alignment between two sequences. This does not do the alignment, and only needs memory
+    for one row of the matrix.
+    :param seq1: the first sequence
+    :param seq2: the second sequence
+    :param matrix: the SubstitutionMatrix. Default: BLOSUM62
+    :param gap_open: the gap opening penalty
+    :param gap_extend: the gap extension penalty
+    :param local: local rather than global alignment
+    :param band: only consider alignments within this distance of the diagonal
+    :return: the score of the best alignment
+    """
+
+    return int(align_many(seq2, [seq1], matrix, gap_open, gap_extend, local, band)[0])
+
+
+def align_many(query, targets, matrix=None, gap_open=11, gap_extend=1, local=False, band=None, batchsize=256):
+    """
+    Score the alignments of one query against a lot of targets. We align a batch of targets of similar
+    lengths at the same time.
+    :param query: the query sequence
+    :param targets: a list of target sequences
+    :param matrix: the SubstitutionMatrix. Default: BLOSUM62
+    :param gap_open: the gap opening penalty
+    :param gap_extend: the gap extension penalty
+    :param local: local rather than global alignment
+    :param band: only consider alignments within this distance of the diagonal
+    :param batchsize: the number of targets to align at once
+    :return: a numpy array of the scores, in the same order as the targets
+    """
+
+    _check_gaps(gap_open, gap_extend)
+    if matrix is None:
+        matrix = SubstitutionMatrix()
+    q = matrix.encode(query)
+    encoded = [matrix.encode(t) for t in targets]
+    lengths = np.array([len(t) for t in encoded], dtype=np.int64)
+    results = np.zeros(len(encoded), dtype=np.int64)
+    order = np.argsort(lengths, kind='stable')
+    unknown = len(matrix.scores) - 1
+    for start in range(0, len(order), batchsize):
+        batch = order[start:start + batchsize]
+        bl = lengths[batch]
+        n = int(bl.max()) if len(bl) else 0
+        padded = np.full((len(batch), n), unknown, dtype=np.int64)
+        for row, t in enumerate(batch):
+            padded[row, :lengths[t]] = encoded[t]
+        b = band
+        if band is not None and not local:
+            b = max(_global_band(band, int(x), len(q)) for x in bl)
+        results[batch] = _affine_rows(q, padded, bl, matrix.scores, gap_open, gap_extend, local, b)
+    return results
+
+
+def align(seq1, seq2, matrix=None, gap_open=11, gap_extend=1, local=False, band=None):
+    """
+    Align two sequences
+    :param seq1: the first sequence
+    :param seq2: the second sequence
+    :param matrix: the SubstitutionMatrix. Default: BLOSUM62
+    :param gap_open: the gap opening penalty
+    :param gap_extend: the gap extension penalty
+    :param local: local rather than global alignment. The local alignment only includes the aligned regions.
+    :param band: only consider alignments within this distance of the diagonal
+    :return: the score, and the two sequences with gaps in them
+    """
+
+    _check_gaps(gap_open, gap_extend)
+    if matrix is None:
+        matrix = SubstitutionMatrix()
+    a = matrix.encode(seq1)
+    b = matrix.encode(seq2)
+    if not local:
+        band = _global_band(band, len(a), len(b))
+    best, ptr, M, E, (i, j) = _affine_rows(b, a[None, :], np.array([len(a)]), matrix.scores, gap_open, gap_extend,
+                                           local, band, traceback=True)
+
+    out1 = []
+    out2 = []
+    if local:
+        state = _FROM_DIAG
+    else:
+        state = _FROM_E if len(a) and len(b) and E[0, j] == M[0, j] else _FROM_DIAG
+    while i > 0 and j > 0:
+        p = int(ptr[i - 1, j])
+        if state == _FROM_DIAG:
+            src = p & 3
+            if src == _START:
+                break
+            if src == _FROM_DIAG:
+                out1.append(seq1[i - 1])
+                out2.append(seq2[j - 1])
+                i -= 1
+                j -= 1
             else:
-                scorematrix[i][j] = min(ed_neighborsof(i,j,scorematrix)) + ed_penalty(seq2[i], seq1[j])
+                state = src
+        elif state == _FROM_E:
+            out1.append(seq1[i - 1])
+            out2.append('-')
+            if p & _E_OPEN:
+                state = _FROM_DIAG
+            i -= 1
+        else:
+            out1.append('-')
+            out2.append(seq2[j - 1])
+            if p & _F_OPEN:
+                state = _FROM_DIAG
+            j -= 1
+
+    if not local:
+        while i > 0:
+            out1.append(seq1[i - 1])
+            out2.append('-')
+            i -= 1
+        while j > 0:
+            out1.append('-')
+            out2.append(seq2[j - 1])
+            j -= 1
+    return int(best[0]), ''.join(reversed(out1)), ''.join(reversed(out2))
+
+
+def edit_distance(seq1, seq2):
+    """
+    The edit (Levenshtein) distance between two sequences: the number of substitutions, insertions and
+    deletions to turn one into the other.
+    :param seq1: the first sequence
+    :param seq2: the second sequence
+    :return: the edit distance
+    """
+
+    if isinstance(seq1, str):
+        seq1 = seq1.encode()
+    if isinstance(seq2, str):
+        seq2 = seq2.encode()
+    a = np.frombuffer(seq1, dtype=np.uint8)
+    b = np.frombuffer(seq2, dtype=np.uint8)
+    cols = np.arange(len(a) + 1, dtype=np.int64)
+    prev = cols.copy()
+    for i in range(1, len(b) + 1):
+        cost = (a != b[i - 1])
+        row = np.empty_like(prev)
+        row[0] = i
+        row[1:] = np.minimum(prev[1:] + 1, prev[:-1] + cost)
+        # deletions along the row: D[j] = min over k <= j of row[k] + (j - k)
+        prev = np.minimum.accumulate(row - cols) + cols
+    return int(prev[-1])
 
-    return scorematrix[len(seq2) - 1][len(seq1) - 1]
 
+if __name__ == '__main__':
+    s1 = 'MQMCDRKHECYFEGFICDWHTLLEPHIVAQSEPYPCHKKMTQMPPPCSWFGNDIAEEKPSSIMATPAMPNVEEGM'
+    s2 = 'MWMKDRKKNANECDWHPLLEYHIVAQSEPYKCCKKAMLGVKGAGTQMPPPCSWFGNDIAEEKPSSIMATPAMPNWEEGM'
+    score, a1, a2 = align(s1, s2)
+    print(f"{score}\n{a1}\n{a2}")
@@ -0,0 +1,176 @@
+"""
+Read fasta and fastq files in batches of sequences stored as contiguous buffers.
+
+Rather than a tuple of strings per read, each batch has all the sequences concatenated into a single
+numpy uint8 array with an array of offsets, and the quality scores as a uint8 array of phred scores
+that uses the same offsets. That lets you work on a whole batch at once with numpy, for example:
+
+    for batch in stream_fastq_batches('reads.fastq.gz'):
+        print(batch.mean_quality().mean())
+
+"""
+
+import numpy as np
+from .chunked_parser import fastq_chunks, fasta_chunks
+
+__author__ = 'Rob Edwards'
+
+
+class SequenceBatch(object):
+    """
+    A batch of sequences.
+
+    :ivar headers: a list of the headers (without the @ or >)
+    :ivar sequences: a numpy uint8 array of all the sequences concatenated together
+    :ivar offsets: a numpy int64 array of length n+1. Sequence i is sequences[offsets[i]:offsets[i+1]]
+    :ivar qualities: a numpy uint8 array of phred scores with the same offsets, or None for fasta files
+    """
+
+    def __init__(self, headers, sequences, offsets, qualities=None):
+        self.headers = headers
+        self.sequences = sequences
+        self.offsets = offsets
+        self.qualities = qualities
+
+    def __len__(self):
+        return len(self.headers)
+
+    @property
+    def ids(self):
+        """
+        The sequence IDs: the header up to the first space
+        """
+        return [h.split(' ')[0] for h in self.headers]
+
+    @property
+    def lengths(self):
+        """
+        The length of each sequence as a numpy array
+        """
+        return np.diff(self.offsets)
+
+    def sequence(self, i):
+        """
+        Get a single sequence as a string
+
+        :param i: the index of the sequence in the batch
+        :return: the sequence
+        """
+        return self.sequences[self.offsets[i]:self.offsets[i + 1]].tobytes().decode()
+
+    def quality(self, i):
+        """
+        Get the phred scores for a single sequence
+
+        :param i: the index of the sequence in the batch
+        :return: a numpy array of the scores
+        """
+        return self.qualities[self.offsets[i]:self.offsets[i + 1]]
+
+    def per_read_sum(self, values):
+        """
+        Sum an array that has the same offsets as the sequences (e.g. the qualities) for each read
+
+        :param values: the array to sum
+        :return: a numpy array with one sum per read
+        """
+        cs = np.zeros(len(values) + 1, dtype=np.int64)
+        np.cumsum(values, out=cs[1:])
+        return cs[self.offsets[1:]] - cs[self.offsets[:-1]]
+
+    def mean_quality(self):
+        """
+        The average quality score of each read. Reads with no bases have an average of 0
+
+        :return: a numpy array of floats with one average per read
+        """
+        means = np.zeros(len(self.lengths), dtype=np.float64)
+        np.divide(self.per_read_sum(self.qualities), self.lengths, out=means, where=self.lengths > 0)
+        return means
+
+    def to_arrow(self):
+        """
+        Convert the batch to an Arrow record batch. This needs pyarrow to be installed.
+
+        The buffers are shared with Arrow and not copied.
+
+        :return: a pyarrow.RecordBatch with the columns header, sequence and (for fastq) quality
+        """
+
+        import pyarrow as pa
+
+        n = len(self)
+        offsets = pa.py_buffer(self.offsets)
+        columns = [pa.array(self.headers, type=pa.string()),
+                   pa.Array.from_buffers(pa.large_binary(), n, [None, offsets, pa.py_buffer(self.sequences)])]
+        names = ['header', 'sequence']
+        if self.qualities is not None:
+            columns.append(pa.LargeListArray.from_arrays(self.offsets, self.qualities))
+            names.append('quality')
+        return pa.RecordBatch.from_arrays(columns, names=names)
+
+
+def _make_batch(records, phred_offset=None):
+    """
+    Make a SequenceBatch from a list of records from the chunked parser
+
+    :param records: a list of tuples of (header, seq) or (header, seq, qual) as bytes
+    :param phred_offset: the offset to subtract from the quality scores, or None if there are no quality scores
+    :return: a SequenceBatch
+    """
+
+    columns = list(zip(*records))
+    offsets = np.zeros(len(records) + 1, dtype=np.int64)
+    np.cumsum(list(map(len, columns[1])), out=offsets[1:])
+    sequences = np.frombuffer(b''.join(columns[1]), dtype=np.uint8)
+    qualities = None
+    if phred_offset is not None:
+        qualities = np.frombuffer(b''.join(columns[2]), dtype=np.uint8) - np.uint8(phred_offset)
+    headers = [h.decode() for h in columns[0]]
+    return SequenceBatch(headers, sequences, offsets, qualities)
+
+
+def _batches(chunks, batch_size, phred_offset=None):
+    """
+    Regroup the lists of records from the parser into batches of batch_size records
+
+    :param chunks: the generator of lists of records
+    :param batch_size: the number of records in each batch
+    :param phred_offset: the quality score offset (None for fasta)
+    :return: a generator of SequenceBatch
+    """
+
+    pending = []
+    for records in chunks:
+        pending.extend(records)
+        while len(pending) >= batch_size:
+            yield _make_batch(pending[:batch_size], phred_offset)
+            del pending[:batch_size]
+    if pending:
+        yield _make_batch(pending, phred_offset)
+
+
+def stream_fastq_batches(fqfile, batch_size=100000, phred_offset=33):
+    """
+    Stream a fastq file in batches of batch_size reads (the last batch may be smaller)
+
+    :param fqfile: the fastq file to read
+    :param batch_size: the number of reads in each batch
+    :param phred_offset: the ascii offset of the quality scores (almost always 33)
+    :return: a generator of SequenceBatch objects
+    """
+
+    return _batches(fastq_chunks(fqfile), batch_size, phred_offset)
+
+
+def stream_fasta_batches(fastafile, batch_size=10000, whole_id=True):
+    """
+    Stream a fasta file in batches of batch_size sequences (the last batch may be smaller)
+
+    :param fastafile: the fasta file to read
+    :param batch_size: the number of sequences in each batch
+    :param whole_id: Whether to keep the whole id (default) or just up to the first white space
+    :return: a generator of SequenceBatch objects
+    """
+
+    return _batches(fasta_chunks(fastafile, whole_id), batch_size)
@@ -2,12 +2,27 @@
 Parse a blast file and create a blast result object
 """
 
+import io
 import os
 import sys
 import argparse
-import gzip
+import numpy as np
+import pandas as pd
+from .compression import open_compressed
+
+# the columns in -outfmt 6 (and 7), named like the BlastResult attributes, and the types we read them as
+BLAST_COLUMNS = [
+    ('query', str), ('db', str), ('percent_id', 'float64'), ('alignment_length', 'int32'), ('gaps', 'int32'),
+    ('mismatches', 'int32'), ('query_start', 'int32'), ('query_end', 'int32'), ('db_start', 'int32'),
+    ('db_end', 'int32'), ('evalue', 'float64'), ('bitscore', 'float64'),
+    ('query_length', 'int32'), ('subject_length', 'int32')
+]
+
 
 class BlastResult():
+    __slots__ = ['query', 'db', 'percent_id', 'alignment_length', 'gaps', 'mismatches', 'query_start', 'query_end',
+                 'db_start', 'db_end', 'evalue', 'bitscore', 'query_length', 'subject_length']
+
     def __init__(self, query, db, percent_id, alignment_length, gaps, mismatches, query_start, query_end, db_start, db_end,
                  evalue, bitscore, query_length=None, subject_length=None):
         self.query = query
@@ -22,10 +37,8 @@ class BlastResult():
         self.db_end = int(db_end)
         self.evalue = float(evalue)
         self.bitscore = float(bitscore)
-        if query_length:
-            self.query_length = int(query_length)
-        if subject_length:
-            self.subject_length = int(subject_length)
+        self.query_length = int(query_length) if query_length else None
+        self.subject_length = int(subject_length) if subject_length else None
 
     def is_significant(self):
         """
@@ -38,27 +51,180 @@ class BlastResult():
 
 def stream_blast_results(blastf, verbose=False):
     """
-    Parse a tab-separated blast file and stream the results
+    Parse a tab-separated blast file (-outfmt 6 or 7) and stream the results
     :param blastf: the file to stream
     :return: a stream of BlastResults
     """
 
-    if blastf.endswith('.gz'):
-        qin = gzip.open(blastf, 'rt')
-    else:
-        qin = open(blastf, 'r')
+    with open_compressed(blastf, 'rt') as qin:
+        for l in qin:
+            if l.startswith('#') or not l.strip():
+                continue
+            p = l.rstrip("\n").split("\t")
+            yield BlastResult(*p)
+
+
+def _blast_columns(blastf):
+    """
+    How many columns are in the blast file: 12 for -outfmt 6 std, or 14 with qlen and slen
+    """
+
+    with open_compressed(blastf, 'rt') as qin:
+        for l in qin:
+            if l.startswith('#') or not l.strip():
+                continue
+            n = len(l.rstrip("\n").split("\t"))
+            if n not in (12, 14):
+                sys.stderr.write(f"WARNING: {blastf} has {n} columns. We expect 12 (std) or 14 (std qlen slen)\n")
+            return min(n, len(BLAST_COLUMNS))
+    return 12
+
+
+class _SkipComments(io.RawIOBase):
+    """
+    A binary file without the lines that start with #. pandas' comment option cuts a line at a # anywhere, and
+    that breaks ids like HWI-ST:1:2#0/1, so we take out the -outfmt 7 comment lines before pandas sees them.
+
+    :param fh: the binary file handle to read
+    :param blocksize: how much to read at a time
+    """
+
+    def __init__(self, fh, blocksize=2 ** 20):
+        super().__init__()
+        self.fh = fh
+        self.blocksize = blocksize
+        self.block = b''
+        self.pos = 0
+        self.partial = b''
+
+    def readable(self):
+        return True
+
+    def _next_block(self):
+        """
+        Read the next whole lines from the file, without the comments
+        :return: False at the end of the file
+        """
+        data = self.fh.read(self.blocksize)
+        if data:
+            data = self.partial + data
+            end = data.rfind(b'\n') + 1
+            data, self.partial = data[:end], data[end:]
+        elif self.partial:
+            data, self.partial = self.partial, b''
+        else:
+            return False
+        # most blocks have no comments, and we leave those alone
+        if data.startswith(b'#') or b'\n#' in data:
+            data = b''.join(l for l in data.splitlines(keepends=True) if not l.startswith(b'#'))
+        self.block = data
+        self.pos = 0
+        return True
+
+    def readinto(self, b):
+        while self.pos >= len(self.block):
+            if not self._next_block():
+                return 0
+        n = min(len(b), len(self.block) - self.pos)
+        b[:n] = self.block[self.pos:self.pos + n]
+        self.pos += n
+        return n
+
+
+def stream_blast_chunks(blastf, chunksize=1000000, verbose=False):
+    """
+    Read a tab-separated blast file (-outfmt 6 or 7, optionally with qlen and slen) in chunks of typed columns
+    :param blastf: the file to read
+    :param chunksize: the number of lines in each chunk
+    :param verbose: more output
+    :return: a stream of pandas data frames with the columns named like the BlastResult attributes
+    """
+
+    columns = BLAST_COLUMNS[:_blast_columns(blastf)]
+    if verbose:
+        sys.stderr.write(f"Reading {blastf} with {len(columns)} columns\n")
+    with open_compressed(blastf, 'rb') as qin:
+        reader = pd.read_csv(io.BufferedReader(_SkipComments(qin)), sep="\t", header=None, chunksize=chunksize,
+                             names=[c for c, t in columns], usecols=range(len(columns)), dtype=dict(columns))
+        for df in reader:
+            yield df
+
+
+def read_blast_table(blastf, verbose=False):
+    """
+    Read a whole tab-separated blast file into a data frame. For big files, use stream_blast_chunks
+    :param blastf: the file to read
+    :param verbose: more output
+    :return: a pandas data frame
+    """
+
+    chunks = list(stream_blast_chunks(blastf, verbose=verbose))
+    if not chunks:
+        return pd.DataFrame({c: pd.Series(dtype=t) for c, t in BLAST_COLUMNS[:12]})
+    return pd.concat(chunks, ignore_index=True)
+
+
+def filter_blast(df, maxeval=None, minid=None, minlen=None, minbits=None):
+    """
+    Filter blast results
+    :param df: the blast results data frame
+    :param maxeval: the maximum E value to keep
+    :param minid: the minimum percent identity to keep
+    :param minlen: the minimum alignment length to keep
+    :param minbits: the minimum bit score to keep
+    :return: the filtered data frame
+    """
+
+    keep = np.ones(len(df), dtype=bool)
+    if maxeval is not None:
+        keep &= df['evalue'].values <= maxeval
+    if minid is not None:
+        keep &= df['percent_id'].values >= minid
+    if minlen is not None:
+        keep &= df['alignment_length'].values >= minlen
+    if minbits is not None:
+        keep &= df['bitscore'].values >= minbits
+    return df[keep]
+
+
+def best_hits(df, score='bitscore'):
+    """
+    Keep the best hit for each query. If there are ties we keep the first one in the file
+    :param df: the blast results data frame
+    :param score: the column to use. We keep the highest bitscore, or the lowest evalue
+    :return: a data frame with one row per query
+    """
+
+    ascending = score == 'evalue'
+    order = df.sort_values(score, ascending=ascending, kind='stable')
+    return order.drop_duplicates('query', keep='first').sort_index()
+
+
+def stream_best_hits(blastf, score='bitscore', chunksize=1000000, verbose=False):
+    """
+    Stream the best hit for each query. Blast writes all the hits for a query together, so we hold back the
+    last query in each chunk in case it continues in the next chunk.
+    :param blastf: the file to read
+    :param score: the column to use. We keep the highest bitscore, or the lowest evalue
+    :param chunksize: the number of lines in each chunk
+    :param verbose: more output
+    :return: a stream of data frames with one row per query
+    """
 
-    while True:
-        l = qin.readline()
-        if not l:
-            break
-        p = l.strip().split("\t")
-        #if verbose:
-        #    sys.stderr.write("LINE: {}\n".format(p))
-        br = BlastResult(*p)
-        yield br
+    pending = None
+    for df in stream_blast_chunks(blastf, chunksize, verbose):
+        if pending is not None:
+            df = pd.concat([pending, df], ignore_index=True)
+        if not len(df):
+            continue
+        last = df['query'].values[-1]
+        tail = df['query'].values == last
+        pending = df[tail]
+        if (~tail).any():
+            yield best_hits(df[~tail], score)
+    if pending is not None and len(pending):
+        yield best_hits(pending, score)
 
-    return None
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description="")
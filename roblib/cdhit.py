@@ -0,0 +1,284 @@
+"""
+Read the .clstr files from cd-hit and cd-hit-est, and split a fasta file into one file per cluster.
+
+A .clstr file looks like this:
+
+    >Cluster 0
+    0	2799aa, >seq1... *
+    1	2214aa, >seq2... at 70.55%
+    >Cluster 1
+    0	2430nt, >seq3... *
+    1	2400nt, >seq4... at +/95.12%
+
+The representative of each cluster has a *, and every other member has its percent identity to the
+representative (and for nucleotides the strand, and with -p 1 the alignment coordinates before the strand).
+
+We keep the member ids in a list and everything else in numpy arrays with one entry per member, so millions of
+members only take a few bytes each on top of their ids.
+
+    cl = CdHitClusters('clusters.clstr')
+    cl.cluster_of('seq2'), cl.sizes(), cl.members(0)
+    split_clusters(cl, 'seqs.fasta', 'clusters/', minsize=2)
+"""
+
+import os
+import sys
+import argparse
+from array import array
+from collections import OrderedDict
+import numpy as np
+from .compression import open_compressed
+from .sequences import stream_fasta
+
+__author__ = 'Rob Edwards'
+
+# the most cluster files we keep open at once
+MAX_OPEN = 256
+
+
+class CdHitClusters(object):
+    """
+    The clusters in a cd-hit .clstr file.
+
+    For member i, ids[i] is the sequence id, cluster[i] is the cluster number, length[i] is the sequence
+    length, representative[i] is True for the representative of the cluster, identity[i] is the percent
+    identity to the representative (100 for the representative), and strand[i] is 1 or -1 for cd-hit-est
+    (0 if the file doesn't say).
+
+    :param clstrfile: the .clstr file (it can be compressed)
+    :param verbose: more output
+    """
+
+    def __init__(self, clstrfile, verbose=False):
+        self.clstr_file = clstrfile
+        self.ids = []
+        cluster = array('l')
+        length = array('l')
+        representative = array('b')
+        identity = array('f')
+        strand = array('b')
+        current = None
+        with open_compressed(clstrfile, 'rt') as f:
+            for l in f:
+                if l.startswith('>'):
+                    current = int(l[1:].split()[-1])
+                    continue
+                if not l.strip():
+                    continue
+                start = l.find(', >')
+                end = l.rfind('...')
+                if current is None or start == -1 or end < start:
+                    sys.stderr.write(f"No sequence id found in {l}")
+                    continue
+                self.ids.append(l[start + 3:end])
+                cluster.append(current)
+                length.append(int(l[l.find("\t") + 1:start].rstrip('antd')))
+                tail = l[end + 3:].strip()
+                if tail == '*':
+                    representative.append(1)
+                    identity.append(100)
+                    strand.append(0)
+                else:
+                    # at 70.55% or at +/95.12% or at 1:2400:1:2400/+/95.12%
+                    fields = tail[2:].strip().rstrip('%').split('/')
+                    representative.append(0)
+                    identity.append(float(fields[-1]))
+                    strand.append(1 if '+' in fields[:-1] else -1 if '-' in fields[:-1] else 0)
+
+        self.cluster = np.frombuffer(cluster, dtype=np.dtype('l')).astype(np.int64)
+        self.length = np.frombuffer(length, dtype=np.dtype('l')).astype(np.int64)
+        self.representative = np.frombuffer(representative, dtype=np.int8).astype(bool)
+        self.identity = np.frombuffer(identity, dtype=np.float32).copy()
+        self.strand = np.frombuffer(strand, dtype=np.int8).copy()
+        self._index = None
+        self._order = None
+        if verbose:
+            sys.stderr.write(f"Read {len(self.ids):,} members of {len(self.clusters()):,} clusters " +
+                             f"from {clstrfile}\n")
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __contains__(self, seqid):
+        return seqid in self.index
+
+    @property
+    def index(self):
+        """
+        A dict of sequence id and its position in self.ids
+        """
+
+        if self._index is None:
+            self._index = {s: i for i, s in enumerate(self.ids)}
+        return self._index
+
+    def _cluster_slices(self):
+        """
+        Sort the members by cluster so we can find all the members of a cluster
+        """
+
+        if self._order is None:
+            self._order = np.argsort(self.cluster, kind='stable')
+            self._numbers, self._starts, self._counts = np.unique(self.cluster[self._order], return_index=True,
+                                                                  return_counts=True)
+        return self._order, self._numbers, self._starts, self._counts
+
+    def clusters(self):
+        """
+        The cluster numbers
+        :return: a sorted numpy array of the cluster numbers
+        """
+
+        return self._cluster_slices()[1]
+
+    def cluster_of(self, seqid):
+        """
+        The cluster that a sequence is in
+        :param seqid: the sequence id
+        :return: the cluster number, or None if the sequence is not in any cluster
+        """
+
+        i = self.index.get(seqid)
+        return None if i is None else int(self.cluster[i])
+
+    def members(self, cluster):
+        """
+        The members of a cluster
+        :param cluster: the cluster number
+        :return: a list of the sequence ids, in the order they are in the file
+        """
+
+        order, numbers, starts, counts = self._cluster_slices()
+        c = np.searchsorted(numbers, cluster)
+        if c == len(numbers) or numbers[c] != cluster:
+            return []
+        return [self.ids[i] for i in order[starts[c]:starts[c] + counts[c]].tolist()]
+
+    def representatives(self):
+        """
+        The representative of each cluster
+        :return: a dict of cluster number and the id of its representative
+        """
+
+        reps = np.flatnonzero(self.representative)
+        return {c: self.ids[i] for c, i in zip(self.cluster[reps].tolist(), reps.tolist())}
+
+    def sizes(self):
+        """
+        The number of members in each cluster
+        :return: a dict of cluster number and size
+        """
+
+        _, numbers, _, counts = self._cluster_slices()
+        return dict(zip(numbers.tolist(), counts.tolist()))
+
+    def member_map(self):
+        """
+        The cluster of every sequence
+        :return: a dict of sequence id and cluster number
+        """
+
+        return dict(zip(self.ids, self.cluster.tolist()))
+
+
+class _FilePool(object):
+    """
+    Keep up to max_open files open for appending, closing the one we used longest ago when we need another.
+    The first time we open a file we truncate it.
+    """
+
+    def __init__(self, max_open=MAX_OPEN):
+        self.max_open = max(1, max_open)
+        self.handles = OrderedDict()
+        self.seen = set()
+
+    def write(self, filename, text):
+        fh = self.handles.get(filename)
+        if fh is None:
+            if len(self.handles) >= self.max_open:
+                self.handles.popitem(last=False)[1].close()
+            fh = open(filename, 'a' if filename in self.seen else 'w')
+            self.seen.add(filename)
+            self.handles[filename] = fh
+        else:
+            self.handles.move_to_end(filename)
+        fh.write(text)
+
+    def close(self):
+        for fh in self.handles.values():
+            fh.close()
+        self.handles.clear()
+
+
+def split_clusters(clusters, fastafile, outdir, minsize=1, filename="{}.fa", max_open=MAX_OPEN, idlength=None,
+                   full_ids=False, verbose=False):
+    """
+    Write the sequences in each cluster to their own fasta file. We read the fasta file once, and keep a
+    limited number of output files open at a time, so the sequences in each file are in the order they are in
+    the fasta file, not the order they are in the .clstr file.
+
+    cd-hit cuts the ids in the .clstr file to the -d option (20 characters by default), and with -d 0 keeps
+    the whole definition line. We match the whole fasta id line, then its first word, and then the first
+    idlength characters of it. The members we can not find in the fasta file are always reported.
+
+    Each sequence is written with the id from the .clstr file, unless full_ids is True.
+
+    :param clusters: the CdHitClusters
+    :param fastafile: the fasta file that was clustered (it can be compressed)
+    :param outdir: the directory to write the clusters to (we make it if it doesn't exist)
+    :param minsize: only write clusters with at least this many members
+    :param filename: the name of each cluster file. {} is replaced with the cluster number
+    :param max_open: the maximum number of files to have open at once
+    :param idlength: the length that cd-hit cut the ids to. Default: the length of the longest id in the
+                     .clstr file. Use 0 to only match whole ids
+    :param full_ids: write the whole fasta id line rather than the id in the .clstr file
+    :param verbose: more output
+    :return: a dict of cluster number and the number of sequences we wrote
+    """
+
+    os.makedirs(outdir, exist_ok=True)
+    sizes = clusters.sizes()
+    index = clusters.index
+    if idlength is None:
+        idlength = max(map(len, clusters.ids), default=0)
+    done = np.zeros(len(clusters), dtype=bool)
+    written = {}
+    pool = _FilePool(max_open)
+    try:
+        for seqid, seq in stream_fasta(fastafile):
+            i = index.get(seqid)
+            if i is None:
+                parts = seqid.split(None, 1)
+                i = index.get(parts[0]) if parts else None
+            if i is None and idlength:
+                i = index.get(seqid[:idlength].rstrip())
+                if i is not None and done[i]:
+                    i = None
+            if i is None:
+                continue
+            c = int(clusters.cluster[i])
+            if sizes[c] < minsize:
+                continue
+            done[i] = True
+            pool.write(os.path.join(outdir, filename.format(c)), f">{seqid if full_ids else clusters.ids[i]}\n{seq}\n")
+            written[c] = written.get(c, 0) + 1
+    finally:
+        pool.close()
+    if verbose:
+        sys.stderr.write(f"Wrote {sum(written.values()):,} sequences in {len(written):,} clusters to {outdir}\n")
+    missing = sum(n for c, n in sizes.items() if n >= minsize) - int(done.sum())
+    if missing:
+        sys.stderr.write(f"WARNING: {missing:,} sequences in the clusters were not found in {fastafile}\n")
+    return written
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='List the clusters in a cd-hit .clstr file and their sizes')
+    parser.add_argument('-c', help='cd-hit .clstr file', required=True)
+    parser.add_argument('-v', help='verbose output', action='store_true')
+    args = parser.parse_args()
+
+    cl = CdHitClusters(args.c, args.v)
+    reps = cl.representatives()
+    for c, n in cl.sizes().items():
+        print(f"{c}\t{n}\t{reps.get(c, '')}")
@@ -0,0 +1,254 @@
+"""
+A chunked, byte-oriented parser for fasta and fastq files.
+
+Rather than reading one line at a time and building strings as we go, we read large blocks of bytes
+(using mmap for uncompressed files), find the record boundaries in bulk, and only build python objects
+for complete records. There is no tell()/seek() which is very slow on gzip handles.
+
+The stream_fastq, stream_paired_fastq and stream_fasta generators in sequences.py are thin wrappers
+around these functions. If you want raw bytes (e.g. to write them straight back out) use these directly.
+"""
+
+import os
+import sys
+import mmap
+import codecs
+from itertools import repeat
+from operator import itemgetter
+from .rob_error import FastqFormatError
+from .compression import open_compressed, compression_type, read_compressed_blocks
+
+__author__ = 'Rob Edwards'
+
+# how much to read at a time. 4 MB is a good compromise between memory and the number of python calls
+BLOCKSIZE = 4 * 1024 * 1024
+
+
+def open_binary(fname):
+    """
+    Open a (possibly compressed) file for reading bytes
+
+    :param fname: the file to open
+    :return: a binary file handle
+    """
+
+    try:
+        return open_compressed(fname, 'rb')
+    except IOError as e:
+        sys.stderr.write(str(e) + "\n")
+        sys.exit("Unable to open file " + fname)
+
+
+def read_blocks(fname, blocksize=BLOCKSIZE, use_mmap=True, decode=False):
+    """
+    Read a file in large blocks of bytes. Uncompressed regular files are memory mapped, and compressed files
+    are decompressed in other threads (see compression.py).
+
+    :param fname: the file to read
+    :param blocksize: the number of (uncompressed) bytes in each block
+    :param use_mmap: memory map uncompressed files
+    :param decode: decode each block to a str (a multi-byte character split between blocks is handled)
+    :return: a generator of bytes (or str if decode is True)
+    """
+
+    if decode:
+        decoder = codecs.getincrementaldecoder('utf-8')()
+        for block in read_blocks(fname, blocksize, use_mmap):
+            yield decoder.decode(block)
+        yield decoder.decode(b'', final=True)
+        return
+
+    if compression_type(fname):
+        yield from read_compressed_blocks(fname, blocksize)
+        return
+
+    if use_mmap and os.path.isfile(fname) and os.path.getsize(fname) > 0:
+        with open(fname, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            for start in range(0, len(mm), blocksize):
+                yield mm[start:start + blocksize]
+        return
+
+    with open_binary(fname) as f:
+        while True:
+            block = f.read(blocksize)
+            if not block:
+                break
+            yield block
+
+
+def _fastq_block(lines, n, linecounter, fname):
+    """
+    Convert the first n lines (a multiple of four) to fastq records
+
+    :param lines: the list of lines as bytes (or str)
+    :param n: the number of lines to use
+    :param linecounter: the number of lines in the file before these
+    :param fname: the file name, for error messages
+    :return: a list of tuples of (header, seq, qual)
+    """
+
+    linetype = type(lines[0])
+    at, plus = ('@', '+') if linetype is str else (b'@', b'+')
+    headers, qualheaders = lines[0:n:4], lines[2:n:4]
+    seqs = list(map(linetype.strip, lines[1:n:4]))
+    quals = list(map(linetype.strip, lines[3:n:4]))
+
+    # check the whole block at once, and only go looking for the problem if there is one
+    if not (all(map(linetype.startswith, headers, repeat(at))) and
+            all(map(linetype.startswith, qualheaders, repeat(plus))) and
+            list(map(len, seqs)) == list(map(len, quals))):
+        ln = linecounter
+        for header, seq, qualheader, qual in zip(headers, seqs, qualheaders, quals):
+            if not header.startswith(at):
+                raise FastqFormatError(f"The file {fname} does not appear to be a four-line fastq file at line {ln + 1}")
+            if not qualheader.startswith(plus):
+                raise FastqFormatError(f"The file {fname} does not appear to be a four-line fastq file at line {ln + 3}")
+            if len(seq) != len(qual):
+                raise FastqFormatError(f"The sequence and qual scores in {fname} are not the same length at line {ln + 4}")
+            ln += 4
+
+    headers = map(linetype.strip, map(itemgetter(slice(1, None)), headers))
+    return list(zip(headers, seqs, quals))
+
+
+def fastq_chunks(fqfile, blocksize=BLOCKSIZE, use_mmap=True, decode=False):
+    """
+    Read a fastq file and yield a list of all the complete records in each block we read.
+
+    The records are tuples of (header, sequence, quality) as bytes. The header does not include the @
+
+    :param fqfile: the fastq file to read
+    :param blocksize: the number of bytes to read at a time
+    :param use_mmap: memory map uncompressed files
+    :param decode: return str rather than bytes. Decoding a whole block at once is much faster than each field
+    :return: a generator of lists of records
+    """
+
+    nl = '\n' if decode else b'\n'
+    leftover = nl[:0]
+    linecounter = 0
+    for block in read_blocks(fqfile, blocksize, use_mmap, decode):
+        lines = (leftover + block).split(nl)
+        # the last line may be incomplete, and we only want whole records
+        complete = (len(lines) - 1) // 4 * 4
+        if complete:
+            yield _fastq_block(lines, complete, linecounter, fqfile)
+            linecounter += complete
+        leftover = nl.join(lines[complete:])
+
+    lines = leftover.split(nl)
+    while lines and not lines[-1].strip():
+        lines.pop()
+    if lines:
+        # a truncated record. Pad it out so the usual format checks report it
+        lines += [nl[:0]] * (-len(lines) % 4)
+        yield _fastq_block(lines, len(lines), linecounter, fqfile)
+
+
+def fastq_records(fqfile, blocksize=BLOCKSIZE, use_mmap=True, decode=False):
+    """
+    Read a fastq file and yield (header, sequence, quality) tuples as bytes
+
+    :param fqfile: the fastq file to read
+    :param blocksize: the number of bytes to read at a time
+    :param use_mmap: memory map uncompressed files
+    :param decode: return str rather than bytes
+    :return: a generator of records
+    """
+
+    for records in fastq_chunks(fqfile, blocksize, use_mmap, decode):
+        yield from records
+
+
+def _fasta_block(data, whole_id):
+    """
+    Convert a block of complete fasta records to a list of (id, seq) tuples.
+
+    :param data: the bytes (or str), starting after the first >
+    :param whole_id: keep the whole id or just up to the first space
+    :return: a list of tuples of (id, seq)
+    """
+
+    nl, gt, space = ('\n', '>', ' ') if isinstance(data, str) else (b'\n', b'>', b' ')
+    records = []
+    for rec in data.split(nl + gt):
+        idline, _, seq = rec.partition(nl)
+        if not whole_id:
+            idline = idline.split(space)[0]
+        records.append((idline.strip(), nl[:0].join(seq.split())))
+    return records
+
+
+def fasta_blocks(fastafile, blocksize=BLOCKSIZE, use_mmap=True, decode=False):
+    """
+    Read a fasta file and yield the complete records in each block we read, without parsing them. Each block
+    starts after the first > and can be parsed with _fasta_block (e.g. in another process).
+
+    :param fastafile: the fasta file to read
+    :param blocksize: the number of bytes to read at a time
+    :param use_mmap: memory map uncompressed files
+    :param decode: return str rather than bytes
+    :return: a generator of bytes (or str)
+    """
+
+    nl, gt = ('\n', '>') if decode else (b'\n', b'>')
+    # a list of pieces so that a single long sequence (e.g. a chromosome) is not copied for every block
+    pieces = []
+    first = True
+    for block in read_blocks(fastafile, blocksize, use_mmap, decode):
+        if not block:
+            continue
+        if first:
+            if not block.startswith(gt):
+                line = block.splitlines()[0]
+                sys.exit("Do not have a fasta file at: {}".format(line if decode else line.decode()))
+            first = False
+        # records start with a > after a newline, and that newline may be the end of the previous block
+        cut = block.rfind(nl + gt)
+        if cut >= 0:
+            cut += 1
+        elif pieces and block.startswith(gt) and pieces[-1].endswith(nl):
+            cut = 0
+        else:
+            pieces.append(block)
+            continue
+        pieces.append(block[:cut])
+        complete = nl[:0].join(pieces)
+        pieces = [block[cut:]]
+        yield complete[1:]
+
+    rest = nl[:0].join(pieces)
+    if rest.strip():
+        yield rest[1:]
+
+
+def fasta_chunks(fastafile, whole_id=True, blocksize=BLOCKSIZE, use_mmap=True, decode=False):
+    """
+    Read a fasta file and yield a list of all the complete records in each block we read.
+
+    :param fastafile: the fasta file to read
+    :param whole_id: Whether to return the whole id (default) or just up to the first white space
+    :param blocksize: the number of bytes to read at a time
+    :param use_mmap: memory map uncompressed files
+    :param decode: return str rather than bytes
+    :return: a generator of lists of (id, seq) tuples as bytes
+    """
+
+    for data in fasta_blocks(fastafile, blocksize, use_mmap, decode):
+        yield _fasta_block(data, whole_id)
+
+
+def fasta_records(fastafile, whole_id=True, blocksize=BLOCKSIZE, use_mmap=True, decode=False):
+    """
+    Read a fasta file and yield (id, sequence) tuples as bytes
+
+    :param fastafile: the fasta file to read
+    :param whole_id: Whether to return the whole id (default) or just up to the first white space
+    :param blocksize: the number of bytes to read at a time
+    :param use_mmap: memory map uncompressed files
+    :param decode: return str rather than bytes
+    :return: a generator of records
+    """
+
+    for records in fasta_chunks(fastafile, whole_id, blocksize, use_mmap, decode):
+        yield from records
@@ -0,0 +1,450 @@
+"""
+Open compressed files for reading and writing, using more than one thread where we can.
+
+- BGZF files (the blocked gzip used by samtools, tabix, bgzip, etc) are decompressed in parallel blocks
+  using a thread pool. zlib releases the GIL so this really does use more than one core.
+- Other gzip files can not be split without decompressing them, so one thread decompresses ahead
+  while the caller is parsing.
+- Anything we write to a .gz file is written as BGZF, compressed by worker threads. BGZF is still a
+  valid gzip file so zcat, gzip.open, etc all read it.
+- zstd (.zst) is supported if the zstandard module is installed (pip install zstandard).
+- lrzip (.lrz) files are read by piping through lrunzip.
+
+Use open_compressed() everywhere you would use gzip.open() or open().
+"""
+
+import os
+import io
+import sys
+import gzip
+import zlib
+import queue
+import struct
+import threading
+import subprocess
+from collections import deque, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+__author__ = 'Rob Edwards'
+
+# the default number of threads to use for compression and decompression
+THREADS = min(8, os.cpu_count() or 1)
+
+# how much uncompressed data to put in each BGZF block. This is what bgzip and htslib use
+BGZF_BLOCKSIZE = 65280
+# an empty BGZF block that marks the end of the file
+BGZF_EOF = bytes.fromhex('1f8b08040000000000ff0600424302001b0003000000000000000000')
+# the number of BGZF blocks each worker handles at a time
+BGZF_BATCH = 16
+
+ZSTD_MAGIC = b'\x28\xb5\x2f\xfd'
+GZIP_MAGIC = b'\x1f\x8b'
+
+
+def compression_type(fname):
+    """
+    What kind of compression does this file use? We look at the magic bytes for regular files
+    and fall back to the file extension for everything else (e.g. pipes).
+
+    :param fname: the file name
+    :return: one of 'bgzf', 'gzip', 'zstd', 'lrz' or None for uncompressed files
+    """
+
+    if fname.endswith('.lrz'):
+        return 'lrz'
+    if not os.path.isfile(fname):
+        if fname.endswith(('.gz', '.bgz')):
+            return 'gzip'
+        if fname.endswith('.zst'):
+            return 'zstd'
+        return None
+
+    with open(fname, 'rb') as f:
+        header = f.read(18)
+    if header.startswith(ZSTD_MAGIC):
+        return 'zstd'
+    if not header.startswith(GZIP_MAGIC):
+        return None
+    # BGZF has the FEXTRA flag set and a BC subfield in the extra data
+    if len(header) == 18 and header[3] & 4 and header[12:14] == b'BC':
+        return 'bgzf'
+    return 'gzip'
+
+
+def is_compressed(fname):
+    """
+    Is this file compressed?
+
+    :param fname: the file name
+    :return: True if it is compressed
+    """
+    return compression_type(fname) is not None
+
+
+def _read_bgzf_block(fh):
+    """
+    Read the next raw (compressed) BGZF block from the file handle
+
+    :param fh: the binary file handle
+    :return: the deflated data, the crc and the uncompressed size, or None at the end of the file
+    """
+
+    header = fh.read(12)
+    if not header:
+        return None
+    if len(header) < 12 or not header.startswith(GZIP_MAGIC):
+        raise IOError("This does not appear to be a BGZF file")
+    xlen = struct.unpack('<H', header[10:12])[0]
+    extra = fh.read(xlen)
+    bsize = None
+    pos = 0
+    while pos < xlen:
+        si, slen = extra[pos:pos + 2], struct.unpack('<H', extra[pos + 2:pos + 4])[0]
+        if si == b'BC':
+            bsize = struct.unpack('<H', extra[pos + 4:pos + 6])[0]
+        pos += 4 + slen
+    if bsize is None:
+        raise IOError("This gzip block does not have a BGZF block size")
+    rest = fh.read(bsize + 1 - 12 - xlen)
+    crc, isize = struct.unpack('<II', rest[-8:])
+    return rest[:-8], crc, isize
+
+
+def _inflate_bgzf(blocks):
+    """
+    Decompress a list of raw BGZF blocks (this runs in a worker thread)
+
+    :param blocks: a list of (deflated data, crc, size) tuples
+    :return: the uncompressed bytes
+    """
+
+    out = []
+    for cdata, crc, isize in blocks:
+        data = zlib.decompress(cdata, -15)
+        if len(data) != isize or zlib.crc32(data) != crc:
+            raise IOError("The BGZF block failed the CRC check. The file is corrupt")
+        out.append(data)
+    return b''.join(out)
+
+
+def _bgzf_blocks(fname, threads):
+    """
+    Decompress a BGZF file in parallel, yielding the uncompressed data in order
+
+    :param fname: the file name
+    :param threads: the number of threads to use
+    :return: a generator of bytes
+    """
+
+    with open(fname, 'rb') as fh, ThreadPoolExecutor(threads) as pool:
+        pending = deque()
+        while True:
+            batch = []
+            while len(batch) < BGZF_BATCH:
+                block = _read_bgzf_block(fh)
+                if block is None:
+                    break
+                batch.append(block)
+            if batch:
+                pending.append(pool.submit(_inflate_bgzf, batch))
+            # keep a few batches in flight for each thread, but don't read the whole file into memory
+            while pending and (len(pending) > 2 * threads or not batch):
+                yield pending.popleft().result()
+            if not batch:
+                break
+
+
+def _threaded_blocks(fh, blocksize):
+    """
+    Read blocks from a file handle in a background thread, so that (for example) gzip decompression
+    happens while we are parsing the previous block.
+
+    :param fh: the file handle to read. It is closed when we are done
+    :param blocksize: the size of each block
+    :return: a generator of bytes
+    """
+
+    blocks = queue.Queue(maxsize=4)
+    stop = threading.Event()
+
+    def put(item):
+        # wait for space in the queue, but give up if the generator has been closed
+        while not stop.is_set():
+            try:
+                blocks.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+
+    def reader():
+        try:
+            while not stop.is_set():
+                block = fh.read(blocksize)
+                put(block)
+                if not block:
+                    break
+        except Exception as e:
+            put(e)
+        finally:
+            fh.close()
+
+    thread = threading.Thread(target=reader, daemon=True)
+    thread.start()
+    try:
+        while True:
+            block = blocks.get()
+            if isinstance(block, Exception):
+                raise block
+            if not block:
+                break
+            yield block
+    finally:
+        stop.set()
+
+
+def bgzf_blocks_with_offsets(fname):
+    """
+    Read a BGZF file one block at a time (in this thread), and report where each block starts in the
+    compressed file. This is what you need to make BGZF virtual offsets.
+
+    :param fname: the BGZF file
+    :return: a generator of tuples of (compressed offset, uncompressed data)
+    """
+
+    with open(fname, 'rb') as fh:
+        while True:
+            coffset = fh.tell()
+            block = _read_bgzf_block(fh)
+            if block is None:
+                break
+            yield coffset, _inflate_bgzf([block])
+
+
+class BgzfRandomReader(object):
+    """
+    Random access to a BGZF file using virtual offsets (the compressed offset of the block shifted
+    left 16 bits, plus the offset within the uncompressed block). Recently used blocks are cached.
+    """
+
+    def __init__(self, fname, cachesize=64):
+        self._fh = open(fname, 'rb')
+        self._cachesize = cachesize
+        self._cache = OrderedDict()
+
+    def _block(self, coffset):
+        """
+        Get the uncompressed block at this compressed offset, and the offset of the next block
+        """
+        if coffset in self._cache:
+            self._cache.move_to_end(coffset)
+            return self._cache[coffset]
+        self._fh.seek(coffset)
+        block = _read_bgzf_block(self._fh)
+        result = (_inflate_bgzf([block]) if block else b'', self._fh.tell())
+        self._cache[coffset] = result
+        if len(self._cache) > self._cachesize:
+            self._cache.popitem(last=False)
+        return result
+
+    def read(self, voffset, length):
+        """
+        Read length uncompressed bytes starting at a virtual offset
+
+        :param voffset: the virtual offset
+        :param length: the number of bytes to read
+        :return: the bytes
+        """
+        coffset, within = voffset >> 16, voffset & 0xFFFF
+        pieces = []
+        needed = within + length
+        while needed > 0:
+            data, nextoffset = self._block(coffset)
+            if not data and nextoffset == coffset:
+                break
+            pieces.append(data)
+            needed -= len(data)
+            coffset = nextoffset
+        return b''.join(pieces)[within:within + length]
+
+    def close(self):
+        self._fh.close()
+
+
+def read_compressed_blocks(fname, blocksize=1024 * 1024, threads=THREADS):
+    """
+    Decompress a file and yield the uncompressed data in blocks. The blocks are not all the same size.
+
+    :param fname: the file to read
+    :param blocksize: roughly how much data to return at a time (BGZF files use their own block sizes)
+    :param threads: the number of threads to use
+    :return: a generator of bytes
+    """
+
+    ctype = compression_type(fname)
+    if ctype == 'bgzf' and threads > 1:
+        return _bgzf_blocks(fname, threads)
+    return _threaded_blocks(_open_binary_reader(fname, ctype), blocksize)
+
+
+class _BlockReader(io.RawIOBase):
+    """
+    Turn a generator of blocks of bytes into a read only file object
+    """
+
+    def __init__(self, blocks):
+        self._blocks = blocks
+        self._buf = memoryview(b'')
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        while not self._buf:
+            try:
+                self._buf = memoryview(next(self._blocks))
+            except StopIteration:
+                return 0
+        n = min(len(b), len(self._buf))
+        b[:n] = self._buf[:n]
+        self._buf = self._buf[n:]
+        return n
+
+    def close(self):
+        if not self.closed:
+            self._blocks.close()
+        super().close()
+
+
+class BgzfWriter(io.RawIOBase):
+    """
+    Write a BGZF file, compressing the blocks in a pool of worker threads.
+    """
+
+    def __init__(self, fname, threads=THREADS, level=6):
+        self._fh = open(fname, 'wb')
+        self._level = level
+        self._threads = threads
+        self._pool = ThreadPoolExecutor(threads)
+        self._pending = deque()
+        self._buf = bytearray()
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        self._buf += b
+        batchsize = BGZF_BLOCKSIZE * BGZF_BATCH
+        while len(self._buf) >= batchsize:
+            self._submit(bytes(self._buf[:batchsize]))
+            del self._buf[:batchsize]
+        return len(b)
+
+    def _submit(self, data):
+        self._pending.append(self._pool.submit(_deflate_bgzf, data, self._level))
+        while len(self._pending) > 2 * self._threads:
+            self._fh.write(self._pending.popleft().result())
+
+    def close(self):
+        if self.closed:
+            return
+        try:
+            if self._buf:
+                self._submit(bytes(self._buf))
+                self._buf = bytearray()
+            while self._pending:
+                self._fh.write(self._pending.popleft().result())
+            self._fh.write(BGZF_EOF)
+        finally:
+            self._pool.shutdown()
+            self._fh.close()
+            super().close()
+
+
+def _deflate_bgzf(data, level):
+    """
+    Compress data into one or more BGZF blocks (this runs in a worker thread)
+
+    :param data: the uncompressed data
+    :param level: the compression level
+    :return: the BGZF blocks as bytes
+    """
+
+    out = []
+    for start in range(0, len(data), BGZF_BLOCKSIZE):
+        block = data[start:start + BGZF_BLOCKSIZE]
+        c = zlib.compressobj(level, zlib.DEFLATED, -15)
+        cdata = c.compress(block) + c.flush()
+        out.append(struct.pack('<BBBBIBBHBBHH', 31, 139, 8, 4, 0, 0, 255, 6, 66, 67, 2, len(cdata) + 25))
+        out.append(cdata)
+        out.append(struct.pack('<II', zlib.crc32(block), len(block)))
+    return b''.join(out)
+
+
+def _zstandard():
+    """
+    Import zstandard, with a useful message if it is not installed
+    """
+    try:
+        import zstandard
+    except ImportError:
+        sys.stderr.write("ERROR: Please install zstandard to read and write .zst files: pip install zstandard\n")
+        raise
+    return zstandard
+
+
+def _open_binary_reader(fname, ctype):
+    """
+    Open a file for reading bytes without any of the threading
+
+    :param fname: the file name
+    :param ctype: the compression type from compression_type()
+    :return: a binary file handle
+    """
+
+    if ctype in ('bgzf', 'gzip'):
+        return gzip.open(fname, 'rb')
+    if ctype == 'zstd':
+        return _zstandard().open(fname, 'rb')
+    if ctype == 'lrz':
+        return subprocess.Popen(['/usr/bin/lrunzip', '-q', '-d', '-f', '-o-', fname], stdout=subprocess.PIPE).stdout
+    return open(fname, 'rb')
+
+
+def open_compressed(fname, mode='rt', threads=THREADS, level=6, encoding='utf-8', errors=None):
+    """
+    Open a file that may be compressed. When reading we figure out the compression from the file
+    (so a gzip file without .gz is fine), and when writing we use the extension: .gz is written as
+    BGZF and .zst as zstd. Everything else is written uncompressed.
+
+    :param fname: the file name
+    :param mode: 'r', 'rt', 'rb', 'w', 'wt', 'wb', 'a', etc. Text mode is the default, like open()
+    :param threads: the number of threads to use for (de)compression
+    :param level: the compression level for writing
+    :param encoding: the text encoding in text mode. We don't use the locale's encoding, so a file always reads
+                     the same way
+    :param errors: how to handle encoding errors in text mode (see open())
+    :return: a file object
+    """
+
+    text = 'b' not in mode
+    textargs = {'encoding': encoding, 'errors': errors} if text else {}
+    if 'r' in mode:
+        ctype = compression_type(fname)
+        if ctype is None:
+            return open(fname, mode, **textargs)
+        handle = io.BufferedReader(_BlockReader(read_compressed_blocks(fname, threads=threads)), 1024 * 1024)
+    elif fname.endswith('.gz') and 'a' not in mode:
+        handle = io.BufferedWriter(BgzfWriter(fname, threads, level), 1024 * 1024)
+    elif fname.endswith('.gz'):
+        # appending another gzip member is fine, but we do it single threaded
+        handle = gzip.open(fname, mode.replace('t', '').replace('b', '') + 'b', compresslevel=level)
+    elif fname.endswith('.zst'):
+        zstandard = _zstandard()
+        cctx = zstandard.ZstdCompressor(level=min(level, 22), threads=threads)
+        handle = zstandard.open(fname, mode.replace('t', '').replace('b', '') + 'b', cctx=cctx)
+    else:
+        return open(fname, mode, **textargs)
+
+    if text:
+        return io.TextIOWrapper(handle, **textargs)
+    return handle
@@ -0,0 +1,248 @@
+"""
+Cophenetic (patristic) distances between the leaves of a tree.
+
+The distance between two leaves is d(root, a) + d(root, b) - 2 * d(root, lca(a, b)), so we calculate the
+distance from the root to every node once, and find the last common ancestor of each pair of leaves from
+an Euler tour of the tree and a sparse table of range minima. The nodes in a NewickTree are numbered in
+preorder, so the last common ancestor is the smallest node number in the Euler tour between the first visits
+to the two leaves.
+
+Then we fill the matrix a block of rows at a time with numpy, so a few thousand leaves take seconds.
+
+    tree = read_newick('tree.nwk')
+    cd = CopheneticDistances(tree)
+    names, matrix = cd.names, cd.matrix()
+    cd.write('matrix.tsv')
+"""
+
+import io
+import os
+import sys
+import argparse
+import numpy as np
+from .newick import read_newick
+from .compression import open_compressed
+
+__author__ = 'Rob Edwards'
+
+# how many distances we calculate at once
+BLOCKSIZE = 2 ** 22
+
+
+class CopheneticDistances(object):
+    """
+    The distances between the leaves of a NewickTree.
+
+    :param tree: the NewickTree
+    :param leaves: the leaf nodes to use, in the order you want them. The default is all the leaves sorted by name.
+    """
+
+    def __init__(self, tree, leaves=None):
+        self.tree = tree
+        if leaves is None:
+            leaves = sorted(tree.leaves().tolist(), key=tree.name_of)
+        self.nodes = np.asarray(leaves, dtype=np.int64)
+        self.names = [tree.name_of(i) for i in self.nodes]
+        self.root_distance = tree.root_distances()
+        self._euler_tour()
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def _euler_tour(self):
+        """
+        Walk around the tree and make a sparse table of the minimum node in each range of the walk
+        """
+
+        first_child = self.tree.first_child.tolist()
+        next_sibling = self.tree.next_sibling.tolist()
+        nxt = list(first_child)
+        root = self.tree.root
+        first = [0] * len(first_child)
+        euler = [root]
+        stack = [root]
+        while stack:
+            v = stack[-1]
+            c = nxt[v]
+            if c != -1:
+                nxt[v] = next_sibling[c]
+                first[c] = len(euler)
+                euler.append(c)
+                stack.append(c)
+            else:
+                stack.pop()
+                if stack:
+                    euler.append(stack[-1])
+
+        self.first = np.array(first, dtype=np.int64)
+        euler = np.array(euler, dtype=np.int32)
+        m = len(euler)
+        levels = max(1, int(m).bit_length())
+        self.table = np.full((levels, m), np.iinfo(np.int32).max, dtype=np.int32)
+        self.table[0] = euler
+        for j in range(1, levels):
+            step = 1 << (j - 1)
+            self.table[j, :m - step] = np.minimum(self.table[j - 1, :m - step], self.table[j - 1, step:])
+        self.log2 = np.zeros(m + 1, dtype=np.int64)
+        self.log2[2:] = np.floor(np.log2(np.arange(2, m + 1))).astype(np.int64)
+
+    def lca(self, a, b):
+        """
+        The last common ancestors of pairs of nodes
+        :param a: a node or a numpy array of nodes
+        :param b: a node or a numpy array of nodes (that broadcasts with a)
+        :return: the last common ancestors
+        """
+
+        fa = self.first[a]
+        fb = self.first[b]
+        lo = np.minimum(fa, fb)
+        hi = np.maximum(fa, fb)
+        k = self.log2[hi - lo + 1]
+        return np.minimum(self.table[k, lo], self.table[k, hi - (1 << k) + 1])
+
+    def distances(self, rows, cols=None):
+        """
+        The distances between some of the leaves
+        :param rows: the positions of the leaves (in self.names) for the rows
+        :param cols: the positions of the leaves for the columns. Default: all the leaves
+        :return: a len(rows) x len(cols) numpy array of distances
+        """
+
+        a = self.nodes[np.asarray(rows)][:, None]
+        b = self.nodes if cols is None else self.nodes[np.asarray(cols)]
+        b = b[None, :]
+        return self.root_distance[a] + self.root_distance[b] - 2 * self.root_distance[self.lca(a, b)]
+
+    def blocks(self, blocksize=BLOCKSIZE):
+        """
+        Calculate the matrix a block of rows at a time
+        :param blocksize: the approximate number of distances in each block
+        :return: a generator of the first row and the distances for the block of rows
+        """
+
+        n = len(self)
+        rows = max(1, blocksize // max(n, 1))
+        for start in range(0, n, rows):
+            yield start, self.distances(np.arange(start, min(start + rows, n)))
+
+    def matrix(self, outfile=None, dtype=None, blocksize=BLOCKSIZE, verbose=False):
+        """
+        The whole distance matrix
+        :param outfile: write the matrix to this .npy file and memory map it, rather than keeping it in memory
+        :param dtype: the type of the matrix. Default: float32 for a file, float64 in memory
+        :param blocksize: the approximate number of distances we calculate at once
+        :param verbose: more output
+        :return: a numpy array (or memmap) of the distances in the order of self.names
+        """
+
+        n = len(self)
+        if outfile:
+            out = np.lib.format.open_memmap(outfile, mode='w+', dtype=dtype or np.float32, shape=(n, n))
+        else:
+            out = np.empty((n, n), dtype=dtype or np.float64)
+        for start, d in self.blocks(blocksize):
+            out[start:start + len(d)] = d
+            if verbose:
+                sys.stderr.write(f"Calculated {start + len(d):,} of {n:,} rows\n")
+        if outfile:
+            out.flush()
+        return out
+
+    def write(self, outfile, fmt='%.10g', blocksize=BLOCKSIZE, verbose=False):
+        """
+        Write the distance matrix as a tab separated file, a block of rows at a time
+        :param outfile: the file name, or an open file handle
+        :param fmt: the format for the distances
+        :param blocksize: the approximate number of distances we calculate at once
+        :param verbose: more output
+        :return: nothing
+        """
+
+        fh = open_compressed(outfile, 'wt') if isinstance(outfile, str) else outfile
+        fh.write("\t".join([""] + self.names) + "\n")
+        for start, d in self.blocks(blocksize):
+            buf = io.StringIO()
+            np.savetxt(buf, d, fmt=fmt, delimiter="\t")
+            rows = buf.getvalue().split("\n")
+            fh.write("".join(f"{self.names[start + i]}\t{row}\n" for i, row in enumerate(rows[:len(d)])))
+            if verbose:
+                sys.stderr.write(f"Wrote {start + len(d):,} of {len(self):,} rows\n")
+        if isinstance(outfile, str):
+            fh.close()
+
+    def write_pairs(self, outfile, both=False, blocksize=BLOCKSIZE, verbose=False):
+        """
+        Write the distance between each pair of leaves as name1, name2, distance
+        :param outfile: the file name, or an open file handle
+        :param both: write A -> B and B -> A. Default is to only write one, with the names in order
+        :param blocksize: the approximate number of distances we calculate at once
+        :param verbose: more output
+        :return: nothing
+        """
+
+        fh = open_compressed(outfile, 'wt') if isinstance(outfile, str) else outfile
+        names = self.names
+        for start, d in self.blocks(blocksize):
+            out = []
+            for i, row in enumerate(d.tolist()):
+                a = names[start + i]
+                for j in range(start + i + 1, len(names)):
+                    b = names[j]
+                    if both:
+                        out.append(f"{a}\t{b}\t{row[j]}\n{b}\t{a}\t{row[j]}\n")
+                    elif a < b:
+                        out.append(f"{a}\t{b}\t{row[j]}\n")
+                    else:
+                        out.append(f"{b}\t{a}\t{row[j]}\n")
+            fh.write("".join(out))
+            if verbose:
+                sys.stderr.write(f"Wrote {start + len(d):,} of {len(self):,} rows\n")
+        if isinstance(outfile, str):
+            fh.close()
+
+    def closest(self, blocksize=BLOCKSIZE):
+        """
+        The closest other leaf to each leaf. If there is a tie we take the first one in self.names
+        :param blocksize: the approximate number of distances we calculate at once
+        :return: numpy arrays of the position of the closest leaf (-1 if there is only one leaf) and its distance
+        """
+
+        n = len(self)
+        closest = np.full(n, -1, dtype=np.int64)
+        distance = np.full(n, np.inf)
+        if n < 2:
+            return closest, distance
+        for start, d in self.blocks(blocksize):
+            rows = np.arange(len(d))
+            d[rows, start + rows] = np.inf
+            closest[start:start + len(d)] = d.argmin(axis=1)
+            distance[start:start + len(d)] = d[rows, closest[start:start + len(d)]]
+        return closest, distance
+
+
+def cophenetic_matrix(treefile, outfile=None, dtype=None, verbose=False):
+    """
+    Read a tree and calculate the distances between all the leaves
+    :param treefile: the newick tree file
+    :param outfile: write the matrix to this .npy file and memory map it, rather than keeping it in memory
+    :param dtype: the type of the matrix. Default: float32 for a file, float64 in memory
+    :param verbose: more output
+    :return: the leaf names (sorted) and the matrix
+    """
+
+    cd = CopheneticDistances(read_newick(treefile))
+    if verbose:
+        sys.stderr.write(f"Read {treefile} with {len(cd):,} leaves\n")
+    return cd.names, cd.matrix(outfile, dtype, verbose=verbose)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Convert a tree into a cophenetic distance matrix')
+    parser.add_argument('-t', help='tree file', required=True)
+    parser.add_argument('-o', help='output file (default: stdout)')
+    parser.add_argument('-v', help='verbose output', action='store_true')
+    args = parser.parse_args()
+
+    cd = CopheneticDistances(read_newick(args.t))
+    cd.write(args.o if args.o else sys.stdout, verbose=args.v)
@@ -0,0 +1,236 @@
+"""
+Read depth along the references in a bam file, without a pileup.
+
+For each read that passes the filters we add 1 where its alignment starts and take 1 away where it ends, and
+a cumulative sum of that difference array is the depth at every position. That is the same as the number of
+reads in each pileup column (deletions and skipped regions count as covered), but there is no maximum
+depth. The other way is method='bases', which uses pysam's count_coverage and only counts the bases with a
+good quality score.
+
+The depths are numpy arrays (0-based, one entry per base of the reference), and if the bam file is indexed
+we calculate each reference in its own process.
+
+    depths = reference_depths('reads.bam')
+    coverage_stats(depths['NC_024711'])
+    window_means(depths['NC_024711'], 1000)
+"""
+
+import os
+import sys
+import argparse
+import multiprocessing
+from array import array
+import numpy as np
+import pysam
+from .compression import THREADS
+
+__author__ = 'Rob Edwards'
+
+# the reads a pileup ignores: unmapped, secondary, QC fail, and duplicates
+FLAG_FILTER = 0x4 | 0x100 | 0x200 | 0x400
+
+
+def _read_intervals(reads, flag_filter=FLAG_FILTER, min_mapq=0):
+    """
+    The parts of the references covered by some reads
+    :param reads: an iterable of pysam AlignedSegments
+    :param flag_filter: skip reads with any of these flags
+    :param min_mapq: skip reads with a lower mapping quality
+    :return: a dict of reference id and a tuple of array('l')s of the starts and ends
+    """
+
+    intervals = {}
+    for read in reads:
+        if read.flag & flag_filter or read.mapping_quality < min_mapq:
+            continue
+        rid = read.reference_id
+        # reads without a CIGAR string have no reference_end, and pileup skips them too
+        if rid < 0 or read.reference_end is None:
+            continue
+        if rid not in intervals:
+            intervals[rid] = (array('l'), array('l'))
+        starts, ends = intervals[rid]
+        starts.append(read.reference_start)
+        ends.append(read.reference_end)
+    return intervals
+
+
+def _depth_from_intervals(starts, ends, length):
+    """
+    Convert the starts and ends of the covered intervals into depths
+    :param starts: the starts of the intervals (0-based)
+    :param ends: the ends of the intervals (not included)
+    :param length: the length of the reference
+    :return: a numpy int32 array of the depth at each position
+    """
+
+    starts = np.clip(np.frombuffer(starts, dtype=np.dtype('l')), 0, length)
+    ends = np.clip(np.frombuffer(ends, dtype=np.dtype('l')), 0, length)
+    diff = np.bincount(starts, minlength=length + 1) - np.bincount(ends, minlength=length + 1)
+    return np.cumsum(diff[:length]).astype(np.int32)
+
+
+def reference_depth(bamfile, reference, method='reads', flag_filter=FLAG_FILTER, min_mapq=0, min_base_quality=15):
+    """
+    The depth at every position of one reference. The bam file must be indexed
+    :param bamfile: the bam file name
+    :param reference: the reference name
+    :param method: 'reads' to count the reads covering each position, or 'bases' to count the bases with a
+    quality score of at least min_base_quality at each position (using pysam's count_coverage)
+    :param flag_filter: skip reads with any of these flags
+    :param min_mapq: skip reads with a lower mapping quality
+    :param min_base_quality: the minimum base quality for method='bases'
+    :return: a numpy int32 array with the depth at each (0-based) position
+    """
+
+    with pysam.AlignmentFile(bamfile, 'rb') as bam:
+        length = bam.get_reference_length(reference)
+        if method == 'bases':
+            def keep(read):
+                return not read.flag & flag_filter and read.mapping_quality >= min_mapq
+            acgt = bam.count_coverage(reference, 0, length, quality_threshold=min_base_quality, read_callback=keep)
+            return np.sum([np.asarray(a, dtype=np.int32) for a in acgt], axis=0, dtype=np.int32)
+        if method != 'reads':
+            raise ValueError(f"The method must be 'reads' or 'bases', not {method}")
+        rid = bam.get_tid(reference)
+        intervals = _read_intervals(bam.fetch(reference), flag_filter, min_mapq)
+        starts, ends = intervals.get(rid, (array('l'), array('l')))
+        return _depth_from_intervals(starts, ends, length)
+
+
+def _depth_worker(job):
+    bamfile, reference, kwargs = job
+    return reference, reference_depth(bamfile, reference, **kwargs)
+
+
+def reference_depths(bamfile, references=None, processes=THREADS, method='reads', flag_filter=FLAG_FILTER,
+                     min_mapq=0, min_base_quality=15, verbose=False):
+    """
+    The depth at every position of each reference in a bam file.
+
+    If the bam file is indexed we calculate the references in parallel, otherwise we read through the whole file
+    once (and can only use method='reads').
+
+    :param bamfile: the bam file name
+    :param references: the reference names. Default: all the references in the bam file
+    :param processes: the number of processes to use
+    :param method: 'reads' or 'bases' (see reference_depth)
+    :param flag_filter: skip reads with any of these flags
+    :param min_mapq: skip reads with a lower mapping quality
+    :param min_base_quality: the minimum base quality for method='bases'
+    :param verbose: more output
+    :return: a dict of reference name and a numpy int32 array of the depth at each (0-based) position
+    """
+
+    with pysam.AlignmentFile(bamfile, 'rb') as bam:
+        if references is None:
+            references = list(bam.references)
+        for r in references:
+            if bam.get_tid(r) < 0:
+                raise ValueError(f"{r} is not a reference in {bamfile}")
+        indexed = bam.has_index()
+        if not indexed:
+            if method != 'reads':
+                raise ValueError(f"{bamfile} is not indexed, so we can only use method='reads'")
+            if verbose:
+                sys.stderr.write(f"{bamfile} is not indexed, so we read all of it in one process\n")
+            intervals = _read_intervals(bam.fetch(until_eof=True), flag_filter, min_mapq)
+            depths = {}
+            for r in references:
+                starts, ends = intervals.get(bam.get_tid(r), (array('l'), array('l')))
+                depths[r] = _depth_from_intervals(starts, ends, bam.get_reference_length(r))
+            return depths
+
+    kwargs = {'method': method, 'flag_filter': flag_filter, 'min_mapq': min_mapq,
+              'min_base_quality': min_base_quality}
+    jobs = [(bamfile, r, kwargs) for r in references]
+    if processes < 2 or len(jobs) < 2:
+        depths = dict(map(_depth_worker, jobs))
+    else:
+        ctx = multiprocessing.get_context('spawn')
+        with ctx.Pool(min(processes, len(jobs))) as pool:
+            depths = dict(pool.imap(_depth_worker, jobs))
+    if verbose:
+        sys.stderr.write(f"Calculated the depth of {len(depths):,} references in {bamfile}\n")
+    return depths
+
+
+def pooled_depth(depths, length=None):
+    """
+    Add up the depths of several references, position by position (like a pileup over all the references)
+    :param depths: a dict of reference and depth array, from reference_depths
+    :param length: the length of the array. Default: the longest reference
+    :return: a numpy int64 array of the total depth at each position
+    """
+
+    if length is None:
+        length = max((len(d) for d in depths.values()), default=0)
+    total = np.zeros(length, dtype=np.int64)
+    for d in depths.values():
+        n = min(length, len(d))
+        total[:n] += d[:n]
+    return total
+
+
+def zero_runs(depth, minlen=1):
+    """
+    The runs of positions with no coverage
+    :param depth: a numpy array of depths
+    :param minlen: the shortest run to report
+    :return: a numpy array with a row of (start, end) for each run. Positions are 0-based and end is not included
+    """
+
+    d = np.diff(np.concatenate(([0], (np.asarray(depth) == 0).astype(np.int8), [0])))
+    runs = np.column_stack((np.flatnonzero(d == 1), np.flatnonzero(d == -1)))
+    return runs[runs[:, 1] - runs[:, 0] >= minlen]
+
+
+def window_means(depth, window):
+    """
+    The mean depth in consecutive windows. The last window is left out if it is not complete
+    :param depth: a numpy array of depths
+    :param window: the window size
+    :return: a numpy array of the mean depth in each window
+    """
+
+    depth = np.asarray(depth)
+    n = len(depth) // window
+    return depth[:n * window].reshape(n, window).mean(axis=1)
+
+
+def coverage_stats(depth):
+    """
+    Summarise the depth along a reference
+    :param depth: a numpy array of depths
+    :return: a dict of the length, total (sum of the depths), mean, stdev, kurtosis (the excess kurtosis, as
+    defined in https://www.ncbi.nlm.nih.gov/pmc/articles/PMC4424905/), breadth (the fraction of positions that
+    are covered), and zero_runs (the number of runs of positions with no coverage)
+    """
+
+    depth = np.asarray(depth, dtype=np.float64)
+    n = len(depth)
+    if n == 0:
+        return {'length': 0, 'total': 0, 'mean': 0, 'stdev': 0, 'kurtosis': float('nan'), 'breadth': 0,
+                'zero_runs': 0}
+    av = depth.mean()
+    dev = depth - av
+    st = np.sqrt(np.mean(dev ** 2))
+    kurtosis = float(np.sum(dev ** 4) / (n * st ** 4) - 3) if st else float('nan')
+    return {'length': n, 'total': int(depth.sum()), 'mean': float(av), 'stdev': float(st), 'kurtosis': kurtosis,
+            'breadth': float(np.count_nonzero(depth) / n), 'zero_runs': len(zero_runs(depth))}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Summarise the coverage of each reference in a bam file")
+    parser.add_argument('-f', help='bamfile', required=True)
+    parser.add_argument('-r', help='reference name (default: all references)', action='append')
+    parser.add_argument('-m', help='method: reads or bases (default: reads)', default='reads')
+    parser.add_argument('-p', help=f'number of processes (default: {THREADS})', type=int, default=THREADS)
+    parser.add_argument('-v', help='verbose output', action='store_true')
+    args = parser.parse_args()
+
+    columns = ['length', 'total', 'mean', 'stdev', 'kurtosis', 'breadth', 'zero_runs']
+    print("\t".join(['Reference'] + columns))
+    for ref, depth in reference_depths(args.f, args.r, args.p, args.m, verbose=args.v).items():
+        stats = coverage_stats(depth)
+        print("\t".join([ref] + [str(stats[c]) for c in columns]))
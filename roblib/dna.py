@@ -1,5 +1,7 @@
 import os
 import sys
+from math import log
+from .kmer_counting import count_kmers
 
 __author__ = 'Rob Edwards'
 
@@ -20,43 +22,29 @@ def rc(dna):
 
 def shannon(dna, word):
     """
-    Count the Shannon entropy for a DNA sequence
+    Count the Shannon entropy for a DNA sequence. Words that contain anything other than A, C, G, or T
+    are ignored.
 
     :param dna: The DNA sequence
     :type dna: str
     :param word: Word length
     :type word: int
-    :return: the Shannon entropy
+    :return: the Shannon entropy (natural log)
     :rtype: float
     """
-    count = {}
-    for i in range(len(dna) - word):
-        substr = dna[i:i + word]
-        count[substr] = count.get(substr, 0) + 1
-
-    hp = 0
-    p = len(dna) - word
-    for s in count:
-        n = 1.0 * count[s]
-        hp += float((n / p) * log(n / p))
-    return 0 - hp
+    return count_kmers(dna, word, dense=False).shannon() * log(2)
+
 
 def kmers(dna, k):
     """
     Given a dna sequence return a hash with all kmers of length k and their frequency.
 
-    This method does NOT use the reverse complement, it only checks the strand you supply.
+    This method does NOT use the reverse complement, it only checks the strand you supply. The kmers are
+    upper case, and kmers that contain anything other than A, C, G, or T are ignored.
 
     :param dna: the dna sequence
     :param k: the length of the kmer
     :return: a hash of kmers and abundance
     """
 
-    counts = {}
-    for i in range(len(dna)-k):
-        subseq=dna[i:i+k]
-        counts[subseq] = counts.get(subseq, 0) + 1
-
-    return counts
-
-
+    return count_kmers(dna, k, dense=False).to_dict()
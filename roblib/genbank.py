@@ -1,5 +1,8 @@
 """
 Read a genbank file and do things with it!
+
+All the functions can use either Biopython (backend='biopython', the default) or the much faster scanner in
+genbank_scanner.py (backend='scanner') to read the file.
 """
 
 import os
@@ -10,6 +13,9 @@ import gzip
 from Bio import SeqIO
 import pandas as pd
 from .colours import message
+from .compression import open_compressed
+from .translate import translate_dna
+from .genbank_scanner import scan_genbank
 
 __author__ = 'Rob Edwards'
 __copyright__ = 'Copyright 2020, Rob Edwards'
@@ -18,6 +24,8 @@ __license__ = 'MIT'
 __maintainer__ = 'Rob Edwards'
 __email__ = 'raedwards@gmail.com'
 
+BACKENDS = ['biopython', 'scanner']
+
 
 def is_gzip(gbkf):
     """
@@ -38,12 +46,26 @@ def genbank_seqio(gbkf, verbose=False):
     :return:
     """
 
-    if is_gzip(gbkf):
-        handle = gzip.open(gbkf, 'rt')
-    else:
-        handle = open(gbkf, 'r')
+    handle = open_compressed(gbkf, 'rt')
     return SeqIO.parse(handle, "genbank")
 
+
+def genbank_records(gbkf, backend='biopython', feature_types=None, verbose=False):
+    """
+    Read the records in a genbank file with either backend
+    :param gbkf: genbank file
+    :param backend: 'biopython' for SeqRecords, or 'scanner' for the lighter GenbankRecords
+    :param feature_types: the feature types we need. The scanner only keeps these; Biopython keeps everything
+    :param verbose: more output
+    :return: a generator of records
+    """
+
+    if backend == 'scanner':
+        return scan_genbank(gbkf, feature_types, verbose=verbose)
+    if backend == 'biopython':
+        return genbank_seqio(gbkf, verbose)
+    raise ValueError(f"The backend must be one of {BACKENDS}, not {backend}")
+
 def feature_id(seq, feat):
     """
     Choose the appropriate id for the feature
@@ -65,174 +87,199 @@ def feat_to_text(feat, qual):
         return " ".join(feat.qualifiers[qual])
     return "-"
 
-def genbank_to_fna(gbkf):
+def genbank_to_fna(gbkf, backend='biopython'):
     """
     Parse a genbank file
     :param gbkf: genbank file
-    :param verbose:
+    :param backend: 'biopython' or 'scanner'
     :return: a dict of the sequences
     """
 
-    for seq in genbank_seqio(gbkf):
+    for seq in genbank_records(gbkf, backend, feature_types=()):
         yield seq.id, seq.seq
 
-def genbank_to_faa(gbkf, complexheader=False, verbose=False):
+def _complex_header(seq, feat, cid):
+    """
+    Add the contig, organism, location and function to a feature id
+    :param seq: the record
+    :param feat: the feature
+    :param cid: the feature id
+    :return: the longer id
+    """
+
+    (start, stop, strand) = (int(feat.location.start), int(feat.location.end), feat.location.strand)
+    loc = f"{start}_{stop}"
+    if strand == -1:
+        loc = f"{stop}_{start}"
+
+    cid += f' [{seq.id}] '
+    if 'organism' in seq.annotations:
+        cid += f' [{seq.annotations["organism"]}]'
+    cid += f' [{seq.id}_{loc}]'
+    if 'product' in feat.qualifiers:
+        cid += f' {feat.qualifiers["product"][0]}'
+    else:
+        cid += f' [hypothetical protein]'
+    return cid
+
+
+def record_to_faa(seq, complexheader=False):
+    """
+    The proteins in one genbank record
+    :param seq: the record (from genbank_records)
+    :param complexheader: more detail in the header
+    :return: yield the record id, protein id and sequence
+    """
+
+    for feat in seq.features:
+        if feat.type != 'CDS':
+            continue
+        cid = feature_id(seq, feat)
+        if complexheader:
+            cid = _complex_header(seq, feat, cid)
+
+        if 'translation' in feat.qualifiers:
+            yield seq.id, cid, feat.qualifiers['translation'][0]
+        else:
+            code = feat.qualifiers.get('transl_table', [1])[0]
+            yield seq.id, cid, translate_dna(str(feat.extract(seq.seq)), code=int(code))
+
+
+def genbank_to_faa(gbkf, complexheader=False, verbose=False, backend='biopython'):
     """
     Parse a genbank file
     :param gbkf: the genbank file
     :param complexheader: more detail in the header
     :param verbose: more output
+    :param backend: 'biopython' or 'scanner'
     :return: yield the protein id and sequence
     """
 
-    for seq in genbank_seqio(gbkf):
-        for feat in seq.features:
-            if feat.type != 'CDS':
-                continue
-            (start, stop, strand) = (feat.location.start.position, feat.location.end.position, feat.strand)
-            prtmtd = {
-                'EC_number': "",
-                'locus_tag': "",
-                'note': "",
-                'product': "",
-                'protein_id': "",
-                'ribosomal_slippage': "",
-                'transl_table': 11,
-                'translation': ""
-            }
-
-            cid = feature_id(seq, feat)
-
-            if complexheader:
-                loc = f"{start}_{stop}"
-                if strand < 0:
-                    loc = f"{stop}_{start}"
-
-                cid += f' [{seq.id}] '
-                if 'organism' in seq.annotations:
-                    cid += f' [{seq.annotations["organism"]}]'
-                cid += f' [{seq.id}_{loc}]'
-                if 'product' in feat.qualifiers:
-                    cid += f' {feat.qualifiers["product"][0]}'
-                else:
-                    cid += f' [hypothetical protein]'
-
-            if 'translation' in feat.qualifiers:
-                yield seq.id, cid, feat.qualifiers['translation'][0]
-            else:
-                yield seq.id, cid, str(feat.extract(seq).translate().seq)
-
-
-def genbank_to_functions(gbkf, verbose=False):
+    for seq in genbank_records(gbkf, backend, feature_types={'CDS'}):
+        yield from record_to_faa(seq, complexheader)
+
+
+def record_to_functions(seq):
+    """
+    The functions of the proteins in one genbank record
+    :param seq: the record (from genbank_records)
+    :return: yield a tple of [protein id, function]
+    """
+
+    for feat in seq.features:
+        if feat.type != 'CDS':
+            continue
+
+        cid = feature_id(seq, feat)
+
+        prod = "Hypothetical protein"
+        if "product" in feat.qualifiers:
+            prod = "|".join(feat.qualifiers['product'])
+
+        yield cid, prod
+
+
+def genbank_to_functions(gbkf, verbose=False, backend='biopython'):
     """
     Parse a genbank file
     :param gbkf: the genbank file
     :param verbose: more output
+    :param backend: 'biopython' or 'scanner'
     :return: yield a tple of [protein id, function]
     """
-    for seq in genbank_seqio(gbkf):
-        for feat in seq.features:
-            if feat.type != 'CDS':
-                continue
+    for seq in genbank_records(gbkf, backend, feature_types={'CDS'}):
+        yield from record_to_functions(seq)
+
 
-            cid = feature_id(seq, feat)
+def record_to_orfs(seq, complexheader=False):
+    """
+    The DNA sequences of the CDSs in one genbank record
+    :param seq: the record (from genbank_records)
+    :param complexheader: more detail in the header
+    :return: yield the record id, protein id and DNA sequence
+    """
 
-            prod = "Hypothetical protein"
-            if "product" in feat.qualifiers:
-                prod = "|".join(feat.qualifiers['product'])
+    for feat in seq.features:
+        if feat.type != 'CDS':
+            continue
+        cid = feature_id(seq, feat)
+        if complexheader:
+            cid = _complex_header(seq, feat, cid)
 
-            yield cid, prod
+        yield seq.id, cid, str(feat.extract(seq.seq))
 
 
-def genbank_to_orfs(gbkf, complexheader=False, verbose=False):
+def genbank_to_orfs(gbkf, complexheader=False, verbose=False, backend='biopython'):
     """
     Parse a genbank file
     :param gbkf:
     :param complexheader:
     :param verbose:
+    :param backend: 'biopython' or 'scanner'
     :return: a dict of the sequences
     """
 
-    for seq in genbank_seqio(gbkf):
-        for feat in seq.features:
-            if feat.type != 'CDS':
-                continue
-            (start, stop, strand) = (feat.location.start.position, feat.location.end.position, feat.strand)
-            prtmtd = {
-                'EC_number': "",
-                'locus_tag': "",
-                'note': "",
-                'product': "",
-                'protein_id': "",
-                'ribosomal_slippage': "",
-                'transl_table': 11,
-                'translation': ""
-            }
-
-            cid = feature_id(seq, feat)
-
-            if complexheader:
-                loc = f"{start}_{stop}"
-                if strand < 0:
-                    loc = f"{stop}_{start}"
-
-                cid += f' [{seq.id}] '
-                if 'organism' in seq.annotations:
-                    cid += f' [{seq.annotations["organism"]}]'
-                cid += f' [{seq.id}_{loc}]'
-                if 'product' in feat.qualifiers:
-                    cid += f' {feat.qualifiers["product"][0]}'
-                else:
-                    cid += f' [hypothetical protein]'
-
-            yield seq.id, cid, str(feat.extract(seq).seq)
-
-
-def genbank_to_ptt(gbkf, printout=False, verbose=False):
+    for seq in genbank_records(gbkf, backend, feature_types={'CDS'}):
+        yield from record_to_orfs(seq, complexheader)
+
+
+GI_RE = re.compile(r'GI:(\d+)')
+COG_RE = re.compile(r'(COG\S+)')
+
+
+def record_to_ptt(seq):
+    """
+    The rows of the ptt table for one genbank record
+    :param seq: the record (from genbank_records)
+    :return: yield a list of the ptt columns for each CDS
+    """
+
+    for feat in seq.features:
+        if feat.type != "CDS":
+            continue
+
+        gi = "-"
+        if GI_RE.match(feat_to_text(feat, 'db_xref')):
+            gi = GI_RE.match(feat_to_text(feat, 'db_xref'))[1]
+
+        cog = "-"
+        if COG_RE.match(feat_to_text(feat, 'product')):
+            cog = COG_RE.match(feat_to_text(feat, 'product'))[1]
+
+        gene = feat_to_text(feat, 'gene')
+        if gene == "-":
+            gene = str(feat.location)
+
+        cid = feature_id(seq, feat)
+
+        yield [
+            f"{feat.location.start}..{feat.location.end}",
+            "-" if feat.location.strand == -1 else "+",
+            (len(feat.location) / 3) - 1,
+            gi,
+            gene,
+            cid,
+            cog,
+            feat_to_text(feat, 'product')
+        ]
+
+
+def genbank_to_ptt(gbkf, printout=False, verbose=False, backend='biopython'):
     """
     Convert the genbank file to a table with the same columns of the ptt file
     :param gbkf: the genbank input file
     :param printout: print the table
     :param verbose: more output
+    :param backend: 'biopython' or 'scanner'
     :return: the table
     """
 
     res = []
 
-    gire = re.compile('GI:(\d+)')
-    cogre = re.compile('(COG\S+)')
-    for seq in genbank_seqio(gbkf):
+    for seq in genbank_records(gbkf, backend, feature_types={'CDS'}):
         if verbose:
             sys.stderr.write(f"Parsing {seq.id}\n")
-        for feat in seq.features:
-            if feat.type != "CDS":
-                continue
-
-            gi = "-"
-            if gire.match(feat_to_text(feat, 'db_xref')):
-                gi = gire.match(feat_to_text(feat, 'db_xref'))[1]
-
-            cog = "-"
-            if cogre.match(feat_to_text(feat, 'product')):
-                cog = cogre.match(feat_to_text(feat, 'product'))[1]
-
-            gene = feat_to_text(feat, 'gene')
-            if gene == "-":
-                gene = str(feat.location)
-
-            cid = feature_id(seq, feat)
-
-            thisres = [
-                f"{feat.location.start}..{feat.location.end}",
-                "+" if feat.strand >= 0 else "-",
-                (len(feat.location) / 3) - 1,
-                gi,
-                gene,
-                cid,
-                cog,
-                feat_to_text(feat, 'product')
-            ]
-
+        for thisres in record_to_ptt(seq):
             if printout:
                 print("\t".join(map(str, thisres)))
 
@@ -240,7 +287,25 @@ def genbank_to_ptt(gbkf, printout=False, verbose=False):
 
     return res
 
-def genbank_to_phage_finder(gbkf, verbose=False):
+
+def record_to_phage_finder(seq):
+    """
+    The phage_finder rows for one genbank record (see genbank_to_phage_finder)
+    :param seq: the record (from genbank_records)
+    :return: yields a tple of the data for each CDS
+    """
+
+    for feat in seq.features:
+        if feat.type != 'CDS':
+            continue
+        cid = feature_id(seq, feat)
+        fn = "Hypothetical protein"
+        if 'product' in feat.qualifiers:
+            fn = feat_to_text(feat, 'product')
+        yield [seq.id, len(seq), cid, feat.location.start, feat.location.end, fn]
+
+
+def genbank_to_phage_finder(gbkf, verbose=False, backend='biopython'):
     """
     This is a very specific format used by phage_finder (http://phage-finder.sourceforge.net/documentation.htm)
     - contig id, including >
@@ -252,20 +317,15 @@ def genbank_to_phage_finder(gbkf, verbose=False):
 
     :param gbkf: the genbank file
     :param verbose: more output
+    :param backend: 'biopython' or 'scanner'
     :return: yields a tple of this data
     """
 
-    for seq in genbank_seqio(gbkf):
-        for feat in seq.features:
-            if feat.type != 'CDS':
-                continue
-            cid = feature_id(seq, feat)
-            fn = "Hypothetical protein"
-            if 'product' in feat.qualifiers:
-                fn = feat_to_text(feat, 'product')
-            yield [seq.id, len(seq.seq), cid, feat.location.start, feat.location.end, fn]
+    for seq in genbank_records(gbkf, backend, feature_types={'CDS'}):
+        yield from record_to_phage_finder(seq)
 
-def genbank_to_pandas(gbkf, mincontiglen, ignorepartials=True, convert_selenocysteine=False, verbose=False):
+def genbank_to_pandas(gbkf, mincontiglen, ignorepartials=True, convert_selenocysteine=False, verbose=False,
+                      backend='biopython'):
     """
     This is a bit of a specific format used by phage_boost. its a simple dataframe with a couple of
     additional columns:
@@ -282,12 +342,13 @@ def genbank_to_pandas(gbkf, mincontiglen, ignorepartials=True, convert_selenocys
     :param convert_selenocysteine: PhageBoost crashes with a selenocysteine protein because it is not included in Biopython
     :param gbkf: Genbank file to parse
     :param verbose: more output
+    :param backend: 'biopython' or 'scanner'
     :return: a pandas data frame
     """
 
     c = 0
     genes = []
-    for seq in genbank_seqio(gbkf):
+    for seq in genbank_records(gbkf, backend, feature_types={'CDS'}):
         if len(seq) < mincontiglen:
             message(f"Skipped {seq.id} because it's length ({len(seq)}) is less than the minimum contig length ({mincontiglen})", "RED")
             continue
@@ -301,14 +362,14 @@ def genbank_to_pandas(gbkf, mincontiglen, ignorepartials=True, convert_selenocys
             if 'truncated' in feat.qualifiers:
                 partial = 1
 
-            dnaseq = str(feat.extract(seq).seq)
+            dnaseq = str(feat.extract(seq.seq))
             if len(dnaseq) == 0:
                 message(f"The DNA sequence for {feature_id(seq, feat)} was zero, so skipped", "RED")
                 continue
 
             # we just do a de novo translation rather than relying on the translation provided
             # in the genbank file that is often wrong
-            trans = str(feat.extract(seq).translate().seq)
+            trans = translate_dna(dnaseq, code=1)
 
             while trans.endswith('*'):
                 trans = trans[:-1]
@@ -333,7 +394,7 @@ def genbank_to_pandas(gbkf, mincontiglen, ignorepartials=True, convert_selenocys
 
             if convert_selenocysteine:
                 trans = trans.replace('U', 'C')
-            row = [seq.id, c, feat.location.start.position, feat.location.end.position, feat.strand,
+            row = [seq.id, c, int(feat.location.start), int(feat.location.end), feat.location.strand,
                    partial, dnaseq, trans, tid]
             c += 1
 
@@ -0,0 +1,353 @@
+"""
+Convert a genbank file to several outputs at once.
+
+The genbank_to_* functions each read the whole file, so making proteins, ORFs, a ptt table and the functions
+means reading the file four times. Here we read each record once and give it to every writer:
+
+    writers = [FaaWriter('genome.faa'), OrfsWriter('genome.orfs'), PttWriter('genome.ptt'),
+               FunctionsWriter('genome.functions')]
+    convert_genbank('genome.gbk', writers)
+
+The writers are in WRITERS, so you can also name them:
+
+    convert_genbank('genome.gbk', make_writers({'faa': 'genome.faa', 'table': 'genome.parquet'}))
+
+and convert_genbank_files() converts lots of files in parallel, each to its own outputs:
+
+    convert_genbank_files(files, {'faa': 'proteins/{name}.faa', 'fna': 'genomes/{name}.fna'}, processes=8)
+"""
+
+import os
+import sys
+import argparse
+import multiprocessing
+from abc import ABC, abstractmethod
+from .compression import open_compressed, THREADS
+from .genbank import genbank_records, record_to_faa, record_to_orfs, record_to_ptt, record_to_functions
+from .genbank import record_to_phage_finder, feat_to_text, BACKENDS
+
+__author__ = 'Rob Edwards'
+
+
+class GenbankWriter(ABC):
+    """
+    Write something for every record in a genbank file.
+
+    Subclasses set feature_types (the features they need, or None for all of them) and implement write_record().
+
+    :param outfile: the file to write to (it is compressed if it ends .gz or .zst). If separate is True, this is a
+    template, and {} is replaced with the record id
+    :param separate: write each record to its own file
+    """
+
+    feature_types = {'CDS'}
+
+    def __init__(self, outfile, separate=False):
+        self.outfile = outfile
+        self.separate = separate
+        self._fh = None
+        self._current = None
+
+    def handle(self, seqid):
+        """
+        The file handle to write a record to
+        :param seqid: the record id
+        :return: an open file handle
+        """
+
+        name = self.outfile.format(seqid) if self.separate else self.outfile
+        if name != self._current:
+            if self._fh:
+                self._fh.close()
+            self._fh = open_compressed(name, 'wt')
+            self._current = name
+        return self._fh
+
+    def write(self, seqid, text):
+        """
+        Write the text for a record. With separate files, we don't make a file for a record with nothing in it
+        :param seqid: the record id
+        :param text: the text to write
+        """
+
+        if text or not self.separate:
+            self.handle(seqid).write(text)
+
+    @abstractmethod
+    def write_record(self, seq):
+        """
+        Write the output for a record
+        :param seq: the SeqRecord
+        """
+
+    def close(self):
+        if self._fh:
+            self._fh.close()
+        self._fh = None
+        self._current = None
+
+
+class FnaWriter(GenbankWriter):
+    """
+    The DNA sequence of each record, in fasta format
+    """
+
+    feature_types = set()
+
+    def write_record(self, seq):
+        self.write(seq.id, f">{seq.id}\n{seq.seq}\n")
+
+
+class FaaWriter(GenbankWriter):
+    """
+    The protein sequences, in fasta format
+
+    :param outfile: the file to write to
+    :param separate: write each record to its own file
+    :param complexheader: more detail in the fasta headers
+    """
+
+    def __init__(self, outfile, separate=False, complexheader=False):
+        super().__init__(outfile, separate)
+        self.complexheader = complexheader
+
+    def write_record(self, seq):
+        self.write(seq.id, "".join(f">{cid}\n{prot}\n" for seqid, cid, prot in record_to_faa(seq, self.complexheader)))
+
+
+class OrfsWriter(FaaWriter):
+    """
+    The DNA sequences of the CDSs, in fasta format
+    """
+
+    def write_record(self, seq):
+        self.write(seq.id, "".join(f">{cid}\n{dna}\n" for seqid, cid, dna in record_to_orfs(seq, self.complexheader)))
+
+
+class PttWriter(GenbankWriter):
+    """
+    A table with the same columns as the ptt file
+    """
+
+    def write_record(self, seq):
+        self.write(seq.id, "".join("\t".join(map(str, r)) + "\n" for r in record_to_ptt(seq)))
+
+
+class FunctionsWriter(GenbankWriter):
+    """
+    A two column table of protein id and function
+    """
+
+    def write_record(self, seq):
+        self.write(seq.id, "".join(f"{pid}\t{prod}\n" for pid, prod in record_to_functions(seq)))
+
+
+class PhageFinderWriter(GenbankWriter):
+    """
+    The table for phage_finder (see genbank_to_phage_finder)
+    """
+
+    def write_record(self, seq):
+        self.write(seq.id, "".join("\t".join(map(str, r)) + "\n" for r in record_to_phage_finder(seq)))
+
+
+class TableWriter(GenbankWriter):
+    """
+    A table with one row per CDS. A .parquet file is written with pyarrow a batch of rows at a time, and anything
+    else is a tab separated file. If outfile is None we keep the rows, and dataframe() gives you a pandas
+    data frame.
+
+    :param outfile: the .parquet or tab separated file to write, or None
+    :param batchsize: the number of rows in each parquet row group
+    """
+
+    COLUMNS = ['contig', 'id', 'start', 'stop', 'strand', 'locus_tag', 'product', 'dna', 'protein']
+
+    def __init__(self, outfile=None, batchsize=100000):
+        super().__init__(outfile)
+        self.batchsize = batchsize
+        self.rows = {c: [] for c in self.COLUMNS}
+        self._parquet = None
+        self._header = False
+
+    def write_record(self, seq):
+        for (seqid, cid, prot), (_, _, dna), feat in zip(record_to_faa(seq), record_to_orfs(seq),
+                                                         [f for f in seq.features if f.type == 'CDS']):
+            row = [seq.id, cid, int(feat.location.start), int(feat.location.end), feat.location.strand or 0,
+                   feat_to_text(feat, 'locus_tag'), feat_to_text(feat, 'product'), dna, prot]
+            for c, v in zip(self.COLUMNS, row):
+                self.rows[c].append(v)
+        if self.outfile and len(self.rows['contig']) >= self.batchsize:
+            self._flush()
+
+    def _flush(self):
+        """
+        Write the rows we have to the file
+        """
+
+        if not self.rows['contig']:
+            return
+        if self.outfile.endswith('.parquet'):
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+            table = pa.table(self.rows)
+            if self._parquet is None:
+                self._parquet = pq.ParquetWriter(self.outfile, table.schema)
+            self._parquet.write_table(table)
+        else:
+            fh = self.handle(None)
+            if not self._header:
+                fh.write("\t".join(self.COLUMNS) + "\n")
+                self._header = True
+            fh.write("".join("\t".join(map(str, r)) + "\n" for r in zip(*self.rows.values())))
+        self.rows = {c: [] for c in self.COLUMNS}
+
+    def dataframe(self):
+        """
+        The rows we kept as a pandas data frame (only when outfile is None)
+        :return: a pandas DataFrame
+        """
+
+        import pandas as pd
+        return pd.DataFrame(self.rows, columns=self.COLUMNS)
+
+    def close(self):
+        if self.outfile:
+            self._flush()
+        if self._parquet:
+            self._parquet.close()
+            self._parquet = None
+        super().close()
+
+
+WRITERS = {
+    'faa': FaaWriter,
+    'fna': FnaWriter,
+    'orfs': OrfsWriter,
+    'ptt': PttWriter,
+    'functions': FunctionsWriter,
+    'phage_finder': PhageFinderWriter,
+    'table': TableWriter,
+}
+
+
+def make_writers(outputs, separate=False, complexheader=False):
+    """
+    Make the writers for some outputs
+    :param outputs: a dict of output type (a key of WRITERS) and the file to write it to
+    :param separate: write each record to its own file (for faa, fna and orfs). The file names need a {}
+    :param complexheader: more detail in the fasta headers (for faa and orfs)
+    :return: a list of GenbankWriters
+    """
+
+    writers = []
+    for kind, outfile in outputs.items():
+        if kind not in WRITERS:
+            raise ValueError(f"There is no writer for {kind}. Please use one of {list(WRITERS)}")
+        if kind in ('faa', 'orfs'):
+            writers.append(WRITERS[kind](outfile, separate, complexheader))
+        elif kind == 'fna':
+            writers.append(WRITERS[kind](outfile, separate))
+        else:
+            writers.append(WRITERS[kind](outfile))
+    return writers
+
+
+def convert_genbank(gbkf, writers, backend='scanner', verbose=False):
+    """
+    Read a genbank file once, and give each record to all the writers
+    :param gbkf: the genbank file (it can be compressed)
+    :param writers: a list of GenbankWriters
+    :param backend: 'scanner' or 'biopython' (see genbank_records)
+    :param verbose: more output
+    :return: the number of records
+    """
+
+    feature_types = set()
+    for w in writers:
+        if w.feature_types is None:
+            feature_types = None
+            break
+        feature_types |= w.feature_types
+
+    n = 0
+    try:
+        for seq in genbank_records(gbkf, backend, feature_types):
+            for w in writers:
+                w.write_record(seq)
+            n += 1
+    finally:
+        for w in writers:
+            w.close()
+    if verbose:
+        sys.stderr.write(f"Converted {n:,} records from {gbkf} to {len(writers)} outputs\n")
+    return n
+
+
+def genbank_name(gbkf):
+    """
+    The name of a genbank file without the directory or the extensions (e.g. .gbk.gz)
+    :param gbkf: the genbank file
+    :return: the name
+    """
+
+    name = os.path.basename(gbkf)
+    for ext in ('.gz', '.zst', '.bz2'):
+        if name.endswith(ext):
+            name = name[:-len(ext)]
+    return os.path.splitext(name)[0]
+
+
+def _convert_one(job):
+    gbkf, outputs, separate, complexheader, backend, verbose = job
+    files = {k: v.replace('{name}', genbank_name(gbkf)) for k, v in outputs.items()}
+    return gbkf, convert_genbank(gbkf, make_writers(files, separate, complexheader), backend, verbose)
+
+
+def convert_genbank_files(files, outputs, processes=THREADS, separate=False, complexheader=False,
+                          backend='scanner', verbose=False):
+    """
+    Convert lots of genbank files, one file per process
+    :param files: the genbank files
+    :param outputs: a dict of output type (a key of WRITERS) and the file to write it to. {name} in the file name
+    is replaced with the name of the genbank file (see genbank_name), so each file has its own outputs
+    :param processes: the number of processes to use
+    :param separate: write each record to its own file (for faa, fna and orfs)
+    :param complexheader: more detail in the fasta headers (for faa and orfs)
+    :param backend: 'scanner' or 'biopython'
+    :param verbose: more output
+    :return: a dict of genbank file and the number of records in it
+    """
+
+    if len(files) > 1:
+        for kind, outfile in outputs.items():
+            if '{name}' not in outfile:
+                raise ValueError(f"The {kind} output {outfile} needs {{name}} in it, so each file has its own output")
+    jobs = [(f, outputs, separate, complexheader, backend, verbose) for f in files]
+    if processes < 2 or len(jobs) < 2:
+        return dict(map(_convert_one, jobs))
+    ctx = multiprocessing.get_context('spawn')
+    with ctx.Pool(min(processes, len(jobs))) as pool:
+        return dict(pool.imap_unordered(_convert_one, jobs))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Convert genbank files to several outputs in one pass. ' +
+                                                 'Use {name} in the output names for the name of each genbank file')
+    parser.add_argument('-g', help='genbank file(s)', nargs='+', required=True)
+    for kind in WRITERS:
+        parser.add_argument(f'--{kind}', help=f'{kind} output file')
+    parser.add_argument('-c', help='complex identifier line', action='store_true')
+    parser.add_argument('-s', help='separate each record into its own file (put {} in the faa, fna and orfs names)',
+                        action='store_true')
+    parser.add_argument('-b', help='backend: scanner or biopython (default: scanner)', default='scanner',
+                        choices=BACKENDS)
+    parser.add_argument('-p', help=f'number of processes (default: {THREADS})', type=int, default=THREADS)
+    parser.add_argument('-v', help='verbose output', action='store_true')
+    args = parser.parse_args()
+
+    outs = {k: getattr(args, k) for k in WRITERS if getattr(args, k)}
+    if not outs:
+        sys.stderr.write(f"Please provide at least one output: {' '.join('--' + k for k in WRITERS)}\n")
+        sys.exit(1)
+    convert_genbank_files(args.g, outs, args.p, args.s, args.c, args.b, args.v)
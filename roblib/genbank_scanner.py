@@ -0,0 +1,480 @@
+"""
+A fast, light weight reader for GenBank (and GBFF) files.
+
+Biopython builds a SeqRecord for every entry, with a SeqFeature, location objects and a dict of every qualifier
+for every feature. Most of the time we only want a few qualifiers from the CDS features, so here we:
+
+- read the file in large blocks and split it into whole records
+- only pull out the header lines we use (LOCUS, DEFINITION, ACCESSION, VERSION, ORGANISM)
+- split the feature table on the feature keys, and only keep the feature types you ask for
+- leave the qualifiers as text until you ask for one, and then only clean up the values of that qualifier
+- keep the sequence as one str, so extracting a CDS is just slicing it
+
+The records and features look enough like Biopython's that the functions in genbank.py work with either:
+record.id, record.name, record.description, record.annotations['organism'], record.seq, record.features,
+feature.type, feature.qualifiers, feature.location (with start, end, strand, parts, len() and the same str()),
+and feature.extract(record.seq). The difference is that the sequences are str, not Seq objects.
+
+    for record in scan_genbank('genomes.gbff.gz', feature_types={'CDS'}):
+        for feat in record.features:
+            print(feat.qualifiers.get('protein_id'), feat.extract(record.seq))
+"""
+
+import re
+import sys
+from collections.abc import Mapping
+from .compression import open_compressed
+from .dna import rc
+
+__author__ = 'Rob Edwards'
+
+# how much of the file we read at a time
+BLOCKSIZE = 2 ** 23
+
+# the width of the left hand column, where the feature keys are
+QUALIFIER_INDENT = 21
+
+_FEATURE_START = re.compile(r'\n {5}(\S+)')
+_TABLE_END = re.compile(r'\n\S')
+_LOCUS = re.compile(r'^LOCUS {7}(.*)$', re.M)
+_DEFINITION = re.compile(r'^DEFINITION  (.*(?:\n {12}.*)*)', re.M)
+_ACCESSION = re.compile(r'^ACCESSION   (\S+)', re.M)
+_VERSION = re.compile(r'^VERSION     (\S+)', re.M)
+_ORGANISM = re.compile(r'^  ORGANISM  (.*)$', re.M)
+_NOT_SEQUENCE = str.maketrans('', '', '0123456789 \t\r\n')
+
+
+class Position(int):
+    """
+    A fuzzy position in a location. It is an int, but the str() has < or > if it is before or after the position
+    (just like Biopython's BeforePosition and AfterPosition). Exact positions are just ints
+    """
+
+    def __new__(cls, position, fuzzy=''):
+        pos = int.__new__(cls, position)
+        pos.fuzzy = fuzzy
+        return pos
+
+    def __str__(self):
+        return self.fuzzy + int.__repr__(self)
+
+    def __repr__(self):
+        return f"Position({int.__repr__(self)}, '{self.fuzzy}')"
+
+
+class Location(object):
+    """
+    The location of a feature: one or more parts of (start, end, strand), in the order they are joined.
+    Positions are 0-based and the end is not included, like Biopython.
+
+    :param parts: a list of tuples of (start, end, strand, ref). ref is None unless the part is on another sequence
+    :param operator: join or order, if there is more than one part
+    """
+
+    __slots__ = ('parts', 'operator')
+
+    def __init__(self, parts, operator='join'):
+        self.parts = parts
+        self.operator = operator
+
+    @property
+    def start(self):
+        return min((p[0] for p in self.parts), default=0)
+
+    @property
+    def end(self):
+        return max((p[1] for p in self.parts), default=0)
+
+    @property
+    def strand(self):
+        strands = {p[2] for p in self.parts}
+        return strands.pop() if len(strands) == 1 else None
+
+    def __len__(self):
+        return sum(int(e) - int(s) for s, e, strand, ref in self.parts)
+
+    def __str__(self):
+        parts = []
+        for start, end, strand, ref in self.parts:
+            s = f"[{start}:{end}]" + {1: "(+)", -1: "(-)", 0: "(?)"}.get(strand, "")
+            parts.append(f"{ref}:{s}" if ref else s)
+        if len(parts) == 1:
+            return parts[0]
+        return f"{self.operator}{{{', '.join(parts)}}}"
+
+    def extract(self, sequence):
+        """
+        The sequence of this location
+        :param sequence: the sequence of the record as a str
+        :return: the sequence of the location as a str
+        """
+
+        out = []
+        for start, end, strand, ref in self.parts:
+            if ref:
+                raise ValueError(f"The location {self} is on another sequence ({ref}), so we can not extract it")
+            out.append(rc(sequence[start:end]) if strand == -1 else sequence[start:end])
+        return "".join(out)
+
+
+def _split_top_level(text):
+    """
+    Split the text on the commas that are not inside brackets
+    """
+
+    parts = []
+    depth = 0
+    last = 0
+    for i, c in enumerate(text):
+        if c == '(':
+            depth += 1
+        elif c == ')':
+            depth -= 1
+        elif c == ',' and depth == 0:
+            parts.append(text[last:i])
+            last = i + 1
+    parts.append(text[last:])
+    return parts
+
+
+def _position(text, end=False):
+    """
+    Convert one position to an int (or a Position if it is fuzzy), 0-based for the start
+    """
+
+    if text.isdigit():
+        return int(text) if end else int(text) - 1
+    fuzzy = ''
+    if text[0] in '<>':
+        fuzzy = text[0]
+        text = text[1:]
+    if text.startswith('('):
+        # one of a range of positions, e.g. (102.110). Use the outer end, like Biopython
+        values = text.strip('()').split('.')
+        text = values[-1] if end else values[0]
+    pos = int(text) if end else int(text) - 1
+    return Position(pos, fuzzy) if fuzzy else pos
+
+
+def _parse_parts(text):
+    """
+    Parse a location string into a list of parts and the operator
+    """
+
+    if text.startswith('complement(') and text.endswith(')'):
+        parts, operator = _parse_parts(text[11:-1])
+        return [(s, e, -strand, ref) for s, e, strand, ref in reversed(parts)], operator
+    for operator in ('join', 'order', 'bond'):
+        if text.startswith(operator + '(') and text.endswith(')'):
+            parts = []
+            for t in _split_top_level(text[len(operator) + 1:-1]):
+                parts.extend(_parse_parts(t.strip())[0])
+            return parts, operator
+    ref = None
+    if ':' in text:
+        ref, text = text.split(':', 1)
+    if '..' in text:
+        s, e = text.split('..', 1)
+        return [(_position(s), _position(e, True), 1, ref)], 'join'
+    if '^' in text:
+        # the site between two bases
+        s = _position(text.split('^')[0], True)
+        return [(s, s, 1, ref)], 'join'
+    return [(_position(text), _position(text, True), 1, ref)], 'join'
+
+
+def parse_location(text):
+    """
+    Parse a GenBank location, e.g. complement(join(<1..100,200..>300))
+    :param text: the location string
+    :return: a Location
+    """
+
+    try:
+        return Location(*_parse_parts("".join(text.split())))
+    except (ValueError, IndexError):
+        raise ValueError(f"Can not parse the location {text}") from None
+
+
+def _clean_qualifier(key, value):
+    """
+    Clean up a qualifier value the same way that Biopython does
+    """
+
+    if value is None:
+        return ""
+    value = value.replace("\n", " ")
+    if len(value) > 1 and value[0] == '"' and value[-1] == '"':
+        value = value[1:-1]
+    value = value.replace('""', '"')
+    if key == 'translation':
+        value = "".join(value.split())
+    return value
+
+
+class Qualifiers(Mapping):
+    """
+    The qualifiers of a feature. We keep the text of the qualifiers from the GenBank file, and only split them up
+    when we first need one, and only clean up the values of the qualifiers you ask for.
+
+    Each value is a list of str, like Biopython.
+
+    :param text: the qualifier lines of the feature
+    """
+
+    __slots__ = ('_text', '_raw', '_values')
+
+    def __init__(self, text):
+        self._text = text
+        self._raw = None
+        self._values = {}
+
+    def _split(self):
+        """
+        Split the lines into the qualifiers, keeping quoted values that go over several lines together
+        """
+
+        raw = {}
+        # the qualifier lines without the indent
+        text = "\n".join(map(str.strip, self._text.strip().split("\n")))
+        n = len(text)
+        pos = 0
+        while pos < n:
+            eol = text.find("\n", pos)
+            if eol == -1:
+                eol = n
+            if text[pos] != '/':
+                pos = eol + 1
+                continue
+            eq = text.find('=', pos, eol)
+            if eq == -1:
+                raw.setdefault(text[pos + 1:eol], []).append(None)
+                pos = eol + 1
+                continue
+            first = text[eq + 1:eol]
+            end = eol
+            if first[:1] == ' ' and first.lstrip()[:1] == '"':
+                first = first.lstrip()
+            if first == '"' or (first[:1] == '"' and first[-1] != '"'):
+                # a quoted value continues until a line that ends with a quote
+                end = text.find('"\n', eol)
+                end = n if end == -1 else end + 1
+            while end < n and text[end + 1] != '/':
+                # a value that goes onto the next line without quotes
+                end = text.find("\n", end + 1)
+                if end == -1:
+                    end = n
+            value = text[eq + 1:end]
+            raw.setdefault(text[pos + 1:eq], []).append(value.lstrip() if value[:1] == ' ' and first[:1] == '"' else value)
+            pos = end + 1
+        self._raw = raw
+        self._text = None
+
+    @property
+    def raw(self):
+        if self._raw is None:
+            self._split()
+        return self._raw
+
+    def __getitem__(self, key):
+        if key not in self._values:
+            if key not in self.raw:
+                raise KeyError(key)
+            values = self.raw[key]
+            # a qualifier with no value (e.g. /pseudo) is an empty string if it comes first, and otherwise ignored
+            values = [v for i, v in enumerate(values) if v is not None or i == 0]
+            self._values[key] = [_clean_qualifier(key, v) for v in values]
+        return self._values[key]
+
+    def __contains__(self, key):
+        return key in self.raw
+
+    def __iter__(self):
+        return iter(self.raw)
+
+    def __len__(self):
+        return len(self.raw)
+
+
+class GenbankFeature(object):
+    """
+    A feature in a GenBank record.
+
+    :param featuretype: the feature key, e.g. CDS
+    :param text: the text of the feature from the feature table, starting after the feature key
+    """
+
+    __slots__ = ('type', '_text', '_location', '_qualifiers')
+
+    def __init__(self, featuretype, text):
+        self.type = featuretype
+        self._text = text
+        self._location = None
+        self._qualifiers = None
+
+    def _split(self):
+        """
+        Separate the location (which may go over several lines) from the qualifiers. There is never a / in a
+        location, so the qualifiers start at the first one
+        """
+
+        slash = self._text.find('/')
+        if slash == -1:
+            slash = len(self._text)
+        self._location = parse_location(self._text[:slash])
+        self._qualifiers = Qualifiers(self._text[slash:])
+        self._text = None
+
+    @property
+    def location(self):
+        if self._location is None:
+            self._split()
+        return self._location
+
+    @property
+    def qualifiers(self):
+        if self._qualifiers is None:
+            self._split()
+        return self._qualifiers
+
+    def extract(self, sequence):
+        """
+        The sequence of this feature
+        :param sequence: the sequence of the record (record.seq)
+        :return: the sequence as a str
+        """
+
+        return self.location.extract(str(sequence))
+
+    def __repr__(self):
+        return f"GenbankFeature({self.type}, {self.location})"
+
+
+class GenbankRecord(object):
+    """
+    One entry in a GenBank file.
+
+    :ivar id: the accession.version (or the accession, or the locus name)
+    :ivar name: the locus name
+    :ivar description: the definition line, without the final full stop
+    :ivar annotations: a dict with the organism, topology and molecule_type
+    :ivar seq: the sequence as an upper case str (empty if there is no ORIGIN)
+    :ivar features: a list of GenbankFeatures
+    """
+
+    __slots__ = ('id', 'name', 'description', 'annotations', 'seq', 'features', 'length')
+
+    def __init__(self, seqid, name, description, annotations, seq, features, length):
+        self.id = seqid
+        self.name = name
+        self.description = description
+        self.annotations = annotations
+        self.seq = seq
+        self.features = features
+        self.length = length
+
+    def __len__(self):
+        return len(self.seq) if self.seq else self.length
+
+    def __repr__(self):
+        return f"GenbankRecord({self.id}, {len(self)} bp, {len(self.features)} features)"
+
+
+def _parse_features(text, feature_types=None):
+    """
+    Split the feature table into features
+    :param text: the feature table, after the FEATURES line
+    :param feature_types: a set of the feature types to keep, or None for all of them
+    :return: a list of GenbankFeatures
+    """
+
+    features = []
+    starts = [(m.start(), m.group(1)) for m in _FEATURE_START.finditer("\n" + text)]
+    for i, (start, key) in enumerate(starts):
+        if feature_types is not None and key not in feature_types:
+            continue
+        end = starts[i + 1][0] if i + 1 < len(starts) else len(text)
+        features.append(GenbankFeature(key, text[start + QUALIFIER_INDENT:end]))
+    return features
+
+
+def parse_record(text, feature_types=None, sequence=True):
+    """
+    Parse the text of one GenBank record
+    :param text: the record, up to (but not including) the // line
+    :param feature_types: a set of the feature types to keep, or None for all of them
+    :param sequence: read the sequence
+    :return: a GenbankRecord
+    """
+
+    features_at = text.find("\nFEATURES ")
+    origin_at = text.find("\nORIGIN")
+    if origin_at == -1:
+        origin_at = len(text)
+    header = text[:features_at if features_at != -1 else origin_at]
+
+    locus = _LOCUS.search(header)
+    fields = locus.group(1).split() if locus else []
+    name = fields[0] if fields else ""
+    length = int(fields[1]) if len(fields) > 2 and fields[1].isdigit() else 0
+    annotations = {}
+    for f in fields[2:]:
+        if f in ('linear', 'circular'):
+            annotations['topology'] = f
+        elif f[-3:] in ('DNA', 'RNA') or f == 'mRNA':
+            annotations['molecule_type'] = f
+    organism = _ORGANISM.search(header)
+    if organism:
+        annotations['organism'] = organism.group(1).strip()
+
+    m = _VERSION.search(header) or _ACCESSION.search(header)
+    seqid = m.group(1) if m else name
+    m = _DEFINITION.search(header)
+    description = " ".join(m.group(1).split()) if m else ""
+    if description.endswith('.'):
+        description = description[:-1]
+
+    features = []
+    if features_at != -1:
+        # skip the FEATURES line itself, and stop at the sequence (or CONTIG)
+        table = text[text.find("\n", features_at + 1) + 1:origin_at]
+        contig = _TABLE_END.search(table)
+        if contig:
+            table = table[:contig.start()]
+        features = _parse_features(table, feature_types)
+
+    seq = ""
+    if sequence and origin_at < len(text):
+        seq = text[text.find("\n", origin_at + 1) + 1:].translate(_NOT_SEQUENCE).upper()
+
+    return GenbankRecord(seqid, name, description, annotations, seq, features, length)
+
+
+def scan_genbank(gbkf, feature_types=None, sequence=True, verbose=False):
+    """
+    Read a GenBank file one record at a time
+    :param gbkf: the GenBank file (it can be compressed)
+    :param feature_types: the feature types to keep (e.g. {'CDS'}), or None for all of them
+    :param sequence: read the sequences. If you only want the features, this is a bit faster
+    :param verbose: more output
+    :return: a generator of GenbankRecords
+    """
+
+    if feature_types is not None:
+        feature_types = set(feature_types)
+    count = 0
+    leftover = ""
+    with open_compressed(gbkf, 'rt') as f:
+        while True:
+            block = f.read(BLOCKSIZE)
+            records = (leftover + block).split("\n//")
+            leftover = records.pop() if block else ""
+            for rec in records:
+                rec = rec.lstrip("\n/")
+                if rec.strip():
+                    count += 1
+                    yield parse_record(rec, feature_types, sequence)
+            if not block:
+                break
+    if verbose:
+        sys.stderr.write(f"Read {count:,} records from {gbkf}\n")
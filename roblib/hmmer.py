@@ -0,0 +1,376 @@
+"""
+Run hmmsearch (or hmmscan) on a lot of proteins and read the tabular output.
+
+We split the proteins into batches with about the same number of amino acids in each, run one hmmsearch per
+batch at the same time, and read the --domtblout (or --tblout) file that each one writes. That is much faster
+than parsing the full text output with Bio.SearchIO. The hits from all the batches are merged into one
+HmmerHits, which keeps the protein and model names once and everything else in numpy arrays.
+
+hmmsearch calculates the E-values from the number of sequences it searched, so we pass -Z with the total
+number of proteins, and the full sequence E-values are the same as searching all the proteins at once. The
+domain i-Evalues still depend on the number of significant sequences in each batch unless you set domz.
+
+    proteins = list(genbank_proteins(['genome1.gbk', 'genome2.gbk']))
+    hits = run_hmmer('phage.hmm', proteins, processes=8)
+    hits.best_hits()
+    hits.dataframe()
+"""
+
+import os
+import sys
+import heapq
+import shutil
+import argparse
+import subprocess
+from array import array
+from tempfile import TemporaryDirectory
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from .compression import open_compressed, THREADS
+from .sequences import stream_fasta
+from .genbank import genbank_records, record_to_faa
+from .rob_error import HmmerError
+
+__author__ = 'Rob Edwards'
+
+# the numeric columns in each table, with their position on the line and the type we keep them as
+DOMTBL_COLUMNS = [
+    ('target_length', 2, 'int32'), ('query_length', 5, 'int32'), ('evalue', 6, 'float64'), ('score', 7, 'float32'),
+    ('bias', 8, 'float32'), ('domain', 9, 'int16'), ('domains', 10, 'int16'), ('c_evalue', 11, 'float64'),
+    ('i_evalue', 12, 'float64'), ('domain_score', 13, 'float32'), ('domain_bias', 14, 'float32'),
+    ('hmm_from', 15, 'int32'), ('hmm_to', 16, 'int32'), ('ali_from', 17, 'int32'), ('ali_to', 18, 'int32'),
+    ('env_from', 19, 'int32'), ('env_to', 20, 'int32'), ('acc', 21, 'float32')
+]
+
+TBL_COLUMNS = [
+    ('evalue', 4, 'float64'), ('score', 5, 'float32'), ('bias', 6, 'float32'), ('best_domain_evalue', 7, 'float64'),
+    ('best_domain_score', 8, 'float32'), ('best_domain_bias', 9, 'float32'), ('exp', 10, 'float32'),
+    ('reg', 11, 'int16'), ('clu', 12, 'int16'), ('ov', 13, 'int16'), ('env', 14, 'int16'), ('dom', 15, 'int16'),
+    ('rep', 16, 'int16'), ('inc', 17, 'int16')
+]
+
+# for each table: the columns, the number of fields before the description, and where the target and query are
+TABLES = {
+    'domtbl': (DOMTBL_COLUMNS, 22, 0, 3),
+    'tbl': (TBL_COLUMNS, 18, 0, 2),
+}
+
+PROGRAMS = ['hmmsearch', 'hmmscan']
+
+
+def stream_hmmer_table(tablefile, table='domtbl'):
+    """
+    Read a --domtblout or --tblout file one line at a time
+    :param tablefile: the file name (it can be compressed) or an open text file handle
+    :param table: 'domtbl' or 'tbl'
+    :return: yield the target name, query name, and a list of the numeric fields (as str) in the order of the
+    table's columns
+    """
+
+    if table not in TABLES:
+        raise HmmerError(f"The table must be one of {list(TABLES)}, not {table}")
+    columns, nfields, t, q = TABLES[table]
+    positions = [c[1] for c in columns]
+    fh = open_compressed(tablefile, 'rt') if isinstance(tablefile, str) else tablefile
+    try:
+        for l in fh:
+            if l.startswith('#') or not l.strip():
+                continue
+            p = l.split(None, nfields)
+            if len(p) < nfields:
+                raise HmmerError(f"Expected at least {nfields} fields in the {table} line {l}")
+            yield p[t], p[q], [p[i] for i in positions]
+    finally:
+        if isinstance(tablefile, str):
+            fh.close()
+
+
+class HmmerHits(object):
+    """
+    The hits in a hmmer table.
+
+    proteins and models are the names, and for hit i, protein[i] and model[i] are their positions in those
+    lists. Every numeric column of the table (see DOMTBL_COLUMNS and TBL_COLUMNS) is a numpy array, so
+    hits['evalue'][i] is the full sequence E-value of hit i. A domtbl has one row for each domain, so a protein
+    and model can be in there more than once.
+
+    :param rows: the rows from stream_hmmer_table
+    :param table: 'domtbl' or 'tbl'
+    :param program: 'hmmsearch' (the targets are the proteins) or 'hmmscan' (the targets are the models)
+    """
+
+    def __init__(self, rows=(), table='domtbl', program='hmmsearch'):
+        if program not in PROGRAMS:
+            raise HmmerError(f"The program must be one of {PROGRAMS}, not {program}")
+        self.table = table
+        self.proteins = []
+        self.models = []
+        pindex = {}
+        mindex = {}
+        protein = array('l')
+        model = array('l')
+        numbers = []
+        for target, query, fields in rows:
+            p, m = (target, query) if program == 'hmmsearch' else (query, target)
+            if p not in pindex:
+                pindex[p] = len(self.proteins)
+                self.proteins.append(p)
+            if m not in mindex:
+                mindex[m] = len(self.models)
+                self.models.append(m)
+            protein.append(pindex[p])
+            model.append(mindex[m])
+            numbers.append(fields)
+
+        columns = TABLES[table][0]
+        values = np.array(numbers, dtype=np.float64).reshape(len(numbers), len(columns))
+        self.protein = np.frombuffer(protein, dtype=np.dtype('l')).astype(np.int32)
+        self.model = np.frombuffer(model, dtype=np.dtype('l')).astype(np.int32)
+        self.columns = {name: values[:, i].astype(dtype) for i, (name, _, dtype) in enumerate(columns)}
+
+    @classmethod
+    def from_file(cls, tablefile, table='domtbl', program='hmmsearch'):
+        """
+        Read a --domtblout or --tblout file
+        :param tablefile: the file name (it can be compressed)
+        :param table: 'domtbl' or 'tbl'
+        :param program: the program that wrote the file, 'hmmsearch' or 'hmmscan'
+        :return: the HmmerHits
+        """
+
+        return cls(stream_hmmer_table(tablefile, table), table, program)
+
+    @classmethod
+    def merge(cls, hits):
+        """
+        Join several sets of hits from the same kind of table
+        :param hits: a list of HmmerHits
+        :return: one HmmerHits
+        """
+
+        if not hits:
+            return cls()
+        tables = {h.table for h in hits}
+        if len(tables) > 1:
+            raise HmmerError(f"Can not merge hits from different tables: {tables}")
+        merged = cls(table=hits[0].table)
+        pindex = {}
+        mindex = {}
+        proteins = []
+        models = []
+        for h in hits:
+            for names, index, merged_names in ((h.proteins, pindex, merged.proteins),
+                                               (h.models, mindex, merged.models)):
+                for n in names:
+                    if n not in index:
+                        index[n] = len(merged_names)
+                        merged_names.append(n)
+            proteins.append(np.array([pindex[n] for n in h.proteins], dtype=np.int32)[h.protein])
+            models.append(np.array([mindex[n] for n in h.models], dtype=np.int32)[h.model])
+        merged.protein = np.concatenate(proteins).astype(np.int32)
+        merged.model = np.concatenate(models).astype(np.int32)
+        merged.columns = {c: np.concatenate([h.columns[c] for h in hits]) for c in merged.columns}
+        return merged
+
+    def __len__(self):
+        return len(self.protein)
+
+    def __getitem__(self, column):
+        return self.columns[column]
+
+    def hits_by_protein(self):
+        """
+        The models that each protein hits
+        :return: a dict of protein and a dict of model and the full sequence E-value
+        """
+
+        pairs = self.protein.astype(np.int64) * max(1, len(self.models)) + self.model
+        _, first = np.unique(pairs, return_index=True)
+        first.sort()
+        allhits = {}
+        evalue = self.columns['evalue']
+        for p, m, e in zip(self.protein[first].tolist(), self.model[first].tolist(), evalue[first].tolist()):
+            allhits.setdefault(self.proteins[p], {})[self.models[m]] = e
+        return allhits
+
+    def best_hits(self):
+        """
+        The model with the lowest full sequence E-value for each protein (ties go to the higher score)
+        :return: a dict of protein and a tuple of the model and its E-value
+        """
+
+        order = np.lexsort((-self.columns['score'], self.columns['evalue'], self.protein))
+        _, first = np.unique(self.protein[order], return_index=True)
+        best = order[first]
+        return {self.proteins[p]: (self.models[m], e) for p, m, e in
+                zip(self.protein[best].tolist(), self.model[best].tolist(), self.columns['evalue'][best].tolist())}
+
+    def dataframe(self):
+        """
+        The hits as a pandas data frame, with a protein and a model column and a column for each number
+        :return: a pandas DataFrame
+        """
+
+        import pandas as pd
+        df = pd.DataFrame(self.columns)
+        df.insert(0, 'model', pd.Categorical.from_codes(self.model, self.models) if len(self.models) else [])
+        df.insert(0, 'protein', pd.Categorical.from_codes(self.protein, self.proteins) if len(self.proteins) else [])
+        return df
+
+
+def genbank_proteins(gbkfiles, backend='scanner'):
+    """
+    The proteins in some genbank files, with the same ids as genbank_to_faa
+    :param gbkfiles: a genbank file, or a list of them
+    :param backend: 'scanner' or 'biopython' (see genbank_records)
+    :return: yield the protein id and sequence
+    """
+
+    if isinstance(gbkfiles, str):
+        gbkfiles = [gbkfiles]
+    for gbkf in gbkfiles:
+        for seq in genbank_records(gbkf, backend, feature_types={'CDS'}):
+            for seqid, cid, prot in record_to_faa(seq):
+                yield cid, prot
+
+
+def protein_batches(proteins, nbatches):
+    """
+    Split some proteins into batches with about the same number of amino acids in each. The longest proteins are
+    added first, each to the batch with the fewest amino acids so far.
+    :param proteins: a list of (id, sequence) tuples
+    :param nbatches: the number of batches
+    :return: a list of batches, each a list of (id, sequence) tuples, leaving out any empty batches
+    """
+
+    nbatches = max(1, min(nbatches, len(proteins)))
+    batches = [[] for _ in range(nbatches)]
+    heap = [(0, b) for b in range(nbatches)]
+    for i in sorted(range(len(proteins)), key=lambda i: len(proteins[i][1]), reverse=True):
+        size, b = heapq.heappop(heap)
+        batches[b].append(proteins[i])
+        heapq.heappush(heap, (size + len(proteins[i][1]), b))
+    return [b for b in batches if b]
+
+
+def hmmer_command(hmmfile, fastafile, tablefile, program='hmmsearch', table='domtbl', cpu=1, evalue=1e-10,
+                  domevalue=1e-5, z=None, domz=None):
+    """
+    The command to run hmmsearch or hmmscan and write a table
+    :param hmmfile: the hmm file (it must be pressed for hmmscan)
+    :param fastafile: the protein fasta file
+    :param tablefile: the table to write
+    :param program: 'hmmsearch' or 'hmmscan'
+    :param table: 'domtbl' or 'tbl'
+    :param cpu: the number of threads for each hmmer process
+    :param evalue: the sequence E-value threshold (-E)
+    :param domevalue: the domain E-value threshold (--domE)
+    :param z: the database size for the E-values (-Z)
+    :param domz: the database size for the domain E-values (--domZ)
+    :return: the command as a list
+    """
+
+    cmd = [program, '--cpu', str(cpu), '-E', str(evalue), '--domE', str(domevalue), '--noali', '-o', os.devnull,
+           f'--{table}out', tablefile]
+    if z:
+        cmd += ['-Z', str(z)]
+    if domz:
+        cmd += ['--domZ', str(domz)]
+    return cmd + [hmmfile, fastafile]
+
+
+def _run_batch(job):
+    cmd, tablefile, table, program = job
+    result = subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    if result.returncode != 0:
+        raise HmmerError(f"{' '.join(cmd)} failed with exit code {result.returncode}:\n{result.stderr.decode()}")
+    return HmmerHits.from_file(tablefile, table, program)
+
+
+def run_hmmer(hmmfile, proteins, processes=THREADS, cpu=1, batches=None, program='hmmsearch', table='domtbl',
+              evalue=1e-10, domevalue=1e-5, domz=None, tmpdir=None, verbose=False):
+    """
+    Search some proteins with hmmer, running several hmmsearch processes at once
+    :param hmmfile: the hmm file (it must be pressed for hmmscan)
+    :param proteins: a protein fasta file, or an iterable of (id, sequence) tuples (e.g. from genbank_proteins)
+    :param processes: the number of hmmer processes to run at the same time
+    :param cpu: the number of threads for each hmmer process
+    :param batches: the number of batches to split the proteins into. Default: one per process
+    :param program: 'hmmsearch' or 'hmmscan'
+    :param table: 'domtbl' or 'tbl'
+    :param evalue: the sequence E-value threshold
+    :param domevalue: the domain E-value threshold
+    :param domz: the database size for the domain E-values (see the note at the top)
+    :param tmpdir: the directory for the batch files. Default: the system temporary directory
+    :param verbose: more output
+    :return: the HmmerHits from all the batches
+    """
+
+    if program not in PROGRAMS:
+        raise HmmerError(f"The program must be one of {PROGRAMS}, not {program}")
+    if table not in TABLES:
+        raise HmmerError(f"The table must be one of {list(TABLES)}, not {table}")
+    if not shutil.which(program):
+        raise HmmerError(f"{program} was not found. Please install hmmer and put it in your PATH")
+    if isinstance(proteins, str):
+        proteins = stream_fasta(proteins)
+    proteins = list(proteins)
+    if not proteins:
+        return HmmerHits(table=table, program=program)
+    processes = max(1, processes)
+    chunks = protein_batches(proteins, batches or processes)
+    # hmmscan's E-values depend on the number of models, which is the same for every batch
+    z = len(proteins) if program == 'hmmsearch' else None
+
+    with TemporaryDirectory(dir=tmpdir) as tmp:
+        jobs = []
+        for i, chunk in enumerate(chunks):
+            fastafile = os.path.join(tmp, f"batch{i}.faa")
+            tablefile = os.path.join(tmp, f"batch{i}.{table}")
+            with open(fastafile, 'w') as out:
+                out.write("".join(f">{pid}\n{seq}\n" for pid, seq in chunk))
+            jobs.append((hmmer_command(hmmfile, fastafile, tablefile, program, table, cpu, evalue, domevalue, z,
+                                       domz), tablefile, table, program))
+        if verbose:
+            sys.stderr.write(f"Running {program} on {len(proteins):,} proteins in {len(jobs)} batches, " +
+                             f"{min(processes, len(jobs))} at a time\n")
+        # the work is done by the hmmer processes, so threads are enough to run them
+        with ThreadPoolExecutor(min(processes, len(jobs))) as pool:
+            hits = HmmerHits.merge(list(pool.map(_run_batch, jobs)))
+    if verbose:
+        sys.stderr.write(f"Found {len(hits):,} hits to {len(hits.models):,} models in " +
+                         f"{len(hits.proteins):,} proteins\n")
+    return hits
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Search the proteins in genbank or fasta files with hmmer, ' +
+                                                 'several batches at a time, and print the best hit for each protein')
+    parser.add_argument('-g', help='genbank file(s)', nargs='+')
+    parser.add_argument('-f', help='protein fasta file')
+    parser.add_argument('-m', help='hmm file', required=True)
+    parser.add_argument('-p', help=f'number of hmmer processes (default: {THREADS})', type=int, default=THREADS)
+    parser.add_argument('-c', help='threads for each hmmer process (default: 1)', type=int, default=1)
+    parser.add_argument('-e', help='E-value threshold (default: 1e-10)', type=float, default=1e-10)
+    parser.add_argument('-d', help='domain E-value threshold (default: 1e-5)', type=float, default=1e-5)
+    parser.add_argument('-t', help='table to use (default: domtbl)', choices=list(TABLES), default='domtbl')
+    parser.add_argument('--hmmscan', help='use hmmscan instead of hmmsearch', action='store_true')
+    parser.add_argument('-a', help='print all the hits, not just the best one for each protein', action='store_true')
+    parser.add_argument('-v', help='verbose output', action='store_true')
+    args = parser.parse_args()
+
+    if args.g:
+        prots = genbank_proteins(args.g)
+    elif args.f:
+        prots = args.f
+    else:
+        sys.stderr.write("Please provide either genbank files (-g) or a protein fasta file (-f)\n")
+        sys.exit(1)
+
+    results = run_hmmer(args.m, prots, args.p, args.c, program='hmmscan' if args.hmmscan else 'hmmsearch',
+                        table=args.t, evalue=args.e, domevalue=args.d, verbose=args.v)
+    if args.a:
+        results.dataframe().to_csv(sys.stdout, sep="\t", index=False)
+    else:
+        for prot, (hmm, ev) in results.best_hits().items():
+            print(f"{prot}\t{hmm}\t{ev}")
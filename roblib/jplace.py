@@ -0,0 +1,301 @@
+"""
+Read jplace files (from pplacer, EPA, etc) without loading the whole JSON into memory.
+
+A jplace file is a JSON object with the tree, the fields, and a (very long) array of placements:
+
+    {"tree": "((A:0.1{0},B:0.2{1}):0.3{2}, ...);",
+     "placements": [{"p": [[edge_num, likelihood, like_weight_ratio, distal_length, pendant_length], ...],
+                     "nm": [["read1", 1], ...]}, ...],
+     "fields": ["edge_num", "likelihood", "like_weight_ratio", "distal_length", "pendant_length"],
+     "version": 3, "metadata": {...}}
+
+stream_placements reads the placements one at a time, and PlacementIndex stores them in numpy arrays grouped
+by edge, so for each edge you can get the reads placed there and their like_weight_ratio, pendant_length, etc.
+
+    pi = PlacementIndex('reads.jplace')
+    pi.reads_on_edge(42)
+    pi.edge(42)['like_weight_ratio']
+"""
+
+import os
+import re
+import sys
+import json
+import math
+import argparse
+from array import array
+import numpy as np
+from .compression import open_compressed
+from .newick import parse_newick
+
+__author__ = 'Rob Edwards'
+
+# how much of the file we read at a time
+BLOCKSIZE = 8 * 1024 * 1024
+_WHITESPACE = re.compile(r'\s*')
+_EDGE_NUMBERS = re.compile(r'\{(\d+)\}')
+
+
+class _JSONStream(object):
+    """
+    Read a JSON file a piece at a time. We decode one value at a time with json.JSONDecoder.raw_decode and
+    read more of the file whenever the value doesn't fit in what we have read.
+    """
+
+    def __init__(self, fh):
+        self.fh = fh
+        self.buf = ''
+        self.pos = 0
+        self.eof = False
+        self.decoder = json.JSONDecoder()
+
+    def _more(self):
+        if self.eof:
+            return False
+        block = self.fh.read(BLOCKSIZE)
+        if not block:
+            self.eof = True
+            return False
+        self.buf = self.buf[self.pos:] + block
+        self.pos = 0
+        return True
+
+    def peek(self):
+        """
+        The next character that is not whitespace
+        """
+
+        while True:
+            self.pos = _WHITESPACE.match(self.buf, self.pos).end()
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self._more():
+                return ''
+
+    def expect(self, chars):
+        c = self.peek()
+        if c not in chars:
+            raise ValueError(f"Expected one of {chars} in the JSON but found {c!r}")
+        self.pos += 1
+        return c
+
+    def value(self):
+        """
+        Decode the next value
+        """
+
+        self.peek()
+        while True:
+            try:
+                v, end = self.decoder.raw_decode(self.buf, self.pos)
+                # a number at the end of what we have read may continue in the next block
+                if end < len(self.buf) or self.eof or isinstance(v, (dict, list, str)):
+                    self.pos = end
+                    return v
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            self._more()
+
+
+def stream_placements(jpf, header=None, verbose=False):
+    """
+    Stream the placements from a jplace file
+    :param jpf: the jplace file (it can be compressed)
+    :param header: a dict that we fill with everything else in the file (the tree, fields, version, metadata)
+    :param verbose: more output
+    :return: a generator of placement dicts
+    """
+
+    if header is None:
+        header = {}
+    with open_compressed(jpf, 'rt') as f:
+        js = _JSONStream(f)
+        js.expect('{')
+        if js.peek() == '}':
+            return
+        while True:
+            key = js.value()
+            js.expect(':')
+            if key == 'placements':
+                js.expect('[')
+                n = 0
+                if js.peek() == ']':
+                    js.expect(']')
+                else:
+                    while True:
+                        yield js.value()
+                        n += 1
+                        if js.expect(',]') == ']':
+                            break
+                if verbose:
+                    sys.stderr.write(f"Read {n:,} placements from {jpf}\n")
+            else:
+                header[key] = js.value()
+            if js.expect(',}') == '}':
+                break
+
+
+def parse_jplace_tree(treestr):
+    """
+    Parse the tree from a jplace file. The edges are numbered with {n} after the branch lengths.
+    :param treestr: the tree string
+    :return: the NewickTree and a numpy array of the edge number of each node (-1 if it doesn't have one)
+    """
+
+    # we turn the edge numbers into comments that the newick parser keeps with each node
+    tree = parse_newick(_EDGE_NUMBERS.sub(r'[{\1}]', treestr))
+    edges = np.full(len(tree), -1, dtype=np.int64)
+    for node, comment in list(tree.comments.items()):
+        m = _EDGE_NUMBERS.fullmatch(comment)
+        if m:
+            edges[node] = int(m.group(1))
+            del tree.comments[node]
+    return tree, edges
+
+
+class PlacementIndex(object):
+    """
+    The placements in a jplace file, grouped by edge.
+
+    Each placement of each read is one entry. For entry i, read[i] is the index of the read in self.reads,
+    multiplicity[i] is the multiplicity of the read (1 if the file doesn't have one), and
+    values[field][i] is the value of each field (edge_num, like_weight_ratio, pendant_length, ...), or nan if
+    the value is null in the file.
+    The entries are sorted by edge_num, and edge_start[e]:edge_end[e] are the entries for the e'th edge in
+    self.edges.
+
+    :param jpf: the jplace file (it can be compressed)
+    :param verbose: more output
+    """
+
+    def __init__(self, jpf, verbose=False):
+        self.jplace_file = jpf
+        self.header = {}
+        names = {}
+        read = array('l')
+        multiplicity = array('d')
+        rows = array('d')
+        ncols = None
+        for pl in stream_placements(jpf, self.header, verbose):
+            if 'nm' in pl:
+                placed = pl['nm']
+            else:
+                placed = [[n, 1] for n in pl.get('n', [])]
+            for p in pl['p']:
+                if ncols is None:
+                    ncols = len(p)
+                elif len(p) != ncols:
+                    raise ValueError(f"Placement {p} has {len(p)} fields but we expected {ncols}")
+                if None in p:
+                    p = [math.nan if v is None else v for v in p]
+                for name, mult in placed:
+                    read.append(names.setdefault(name, len(names)))
+                    multiplicity.append(mult)
+                    rows.extend(p)
+
+        if 'fields' not in self.header:
+            raise ValueError(f"{jpf} does not have any fields")
+        self.fields = self.header['fields']
+        if ncols is not None and ncols != len(self.fields):
+            raise ValueError(f"{jpf} has {len(self.fields)} fields but the placements have {ncols} values")
+
+        self.reads = list(names)
+
+        read = np.frombuffer(read, dtype=np.dtype('l'))
+        rows = np.frombuffer(rows, dtype=np.float64).reshape(-1, len(self.fields))
+        if np.isnan(rows[:, self.fields.index('edge_num')]).any():
+            raise ValueError(f"{jpf} has placements without an edge_num")
+        order = np.argsort(rows[:, self.fields.index('edge_num')], kind='stable')
+        self.read = read[order].astype(np.int64)
+        self.multiplicity = np.frombuffer(multiplicity, dtype=np.float64)[order]
+        self.values = {f: np.ascontiguousarray(rows[order, i]) for i, f in enumerate(self.fields)}
+        self.values['edge_num'] = self.values['edge_num'].astype(np.int64)
+        edge_num = self.values['edge_num']
+        self.edges, self.edge_start = np.unique(edge_num, return_index=True)
+        self.edge_end = np.append(self.edge_start[1:], len(edge_num))
+        self._edge_index = {e: i for i, e in enumerate(self.edges.tolist())}
+        if verbose:
+            sys.stderr.write(f"Indexed {len(self.read):,} placements of {len(self.reads):,} reads on " +
+                             f"{len(self.edges):,} edges\n")
+
+    def __len__(self):
+        return len(self.read)
+
+    def _slice(self, edge_num):
+        i = self._edge_index.get(int(edge_num))
+        if i is None:
+            return slice(0, 0)
+        return slice(self.edge_start[i], self.edge_end[i])
+
+    def edge(self, edge_num):
+        """
+        The placements on an edge
+        :param edge_num: the edge number
+        :return: a dict of numpy arrays: read (the index in self.reads), multiplicity, and each of the fields
+        """
+
+        s = self._slice(edge_num)
+        data = {f: v[s] for f, v in self.values.items()}
+        data['read'] = self.read[s]
+        data['multiplicity'] = self.multiplicity[s]
+        return data
+
+    def reads_on_edge(self, edge_num):
+        """
+        The names of the reads placed on an edge
+        :param edge_num: the edge number
+        :return: a list of read names
+        """
+
+        return [self.reads[i] for i in self.read[self._slice(edge_num)].tolist()]
+
+    def edge_counts(self, weighted=False):
+        """
+        How many reads are placed on each edge
+        :param weighted: weight each placement by its multiplicity and like_weight_ratio
+        :return: a dict of edge number and count
+        """
+
+        if weighted:
+            w = self.multiplicity * self.values.get('like_weight_ratio', 1)
+            counts = np.add.reduceat(w, self.edge_start) if len(w) else []
+        else:
+            counts = self.edge_end - self.edge_start
+        return dict(zip(self.edges.tolist(), np.asarray(counts).tolist()))
+
+    def placements_by_edge(self, distmeasure):
+        """
+        The distance of each read from each edge, multiplied by the multiplicity of the read
+        :param distmeasure: the field to use for the distance (e.g. distal_length or pendant_length)
+        :return: a dict of edge numbers and a dict of the reads and their distances
+        """
+
+        if distmeasure not in self.values:
+            raise KeyError(f"{distmeasure} is not one of the fields: {self.fields}")
+        distance = (self.multiplicity * self.values[distmeasure]).tolist()
+        read = self.read.tolist()
+        placements = {}
+        for e, s, t in zip(self.edges.tolist(), self.edge_start.tolist(), self.edge_end.tolist()):
+            placements[e] = {self.reads[read[i]]: distance[i] for i in range(s, t)}
+        return placements
+
+    def tree(self):
+        """
+        The tree from the jplace file
+        :return: the NewickTree and a numpy array of the edge number of each node
+        """
+
+        return parse_jplace_tree(self.header['tree'])
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Count the placements on each edge in a jplace file')
+    parser.add_argument('-j', help='jplace file', required=True)
+    parser.add_argument('-w', help='weight the counts by multiplicity and like_weight_ratio', action='store_true')
+    parser.add_argument('-v', help='verbose output', action='store_true')
+    args = parser.parse_args()
+
+    pi = PlacementIndex(args.j, args.v)
+    for e, c in pi.edge_counts(args.w).items():
+        print(f"{e}\t{c}")
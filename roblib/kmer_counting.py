@@ -0,0 +1,430 @@
+"""
+Count k-mers with numpy.
+
+Sequences are encoded two bits per base (A=0, C=1, G=2, T=3) and every k-mer is converted to an
+integer with a rolling shift, so counting is a handful of array operations per sequence rather than a
+python loop over every position. Windows that contain anything other than A, C, G, or T are skipped.
+
+We keep sorted arrays of the k-mers we have seen and their counts. For k up to DENSE_K, once we have
+counted more than 4^k / DENSE_FRACTION k-mers we switch to an array with one entry per possible k-mer and
+count with bincount, so a short sequence does not pay for allocating and counting 4^k entries.
+
+    counts = count_kmers_in_file('reads.fastq.gz', 11, canonical=True)
+    print(counts.distinct(), counts.shannon())
+    counts['ACGTACGTACG']
+"""
+
+import numpy as np
+from .batches import SequenceBatch, stream_fastq_batches, stream_fasta_batches
+from .seqindex import sequence_format
+
+__author__ = 'Rob Edwards'
+
+BASES = 'ACGT'
+
+# count with a dense array (4^k entries) up to this k
+DENSE_K = 12
+# switch to the dense array once we have counted this fraction of 4^k k-mers
+DENSE_FRACTION = 16
+# the most bases we turn into k-mers at once. This limits the memory for very long sequences
+CHUNK = 2 ** 24
+
+# A C G T (upper or lower case) are 0 1 2 3 and everything else is 4
+_ENCODE = np.full(256, 4, dtype=np.uint8)
+for _i, _b in enumerate(BASES):
+    _ENCODE[ord(_b)] = _i
+    _ENCODE[ord(_b.lower())] = _i
+
+
+def encode(seq):
+    """
+    Encode a sequence as an array of 2-bit codes. Anything that is not A, C, G, or T is 4
+
+    :param seq: the sequence as a str, bytes, or numpy uint8 array
+    :return: a numpy uint8 array
+    """
+    if isinstance(seq, str):
+        seq = seq.encode()
+    if isinstance(seq, (bytes, bytearray, memoryview)):
+        seq = np.frombuffer(seq, dtype=np.uint8)
+    return _ENCODE[seq]
+
+
+def kmer_to_int(kmer):
+    """
+    Convert a k-mer string to its integer
+
+    :param kmer: the k-mer
+    :return: the integer
+    """
+    val = 0
+    for b in kmer.upper():
+        val = (val << 2) | BASES.index(b)
+    return val
+
+
+def int_to_kmer(code, k):
+    """
+    Convert an integer back to a k-mer string
+
+    :param code: the integer
+    :param k: the k-mer length
+    :return: the k-mer
+    """
+    code = int(code)
+    bases = []
+    for _ in range(k):
+        bases.append(BASES[code & 3])
+        code >>= 2
+    return ''.join(reversed(bases))
+
+
+def rc_int(code, k):
+    """
+    The integer of the reverse complement of a k-mer integer
+
+    :param code: the integer
+    :param k: the k-mer length
+    :return: the integer of the reverse complement
+    """
+    code = int(code)
+    rev = 0
+    for _ in range(k):
+        rev = (rev << 2) | (3 - (code & 3))
+        code >>= 2
+    return rev
+
+
+def _window_ints(codes, k):
+    """
+    The integer for every window of length k, including windows with invalid bases (we mask those later)
+    """
+    n = len(codes) - k + 1
+    if n <= 0:
+        return np.zeros(0, dtype=np.uint64)
+    c64 = (codes & 3).astype(np.uint64)
+    vals = np.zeros(n, dtype=np.uint64)
+    two = np.uint64(2)
+    for j in range(k):
+        vals <<= two
+        vals |= c64[j:j + n]
+    return vals
+
+
+def kmer_ints(codes, k, canonical=False, both_strands=False, ends=None):
+    """
+    Convert an encoded sequence to the integers of all its valid k-mers
+
+    :param codes: the encoded sequence (from encode())
+    :param k: the k-mer length (at most 32)
+    :param canonical: use the smaller of each k-mer and its reverse complement
+    :param both_strands: return the k-mers on both strands (like counting the sequence and its reverse complement)
+    :param ends: for several sequences joined together, the position that each base's sequence ends, so we
+                 don't count k-mers that span two sequences
+    :return: a numpy uint64 array
+    """
+
+    if k < 1 or k > 32:
+        raise ValueError(f"k must be between 1 and 32, not {k}")
+    n = len(codes) - k + 1
+    if n <= 0:
+        return np.zeros(0, dtype=np.uint64)
+
+    bad = np.zeros(len(codes) + 1, dtype=np.int64)
+    np.cumsum(codes > 3, out=bad[1:])
+    valid = (bad[k:] - bad[:n]) == 0
+    if ends is not None:
+        valid &= np.arange(k, n + k) <= ends[:n]
+
+    fwd = _window_ints(codes, k)
+    if not canonical and not both_strands:
+        return fwd[valid]
+
+    # the reverse complement of window i is window n-1-i of the reverse complemented sequence
+    rev = _window_ints((3 - codes)[::-1], k)[::-1]
+    if canonical:
+        return np.minimum(fwd, rev)[valid]
+    return np.concatenate((fwd[valid], rev[valid]))
+
+
+class KmerCounts(object):
+    """
+    The counts of k-mers. Add the integers from kmer_ints() with add().
+
+    :param k: the k-mer length
+    :param dense: keep a count for every possible k-mer (True), or sorted arrays of the k-mers we have seen
+                  (False). The default is to start with the sorted arrays and switch to the dense counts if
+                  k <= DENSE_K and we count more than 4^k / DENSE_FRACTION k-mers
+    """
+
+    def __init__(self, k, dense=None):
+        self.k = k
+        self.dense = bool(dense)
+        self._auto = dense is None and k <= DENSE_K
+        self._dense = np.zeros(4 ** k, dtype=np.uint64) if self.dense else None
+        self._kmers = np.zeros(0, dtype=np.uint64)
+        self._counts = np.zeros(0, dtype=np.uint64)
+        self._pending = []
+        self._pending_size = 0
+
+    def add(self, ints):
+        """
+        Count some k-mers
+
+        :param ints: a numpy array of k-mer integers
+        """
+        if self.dense:
+            self._dense += np.bincount(ints.astype(np.int64), minlength=4 ** self.k).astype(np.uint64)
+            return
+        self._pending.append(ints)
+        self._pending_size += len(ints)
+        if self._auto and self._pending_size + len(self._kmers) > 4 ** self.k // DENSE_FRACTION:
+            self._to_dense()
+        elif self._pending_size > CHUNK:
+            self._merge()
+
+    def add_counts(self, kmers, counts):
+        """
+        Add k-mers that have already been counted (e.g. from another KmerCounts)
+
+        :param kmers: a numpy array of k-mer integers
+        :param counts: a numpy array of their counts
+        """
+        if self.dense:
+            np.add.at(self._dense, kmers.astype(np.int64), counts.astype(np.uint64))
+            return
+        self._merge()
+        self._kmers, self._counts = merge_counts(self._kmers, self._counts, kmers, counts)
+        if self._auto and len(self._kmers) > 4 ** self.k // DENSE_FRACTION:
+            self._to_dense()
+
+    def _to_dense(self):
+        """
+        Move the counts from the sorted arrays to a count for every possible k-mer
+        """
+        self._dense = self.dense_counts()
+        self.dense = True
+        self._kmers = np.zeros(0, dtype=np.uint64)
+        self._counts = np.zeros(0, dtype=np.uint64)
+
+    def merge(self, other):
+        """
+        Add all the counts from another KmerCounts with the same k
+
+        :param other: the other KmerCounts
+        """
+        if other.k != self.k:
+            raise ValueError(f"Can not merge {other.k}-mers with {self.k}-mers")
+        if other.dense and not self.dense and self._auto:
+            self._to_dense()
+        if self.dense:
+            self._dense += other.dense_counts()
+        else:
+            self.add_counts(other.kmers, other.counts)
+
+    def _merge(self):
+        """
+        Fold the pending k-mers into the sorted arrays
+        """
+        if not self._pending:
+            return
+        kmers, counts = np.unique(np.concatenate(self._pending), return_counts=True)
+        self._pending = []
+        self._pending_size = 0
+        self._kmers, self._counts = merge_counts(self._kmers, self._counts, kmers, counts.astype(np.uint64))
+
+    @property
+    def kmers(self):
+        """
+        The integers of the k-mers we have seen, sorted
+        """
+        if self.dense:
+            return np.flatnonzero(self._dense).astype(np.uint64)
+        self._merge()
+        return self._kmers
+
+    @property
+    def counts(self):
+        """
+        The counts of the k-mers, in the same order as kmers
+        """
+        if self.dense:
+            return self._dense[self._dense > 0]
+        self._merge()
+        return self._counts
+
+    def dense_counts(self):
+        """
+        The counts of all 4^k possible k-mers, including the ones we did not see
+
+        :return: a numpy array with 4^k entries
+        """
+        if self.dense:
+            return self._dense
+        d = np.zeros(4 ** self.k, dtype=np.uint64)
+        d[self.kmers.astype(np.int64)] = self.counts
+        return d
+
+    def __getitem__(self, kmer):
+        code = kmer_to_int(kmer) if isinstance(kmer, str) else int(kmer)
+        if self.dense:
+            return int(self._dense[code])
+        kmers = self.kmers
+        i = np.searchsorted(kmers, np.uint64(code))
+        if i < len(kmers) and kmers[i] == code:
+            return int(self.counts[i])
+        return 0
+
+    def total(self):
+        """
+        The total number of k-mers counted
+        """
+        return int(self.counts.sum())
+
+    def distinct(self):
+        """
+        The number of different k-mers we saw
+        """
+        return len(self.counts)
+
+    def to_dict(self):
+        """
+        The counts as a dict of k-mer string: count
+        """
+        return {int_to_kmer(km, self.k): int(c) for km, c in zip(self.kmers, self.counts)}
+
+    def shannon(self):
+        """
+        The Shannon entropy (base 2) of the k-mer distribution
+        """
+        c = self.counts
+        if len(c) == 0:
+            return 0.0
+        p = c / c.sum()
+        return float(-(p * np.log2(p)).sum())
+
+    def evenness(self, H=None):
+        """
+        The evenness of the k-mer distribution: the Shannon entropy over log2 of the number of k-mers.
+        This is 0 if we saw fewer than two different k-mers
+
+        :param H: the Shannon entropy, if you already have it
+        """
+        if self.distinct() <= 1:
+            return 0.0
+        if H is None:
+            H = self.shannon()
+        return H / np.log2(self.distinct())
+
+
+def merge_counts(kmers1, counts1, kmers2, counts2):
+    """
+    Merge two sets of sorted k-mers and their counts
+
+    :return: the merged (kmers, counts) arrays, sorted
+    """
+    kmers = np.concatenate((kmers1, kmers2))
+    counts = np.concatenate((counts1, counts2))
+    if len(kmers) == 0:
+        return kmers, counts
+    order = np.argsort(kmers, kind='stable')
+    kmers = kmers[order]
+    counts = counts[order]
+    starts = np.flatnonzero(np.concatenate(([True], kmers[1:] != kmers[:-1])))
+    return kmers[starts], np.add.reduceat(counts, starts)
+
+
+def _count_codes(codes, k, counter, canonical=False, both_strands=False, ends=None):
+    """
+    Count the k-mers in an encoded sequence, a chunk at a time so that long sequences don't use too much memory
+    """
+    n = len(codes)
+    for start in range(0, max(n - k + 1, 0), CHUNK):
+        stop = min(n, start + CHUNK + k - 1)
+        e = None if ends is None else ends[start:stop] - start
+        counter.add(kmer_ints(codes[start:stop], k, canonical, both_strands, e))
+
+
+def count_batch(batch, k, counter, canonical=False, both_strands=False):
+    """
+    Count all the k-mers in a SequenceBatch at once
+
+    :param batch: the SequenceBatch
+    :param k: the k-mer length
+    :param counter: the KmerCounts to add to
+    :param canonical: count canonical k-mers
+    :param both_strands: count both strands
+    """
+    ends = np.repeat(batch.offsets[1:], batch.lengths)
+    _count_codes(encode(batch.sequences), k, counter, canonical, both_strands, ends)
+
+
+def count_kmers(sequences, k, canonical=False, both_strands=False, dense=None):
+    """
+    Count the k-mers in some sequences
+
+    :param sequences: a str, or an iterable of str, bytes, or SequenceBatch objects
+    :param k: the k-mer length
+    :param canonical: count each k-mer and its reverse complement together
+    :param both_strands: count the k-mers on both strands
+    :param dense: how to keep the counts (see KmerCounts)
+    :return: a KmerCounts object
+    """
+
+    if isinstance(sequences, (str, bytes)):
+        sequences = [sequences]
+    counter = KmerCounts(k, dense)
+    for seq in sequences:
+        if isinstance(seq, SequenceBatch):
+            count_batch(seq, k, counter, canonical, both_strands)
+        else:
+            _count_codes(encode(seq), k, counter, canonical, both_strands)
+    return counter
+
+
+def stream_batches(fname):
+    """
+    Stream a fasta or fastq file in batches, figuring out which it is
+
+    :param fname: the file name
+    :return: a generator of SequenceBatch
+    """
+    if sequence_format(fname) == 'fastq':
+        return stream_fastq_batches(fname)
+    return stream_fasta_batches(fname)
+
+
+def count_kmers_in_file(fname, k, canonical=False, both_strands=False, dense=None):
+    """
+    Count all the k-mers in a fasta or fastq file
+
+    :param fname: the file name
+    :param k: the k-mer length
+    :param canonical: count each k-mer and its reverse complement together
+    :param both_strands: count the k-mers on both strands
+    :param dense: how to keep the counts (see KmerCounts)
+    :return: a KmerCounts object
+    """
+    return count_kmers(stream_batches(fname), k, canonical, both_strands, dense)
+
+
+def positional_base_counts(batch, n, from_end=False, skip_n=True):
+    """
+    Count the bases at each of the first (or last) n positions of all the reads in a batch.
+    Reads shorter than n are skipped.
+
+    :param batch: the SequenceBatch
+    :param n: the number of positions
+    :param from_end: count the last n positions instead of the first n
+    :param skip_n: skip reads that have an N
+    :return: a numpy array of shape (n, 4) with the counts of A, C, G, T at each position
+    """
+
+    keep = batch.lengths >= n
+    if skip_n:
+        isn = (batch.sequences == ord('N')) | (batch.sequences == ord('n'))
+        keep &= batch.per_read_sum(isn) == 0
+    starts = batch.offsets[1:][keep] - n if from_end else batch.offsets[:-1][keep]
+    codes = encode(batch.sequences[starts[:, None] + np.arange(n)])
+    flat = codes.astype(np.int64) + 5 * np.arange(n)
+    return np.bincount(flat.ravel(), minlength=5 * n).reshape(n, 5)[:, :4]
@@ -0,0 +1,385 @@
+"""
+Count k-mers with several processes and save the counts in a file that we can query or merge later.
+
+The k-mers are split into shards by a hash of the k-mer, so that each shard can be counted, merged, and
+searched independently. A count file has a small JSON header followed by two arrays: the k-mers (sorted
+within each shard) and their counts. The arrays are memory mapped when the file is opened, so looking
+up a k-mer only reads a few pages of the file.
+
+    count_kmers_to_file('SRR123.fastq.gz', 'SRR123.kmc', 11, canonical=True, processes=8)
+    counts = KmerCountFile('SRR123.kmc')
+    print(counts.shannon(), counts['ACGTACGTACG'])
+    merge_kmer_files(['SRR123.kmc', 'SRR124.kmc'], 'both.kmc')
+"""
+
+import os
+import json
+import queue
+import shutil
+import tempfile
+import multiprocessing
+import numpy as np
+from .kmer_counting import DENSE_K, KmerCounts, count_batch, stream_batches, merge_counts, kmer_to_int, rc_int
+from .batches import SequenceBatch
+from .compression import THREADS
+from .rob_error import KmerCountError
+from .colours import message
+
+__author__ = 'Rob Edwards'
+
+MAGIC = b'ROBKMC01'
+# the default number of shards
+SHARDS = 16
+# an odd 64-bit constant (from the golden ratio) to mix the bits of the k-mers before we shard them
+_MIX = np.uint64(0x9E3779B97F4A7C15)
+
+
+def shard_of(kmers, shards):
+    """
+    The shard that each k-mer belongs in
+
+    :param kmers: a numpy uint64 array of k-mer integers
+    :param shards: the number of shards
+    :return: a numpy array of shard numbers
+    """
+    with np.errstate(over='ignore'):
+        return ((np.asarray(kmers, dtype=np.uint64) * _MIX) >> np.uint64(32)) % np.uint64(shards)
+
+
+def split_shards(kmers, counts, shards):
+    """
+    Split k-mers and their counts into shards. If the k-mers are sorted they stay sorted in each shard.
+
+    :return: a list of (kmers, counts) tuples, one per shard
+    """
+    s = shard_of(kmers, shards)
+    order = np.argsort(s, kind='stable')
+    bounds = np.searchsorted(s[order], np.arange(shards + 1, dtype=np.uint64))
+    kmers = kmers[order]
+    counts = counts[order]
+    return [(kmers[bounds[i]:bounds[i + 1]], counts[bounds[i]:bounds[i + 1]]) for i in range(shards)]
+
+
+class _ShardedCounts(object):
+    """
+    A KmerCounts for each shard. This only has add(), so we can count into it with count_batch().
+    """
+
+    def __init__(self, k, shards):
+        self.shards = shards
+        self.counters = [KmerCounts(k, dense=False) for _ in range(shards)]
+
+    def add(self, ints):
+        s = shard_of(ints, self.shards)
+        order = np.argsort(s, kind='stable')
+        bounds = np.searchsorted(s[order], np.arange(self.shards + 1, dtype=np.uint64))
+        ints = ints[order]
+        for i, c in enumerate(self.counters):
+            if bounds[i + 1] > bounds[i]:
+                c.add(ints[bounds[i]:bounds[i + 1]])
+
+    def shard_counts(self):
+        return [(c.kmers, c.counts) for c in self.counters]
+
+
+def _shard_file(workdir, worker, shard):
+    return os.path.join(workdir, f"worker{worker}.shard{shard}.npz")
+
+
+def _count_worker(work, worker, k, canonical, both_strands, shards, workdir):
+    """
+    Count the k-mers in the batches from the queue until we get None, and then save each shard in workdir
+    """
+
+    counter = KmerCounts(k) if k <= DENSE_K else _ShardedCounts(k, shards)
+    while True:
+        item = work.get()
+        if item is None:
+            break
+        count_batch(SequenceBatch(None, item[0], item[1]), k, counter, canonical, both_strands)
+
+    if isinstance(counter, _ShardedCounts):
+        parts = counter.shard_counts()
+    else:
+        parts = split_shards(counter.kmers, counter.counts, shards)
+    for i, (kmers, counts) in enumerate(parts):
+        np.savez(_shard_file(workdir, worker, i), kmers=kmers, counts=counts)
+
+
+def _write_count_file(outfile, header, shards, verbose=False):
+    """
+    Write a count file from an iterable of (kmers, counts) for each shard, in order.
+
+    We don't know how many k-mers there are until we have seen them all, so the arrays go to
+    temporary files first and are then copied after the header.
+    """
+
+    tmpk = outfile + '.kmers.tmp'
+    tmpc = outfile + '.counts.tmp'
+    offsets = [0]
+    total = 0
+    maxcount = 0
+    with open(tmpk, 'wb') as kout, open(tmpc, 'wb') as cout:
+        for kmers, counts in shards:
+            kout.write(np.asarray(kmers, dtype=np.uint64).tobytes())
+            cout.write(np.asarray(counts, dtype=np.uint64).tobytes())
+            offsets.append(offsets[-1] + len(kmers))
+            if len(counts):
+                total += int(counts.sum())
+                maxcount = max(maxcount, int(counts.max()))
+
+    # the counts are usually small, so save space by storing them in 32 bits if we can
+    ctype = 'u4' if maxcount < 2 ** 32 else 'u8'
+    header.update({
+        'shards': len(offsets) - 1,
+        'shard_offsets': offsets,
+        'distinct': offsets[-1],
+        'total': total,
+        'count_type': ctype
+    })
+    hjson = json.dumps(header).encode()
+    # pad the header so the arrays are 8 byte aligned
+    hjson += b' ' * (-(len(MAGIC) + 8 + len(hjson)) % 8)
+
+    try:
+        with open(outfile, 'wb') as out:
+            out.write(MAGIC)
+            out.write(len(hjson).to_bytes(8, 'little'))
+            out.write(hjson)
+            with open(tmpk, 'rb') as f:
+                shutil.copyfileobj(f, out, 16 * 1024 * 1024)
+            if offsets[-1]:
+                counts = np.memmap(tmpc, dtype=np.uint64, mode='r')
+                for i in range(0, len(counts), 2 ** 22):
+                    out.write(counts[i:i + 2 ** 22].astype(ctype).tobytes())
+                del counts
+            out.write(b'\0' * (-(offsets[-1] * np.dtype(ctype).itemsize) % 8))
+    finally:
+        os.remove(tmpk)
+        os.remove(tmpc)
+
+    if verbose:
+        message(f"Wrote {offsets[-1]} distinct {header['k']}-mers to {outfile}", "GREEN")
+    return outfile
+
+
+def write_kmer_counts(counts, outfile, canonical=False, both_strands=False, sources=None, shards=SHARDS,
+                      verbose=False):
+    """
+    Save a KmerCounts to a count file
+
+    :param counts: the KmerCounts
+    :param outfile: the file to write
+    :param canonical: whether the k-mers were counted as canonical k-mers
+    :param both_strands: whether the k-mers were counted on both strands
+    :param sources: a list of the files that the k-mers came from
+    :param shards: the number of shards
+    :param verbose: more output
+    :return: the name of the file we wrote
+    """
+    header = {'k': counts.k, 'canonical': canonical, 'both_strands': both_strands, 'sources': sources or []}
+    return _write_count_file(outfile, header, split_shards(counts.kmers, counts.counts, shards), verbose)
+
+
+def count_kmers_to_file(fname, outfile, k, canonical=False, both_strands=False, processes=THREADS,
+                        shards=SHARDS, tmpdir=None, verbose=False):
+    """
+    Count the k-mers in a fasta or fastq file using several processes, and save the counts to a file.
+
+    This process reads the sequences and hands batches of them to the workers. Each worker counts its
+    batches into its own shards, and then we merge the shards from all the workers.
+
+    :param fname: the fasta or fastq file
+    :param outfile: the count file to write
+    :param k: the k-mer length
+    :param canonical: count each k-mer and its reverse complement together
+    :param both_strands: count the k-mers on both strands
+    :param processes: the number of worker processes
+    :param shards: the number of shards
+    :param tmpdir: the directory for temporary files
+    :param verbose: more output
+    :return: the name of the file we wrote
+    """
+
+    if k < 1 or k > 32:
+        raise KmerCountError(f"k must be between 1 and 32, not {k}")
+    processes = max(1, processes)
+    workdir = tempfile.mkdtemp(prefix='kmer_counts.', dir=tmpdir)
+    ctx = multiprocessing.get_context('spawn')
+    work = ctx.Queue(maxsize=2 * processes)
+    workers = [ctx.Process(target=_count_worker, args=(work, i, k, canonical, both_strands, shards, workdir))
+               for i in range(processes)]
+    try:
+        for w in workers:
+            w.start()
+        if verbose:
+            message(f"Counting {k}-mers in {fname} with {processes} processes", "GREEN")
+
+        def put(item):
+            while True:
+                try:
+                    work.put(item, timeout=1)
+                    return
+                except queue.Full:
+                    if not all(w.is_alive() for w in workers):
+                        raise KmerCountError(f"A k-mer counting process died while counting {fname}")
+
+        for batch in stream_batches(fname):
+            put((batch.sequences, batch.offsets))
+        for _ in workers:
+            put(None)
+        for w in workers:
+            w.join()
+        if any(w.exitcode != 0 for w in workers):
+            raise KmerCountError(f"A k-mer counting process failed while counting {fname}")
+
+        def merged_shards():
+            for s in range(shards):
+                kmers = np.zeros(0, dtype=np.uint64)
+                counts = np.zeros(0, dtype=np.uint64)
+                for i in range(processes):
+                    with np.load(_shard_file(workdir, i, s)) as part:
+                        kmers, counts = merge_counts(kmers, counts, part['kmers'], part['counts'])
+                    os.remove(_shard_file(workdir, i, s))
+                yield kmers, counts
+
+        header = {'k': k, 'canonical': canonical, 'both_strands': both_strands,
+                  'sources': [os.path.basename(fname)]}
+        return _write_count_file(outfile, header, merged_shards(), verbose)
+    finally:
+        for w in workers:
+            if w.is_alive():
+                w.terminate()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+class KmerCountFile(KmerCounts):
+    """
+    A count file made by count_kmers_to_file, write_kmer_counts, or merge_kmer_files.
+
+    This is a KmerCounts, so you can get counts with counts['ACGT'] and use shannon(), evenness() and
+    so on. The arrays are memory mapped and read only.
+    """
+
+    def __init__(self, fname):
+        if not os.path.exists(fname):
+            raise KmerCountError(f"{fname} does not exist")
+        with open(fname, 'rb') as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise KmerCountError(f"{fname} is not a k-mer count file")
+            hlen = int.from_bytes(f.read(8), 'little')
+            self.header = json.loads(f.read(hlen))
+
+        super().__init__(self.header['k'], dense=False)
+        self.fname = fname
+        self.canonical = self.header['canonical']
+        self.both_strands = self.header['both_strands']
+        self.shards = self.header['shards']
+        self.shard_offsets = self.header['shard_offsets']
+        n = self.header['distinct']
+        offset = len(MAGIC) + 8 + hlen
+        if n:
+            self._kmers = np.memmap(fname, dtype=np.uint64, mode='r', offset=offset, shape=(n,))
+            self._counts = np.memmap(fname, dtype=self.header['count_type'], mode='r', offset=offset + 8 * n,
+                                     shape=(n,))
+
+    def add(self, ints):
+        raise KmerCountError(f"{self.fname} is read only. Merge it into a new file with merge_kmer_files()")
+
+    add_counts = add
+
+    def shard(self, i):
+        """
+        The k-mers and counts in one shard
+
+        :param i: the shard number
+        :return: a tuple of (kmers, counts) arrays, with the k-mers sorted
+        """
+        start, end = self.shard_offsets[i], self.shard_offsets[i + 1]
+        return self._kmers[start:end], self._counts[start:end]
+
+    def __getitem__(self, kmer):
+        code = kmer_to_int(kmer) if isinstance(kmer, str) else int(kmer)
+        if self.canonical:
+            code = min(code, rc_int(code, self.k))
+        code = np.uint64(code)
+        kmers, counts = self.shard(int(shard_of(code, self.shards)))
+        i = np.searchsorted(kmers, code)
+        if i < len(kmers) and kmers[i] == code:
+            return int(counts[i])
+        return 0
+
+    def __contains__(self, kmer):
+        return self[kmer] > 0
+
+    def __len__(self):
+        return self.header['distinct']
+
+    def total(self):
+        return self.header['total']
+
+    def close(self):
+        """
+        Release the memory maps
+        """
+        self._kmers = np.zeros(0, dtype=np.uint64)
+        self._counts = np.zeros(0, dtype=np.uint64)
+
+
+def merge_kmer_files(files, outfile, verbose=False):
+    """
+    Merge several count files into one, a shard at a time.
+
+    The files must have the same k, have been counted the same way (canonical or both strands), and
+    have the same number of shards.
+
+    :param files: the count files to merge
+    :param outfile: the merged count file to write
+    :param verbose: more output
+    :return: the name of the file we wrote
+    """
+
+    counts = [KmerCountFile(f) for f in files]
+    if not counts:
+        raise KmerCountError("No k-mer count files to merge")
+    first = counts[0]
+    for c in counts[1:]:
+        if (c.k, c.canonical, c.both_strands, c.shards) != (first.k, first.canonical, first.both_strands, first.shards):
+            raise KmerCountError(f"Can not merge {c.fname} with {first.fname}: they were not counted the same way")
+
+    def merged_shards():
+        for s in range(first.shards):
+            kmers = np.zeros(0, dtype=np.uint64)
+            cts = np.zeros(0, dtype=np.uint64)
+            for c in counts:
+                k, n = c.shard(s)
+                kmers, cts = merge_counts(kmers, cts, np.asarray(k), np.asarray(n, dtype=np.uint64))
+            yield kmers, cts
+
+    sources = []
+    for c in counts:
+        sources.extend(c.header['sources'])
+    header = {'k': first.k, 'canonical': first.canonical, 'both_strands': first.both_strands, 'sources': sources}
+    try:
+        return _write_count_file(outfile, header, merged_shards(), verbose)
+    finally:
+        for c in counts:
+            c.close()
+
+
+def kmer_jaccard(a, b):
+    """
+    The Jaccard index of the sets of k-mers in two count files, a shard at a time
+
+    :param a: a KmerCountFile
+    :param b: another KmerCountFile with the same k and number of shards
+    :return: the Jaccard index (between 0 and 1)
+    """
+
+    if (a.k, a.shards) != (b.k, b.shards):
+        raise KmerCountError(f"Can not compare {a.fname} and {b.fname}: they have different k or shards")
+    shared = 0
+    for s in range(a.shards):
+        shared += len(np.intersect1d(a.shard(s)[0], b.shard(s)[0], assume_unique=True))
+    union = len(a) + len(b) - shared
+    return shared / union if union else 0.0
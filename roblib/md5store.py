@@ -0,0 +1,308 @@
+"""
+Find the unique proteins in lots of fasta files using the md5 sums of the sequences.
+
+A python set of md5 hex strings takes about 100 bytes per protein, and that runs out of memory long before we
+get through all the phage and bacterial proteins. Instead, an Md5Store keeps the 16 byte digests in a sorted
+numpy array, and saves them to a file that we memory map the next time. New digests go into a second, smaller
+sorted array that is merged into the main one when it gets big, so adding a chunk of proteins and checking
+which ones we have seen before are both binary searches.
+
+The store file is a sorted table of digests, so two stores from different runs can be merged, and a run can
+start from the store of an earlier run and only write the proteins that are new.
+
+    store = Md5Store.load('proteins.md5s')
+    dedup_proteins(['phages.faa', 'bacteria.faa.gz'], 'nr.faa', 'idmap.tsv', store=store, processes=8)
+    store.save('proteins.md5s')
+    Md5Store.merge(['run1.md5s', 'run2.md5s']).save('all.md5s')
+"""
+
+import os
+import sys
+import json
+import hashlib
+import argparse
+import binascii
+import multiprocessing
+from collections import deque
+import numpy as np
+from .chunked_parser import fasta_blocks, _fasta_block
+from .compression import open_compressed, THREADS
+from .rob_error import Md5StoreError
+
+__author__ = 'Rob Edwards'
+
+MAGIC = b'ROBMD5S1'
+
+# the digests are compared as 16 byte strings
+DIGEST = np.dtype('S16')
+
+# the pending digests are merged into the main array when there are this many (or a quarter of the main array)
+PENDING = 1000000
+
+
+def _as_digests(digests):
+    """
+    Convert digests to a numpy array
+    :param digests: the 16 byte digests joined together as bytes, a list of digests (bytes or hex str), or an array
+    :return: a numpy S16 array
+    """
+
+    if isinstance(digests, (bytes, bytearray, memoryview)):
+        if len(digests) % 16:
+            raise Md5StoreError(f"{len(digests)} bytes is not a whole number of 16 byte digests")
+        return np.frombuffer(digests, dtype=DIGEST)
+    if isinstance(digests, np.ndarray):
+        return digests.astype(DIGEST, copy=False)
+    return np.frombuffer(b"".join(bytes.fromhex(d) if isinstance(d, str) else d for d in digests), dtype=DIGEST)
+
+
+def _isin_sorted(values, sorted_values):
+    """
+    Which values are in a sorted array
+    :param values: a numpy array
+    :param sorted_values: a sorted numpy array of the same type
+    :return: a numpy bool array
+    """
+
+    if not len(sorted_values) or not len(values):
+        return np.zeros(len(values), dtype=bool)
+    rows = np.minimum(np.searchsorted(sorted_values, values), len(sorted_values) - 1)
+    return sorted_values[rows] == values
+
+
+def _merge_sorted(a, b):
+    """
+    Join two sorted arrays of digests, without sorting them again
+    :param a: a sorted numpy array
+    :param b: a sorted numpy array (the digests that are also in a are left out)
+    :return: a sorted numpy array of the digests in either of them
+    """
+
+    b = b[~_isin_sorted(b, a)]
+    if not len(b):
+        return a
+    return np.insert(a, np.searchsorted(a, b), b)
+
+
+class Md5Store(object):
+    """
+    A sorted set of 16 byte md5 digests.
+
+    :param digests: the digests to start with (see add)
+    """
+
+    def __init__(self, digests=()):
+        self.digests = np.zeros(0, dtype=DIGEST)
+        self.pending = np.zeros(0, dtype=DIGEST)
+        self.add(digests)
+
+    @classmethod
+    def load(cls, filename):
+        """
+        Memory map a store saved with save()
+        :param filename: the file name
+        :return: the Md5Store
+        """
+
+        with open(filename, 'rb') as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise Md5StoreError(f"{filename} is not an md5 store")
+            hlen = int.from_bytes(f.read(8), 'little')
+            header = json.loads(f.read(hlen))
+        store = cls()
+        if header['records']:
+            store.digests = np.memmap(filename, dtype=DIGEST, mode='r', offset=len(MAGIC) + 8 + hlen,
+                                      shape=(header['records'],))
+        return store
+
+    @classmethod
+    def merge(cls, stores):
+        """
+        Join several stores
+        :param stores: a list of Md5Stores or store file names
+        :return: an Md5Store with all their digests
+        """
+
+        merged = cls()
+        for s in stores:
+            if isinstance(s, str):
+                s = cls.load(s)
+            s.flush()
+            merged.digests = _merge_sorted(merged.digests, s.digests)
+        return merged
+
+    def flush(self):
+        """
+        Merge the pending digests into the main sorted array
+        """
+
+        if len(self.pending):
+            self.digests = _merge_sorted(self.digests, self.pending)
+            self.pending = np.zeros(0, dtype=DIGEST)
+
+    def save(self, filename):
+        """
+        Save the digests so we can load() them again. We write a new file and then replace the old one, so you can
+        save a store to the file it was loaded from
+        :param filename: the file name
+        :return: the file name
+        """
+
+        self.flush()
+        hjson = json.dumps({'records': len(self)}).encode()
+        # pad the header so the digests are 8 byte aligned
+        hjson += b' ' * (-(len(MAGIC) + 8 + len(hjson)) % 8)
+        tmp = f"{filename}.tmp"
+        with open(tmp, 'wb') as out:
+            out.write(MAGIC)
+            out.write(len(hjson).to_bytes(8, 'little'))
+            out.write(hjson)
+            out.write(np.ascontiguousarray(self.digests).tobytes())
+        os.replace(tmp, filename)
+        return filename
+
+    def __len__(self):
+        return len(self.digests) + len(self.pending)
+
+    def __iter__(self):
+        """
+        The digests as hex strings, in sorted order
+        """
+
+        self.flush()
+        for i in range(len(self.digests)):
+            yield self.digests[i:i + 1].tobytes().hex()
+
+    def __contains__(self, digest):
+        return bool(self.contains([digest])[0])
+
+    def contains(self, digests):
+        """
+        Check a lot of digests at once
+        :param digests: the digests (see _as_digests)
+        :return: a numpy bool array that is True for the digests we have
+        """
+
+        digests = _as_digests(digests)
+        return _isin_sorted(digests, self.digests) | _isin_sorted(digests, self.pending)
+
+    def add(self, digests):
+        """
+        Add some digests
+        :param digests: the digests (see _as_digests)
+        :return: a numpy bool array that is True for the digests that are new: not in the store, and the first
+        time they are in digests
+        """
+
+        digests = _as_digests(digests)
+        new = np.zeros(len(digests), dtype=bool)
+        if not len(digests):
+            return new
+        _, first = np.unique(digests, return_index=True)
+        first = first[~self.contains(digests[first])]
+        new[first] = True
+        if len(first):
+            self.pending = _merge_sorted(self.pending, np.sort(digests[first]))
+            if len(self.pending) >= max(PENDING, len(self.digests) // 4):
+                self.flush()
+        return new
+
+
+def _hash_proteins(job):
+    """
+    Parse a block of a fasta file and calculate the md5 sums of the proteins
+    :param job: the block (from fasta_blocks), the minimum length, and whether to skip sequences with a stop (*)
+    :return: a list of the (id, seq) tuples we kept, and their digests joined together
+    """
+
+    data, minlen, nostop = job
+    records = [(seqid, seq) for seqid, seq in _fasta_block(data, True)
+               if len(seq) >= minlen and not (nostop and b'*' in seq)]
+    return records, b"".join([hashlib.md5(seq.upper()).digest() for seqid, seq in records])
+
+
+def _hashed_chunks(fastafiles, minlen, nostop, processes):
+    """
+    Read the fasta files and parse and hash the proteins in worker processes, keeping the blocks in order
+    :return: yield the records we kept in each block, and their digests
+    """
+
+    jobs = ((data, minlen, nostop) for f in fastafiles for data in fasta_blocks(f))
+    if processes < 2:
+        yield from map(_hash_proteins, jobs)
+        return
+    ctx = multiprocessing.get_context('spawn')
+    with ctx.Pool(processes) as pool:
+        waiting = deque()
+        for job in jobs:
+            waiting.append(pool.apply_async(_hash_proteins, (job,)))
+            # only read a few blocks ahead of the workers
+            if len(waiting) > 2 * processes:
+                yield waiting.popleft().get()
+        while waiting:
+            yield waiting.popleft().get()
+
+
+def dedup_proteins(fastafiles, outfile=None, idmapfile=None, store=None, minlen=0, nostop=False, processes=THREADS,
+                   append=False, verbose=False):
+    """
+    Write the proteins that we have not seen before, named by their md5 sum, and the md5 sum of every protein,
+    reading the fasta files once
+    :param fastafiles: a fasta file, or a list of them (they can be compressed)
+    :param outfile: the fasta file of the new proteins, with the md5 sum (of the upper case sequence) as the id
+    :param idmapfile: the file of md5 sum and protein id for every protein we kept
+    :param store: the Md5Store of the proteins we have seen. Default: a new, empty store
+    :param minlen: skip proteins shorter than this
+    :param nostop: skip proteins with a stop (*) in them
+    :param processes: the number of processes to hash the proteins with
+    :param append: add to the end of idmapfile rather than replacing it (e.g. when the store is from an earlier
+                   run that wrote the same id map)
+    :param verbose: more output
+    :return: the Md5Store, the number of proteins we kept, and the number of those that were new
+    """
+
+    if isinstance(fastafiles, str):
+        fastafiles = [fastafiles]
+    if store is None:
+        store = Md5Store()
+    out = open_compressed(outfile, 'wb') if outfile else None
+    idout = open_compressed(idmapfile, 'ab' if append else 'wb') if idmapfile else None
+    kept = 0
+    new = 0
+    try:
+        for records, digests in _hashed_chunks(fastafiles, minlen, nostop, processes):
+            hexes = binascii.hexlify(digests)
+            isnew = store.add(digests).tolist()
+            kept += len(records)
+            new += sum(isnew)
+            if idout:
+                idout.write(b"".join(hexes[32 * i:32 * i + 32] + b"\t" + seqid + b"\n"
+                                     for i, (seqid, seq) in enumerate(records)))
+            if out:
+                out.write(b"".join(b">" + hexes[32 * i:32 * i + 32] + b"\n" + seq + b"\n"
+                                   for i, (seqid, seq) in enumerate(records) if isnew[i]))
+    finally:
+        for fh in (out, idout):
+            if fh:
+                fh.close()
+    if verbose:
+        sys.stderr.write(f"Kept {kept:,} proteins from {len(fastafiles)} files and {new:,} of them were new. " +
+                         f"There are {len(store):,} proteins in the store\n")
+    return store, kept, new
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Merge md5 stores, or list the md5 sums in a store')
+    parser.add_argument('-s', help='md5 store file(s)', nargs='+', required=True)
+    parser.add_argument('-o', help='merge the stores into this file')
+    parser.add_argument('-v', help='verbose output', action='store_true')
+    args = parser.parse_args()
+
+    md5s = Md5Store.merge(args.s)
+    if args.o:
+        md5s.save(args.o)
+        if args.v:
+            sys.stderr.write(f"Wrote {len(md5s):,} md5 sums to {args.o}\n")
+    else:
+        for m in md5s:
+            print(m)
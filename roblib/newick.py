@@ -1,7 +1,11 @@
 import argparse
+import math
 import os
-import string
+import re
 import sys
+import numpy as np
+from .compression import open_compressed
+from .rob_error import NewickError
 
 __author__ = 'Rob Edwards'
 
@@ -15,11 +19,23 @@ Newick format:
 12:-0.00216):0.00082):0.00088):0.01351):0.05366):0.01353):0.01429,0:0.00383);
 
 This is a parser that I wrote myself. (Mainly so that other people don't have to install biopython or something
-similar). It works for vanilla newick trees, but not for more complex trees (e.g. that have trifurcating branches).
-Use at your own risk!
+similar).
+
+parse_newick (and read_newick for a file) tokenizes the tree without recursion and stores it in a NewickTree:
+numpy arrays of the parent, first child, and next sibling of every node, the branch lengths, and an index into
+a table of names. It handles multifurcating trees, quoted labels, and [comments], and trees with hundreds of
+thousands of leaves. Use to_nodes() if you want the old Node objects.
 
 """
 
+# the newick tokens: whitespace, a 'quoted label', a [comment], punctuation, an unquoted label or number,
+# and anything else, which is an error.
+_TOKENS = re.compile(r"(\s+)|'((?:[^']|'')*)'|\[([^\]]*)\]|([(),:;])|([^\s()\[\]',:;]+)|(.)", re.S)
+# names with these characters need to be quoted when we write the tree
+_NEEDS_QUOTES = re.compile(r"[\s()\[\]',:;]")
+# how many pieces of the tree we join before we write them
+WRITE_BUFFER = 100000
+
 
 class Node(object):
     """A node object"""
@@ -31,9 +47,394 @@ class Node(object):
         self.distance = ""
         self.name = ""
         self.side = None
+        self.children = []
+
+
+class NewickTree(object):
+    """
+    A tree stored in arrays. Node 0 is the root and the nodes are numbered in preorder, so every node comes
+    after its parent. For node i:
+
+        parent[i]        the parent node, or -1 for the root
+        first_child[i]   the first child, or -1 for a leaf
+        next_sibling[i]  the next child of the same parent, or -1 for the last one
+        length[i]        the branch length to the parent, or nan if the tree doesn't have one
+        name[i]          the index of the name in names, or -1 if the node doesn't have a name
+
+    and comments is a dict of the [comments] for the nodes that have them.
+    """
+
+    def __init__(self, parent, first_child, next_sibling, length, name, names, comments=None):
+        self.parent = np.asarray(parent, dtype=np.int32)
+        self.first_child = np.asarray(first_child, dtype=np.int32)
+        self.next_sibling = np.asarray(next_sibling, dtype=np.int32)
+        self.length = np.asarray(length, dtype=np.float64)
+        self.name = np.asarray(name, dtype=np.int32)
+        self.names = names
+        self.comments = comments if comments else {}
+        self.root = 0
+
+    def __len__(self):
+        return len(self.parent)
+
+    def children(self, node):
+        """
+        The children of a node
+        :param node: the node
+        :return: a generator of the child nodes
+        """
+
+        child = int(self.first_child[node])
+        while child != -1:
+            yield child
+            child = int(self.next_sibling[child])
+
+    def is_leaf(self, node):
+        return self.first_child[node] == -1
+
+    def leaves(self):
+        """
+        The leaves of the tree
+        :return: a numpy array of the leaf nodes
+        """
+
+        return np.flatnonzero(self.first_child == -1)
+
+    def name_of(self, node):
+        """
+        The name of a node
+        :param node: the node
+        :return: the name, or an empty string if the node doesn't have one
+        """
+
+        n = self.name[node]
+        return self.names[n] if n >= 0 else ""
+
+    def leaf_names(self):
+        """
+        The names of the leaves, in the order they are in the tree
+        :return: a list of names
+        """
+
+        return [self.name_of(i) for i in self.leaves()]
+
+    def find(self, name):
+        """
+        Find the nodes with a name
+        :param name: the name to find
+        :return: a numpy array of the nodes with that name
+        """
+
+        try:
+            n = self.names.index(name)
+        except ValueError:
+            return np.zeros(0, dtype=np.int64)
+        return np.flatnonzero(self.name == n)
+
+    def child_counts(self):
+        """
+        The number of children of every node
+        :return: a numpy array of the counts
+        """
+
+        return np.bincount(self.parent[1:], minlength=len(self))
+
+    def root_distances(self):
+        """
+        The distance from the root to every node. Missing branch lengths count as 0.
+        :return: a numpy array of the distances
+        """
+
+        lengths = np.nan_to_num(self.length).tolist()
+        parent = self.parent.tolist()
+        dist = [0.0] * len(parent)
+        for i in range(1, len(parent)):
+            dist[i] = dist[parent[i]] + lengths[i]
+        return np.array(dist)
+
+    def rename(self, newnames):
+        """
+        Rename the nodes in the tree
+        :param newnames: a dict of old name -> new name. Names that are not in the dict are not changed.
+        :return: the tree
+        """
+
+        self.names = [newnames.get(n, n) for n in self.names]
+        return self
+
+    def _labels(self):
+        """
+        The label we write for each name: quoted if it needs to be
+        """
+
+        labels = []
+        for n in self.names:
+            if _NEEDS_QUOTES.search(n):
+                n = "'" + n.replace("'", "''") + "'"
+            labels.append(n)
+        return labels
+
+    def write(self, fh):
+        """
+        Write the tree in newick format. We walk the tree without recursion and write it in pieces, so we
+        never have the whole tree in memory as a string.
+        :param fh: the file handle to write to
+        :return: nothing
+        """
+
+        labels = self._labels()
+        name = self.name.tolist()
+        length = self.length.tolist()
+        first_child = self.first_child.tolist()
+        next_sibling = self.next_sibling.tolist()
+
+        def label(v):
+            lab = labels[name[v]] if name[v] >= 0 else ""
+            if not math.isnan(length[v]):
+                lab += f":{length[v]}"
+            if v in self.comments:
+                lab += f"[{self.comments[v]}]"
+            return lab
+
+        out = []
+        # a node to open, ~node to close it, or None for a comma
+        stack = [self.root]
+        while stack:
+            v = stack.pop()
+            if v is None:
+                out.append(',')
+            elif v < 0:
+                out.append(')')
+                out.append(label(~v))
+            elif first_child[v] == -1:
+                out.append(label(v))
+            else:
+                out.append('(')
+                stack.append(~v)
+                kids = []
+                c = first_child[v]
+                while c != -1:
+                    kids.append(c)
+                    c = next_sibling[c]
+                for j, c in enumerate(reversed(kids)):
+                    if j:
+                        stack.append(None)
+                    stack.append(c)
+            if len(out) > WRITE_BUFFER:
+                fh.write(''.join(out))
+                out = []
+        out.append(";\n")
+        fh.write(''.join(out))
+
+    def to_string(self):
+        """
+        The tree as a newick string
+        :return: the string
+        """
+
+        out = _StringWriter()
+        self.write(out)
+        return ''.join(out.pieces)
+
+    def to_nodes(self):
+        """
+        Convert the tree to Node objects. Each Node has all its children, and left and right are the first
+        and second child.
+        :return: the root Node
+        """
+
+        nodes = []
+        for i in range(len(self)):
+            n = Node("root" if i == self.root else i)
+            n.name = self.name_of(i)
+            if not math.isnan(self.length[i]):
+                n.distance = float(self.length[i])
+            nodes.append(n)
+        for i, p in enumerate(self.parent.tolist()):
+            if p < 0:
+                continue
+            n = nodes[i]
+            n.parent = nodes[p]
+            n.parent.children.append(n)
+            if n.parent.left is None:
+                n.parent.left = n
+                n.side = "Left"
+            else:
+                if n.parent.right is None:
+                    n.parent.right = n
+                n.side = "Right"
+        return nodes[self.root]
+
+    @classmethod
+    def from_nodes(cls, root):
+        """
+        Convert a tree of Node objects to a NewickTree
+        :param root: the root Node
+        :return: the NewickTree
+        """
+
+        builder = _TreeBuilder()
+        stack = [(root, -1)]
+        while stack:
+            node, p = stack.pop()
+            v = builder.add_node(p)
+            if node.name:
+                builder.set_name(v, node.name)
+            if node.distance != "" and node.distance is not None:
+                builder.length[v] = float(node.distance)
+            kids = node.children if node.children else [c for c in (node.left, node.right) if c]
+            for c in reversed(kids):
+                stack.append((c, v))
+        return builder.tree()
+
+
+class _StringWriter(object):
+    """
+    Collect the pieces that NewickTree.write writes
+    """
+
+    def __init__(self):
+        self.pieces = []
+
+    def write(self, s):
+        self.pieces.append(s)
+
+
+class _TreeBuilder(object):
+    """
+    Build the arrays for a NewickTree one node at a time
+    """
+
+    def __init__(self):
+        self.parent = []
+        self.first_child = []
+        self.last_child = []
+        self.next_sibling = []
+        self.length = []
+        self.name = []
+        self.names = []
+        self.name_index = {}
+        self.comments = {}
+
+    def add_node(self, parent):
+        v = len(self.parent)
+        self.parent.append(parent)
+        self.first_child.append(-1)
+        self.last_child.append(-1)
+        self.next_sibling.append(-1)
+        self.length.append(math.nan)
+        self.name.append(-1)
+        if parent >= 0:
+            if self.first_child[parent] == -1:
+                self.first_child[parent] = v
+            else:
+                self.next_sibling[self.last_child[parent]] = v
+            self.last_child[parent] = v
+        return v
+
+    def set_name(self, v, name):
+        if name not in self.name_index:
+            self.name_index[name] = len(self.names)
+            self.names.append(name)
+        self.name[v] = self.name_index[name]
+
+    def tree(self):
+        return NewickTree(self.parent, self.first_child, self.next_sibling, self.length, self.name, self.names,
+                          self.comments)
+
+
+def stream_newick(treestr):
+    """
+    Parse all the trees in a string
+    :param treestr: one or more newick trees, each ending with a ;
+    :return: a generator of NewickTrees
+    """
+
+    builder = None
+    node = -1
+    want_length = False
+    for m in _TOKENS.finditer(treestr):
+        space, quoted, comment, punct, label, bad = m.groups()
+        if space:
+            continue
+        if bad:
+            raise NewickError(f"Can not parse the tree at position {m.start()}: unexpected {bad!r}")
+        if builder is None:
+            if comment is not None:
+                continue
+            builder = _TreeBuilder()
+            node = builder.add_node(-1)
+        if comment is not None:
+            if node in builder.comments:
+                builder.comments[node] += comment
+            else:
+                builder.comments[node] = comment
+        elif want_length:
+            if label is None:
+                raise NewickError(f"Expected a branch length at position {m.start()}")
+            try:
+                builder.length[node] = float(label)
+            except ValueError:
+                raise NewickError(f"Branch length {label} at position {m.start()} is not a number")
+            want_length = False
+        elif punct == '(':
+            node = builder.add_node(node)
+        elif punct == ',':
+            if builder.parent[node] < 0:
+                raise NewickError(f"Unexpected , at position {m.start()} outside the brackets")
+            node = builder.add_node(builder.parent[node])
+        elif punct == ')':
+            node = builder.parent[node]
+            if node < 0:
+                raise NewickError(f"Unbalanced ) at position {m.start()}")
+        elif punct == ':':
+            want_length = True
+        elif punct == ';':
+            if node != 0:
+                raise NewickError(f"The tree ending at position {m.start()} has unbalanced brackets")
+            yield builder.tree()
+            builder = None
+        else:
+            if builder.name[node] != -1:
+                raise NewickError(f"Node at position {m.start()} has two names")
+            builder.set_name(node, quoted.replace("''", "'") if quoted is not None else label)
+
+    if want_length:
+        raise NewickError("The tree ends with a : but no branch length")
+    if builder is not None:
+        # the last tree doesn't have to end with a ;
+        if node != 0:
+            raise NewickError("The tree has unbalanced brackets")
+        yield builder.tree()
+
+
+def parse_newick(treestr):
+    """
+    Parse a newick tree
+    :param treestr: the tree as a string
+    :return: a NewickTree
+    """
+
+    for t in stream_newick(treestr):
+        return t
+    raise NewickError("There is no tree to parse")
+
+
+def read_newick(treefile):
+    """
+    Read a newick tree from a file
+    :param treefile: the file (it can be compressed)
+    :return: a NewickTree
+    """
+
+    with open_compressed(treefile, 'rt') as f:
+        return parse_newick(f.read())
 
 
 class Newick_Tree(object):
+    """
+    The original Node based interface to the newick parser
+    """
 
     def __init__(self):
         pass
@@ -46,87 +447,26 @@ class Newick_Tree(object):
         :rtype: int
         """
 
-        def count(node):
-            c = 1
-            if node.left:
-                c += count(node.left)
-            if node.right:
-                c += count(node.right)
-            return c
-
-        return count(root)
+        c = 0
+        stack = [root]
+        while stack:
+            node = stack.pop()
+            c += 1
+            stack.extend(node.children if node.children else [n for n in (node.left, node.right) if n])
+        return c
 
     def parse(self, tree, verbose=False):
         """
         Parse the string given by tree
         :param tree: the string to parse
         :param verbose: whether to make lots of output
-        :return:
+        :return: the root Node
         """
-        def process_tree(treestr, pos, node):
-            # sys.stderr.write("At pos {} tree has depth {}\n".format(pos, Tree().count_nodes(root)))
-
-            if treestr[pos] == '(':
-                pos += 1
-                # sys.stderr.write("LEFT: When adding node {} tree has depth {}\n".format(pos, Tree().count_nodes(root)))
-                newnode = Node(pos)
-                newnode.parent = node
-                node.left = newnode
-                newnode.side = "Left"
-                # sys.stderr.write("ADDED NODE {} to the LEFT\n".format(newnode.id))
-                return process_tree(treestr, pos, newnode)
-            elif treestr[pos] == ',':
-                pos += 1
-                # sys.stderr.write("RIGHT: When adding node {} tree has depth {}\n".format(pos, Tree().count_nodes(root)))
-                newnode = Node(pos)
-                if node.parent.right:
-                    newnode = node.parent
-                else:
-                    newnode.parent = node.parent
-                    node.parent.right = newnode
-                    newnode.side = 'Right'
-                # sys.stderr.write("ADDED NODE {} to the RIGHT\n".format(newnode.id))
-                return process_tree(treestr, pos, newnode)
-            elif treestr[pos] == ')':
-                pos += 1
-                if pos >= len(treestr):
-                    return
-                while treestr[pos] in string.ascii_letters or treestr[pos] == '_' or treestr[pos] in string.digits or treestr[pos] in '-':
-                    node.name += treestr[pos]
-                    pos += 1
-                if verbose:
-                    sys.stderr.write("At pos {} set node {} ({}) to {}\n".format(pos, node.id, node.side, node.name))
-                return process_tree(treestr, pos, node.parent)
-            elif treestr[pos] == ':':
-                pos += 1
-                try:
-                    while treestr[pos] in string.digits or treestr[pos] == '.' or treestr[pos] in ['-', 'e']:
-                        node.distance += treestr[pos]
-                        pos += 1
-                except TypeError:
-                    raise TypeError("TypeError: CANNOT ADD {} at POS {} to {} in node {}\n".format(treestr[pos], pos, node.distance, node.id))
-                if verbose:
-                    sys.stderr.write("Set NODE {} dist to {}\n".format(node.id, node.distance))
-                node.distance = float(node.distance)
-                return process_tree(treestr, pos, node)
-            else:
-                while treestr[pos] in string.ascii_letters or treestr[pos] == '_' or treestr[pos] in string.digits or \
-                                treestr[pos] in '-':
-                    node.name += treestr[pos]
-                    pos += 1
-                # sys.stderr.write("When adding node {} tree has depth {}\n".format(node.name, Tree().count_nodes(root)))
-                if verbose:
-                    sys.stderr.write("At pos {} Set node {} ({}) to {}\n".format(pos, node.id, node.side, node.name))
-                return process_tree(treestr, pos, node)
-
-        parent = Node("root")
-        root = parent
-        pos = 0
-        tree = tree.rstrip(';')
-        pos = process_tree(tree, pos, parent)
+
+        t = parse_newick(tree)
         if verbose:
-            sys.stderr.write("TREE HAS DEPTH {}\n".format(Tree().count_nodes(root)))
-        return parent
+            sys.stderr.write(f"TREE HAS {len(t)} NODES and {len(t.leaves())} LEAVES\n")
+        return t.to_nodes()
 
     def print_tree(self, root):
         """
@@ -138,27 +478,7 @@ class Newick_Tree(object):
         :rtype:
         """
 
-        def process_child(node):
-            toreturn = ''
-            if node.left or node.right:
-                toreturn = '('
-            if node.left and node.right:
-                toreturn += process_child(node.left) + "," + process_child(node.right)
-            elif node.left:
-                toreturn += process_child(node.left)
-            elif node.right:
-                toreturn += process_child(node.right)
-            if node.left and node.right and node.name:
-                # the root node??
-                toreturn += ','
-            elif node.left or node.right:
-                toreturn += ")"
-            if node.name:
-                toreturn += node.name
-            toreturn += ":{}".format(node.distance)
-            return toreturn
-
-        print(process_child(root) + ");")
+        NewickTree.from_nodes(root).write(sys.stdout)
 
 
 if __name__ == '__main__':
@@ -167,13 +487,6 @@ if __name__ == '__main__':
     parser.add_argument('-v', help='verbose output during parsing', action='store_true')
     args = parser.parse_args()
 
-    tre = []
-    with open(args.t, 'r') as f:
-        for l in f:
-            tre.append(l.strip())
-
-    root = Tree().parse(''.join(tre), args.v)
-    print("PARSED\n\nThere are {} nodes\n\n".format(Tree().count_nodes(root)))
-    print("Root has left {} and right {}\n".format(root.left, root.right))
-    Tree().print_tree(root)
-
+    tree = read_newick(args.t)
+    print(f"PARSED\n\nThere are {len(tree)} nodes and {len(tree.leaves())} leaves\n\n")
+    tree.write(sys.stdout)
@@ -0,0 +1,275 @@
+"""
+Pair up two fastq files, writing the reads that have a mate to one pair of files and the singletons
+to another, using a bounded amount of memory.
+
+There are two ways we do this:
+
+1. If the files are (mostly) in the same order we just stream through them together. Reads that are
+   out of step are kept in a small buffer until their mate turns up. This is the common case, e.g.
+   after quality trimming has removed a few reads from one file.
+2. If that buffer gets bigger than the memory we are allowed to use, the files are not in the same
+   order. We start again and hash-partition both files by read ID into temporary files on disk so
+   that each partition fits in memory, and then pair up each partition separately.
+
+The read IDs are the header up to the first white space. If the IDs at the start of the two files all end
+/1 and /2 (or _1 and _2, or .1 and .2) we remove those suffixes so that the mates match. We don't remove
+anything otherwise, so SRA spot ids like SRR123.1 and SRR123.2 stay different reads.
+"""
+
+import os
+import sys
+import zlib
+import shutil
+import tempfile
+from itertools import zip_longest, islice
+from .chunked_parser import fastq_records
+from .compression import open_compressed, compression_type
+from .colours import message
+
+__author__ = 'Rob Edwards'
+
+# the default amount of memory to use for reads that are waiting for their mate (in bytes)
+MEMORY = 2 * 1024 ** 3
+# the number of reads at the start of each file we look at to decide whether the ids have /1 /2 suffixes
+SUFFIX_READS = 100
+
+
+def read_id(header):
+    """
+    The read id from a fastq header: everything up to the first white space
+
+    :param header: the header (without the @) as bytes
+    :return: the id as bytes
+    """
+    return header.split(None, 1)[0] if header else b''
+
+
+def pair_key(header, suffix=None):
+    """
+    The key we use to match up the mates of a pair.
+
+    :param header: the header (without the @) as bytes
+    :param suffix: remove this suffix (e.g. b'/1') from the end of the id, if it is there
+    :return: the key as bytes
+    """
+    seqid = read_id(header)
+    if suffix and seqid.endswith(suffix) and len(seqid) > len(suffix):
+        return seqid[:-len(suffix)]
+    return seqid
+
+
+def _record(rec):
+    """
+    Convert a record from the parser back to fastq
+
+    :param rec: the tuple of (header, seq, qual) as bytes
+    :return: the bytes to write
+    """
+    return b'@' + rec[0] + b'\n' + rec[1] + b'\n+\n' + rec[2] + b'\n'
+
+
+def _mate_suffixes(leftfq, rightfq, nreads=SUFFIX_READS):
+    """
+    The suffixes that we need to remove from the left and right IDs so the mates match. If the first IDs
+    in the two files are the same we leave the IDs alone. Otherwise, if the first nreads IDs in the left file
+    all end /1 (or _1 or .1) and the ones in the right file all end with the matching /2, we remove them.
+
+    :return: the left and right suffixes, or None, None if we should leave the IDs alone
+    """
+    left = [read_id(r[0]) for r in islice(fastq_records(leftfq, blocksize=65536), nreads)]
+    right = [read_id(r[0]) for r in islice(fastq_records(rightfq, blocksize=65536), nreads)]
+    if not left or not right or left[0] == right[0]:
+        return None, None
+    for sep in (b'/', b'_', b'.'):
+        lsuffix, rsuffix = sep + b'1', sep + b'2'
+        if all(i.endswith(lsuffix) for i in left) and all(i.endswith(rsuffix) for i in right):
+            return lsuffix, rsuffix
+    return None, None
+
+
+def _estimated_size(fname):
+    """
+    Roughly how big the uncompressed file is
+    """
+    size = os.path.getsize(fname)
+    if compression_type(fname):
+        # fastq usually compresses about 4 fold
+        size *= 4
+    return size
+
+
+def _pair_streaming(leftfq, rightfq, outputs, memory, suffixes):
+    """
+    Stream through both files together, keeping the reads that are out of step in memory until we
+    find their mates. If an ID turns up again while the first read with that ID is still waiting for its
+    mate, we write the first read as a single.
+
+    :return: the counts, or None if we ran out of memory
+    """
+
+    lp, rp, ls, rs = outputs
+    lsuffix, rsuffix = suffixes
+    lpending = {}
+    rpending = {}
+    used = 0
+    paired = 0
+    lsingles = 0
+    rsingles = 0
+    for lrec, rrec in zip_longest(fastq_records(leftfq), fastq_records(rightfq)):
+        lkey = pair_key(lrec[0], lsuffix) if lrec else None
+        rkey = pair_key(rrec[0], rsuffix) if rrec else None
+        if lkey is not None and lkey == rkey:
+            lp.write(_record(lrec))
+            rp.write(_record(rrec))
+            paired += 1
+            continue
+        if lrec:
+            if lkey in rpending:
+                other = rpending.pop(lkey)
+                used -= len(other)
+                lp.write(_record(lrec))
+                rp.write(other)
+                paired += 1
+            else:
+                if lkey in lpending:
+                    old = lpending.pop(lkey)
+                    used -= len(old)
+                    ls.write(old)
+                    lsingles += 1
+                lpending[lkey] = _record(lrec)
+                used += len(lpending[lkey])
+        if rrec:
+            if rkey in lpending:
+                other = lpending.pop(rkey)
+                used -= len(other)
+                lp.write(other)
+                rp.write(_record(rrec))
+                paired += 1
+            else:
+                if rkey in rpending:
+                    old = rpending.pop(rkey)
+                    used -= len(old)
+                    rs.write(old)
+                    rsingles += 1
+                rpending[rkey] = _record(rrec)
+                used += len(rpending[rkey])
+        if used > memory:
+            return None
+
+    for rec in lpending.values():
+        ls.write(rec)
+    for rec in rpending.values():
+        rs.write(rec)
+    return {'paired': paired, 'left_singles': lsingles + len(lpending), 'right_singles': rsingles + len(rpending),
+            'method': 'streaming'}
+
+
+def _partition(fqfile, partitions, tmpdir, side, suffix):
+    """
+    Split a fastq file into partitions by the hash of the pair key
+
+    :return: the list of partition file names
+    """
+
+    names = [os.path.join(tmpdir, f"{side}.{i}.fastq") for i in range(partitions)]
+    handles = [open(n, 'wb') for n in names]
+    try:
+        for rec in fastq_records(fqfile):
+            handles[zlib.crc32(pair_key(rec[0], suffix)) % partitions].write(_record(rec))
+    finally:
+        for h in handles:
+            h.close()
+    return names
+
+
+def _pair_partitioned(leftfq, rightfq, outputs, memory, suffixes, tmpdir=None, verbose=False):
+    """
+    Hash-partition both files on disk so that each partition of the left file fits in memory, and then
+    pair up each partition.
+
+    :return: the counts
+    """
+
+    lp, rp, ls, rs = outputs
+    lsuffix, rsuffix = suffixes
+    partitions = max(1, -(-_estimated_size(leftfq) // memory))
+    if verbose:
+        message(f"Splitting the reads into {partitions} partitions", "GREEN")
+
+    workdir = tempfile.mkdtemp(prefix='pair_fastq.', dir=tmpdir)
+    counts = {'paired': 0, 'left_singles': 0, 'right_singles': 0, 'method': 'partitioned'}
+    try:
+        lparts = _partition(leftfq, partitions, workdir, 'left', lsuffix)
+        rparts = _partition(rightfq, partitions, workdir, 'right', rsuffix)
+        for lpart, rpart in zip(lparts, rparts):
+            left = {}
+            for rec in fastq_records(lpart):
+                key = pair_key(rec[0], lsuffix)
+                if key in left:
+                    ls.write(left[key])
+                    counts['left_singles'] += 1
+                left[key] = _record(rec)
+            os.remove(lpart)
+            for rec in fastq_records(rpart):
+                key = pair_key(rec[0], rsuffix)
+                if key in left:
+                    lp.write(left.pop(key))
+                    rp.write(_record(rec))
+                    counts['paired'] += 1
+                else:
+                    rs.write(_record(rec))
+                    counts['right_singles'] += 1
+            os.remove(rpart)
+            for rec in left.values():
+                ls.write(rec)
+            counts['left_singles'] += len(left)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return counts
+
+
+def pair_fastq(leftfq, rightfq, left_paired, right_paired, left_singles, right_singles, memory=MEMORY,
+               tmpdir=None, verbose=False):
+    """
+    Pair up the reads in two fastq files.
+
+    The output files can end .gz or .zst to compress them.
+
+    :param leftfq: the R1 fastq file
+    :param rightfq: the R2 fastq file
+    :param left_paired: where to write the R1 reads that have a mate
+    :param right_paired: where to write the R2 reads that have a mate (in the same order)
+    :param left_singles: where to write the R1 reads without a mate
+    :param right_singles: where to write the R2 reads without a mate
+    :param memory: the most memory (in bytes) to use for reads waiting for their mate
+    :param tmpdir: the directory for temporary files if the reads are not in the same order
+    :param verbose: more output
+    :return: a dict with the number of paired reads, left singles and right singles, and the method we used
+    """
+
+    if memory <= 0:
+        raise ValueError(f"The memory for reads waiting for their mate must be more than 0, not {memory}")
+    suffixes = _mate_suffixes(leftfq, rightfq)
+    outnames = [left_paired, right_paired, left_singles, right_singles]
+
+    outputs = [open_compressed(o, 'wb') for o in outnames]
+    try:
+        counts = _pair_streaming(leftfq, rightfq, outputs, memory, suffixes)
+    finally:
+        for o in outputs:
+            o.close()
+
+    if counts is None:
+        if verbose:
+            message("The reads are not in the same order. Pairing them using temporary files", "PINK")
+        outputs = [open_compressed(o, 'wb') for o in outnames]
+        try:
+            counts = _pair_partitioned(leftfq, rightfq, outputs, memory, suffixes, tmpdir, verbose)
+        finally:
+            for o in outputs:
+                o.close()
+
+    if verbose:
+        message(f"Paired: {counts['paired']} Left singles: {counts['left_singles']} " +
+                f"Right singles: {counts['right_singles']} (method: {counts['method']})", "GREEN")
+    return counts
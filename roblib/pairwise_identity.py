@@ -0,0 +1,280 @@
+"""
+Percent identity between every pair of sequences in an alignment.
+
+We encode the alignment once as a uint8 matrix with one row per sequence, and then compare each sequence to
+all the sequences after it with numpy, so each pair is only calculated once. Blocks of rows are shared out
+to a pool of processes.
+
+There are two measures:
+    identity:   the identical positions / the length of the alignment. Positions that are gaps in both
+                sequences count as identical (this is what pairwise_percent_ids.py has always done)
+    gap aware:  the identical positions / the length of the alignment, ignoring the positions that are gaps
+                in both sequences
+
+The results are either a condensed matrix (the upper triangle in the same order as scipy's pdist, so
+squareform() works on it) or a tab separated file of id1, id2, percent.
+
+    pi = PairwiseIdentity.from_fasta('alignment.fasta')
+    condensed = pi.condensed('identity.npy')
+    pi.write('identity.tsv')
+"""
+
+import os
+import sys
+import argparse
+import multiprocessing
+import numpy as np
+from .sequences import read_fasta
+from .compression import open_compressed, THREADS
+
+__author__ = 'Rob Edwards'
+
+# the approximate number of pairs in each block of work
+BLOCKSIZE = 2 ** 20
+GAP = '-'
+
+# the alignment in each worker process
+_WORKER = {}
+
+
+def encode_alignment(sequences, gap=GAP):
+    """
+    Encode aligned sequences as a matrix
+    :param sequences: a list of aligned sequences (all the same length)
+    :param gap: the gap character
+    :return: a uint8 numpy array with one row per sequence
+    """
+
+    lengths = {len(s) for s in sequences}
+    if len(lengths) > 1:
+        raise ValueError(f"The aligned sequences are not all the same length. We found lengths {sorted(lengths)}")
+    length = lengths.pop() if lengths else 0
+    joined = "".join(sequences).encode('ascii', errors='replace')
+    return np.frombuffer(joined, dtype=np.uint8).reshape(len(sequences), length)
+
+
+def _row_blocks(n, square=False, blocksize=BLOCKSIZE):
+    """
+    Split the rows into blocks with about the same number of pairs in each block
+    :param n: the number of sequences
+    :param square: compare each row to all the rows, not just the ones after it
+    :param blocksize: the approximate number of pairs in each block
+    :return: a list of (start, end) of the rows in each block
+    """
+
+    blocks = []
+    start = 0
+    pairs = 0
+    for i in range(n):
+        pairs += n if square else n - i - 1
+        if pairs >= blocksize:
+            blocks.append((start, i + 1))
+            start = i + 1
+            pairs = 0
+    if start < n:
+        blocks.append((start, n))
+    return blocks
+
+
+def _identities(matrix, gaps, start, end, square, gap_aware):
+    """
+    The percent identity of a block of rows to the other rows
+    :param matrix: the encoded alignment
+    :param gaps: a float32 matrix that is 1 where the alignment has a gap (only needed if gap_aware)
+    :param start: the first row
+    :param end: the row after the last row
+    :param square: compare each row to all the rows, not just the ones after it
+    :param gap_aware: ignore the positions that are gaps in both sequences
+    :return: a 1D numpy array of the percents for each row in turn
+    """
+
+    n, length = matrix.shape
+    out = []
+    for i in range(start, end):
+        first = 0 if square else i + 1
+        same = np.count_nonzero(matrix[first:] == matrix[i], axis=1)
+        if gap_aware:
+            both = np.rint(gaps[first:] @ gaps[i]).astype(np.int64)
+            compared = length - both
+            out.append(100.0 * np.divide(same - both, compared, out=np.zeros(len(same)), where=compared > 0))
+        elif length:
+            out.append(same / length * 100.0)
+        else:
+            out.append(np.zeros(len(same)))
+    return np.concatenate(out) if out else np.zeros(0)
+
+
+def _init_worker(matrix, gap_code):
+    _WORKER['matrix'] = matrix
+    _WORKER['gaps'] = (matrix == gap_code).astype(np.float32)
+
+
+def _worker(job):
+    start, end, square, gap_aware = job
+    return start, end, _identities(_WORKER['matrix'], _WORKER['gaps'], start, end, square, gap_aware)
+
+
+class PairwiseIdentity(object):
+    """
+    The pairwise percent identities between the sequences in an alignment.
+
+    :param ids: the sequence ids
+    :param sequences: the aligned sequences in the same order as the ids
+    :param gap: the gap character
+    """
+
+    def __init__(self, ids, sequences, gap=GAP):
+        if len(ids) != len(sequences):
+            raise ValueError(f"We have {len(ids)} ids but {len(sequences)} sequences")
+        self.ids = list(ids)
+        self.gap = gap
+        self.matrix = encode_alignment(sequences, gap)
+
+    @classmethod
+    def from_fasta(cls, fastafile, gap=GAP, verbose=False):
+        """
+        Read an aligned fasta file. The sequences are sorted by id.
+        :param fastafile: the fasta file (it can be compressed)
+        :param gap: the gap character
+        :param verbose: more output
+        :return: the PairwiseIdentity
+        """
+
+        seqs = read_fasta(fastafile)
+        ids = sorted(seqs)
+        pi = cls(ids, [seqs[i] for i in ids], gap)
+        if verbose:
+            sys.stderr.write(f"Read {len(pi):,} sequences of length {pi.matrix.shape[1]:,} from {fastafile}\n")
+        return pi
+
+    def __len__(self):
+        return len(self.ids)
+
+    def blocks(self, gap_aware=False, square=False, processes=THREADS, blocksize=BLOCKSIZE):
+        """
+        Calculate the percent identities a block of rows at a time
+        :param gap_aware: ignore the positions that are gaps in both sequences
+        :param square: compare each row to all the rows, not just the rows after it
+        :param processes: the number of processes to use
+        :param blocksize: the approximate number of pairs in each block
+        :return: a generator of the first row, the row after the last row, and a 1D array of the percents. For
+        each row there are either len(self) percents (square) or one for each of the rows after it
+        """
+
+        jobs = [(s, e, square, gap_aware) for s, e in _row_blocks(len(self), square, blocksize)]
+        if processes < 2 or len(jobs) < 2:
+            _init_worker(self.matrix, ord(self.gap))
+            try:
+                for job in jobs:
+                    yield _worker(job)
+            finally:
+                _WORKER.clear()
+            return
+        ctx = multiprocessing.get_context('spawn')
+        with ctx.Pool(processes, initializer=_init_worker, initargs=(self.matrix, ord(self.gap))) as pool:
+            for result in pool.imap(_worker, jobs):
+                yield result
+
+    def condensed(self, outfile=None, dtype=None, gap_aware=False, processes=THREADS, blocksize=BLOCKSIZE,
+                  verbose=False):
+        """
+        The condensed (upper triangle) matrix of percent identities, in the same order as scipy's pdist
+        :param outfile: write the matrix to this .npy file and memory map it, rather than keeping it in memory
+        :param dtype: the type of the matrix. Default: float32 for a file, float64 in memory
+        :param gap_aware: ignore the positions that are gaps in both sequences
+        :param processes: the number of processes to use
+        :param blocksize: the approximate number of pairs in each block
+        :param verbose: more output
+        :return: a numpy array (or memmap) of the n * (n-1) / 2 percents
+        """
+
+        n = len(self)
+        size = n * (n - 1) // 2
+        if outfile:
+            out = np.lib.format.open_memmap(outfile, mode='w+', dtype=dtype or np.float32, shape=(size,))
+        else:
+            out = np.empty(size, dtype=dtype or np.float64)
+        for start, end, pct in self.blocks(gap_aware, False, processes, blocksize):
+            offset = start * (2 * n - start - 1) // 2
+            out[offset:offset + len(pct)] = pct
+            if verbose:
+                sys.stderr.write(f"Calculated {end:,} of {n:,} rows\n")
+        if outfile:
+            out.flush()
+        return out
+
+    def write(self, outfile, square=False, gap_aware=False, processes=THREADS, blocksize=BLOCKSIZE, verbose=False):
+        """
+        Write the percent identities as a tab separated file of id1, id2, percent
+        :param outfile: the file name, or an open file handle
+        :param square: write every pair in both directions, and each sequence against itself
+        :param gap_aware: ignore the positions that are gaps in both sequences
+        :param processes: the number of processes to use
+        :param blocksize: the approximate number of pairs in each block
+        :param verbose: more output
+        :return: nothing
+        """
+
+        fh = open_compressed(outfile, 'wt') if isinstance(outfile, str) else outfile
+        ids = self.ids
+        n = len(ids)
+        for start, end, pct in self.blocks(gap_aware, square, processes, blocksize):
+            pct = pct.tolist()
+            out = []
+            p = 0
+            for i in range(start, end):
+                first = 0 if square else i + 1
+                a = ids[i]
+                out.extend(f"{a}\t{b}\t{v}\n" for b, v in zip(ids[first:], pct[p:p + n - first]))
+                p += n - first
+            fh.write("".join(out))
+            if verbose:
+                sys.stderr.write(f"Wrote {end:,} of {n:,} rows\n")
+        if isinstance(outfile, str):
+            fh.close()
+
+
+def read_identities(filename):
+    """
+    Read the percent identities from a condensed .npy matrix, a tab separated file of id1, id2, percent, or a
+    file with one percent per line
+    :param filename: the file to read
+    :return: a numpy array of the percents
+    """
+
+    if filename.endswith('.npy'):
+        return np.load(filename, mmap_mode='r')
+    values = []
+    with open_compressed(filename, 'rt') as f:
+        for l in f:
+            p = l.rstrip('\r\n').split("\t")
+            if p[-1]:
+                values.append(float(p[-1]))
+    return np.array(values)
+
+
+def count_below(values, thresholds):
+    """
+    Count how many of the values are less than each threshold
+    :param values: a numpy array of values
+    :param thresholds: a list of thresholds
+    :return: a numpy array of the counts for each threshold
+    """
+
+    return np.searchsorted(np.sort(values, kind='stable'), thresholds, side='left')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Calculate the percent pairwise ID between all pairs of sequences")
+    parser.add_argument('-f', help='aligned fasta file', required=True)
+    parser.add_argument('-o', help='output file. A .npy file is a condensed matrix. Default: tsv to stdout')
+    parser.add_argument('-g', help='ignore positions that are gaps in both sequences', action='store_true')
+    parser.add_argument('-p', help=f'number of processes (default: {THREADS})', type=int, default=THREADS)
+    parser.add_argument('-v', help='verbose output', action='store_true')
+    args = parser.parse_args()
+
+    pi = PairwiseIdentity.from_fasta(args.f, verbose=args.v)
+    if args.o and args.o.endswith('.npy'):
+        pi.condensed(args.o, gap_aware=args.g, processes=args.p, verbose=args.v)
+    else:
+        pi.write(args.o if args.o else sys.stdout, gap_aware=args.g, processes=args.p, verbose=args.v)
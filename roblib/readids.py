@@ -0,0 +1,284 @@
+"""
+A compact set of read ids, for filtering fastq files with the reads in a bam file or a blast search.
+
+A python set of millions of read names takes tens of GB, so instead we keep:
+
+- a sorted numpy array of 64-bit hashes of the ids (the same hashes as the sequence index)
+- the ids themselves as one array of bytes, in the same order, with an array of offsets
+
+That is about 16 bytes per read plus the ids. Looking up an id is a binary search over the hashes, and then
+we check the id itself in case two ids have the same hash. Looking up a whole chunk of reads at once is done
+with numpy.
+
+The set can be saved to a file and memory mapped, so several processes can share it, and we don't need to
+read the bam file again.
+
+    ids = ReadIdSet.from_bam('reads.bam')
+    ids.save('reads.rids')
+    ids = ReadIdSet.load('reads.rids')
+    'read_123' in ids
+    filter_fastq_by_ids('reads.fastq.gz', ids, matchout='in_bam.fastq', nomatchout='not_in_bam.fastq')
+"""
+
+import sys
+import json
+import argparse
+from array import array
+import numpy as np
+from .seqindex import hash_id
+from .chunked_parser import fastq_chunks
+from .compression import open_compressed
+from .rob_error import ReadIdError
+
+__author__ = 'Rob Edwards'
+
+MAGIC = b'ROBRIDS1'
+
+
+def _encode_ids(ids):
+    """
+    Hash some ids and join them together
+    :param ids: an iterable of ids as str or bytes
+    :return: a numpy uint64 array of the hashes, a numpy uint8 array of the ids, and a numpy int64 array of
+    the n+1 offsets of each id
+    """
+
+    hashes = array('Q')
+    blob = bytearray()
+    ends = array('q', [0])
+    for seqid in ids:
+        if isinstance(seqid, str):
+            seqid = seqid.encode()
+        hashes.append(hash_id(seqid))
+        blob += seqid
+        ends.append(len(blob))
+    return (np.frombuffer(hashes, dtype=np.uint64), np.frombuffer(bytes(blob), dtype=np.uint8),
+            np.frombuffer(ends, dtype=np.int64))
+
+
+def _gather(starts, lengths):
+    """
+    The positions of all the bytes in some slices of an array
+    :param starts: the start of each slice
+    :param lengths: the length of each slice
+    :return: a numpy int64 array of the positions, one slice after another
+    """
+
+    lengths = np.asarray(lengths, dtype=np.int64)
+    total = int(lengths.sum())
+    first = np.cumsum(lengths) - lengths
+    return np.arange(total, dtype=np.int64) + np.repeat(np.asarray(starts, dtype=np.int64) - first, lengths)
+
+
+def _same_ids(blob1, starts1, blob2, starts2, lengths):
+    """
+    Compare pairs of ids that are the same length
+    :param blob1: the bytes of the first ids
+    :param starts1: where each of the first ids starts
+    :param blob2: the bytes of the second ids
+    :param starts2: where each of the second ids starts
+    :param lengths: the length of each pair of ids
+    :return: a numpy bool array that is True where the ids are the same
+    """
+
+    same = np.ones(len(lengths), dtype=bool)
+    nonempty = np.flatnonzero(lengths > 0)
+    if len(nonempty):
+        lens = lengths[nonempty]
+        equal = blob1[_gather(starts1[nonempty], lens)] == blob2[_gather(starts2[nonempty], lens)]
+        same[nonempty] = np.logical_and.reduceat(equal, np.cumsum(lens) - lens)
+    return same
+
+
+class ReadIdSet(object):
+    """
+    A set of read ids, stored as sorted hashes and the ids.
+
+    :param ids: an iterable of read ids (str or bytes). Duplicates are only kept once
+    :param verbose: more output
+    """
+
+    def __init__(self, ids=(), verbose=False):
+        hashes, blob, offsets = _encode_ids(ids)
+        starts = offsets[:-1]
+        lengths = np.diff(offsets)
+        order = np.lexsort((lengths, hashes))
+        hashes, starts, lengths = hashes[order], starts[order], lengths[order]
+
+        # drop the duplicates, which are next to each other now
+        keep = np.ones(len(hashes), dtype=bool)
+        dup = np.flatnonzero((hashes[1:] == hashes[:-1]) & (lengths[1:] == lengths[:-1])) + 1
+        if len(dup):
+            keep[dup] = ~_same_ids(blob, starts[dup], blob, starts[dup - 1], lengths[dup])
+
+        self.hashes = hashes[keep]
+        self.blob = blob[_gather(starts[keep], lengths[keep])]
+        self.offsets = np.zeros(len(self.hashes) + 1, dtype=np.int64)
+        np.cumsum(lengths[keep], out=self.offsets[1:])
+        if verbose:
+            sys.stderr.write(f"Kept {len(self):,} different ids from {len(hashes):,} ids\n")
+
+    @classmethod
+    def from_bam(cls, bamfile, mapped_only=False, verbose=False):
+        """
+        The names of the reads in a bam file
+        :param bamfile: the bam (or sam) file
+        :param mapped_only: only include the reads that are mapped
+        :param verbose: more output
+        :return: the ReadIdSet
+        """
+
+        import pysam
+        with pysam.AlignmentFile(bamfile, 'rb') as bam:
+            reads = (r.query_name for r in bam.fetch(until_eof=True) if not (mapped_only and r.is_unmapped))
+            ids = cls(reads)
+        if verbose:
+            sys.stderr.write(f"There are {len(ids):,} reads in {bamfile}\n")
+        return ids
+
+    @classmethod
+    def load(cls, filename):
+        """
+        Memory map a set of ids saved with save()
+        :param filename: the file name
+        :return: the ReadIdSet
+        """
+
+        with open(filename, 'rb') as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ReadIdError(f"{filename} is not a read id file")
+            hlen = int.from_bytes(f.read(8), 'little')
+            header = json.loads(f.read(hlen))
+        n = header['records']
+        offset = len(MAGIC) + 8 + hlen
+        ids = cls.__new__(cls)
+        ids.hashes = np.memmap(filename, dtype=np.uint64, mode='r', offset=offset, shape=(n,)) \
+            if n else np.zeros(0, dtype=np.uint64)
+        offset += 8 * n
+        ids.offsets = np.memmap(filename, dtype=np.int64, mode='r', offset=offset, shape=(n + 1,))
+        offset += 8 * (n + 1)
+        ids.blob = np.memmap(filename, dtype=np.uint8, mode='r', offset=offset, shape=(header['bytes'],)) \
+            if header['bytes'] else np.zeros(0, dtype=np.uint8)
+        return ids
+
+    def save(self, filename):
+        """
+        Save the ids so we can load() them again
+        :param filename: the file name
+        :return: the file name
+        """
+
+        hjson = json.dumps({'records': len(self), 'bytes': len(self.blob)}).encode()
+        # pad the header so the arrays are 8 byte aligned
+        hjson += b' ' * (-(len(MAGIC) + 8 + len(hjson)) % 8)
+        with open(filename, 'wb') as out:
+            out.write(MAGIC)
+            out.write(len(hjson).to_bytes(8, 'little'))
+            out.write(hjson)
+            out.write(np.ascontiguousarray(self.hashes, dtype=np.uint64).tobytes())
+            out.write(np.ascontiguousarray(self.offsets, dtype=np.int64).tobytes())
+            out.write(np.ascontiguousarray(self.blob, dtype=np.uint8).tobytes())
+        return filename
+
+    def __len__(self):
+        return len(self.hashes)
+
+    def __iter__(self):
+        """
+        The ids as str, in the order of their hashes
+        """
+
+        blob = self.blob.tobytes()
+        offsets = self.offsets.tolist()
+        for i in range(len(self)):
+            yield blob[offsets[i]:offsets[i + 1]].decode()
+
+    def __contains__(self, seqid):
+        if isinstance(seqid, str):
+            seqid = seqid.encode()
+        h = np.uint64(hash_id(seqid))
+        row = int(np.searchsorted(self.hashes, h, side='left'))
+        while row < len(self) and self.hashes[row] == h:
+            if self.blob[self.offsets[row]:self.offsets[row + 1]].tobytes() == seqid:
+                return True
+            row += 1
+        return False
+
+    def contains(self, ids):
+        """
+        Check a lot of ids at once
+        :param ids: a list of ids (str or bytes)
+        :return: a numpy bool array that is True for the ids that are in the set
+        """
+
+        hashes, blob, offsets = _encode_ids(ids)
+        found = np.zeros(len(hashes), dtype=bool)
+        if not len(self) or not len(hashes):
+            return found
+        rows = np.minimum(np.searchsorted(self.hashes, hashes, side='left'), len(self) - 1)
+        candidates = np.flatnonzero(self.hashes[rows] == hashes)
+        rows = rows[candidates]
+        lengths = np.diff(offsets)[candidates]
+        samelen = (self.offsets[rows + 1] - self.offsets[rows]) == lengths
+        found[candidates[samelen]] = _same_ids(blob, offsets[candidates[samelen]], self.blob,
+                                               self.offsets[rows[samelen]], lengths[samelen])
+        # another id with the same hash may be next, but that almost never happens
+        for i, row in zip(candidates.tolist(), rows.tolist()):
+            if not found[i] and row + 1 < len(self) and self.hashes[row + 1] == hashes[i]:
+                found[i] = ids[i] in self
+        return found
+
+
+def filter_fastq_by_ids(fqfile, ids, matchout=None, nomatchout=None, verbose=False):
+    """
+    Split a fastq file into the reads whose ids are in a set and the reads that are not, in one pass
+    :param fqfile: the fastq file (it can be compressed)
+    :param ids: the ReadIdSet (or anything with a contains() method)
+    :param matchout: the file name or binary file handle for the reads in the set
+    :param nomatchout: the file name or binary file handle for the reads not in the set
+    :param verbose: more output
+    :return: the number of reads that were in the set and the number that were not
+    """
+
+    outputs = []
+    for out in (matchout, nomatchout):
+        outputs.append(open_compressed(out, 'wb') if isinstance(out, str) else out)
+    matches = 0
+    nonmatches = 0
+    try:
+        for records in fastq_chunks(fqfile):
+            found = ids.contains([h.split(b' ')[0] for h, s, q in records])
+            n = int(np.count_nonzero(found))
+            matches += n
+            nonmatches += len(records) - n
+            for fh, want in zip(outputs, (True, False)):
+                if fh:
+                    fh.write(b"".join(b"@" + h + b"\n" + s + b"\n+\n" + q + b"\n"
+                                      for (h, s, q), f in zip(records, found.tolist()) if f == want))
+    finally:
+        for fh, out in zip(outputs, (matchout, nomatchout)):
+            if isinstance(out, str):
+                fh.close()
+    if verbose:
+        sys.stderr.write(f"{fqfile}: {matches:,} reads were in the set and {nonmatches:,} were not\n")
+    return matches, nonmatches
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Save the read ids in a bam file, or one id per line, ' +
+                                                 'as a read id set')
+    parser.add_argument('-b', help='bam file')
+    parser.add_argument('-f', help='file of read ids, one per line')
+    parser.add_argument('-o', help='read id set file to write', required=True)
+    parser.add_argument('-v', help='verbose output', action='store_true')
+    args = parser.parse_args()
+
+    if args.b:
+        readids = ReadIdSet.from_bam(args.b, verbose=args.v)
+    elif args.f:
+        with open_compressed(args.f, 'rt') as f:
+            readids = ReadIdSet((l.strip() for l in f if l.strip()), verbose=args.v)
+    else:
+        sys.stderr.write("Please provide either a bam file (-b) or a file of ids (-f)\n")
+        sys.exit(1)
+    readids.save(args.o)
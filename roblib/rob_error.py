@@ -38,3 +38,69 @@ class ColorNotFoundError(Error):
 
     def __init__(self, message):
         self.message = message
+
+class SequenceIndexError(Error):
+    """
+    Exception raised for a sequence file that we can not index, or an index that does not match the file.
+
+    :param message: explanation of the error
+    """
+
+    def __init__(self, message):
+        self.message = message
+        super().__init__(self.message)
+
+class KmerCountError(Error):
+    """
+    Exception raised for a problem counting k-mers or reading a k-mer count file.
+
+    :param message: explanation of the error
+    """
+
+    def __init__(self, message):
+        self.message = message
+        super().__init__(self.message)
+
+class NewickError(Error):
+    """
+    Exception raised for a newick tree that we can not parse.
+
+    :param message: explanation of the error
+    """
+
+    def __init__(self, message):
+        self.message = message
+        super().__init__(self.message)
+
+class ReadIdError(Error):
+    """
+    Exception raised for a read id set file that we can not read.
+
+    :param message: explanation of the error
+    """
+
+    def __init__(self, message):
+        self.message = message
+        super().__init__(self.message)
+
+class HmmerError(Error):
+    """
+    Exception raised for a problem running hmmer or reading its output.
+
+    :param message: explanation of the error
+    """
+
+    def __init__(self, message):
+        self.message = message
+        super().__init__(self.message)
+
+class Md5StoreError(Error):
+    """
+    Exception raised for an md5 store file that we can not read, or digests that are not 16 bytes.
+
+    :param message: explanation of the error
+    """
+
+    def __init__(self, message):
+        self.message = message
+        super().__init__(self.message)
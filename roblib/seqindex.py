@@ -0,0 +1,476 @@
+"""
+A compact, persistent, random-access index for fasta and fastq files (a bit like samtools faidx).
+
+The index is a single file (by default the sequence file name with .ridx added) that contains:
+
+- a small JSON header describing the sequence file
+- a sorted array of 64-bit hashes of the sequence IDs (the header up to the first white space)
+- for each ID, where the record starts, its length in bytes, where the sequence starts, the sequence
+  length, and for fasta files the number of bases and bytes per line
+
+The arrays are memory mapped, so opening an index is instant no matter how many reads there are, and
+several processes can share the same index through the page cache. Looking up an ID is a binary search
+over the hashes, and we check the ID in the record in case two IDs have the same hash.
+
+For uncompressed files the offsets are byte offsets. For BGZF compressed files (bgzip, or anything
+written by roblib to a .gz file) they are BGZF virtual offsets. Other gzip files can not be randomly
+accessed, so recompress them with bgzip first.
+
+    index_sequences('reads.fastq.gz')
+    idx = SequenceIndex('reads.fastq.gz')
+    header, seq, qual = idx['read_123']
+    for rec in idx.get_many(list_of_ids):
+        ...
+    idx.subsequence('NC_001416', 1000, 2000)
+"""
+
+import os
+import json
+import mmap
+import hashlib
+from array import array
+from itertools import chain
+import numpy as np
+from .compression import compression_type, bgzf_blocks_with_offsets, BgzfRandomReader
+from .chunked_parser import read_blocks
+from .rob_error import SequenceIndexError
+from .colours import message
+
+__author__ = 'Rob Edwards'
+
+MAGIC = b'ROBIDX01'
+
+# the arrays in the index, and their types. Everything is sorted by the hash of the id
+COLUMNS = [
+    ('hashes', 'u8'),
+    ('offsets', 'u8'),
+    ('lengths', 'u8'),
+    ('seqstarts', 'u4'),
+    ('seqlens', 'u8'),
+    ('line_bases', 'u4'),
+    ('line_bytes', 'u4'),
+]
+
+
+def hash_id(seqid):
+    """
+    The 64-bit hash we use for sequence ids. We don't use python's hash() because it changes between runs
+
+    :param seqid: the sequence id as str or bytes
+    :return: an int
+    """
+    if isinstance(seqid, str):
+        seqid = seqid.encode()
+    return int.from_bytes(hashlib.blake2b(seqid, digest_size=8).digest(), 'little')
+
+
+def record_id(header):
+    """
+    The id for a header line: everything up to the first white space, without the > or @
+
+    :param header: the header line as bytes
+    :return: the id as bytes
+    """
+    parts = header[1:].split(None, 1)
+    return parts[0] if parts else b''
+
+
+def sequence_format(fname):
+    """
+    Is this a fasta or fastq file? We look at the first character
+
+    :param fname: the file name
+    :return: 'fasta' or 'fastq'
+    """
+    for block in read_blocks(fname, 1024):
+        if block.startswith(b'>'):
+            return 'fasta'
+        if block.startswith(b'@'):
+            return 'fastq'
+        break
+    raise SequenceIndexError(f"{fname} does not appear to be either a fasta or a fastq file")
+
+
+def _scan_fastq(blocks, columns):
+    """
+    Find all the records in a fastq file
+
+    :param blocks: a generator of bytes
+    :param columns: a dict of arrays to add to
+    :return: the total number of bytes
+    """
+
+    hashes, offsets, lengths, seqstarts, seqlens = [columns[c] for c in
+                                                    ('hashes', 'offsets', 'lengths', 'seqstarts', 'seqlens')]
+    pos = 0
+    leftover = b''
+    missing = 0
+    for block in chain(blocks, [None]):
+        if block is None:
+            if not leftover.strip():
+                break
+            # the last record does not end with a new line. Add one and take it off again at the end
+            missing = 0 if leftover.endswith(b'\n') else 1
+            block = b'\n' * missing
+        lines = (leftover + block).split(b'\n')
+        complete = (len(lines) - 1) // 4 * 4
+        for header, seq, qualheader, qual in zip(lines[0:complete:4], lines[1:complete:4],
+                                                 lines[2:complete:4], lines[3:complete:4]):
+            if not header.startswith(b'@'):
+                raise SequenceIndexError(f"The fastq file is not a four-line fastq file at byte {pos}")
+            reclen = len(header) + len(seq) + len(qualheader) + len(qual) + 4
+            hashes.append(hash_id(record_id(header)))
+            offsets.append(pos)
+            lengths.append(reclen)
+            seqstarts.append(len(header) + 1)
+            seqlens.append(len(seq.strip()))
+            pos += reclen
+        leftover = b'\n'.join(lines[complete:])
+    if missing:
+        lengths[-1] -= missing
+        pos -= missing
+    return pos
+
+
+def _lines(blocks):
+    """
+    Split blocks of bytes into lines
+
+    :param blocks: a generator of bytes
+    :return: a generator of tuples of (line, the number of bytes including the new line)
+    """
+    leftover = b''
+    for block in blocks:
+        lines = (leftover + block).split(b'\n')
+        leftover = lines.pop()
+        for line in lines:
+            yield line, len(line) + 1
+    if leftover:
+        yield leftover, len(leftover)
+
+
+def _scan_fasta(blocks, columns):
+    """
+    Find all the records in a fasta file, and whether the lines are all the same length
+
+    :param blocks: a generator of bytes
+    :param columns: a dict of arrays to add to
+    :return: the total number of bytes
+    """
+
+    def finish(rec, end):
+        offset, seqid, seqstart, seqlen, line_bases, line_bytes, regular, short = rec
+        columns['hashes'].append(hash_id(seqid))
+        columns['offsets'].append(offset)
+        columns['lengths'].append(end - offset)
+        columns['seqstarts'].append(seqstart)
+        columns['seqlens'].append(seqlen)
+        columns['line_bases'].append(line_bases if regular else 0)
+        columns['line_bytes'].append(line_bytes if regular else 0)
+
+    pos = 0
+    current = None
+    for line, nbytes in _lines(blocks):
+        if line.startswith(b'>'):
+            if current:
+                finish(current, pos)
+            # offset, id, sequence start, sequence length, bases per line, bytes per line, regular?, short line?
+            current = [pos, record_id(line), nbytes, 0, 0, 0, True, False]
+        elif current:
+            n = len(line.rstrip())
+            if current[4] == 0 and not current[7]:
+                current[4], current[5] = n, nbytes
+            elif n > current[4] or (n and current[7]):
+                # a line longer than the first, or more sequence after a short line
+                current[6] = False
+            if n < current[4]:
+                current[7] = True
+            current[3] += n
+        elif line.strip():
+            raise SequenceIndexError(f"The fasta file does not start with a > at byte {pos}")
+        pos += nbytes
+    if current:
+        finish(current, pos)
+    return pos
+
+
+def index_sequences(fname, indexfile=None, overwrite=False, verbose=False):
+    """
+    Create an index for a fasta or fastq file
+
+    :param fname: the sequence file. Can be uncompressed or BGZF compressed
+    :param indexfile: the index file to write (default: fname + '.ridx')
+    :param overwrite: overwrite the index if it exists
+    :param verbose: more output
+    :return: the index file name
+    """
+
+    if not indexfile:
+        indexfile = fname + '.ridx'
+    if os.path.exists(indexfile) and not overwrite:
+        raise SequenceIndexError(f"{indexfile} already exists. Please set the overwrite flag")
+
+    ctype = compression_type(fname)
+    if ctype not in (None, 'bgzf'):
+        raise SequenceIndexError(f"{fname} is {ctype} compressed and can not be randomly accessed. " +
+                                 "Please compress it with bgzip instead")
+
+    fmt = sequence_format(fname)
+    columns = {c: array('Q') for c, t in COLUMNS}
+
+    # for BGZF files we also need to know where each block starts to make the virtual offsets
+    cstarts = array('Q')
+    ustarts = array('Q')
+
+    def bgzf_blocks():
+        upos = 0
+        for coffset, data in bgzf_blocks_with_offsets(fname):
+            cstarts.append(coffset)
+            ustarts.append(upos)
+            upos += len(data)
+            yield data
+
+    blocks = bgzf_blocks() if ctype == 'bgzf' else read_blocks(fname)
+    if fmt == 'fastq':
+        total = _scan_fastq(blocks, columns)
+    else:
+        total = _scan_fasta(blocks, columns)
+
+    n = len(columns['hashes'])
+    arrays = {}
+    for c, t in COLUMNS:
+        if n and len(columns[c]) == n:
+            arrays[c] = np.frombuffer(columns[c], dtype=np.uint64).astype(t)
+        else:
+            # e.g. there are no line lengths for fastq files
+            arrays[c] = np.zeros(n, dtype=t)
+
+    if ctype == 'bgzf' and n:
+        cs = np.frombuffer(cstarts, dtype=np.uint64)
+        us = np.frombuffer(ustarts, dtype=np.uint64)
+        b = np.searchsorted(us, arrays['offsets'], side='right') - 1
+        arrays['offsets'] = (cs[b] << np.uint64(16)) | (arrays['offsets'] - us[b])
+
+    order = np.argsort(arrays['hashes'], kind='stable')
+    for c in arrays:
+        arrays[c] = arrays[c][order]
+
+    header = {
+        'format': fmt,
+        'compression': ctype,
+        'records': n,
+        'source': os.path.basename(fname),
+        'source_size': os.path.getsize(fname),
+        'source_mtime': os.path.getmtime(fname),
+        'uncompressed_size': total,
+        'columns': [[c, t] for c, t in COLUMNS]
+    }
+    hjson = json.dumps(header).encode()
+    # pad the header so the arrays are 8 byte aligned
+    hjson += b' ' * (-(len(MAGIC) + 8 + len(hjson)) % 8)
+    with open(indexfile, 'wb') as out:
+        out.write(MAGIC)
+        out.write(len(hjson).to_bytes(8, 'little'))
+        out.write(hjson)
+        for c, t in COLUMNS:
+            out.write(arrays[c].tobytes())
+            out.write(b'\0' * (-arrays[c].nbytes % 8))
+
+    if verbose:
+        message(f"Indexed {n} {fmt} records from {fname} into {indexfile}", "GREEN")
+    return indexfile
+
+
+class SequenceIndex(object):
+    """
+    Random access to a fasta or fastq file using an index made by index_sequences.
+
+    idx[seqid] returns (header, seq) for fasta and (header, seq, qual) for fastq files as strings.
+    """
+
+    def __init__(self, fname, indexfile=None, verbose=False):
+        self.fname = fname
+        if not indexfile:
+            indexfile = fname + '.ridx'
+        if not os.path.exists(indexfile):
+            raise SequenceIndexError(f"{indexfile} does not exist. Please make it with index_sequences()")
+        self.indexfile = indexfile
+
+        with open(indexfile, 'rb') as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise SequenceIndexError(f"{indexfile} is not a sequence index")
+            hlen = int.from_bytes(f.read(8), 'little')
+            self.header = json.loads(f.read(hlen))
+
+        if os.path.getsize(fname) != self.header['source_size']:
+            raise SequenceIndexError(f"{fname} has changed since {indexfile} was made. Please remake the index")
+        if verbose and os.path.getmtime(fname) != self.header['source_mtime']:
+            message(f"WARNING: {fname} has been modified since {indexfile} was made", "RED")
+
+        self.format = self.header['format']
+        n = self.header['records']
+        offset = len(MAGIC) + 8 + hlen
+        self.columns = {}
+        for c, t in self.header['columns']:
+            dt = np.dtype(t)
+            if n:
+                self.columns[c] = np.memmap(indexfile, dtype=dt, mode='r', offset=offset, shape=(n,))
+            else:
+                self.columns[c] = np.zeros(0, dtype=dt)
+            offset += n * dt.itemsize
+            offset += -offset % 8
+
+        self._reader = None
+        self._mm = None
+        if self.header['compression'] == 'bgzf':
+            self._reader = BgzfRandomReader(fname)
+        elif os.path.getsize(fname):
+            with open(fname, 'rb') as f:
+                self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def __len__(self):
+        return self.header['records']
+
+    def __contains__(self, seqid):
+        return self._find(seqid) is not None
+
+    def __getitem__(self, seqid):
+        rec = self.get(seqid)
+        if rec is None:
+            raise KeyError(seqid)
+        return rec
+
+    def close(self):
+        if self._reader:
+            self._reader.close()
+        if self._mm:
+            self._mm.close()
+
+    def _read(self, offset, length):
+        """
+        Read the raw bytes for a record
+        """
+        offset, length = int(offset), int(length)
+        if self._reader:
+            return self._reader.read(offset, length)
+        return self._mm[offset:offset + length]
+
+    def _candidates(self, h):
+        """
+        The rows with this hash (almost always zero or one)
+        """
+        hashes = self.columns['hashes']
+        left = np.searchsorted(hashes, np.uint64(h), side='left')
+        right = np.searchsorted(hashes, np.uint64(h), side='right')
+        return range(left, right)
+
+    def _find(self, seqid, h=None, rows=None):
+        """
+        Find the row and raw record for a sequence id, checking the id in case of hash collisions
+
+        :return: a tuple of (row, raw bytes) or None if the id is not in the file
+        """
+        if isinstance(seqid, str):
+            seqid = seqid.encode()
+        if rows is None:
+            rows = self._candidates(hash_id(seqid) if h is None else h)
+        for row in rows:
+            raw = self._read(self.columns['offsets'][row], self.columns['lengths'][row])
+            if record_id(raw.split(b'\n', 1)[0]) == seqid:
+                return row, raw
+        return None
+
+    def _parse(self, raw):
+        """
+        Convert the raw bytes of a record to a tuple of strings
+        """
+        if self.format == 'fastq':
+            header, seq, _, qual = raw.split(b'\n')[:4]
+            return header[1:].strip().decode(), seq.strip().decode(), qual.strip().decode()
+        header, _, seq = raw.partition(b'\n')
+        return header[1:].strip().decode(), b''.join(seq.split()).decode()
+
+    def get(self, seqid):
+        """
+        Get one record
+
+        :param seqid: the sequence id
+        :return: (header, seq) for fasta or (header, seq, qual) for fastq, or None if it is not there
+        """
+        found = self._find(seqid)
+        if found is None:
+            return None
+        return self._parse(found[1])
+
+    def get_many(self, seqids):
+        """
+        Get lots of records. We hash and search for all the ids at once, and read the records in the order
+        they are in the file, which is much faster than random reads.
+
+        :param seqids: a list of sequence ids
+        :return: a list of records in the same order as seqids (None for ids that are not in the file)
+        """
+
+        seqids = [s.encode() if isinstance(s, str) else s for s in seqids]
+        hashes = self.columns['hashes']
+        qh = np.fromiter((hash_id(s) for s in seqids), dtype=np.uint64, count=len(seqids))
+        left = np.searchsorted(hashes, qh, side='left')
+        right = np.searchsorted(hashes, qh, side='right')
+        found = np.nonzero(right > left)[0]
+        results = [None] * len(seqids)
+        offsets = np.asarray(self.columns['offsets'])[left[found]]
+        for i in found[np.argsort(offsets, kind='stable')]:
+            match = self._find(seqids[i], rows=range(left[i], right[i]))
+            if match:
+                results[i] = self._parse(match[1])
+        return results
+
+    def subsequence(self, seqid, start, end=None):
+        """
+        Get part of a sequence. For fasta files with lines that are all the same length (except the last)
+        we only read the bytes we need.
+
+        :param seqid: the sequence id
+        :param start: the start position (0-based)
+        :param end: the end position (exclusive, the default is the end of the sequence)
+        :return: the subsequence as a string
+        """
+
+        rows = self._candidates(hash_id(seqid))
+        if not rows:
+            raise KeyError(seqid)
+        row = rows[0]
+        seqlen = int(self.columns['seqlens'][row])
+        if end is None or end > seqlen:
+            end = seqlen
+        start = max(0, start)
+        if start >= end:
+            return ""
+
+        line_bases = int(self.columns['line_bases'][row])
+        line_bytes = int(self.columns['line_bytes'][row])
+        if self.format != 'fasta' or line_bases == 0 or len(rows) > 1:
+            found = self._find(seqid, rows=rows)
+            if found is None:
+                raise KeyError(seqid)
+            return self._parse(found[1])[1][start:end]
+
+        seqstart = int(self.columns['seqstarts'][row])
+        first = seqstart + (start // line_bases) * line_bytes + start % line_bases
+        last = seqstart + ((end - 1) // line_bases) * line_bytes + (end - 1) % line_bases + 1
+        # check the header, in case this id is not in the file but shares a hash with one that is
+        raw = self._read(self.columns['offsets'][row], seqstart)
+        if record_id(raw) != (seqid.encode() if isinstance(seqid, str) else seqid):
+            raise KeyError(seqid)
+        chunk = self._read_within(row, first, last - first)
+        return b''.join(chunk.split()).decode()
+
+    def _read_within(self, row, start, length):
+        """
+        Read length bytes starting start bytes into a record
+        """
+        offset = int(self.columns['offsets'][row])
+        if self._reader:
+            # we can't add to a virtual offset, so read from the start of the record
+            return self._reader.read(offset, start + length)[start:]
+        return self._mm[offset + start:offset + start + length]
@@ -1,10 +1,10 @@
 import os
 import sys
-import gzip
-
-import subprocess
+from itertools import zip_longest
 from .rob_error import SequencePairError, FastqFormatError
 from .colours import colours, message
+from .chunked_parser import fastq_records, fasta_records
+from .compression import open_compressed
 
 __author__ = 'Rob Edwards'
 
@@ -23,12 +23,7 @@ def read_fasta(fname: str, whole_id: bool = True, qual: bool = False) -> dict:
     """
 
     try:
-        if fname.endswith('.gz'):
-            f = gzip.open(fname, 'rt')
-        elif fname.endswith('.lrz'):
-            f = subprocess.Popen(['/usr/bin/lrunzip', '-q', '-d', '-f', '-o-', fname], stdout=subprocess.PIPE).stdout
-        else:
-            f = open(fname, 'r')
+        f = open_compressed(fname, 'rt')
     except IOError as e:
         sys.stderr.write(str(e) + "\n")
         sys.stderr.write("Message: \n" + str(e.message) + "\n")
@@ -72,40 +67,15 @@ def stream_fastq(fqfile):
 
     Note that the sequence ID is the header up until the first space,
     while the header is the whole header.
-    """
 
-    if fqfile.endswith('.gz'):
-        qin = gzip.open(fqfile, 'rt')
-    else:
-        qin = open(fqfile, 'r')
+    This is a thin wrapper around chunked_parser.fastq_records, which reads the file in large blocks
+    """
 
-    linecounter = 0
-    while True:
-        header = qin.readline()
-        linecounter += 1
-        if not header:
-            break
-        if not header.startswith("@"):
-            raise FastqFormatError(f"The file does not appear to be a four-line fastq file at line {linecounter}")
-        header = header.strip()
-        seqidparts = header.split(' ')
-        seqid = seqidparts[0]
-        seqid = seqid.replace('@', '')
-        seq = qin.readline().strip()
-        linecounter += 1
-        qualheader = qin.readline()
-        if not qualheader.startswith("+"):
-            raise FastqFormatError(f"The file does not appear to be a four-line fastq file at line {linecounter}")
-        linecounter += 1
-        qualscores = qin.readline().strip()
-        linecounter += 1
-        header = header.replace('@', '', 1)
-        if len(qualscores) != len(seq):
-            raise FastqFormatError(f"The sequence and qual scores are not the same length at line {linecounter}")
+    for header, seq, qualscores in fastq_records(fqfile, decode=True):
+        seqid = header.split(' ')[0].replace('@', '')
         yield seqid, header, seq, qualscores
 
 
-
 def stream_paired_fastq(fqfile1, fqfile2):
     """Read paired fastq files and provide an iterable of the sequence ID, the
     full header, the sequence, and the quaity scores for the left and right pairs
@@ -116,31 +86,16 @@ def stream_paired_fastq(fqfile1, fqfile2):
     Should accomodate both /1 /2 // _1 _2 and [space]1 [space]2
     """
 
-    if fqfile1.endswith('.gz'):
-        qin1 = gzip.open(fqfile1, 'rt')
-    else:
-        qin1 = open(fqfile1, 'r')
-
-    if fqfile2.endswith('.gz'):
-        qin2 = gzip.open(fqfile2, 'rt')
-    else:
-        qin2 = open(fqfile2, 'r')
-
     linecounter = 0
-    while True:
+    for r1, r2 in zip_longest(fastq_records(fqfile1, decode=True), fastq_records(fqfile2, decode=True)):
         linecounter += 1
-        header1 = qin1.readline().strip()
-        header2 = qin2.readline().strip()
-        if not header1 and not header2:
-            break
-
-        if not header1.startswith("@"):
+        if r1 is None:
             raise FastqFormatError(f"The file {fqfile1} does not appear to be a four-line fastq file at line {linecounter}")
-        if not header2.startswith("@"):
+        if r2 is None:
             raise FastqFormatError(f"The file {fqfile2} does not appear to be a four-line fastq file at line {linecounter}")
 
-        header1 = header1.replace('@', '', 1)
-        header2 = header2.replace('@', '', 1)
+        header1 = r1[0]
+        header2 = r2[0]
 
         seqidparts1 = header1.split(' ')
         seqidparts2 = header2.split(' ')
@@ -165,38 +120,17 @@ def stream_paired_fastq(fqfile1, fqfile2):
             raise SequencePairError(f"{colours.RED}The sequence IDs {seqid1} and {seqid2} do not match and are not paired{colours.ENDC}\n")
 
         seqid = seqid1.replace('@', '')
-        seq1 = qin1.readline().strip()
-        linecounter += 1
-        qualheader1 = qin1.readline()
-        linecounter += 1
-        qualscores1 = qin1.readline().strip()
-        linecounter += 1
-
-
-        seq2 = qin2.readline().strip()
-        qualheader2 = qin2.readline()
-        qualscores2 = qin2.readline().strip()
-
-        if not qualheader1.startswith("+"):
-            raise FastqFormatError(f"The file {fqfile1} does not appear to be a four-line fastq file at line {linecounter}")
-        if not qualheader2.startswith("+"):
-            raise FastqFormatError(f"The file {fqfile2} does not appear to be a four-line fastq file at line {linecounter}")
-
-        if len(qualscores1) != len(seq1):
-            raise FastqFormatError(f"The sequence and qual scores in {fqfile1} are not the same length at line {linecounter}")
-        if len(qualscores2) != len(seq2):
-            raise FastqFormatError(f"The sequence and qual scores in {fqfile2} are not the same length at line {linecounter}")
-
-        yield seqid, header1, seq1, qualscores1, header2, seq2, qualscores2
-
-
+        linecounter += 3
 
+        yield seqid, header1, r1[1], r1[2], header2, r2[1], r2[2]
 
 
 def stream_fasta(fastafile, whole_id=True):
     """
     Stream a fasta file, one read at a time. Saves memory!
 
+    This is a thin wrapper around chunked_parser.fasta_records, which reads the file in large blocks
+
     :param fastafile: The fasta file to stream
     :type fastafile: str
     :param whole_id: Whether to return the whole id (default) or just up to the first white space
@@ -205,40 +139,7 @@ def stream_fasta(fastafile, whole_id=True):
     :rtype:str, str
     """
 
-    try:
-        if fastafile.endswith('.gz'):
-            f = gzip.open(fastafile, 'rt')
-        elif fastafile.endswith('.lrz'):
-            f = subprocess.Popen(['/usr/bin/lrunzip', '-q', '-d', '-f', '-o-', fastafile], stdout=subprocess.PIPE).stdout
-        else:
-            f = open(fastafile, 'r')
-    except IOError as e:
-        sys.stderr.write(str(e) + "\n")
-        sys.stderr.write("Message: \n" + str(e.message) + "\n")
-        sys.exit("Unable to open file " + fastafile)
-
-    posn = 0
-    while f:
-        # first line should start with >
-        idline = f.readline()
-        if not idline:
-            break
-        if not idline.startswith('>'):
-            sys.exit("Do not have a fasta file at: {}".format(idline))
-        if not whole_id:
-            idline = idline.split(" ")[0]
-        idline = idline.strip().replace('>', '', 1)
-        posn = f.tell()
-        line = f.readline()
-        seq = ""
-        while not line.startswith('>'):
-            seq += line.strip()
-            posn = f.tell()
-            line = f.readline()
-            if not line:
-                break
-        f.seek(posn)
-        yield idline, seq
+    yield from fasta_records(fastafile, whole_id, decode=True)
 
 
 def stream_gfa_sequences(gfafile):
@@ -249,12 +150,7 @@ def stream_gfa_sequences(gfafile):
     """
 
     try:
-        if gfafile.endswith('.gz'):
-            f = gzip.open(gfafile, 'rt')
-        elif gfafile.endswith('.lrz'):
-            f = subprocess.Popen(['/usr/bin/lrunzip', '-q', '-d', '-f', '-o-', gfafile], stdout=subprocess.PIPE).stdout
-        else:
-            f = open(gfafile, 'r')
+        f = open_compressed(gfafile, 'rt')
     except IOError as e:
         sys.stderr.write(str(e) + "\n")
         sys.stderr.write("Message: \n" + str(e.message) + "\n")
@@ -275,12 +171,12 @@ def write_fastq(fna, qual, outf, verbose=False):
     Write DNA sequences + quality scores to a fastq file
     :param fna: a dict of the DNA sequences
     :param qual: a dict of the the quality scores
-    :param outf: the output file to write
+    :param outf: the output file to write. If this ends .gz or .zst it will be compressed
     :param verbose: more output
     :return:
     """
 
-    with open(outf, 'w') as out:
+    with open_compressed(outf, 'w') as out:
         for k in fna:
             if k not in qual:
                 raise FastqFormatError(f"{colours.RED}No quality scores were found for {k}{colours.ENDC}")
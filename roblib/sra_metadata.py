@@ -0,0 +1,401 @@
+"""
+Read the BioSample and SRA XML files one record at a time, and turn them into a table.
+
+The whole BioSample dump is tens of GB, and ElementTree.parse or BeautifulSoup build the whole tree before we
+can look at any of it. Here we use iterparse: as each BioSample (or RUN) element ends we make it into a flat
+row, and then clear it and remove it from the tree, so we only ever have one record in memory.
+
+    for row in stream_biosamples('biosample_set.xml.gz'):
+        row['Accession'], row.get('host')
+
+Each row is a dict. The columns from the BioSample itself have CamelCase names (see BIOSAMPLE_COLUMNS) and the
+attributes have their harmonized name (or their lower case attribute name), so they can't clash.
+
+xml_table() converts lots of xml files in a pool of processes and writes them to one parquet or tab separated
+file. Every process writes its rows to parquet files a batch at a time, and then we join them up with all the
+columns that we saw:
+
+    xml_table(['biosample_set.1.xml.gz', 'biosample_set.2.xml.gz'], 'biosamples.parquet', processes=8)
+"""
+
+import os
+import sys
+import argparse
+import multiprocessing
+import xml.etree.ElementTree as ET
+from tempfile import TemporaryDirectory
+from .compression import open_compressed, THREADS
+
+__author__ = 'Rob Edwards'
+
+BIOSAMPLE_COLUMNS = ['Accession', 'Id', 'Access', 'PublicationDate', 'LastUpdate', 'SubmissionDate', 'Ids', 'Title',
+                     'Comment', 'Organism', 'TaxonomyId', 'OwnerName', 'OwnerEmail', 'Status', 'ReleaseDate', 'Links',
+                     'Package']
+
+RUN_COLUMNS = ['Accession', 'Alias', 'CenterName', 'PrimaryId', 'Experiment', 'TotalSpots', 'TotalBases', 'Size',
+               'Published', 'Title']
+
+# the element that makes a row, and the columns that come first, for each kind of file
+KINDS = {
+    'biosample': ('BioSample', BIOSAMPLE_COLUMNS),
+    'run': ('RUN', RUN_COLUMNS),
+}
+
+
+def _text(elem):
+    """
+    All the text in an element and its children, like BeautifulSoup's .text
+    :param elem: the element (or None)
+    :return: the text, or None if there is no element
+    """
+
+    return None if elem is None else "".join(elem.itertext())
+
+
+def iter_elements(xmlfile, tag):
+    """
+    Read an xml file and yield each element with a tag once it is complete. After you have used an element we
+    clear it, so don't keep a reference to it (or its children)
+    :param xmlfile: the xml file (it can be compressed)
+    :param tag: the tag of the elements we want (e.g. BioSample)
+    :return: a generator of Elements
+    """
+
+    with open_compressed(xmlfile, 'rb') as fh:
+        root = None
+        for event, elem in ET.iterparse(fh, events=('start', 'end')):
+            if root is None:
+                root = elem
+            if event == 'end' and elem.tag == tag:
+                yield elem
+                elem.clear()
+                # the tree keeps every element we have seen, so throw them away
+                root.clear()
+
+
+def biosample_row(biosample):
+    """
+    Make a BioSample element into a flat row
+    :param biosample: the BioSample Element
+    :return: a dict of column and value
+    """
+
+    a = biosample.attrib
+    row = {'Accession': a.get('accession'), 'Id': a.get('id'), 'Access': a.get('access'),
+           'PublicationDate': a.get('publication_date'), 'LastUpdate': a.get('last_update'),
+           'SubmissionDate': a.get('submission_date')}
+    for child in biosample:
+        if child.tag == 'Ids':
+            ids = []
+            for anid in child:
+                if 'db' in anid.attrib:
+                    ids.append(f"{anid.attrib['db']}|{anid.text}")
+                elif anid.attrib.get('db_label') == 'Sample name':
+                    ids.append(f"Sample|{anid.text}")
+            row['Ids'] = "; ".join(ids)
+        elif child.tag == 'Description':
+            for d in child:
+                if d.tag == 'Title' and d.text:
+                    row['Title'] = d.text.strip()
+                elif d.tag == 'Comment':
+                    row['Comment'] = _text(d).strip()
+                elif d.tag == 'Organism':
+                    row['Organism'] = d.attrib.get('taxonomy_name')
+                    row['TaxonomyId'] = d.attrib.get('taxonomy_id')
+        elif child.tag == 'Owner':
+            for o in child:
+                if o.tag == 'Name' and o.text:
+                    row['OwnerName'] = o.text
+                elif o.tag == 'Contacts':
+                    for c in o:
+                        if 'email' in c.attrib:
+                            row['OwnerEmail'] = c.attrib['email']
+                elif o.tag == 'Contact' and 'email' in o.attrib:
+                    row['OwnerEmail'] = o.attrib['email']
+        elif child.tag == 'Status':
+            row['Status'] = child.attrib.get('status')
+            row['ReleaseDate'] = child.attrib.get('when')
+        elif child.tag == 'Links':
+            links = []
+            for link in child:
+                if link.attrib.get('type') == 'entrez':
+                    links.append(f"{link.attrib.get('target')}|{link.text}")
+                elif link.attrib.get('type') == 'url':
+                    links.append(f"url|[{link.text}]({link.attrib.get('label', link.text)})")
+            row['Links'] = "; ".join(links)
+        elif child.tag == 'Package':
+            row['Package'] = child.text
+        elif child.tag == 'Attributes':
+            for attr in child:
+                name = attr.attrib.get('harmonized_name') or attr.attrib.get('attribute_name', '').lower()
+                if not name or not attr.text:
+                    continue
+                value = attr.text.strip()
+                if name in row and row[name] != value:
+                    row[name] = f"{row[name]}; {value}"
+                else:
+                    row[name] = value
+    return row
+
+
+def run_row(run):
+    """
+    Make an SRA RUN element into a flat row. The RUN_ATTRIBUTES are added with their TAG as the column
+    :param run: the RUN Element
+    :return: a dict of column and value
+    """
+
+    a = run.attrib
+    row = {'Accession': a.get('accession'), 'Alias': a.get('alias'), 'CenterName': a.get('center_name'),
+           'TotalSpots': a.get('total_spots'), 'TotalBases': a.get('total_bases'), 'Size': a.get('size'),
+           'Published': a.get('published'), 'PrimaryId': _text(run.find('IDENTIFIERS/PRIMARY_ID')),
+           'Title': _text(run.find('TITLE'))}
+    exp = run.find('EXPERIMENT_REF')
+    if exp is not None:
+        row['Experiment'] = exp.attrib.get('accession') or _text(exp.find('IDENTIFIERS/PRIMARY_ID'))
+    for ra in run.iter('RUN_ATTRIBUTE'):
+        tag = ra.find('TAG')
+        if tag is not None and tag.text:
+            row[tag.text] = _text(ra.find('VALUE'))
+    return row
+
+
+def stream_biosamples(xmlfile):
+    """
+    Read a BioSample xml file one BioSample at a time
+    :param xmlfile: the xml file (it can be compressed)
+    :return: a generator of flat rows (see biosample_row)
+    """
+
+    for biosample in iter_elements(xmlfile, 'BioSample'):
+        yield biosample_row(biosample)
+
+
+def stream_runs(xmlfile):
+    """
+    Read an SRA run.xml file one RUN at a time
+    :param xmlfile: the xml file (it can be compressed)
+    :return: a generator of flat rows (see run_row)
+    """
+
+    for run in iter_elements(xmlfile, 'RUN'):
+        yield run_row(run)
+
+
+def parse_sra_runs(xmlfile):
+    """
+    The SRA run ids in a run.xml file
+    :param xmlfile: the run.xml file
+    :return: a set of the PRIMARY_IDs in the RUNs
+    """
+
+    sra_ids = set()
+    for run in iter_elements(xmlfile, 'RUN'):
+        for p in run.iter('PRIMARY_ID'):
+            sra_ids.add(_text(p))
+    return sra_ids
+
+
+def parse_sra_sample(xmlfile):
+    """
+    The metadata in an SRA sample.xml file: the primary_id, title, scientific_name, taxon_id, xref, and the
+    SAMPLE_ATTRIBUTES with their TAG as the key. If there is more than one SAMPLE, the later ones overwrite the
+    earlier ones
+    :param xmlfile: the sample.xml file
+    :return: a dict of metadata
+    :raises: KeyError if a SAMPLE has no IDENTIFIERS
+    """
+
+    data = {}
+    for sample in iter_elements(xmlfile, 'SAMPLE'):
+        identifiers = next(sample.iter('IDENTIFIERS'), None)
+        if identifiers is None:
+            raise KeyError(f"FATAL: no IDENTIFIERS tag found in {xmlfile}")
+        data['primary_id'] = _text(next(identifiers.iter('PRIMARY_ID'), None))
+        title = next(sample.iter('TITLE'), None)
+        if title is not None:
+            data['title'] = _text(title)
+        si = next(sample.iter('SAMPLE_NAME'), None)
+        if si is not None:
+            for tag, key in (('SCIENTIFIC_NAME', 'scientific_name'), ('TAXON_ID', 'taxon_id')):
+                e = next(si.iter(tag), None)
+                if e is not None:
+                    data[key] = _text(e)
+        data['xref'] = "; ".join(f"{_text(next(xr.iter('DB')))}|{_text(next(xr.iter('ID')))}"
+                                 for sls in sample.iter('SAMPLE_LINKS') for sl in sls.iter('SAMPLE_LINK')
+                                 for xr in sl.iter('XREF_LINK'))
+        for sas in sample.iter('SAMPLE_ATTRIBUTES'):
+            for sa in sas.iter('SAMPLE_ATTRIBUTE'):
+                tag = next(sa.iter('TAG'), None)
+                val = next(sa.iter('VALUE'), None)
+                if tag is not None and val is not None:
+                    data[_text(tag)] = _text(val)
+                elif tag is not None:
+                    sys.stderr.write(f"Found a tag {_text(tag)} for {xmlfile} but no value\n")
+                elif val is not None:
+                    sys.stderr.write(f"Found a value {_text(val)} for {xmlfile} but no tag\n")
+    return data
+
+
+def sra_directory_row(directory, verbose=False):
+    """
+    The metadata for one directory of the SRA metadata tarball (see ncbi/parse_sra.py): the sample metadata and
+    the run ids
+    :param directory: the directory with the .sample.xml and .run.xml files
+    :param verbose: more output
+    :return: a dict of the metadata, or None if there is no sample.xml or run.xml file
+    """
+
+    runxmlfile = None
+    samplefile = None
+    for f in os.listdir(directory):
+        if f.endswith('run.xml'):
+            if runxmlfile:
+                sys.stderr.write(f"There are two run.xml files in {directory}\n")
+            runxmlfile = f
+        if f.endswith('sample.xml'):
+            if samplefile:
+                sys.stderr.write(f"There are two sample.xml files in {directory}\n")
+            samplefile = f
+    if not samplefile or not runxmlfile:
+        return None
+    if verbose:
+        sys.stderr.write(f"Parsing {samplefile} and {runxmlfile} in {directory}\n")
+    data = parse_sra_sample(os.path.join(directory, samplefile))
+    data['sra_ids'] = "; ".join(sorted(parse_sra_runs(os.path.join(directory, runxmlfile))))
+    return data
+
+
+def _write_part(rows, partfile):
+    """
+    Write some rows to a parquet file, with a string column for every key in the rows
+    :param rows: a list of dicts
+    :param partfile: the parquet file to write
+    """
+
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    columns = list(dict.fromkeys(k for r in rows for k in r))
+    schema = pa.schema([(c, pa.string()) for c in columns])
+    pq.write_table(pa.table({c: [r.get(c) for r in rows] for c in columns}, schema=schema), partfile)
+
+
+def _table_worker(job):
+    """
+    Read one xml file and write its rows to parquet files, batchsize rows at a time
+    :return: the xml file, a list of the parquet files, and a dict of column and the number of rows with a value
+    """
+
+    xmlfile, kind, tmpdir, n, batchsize = job
+    stream = stream_biosamples if kind == 'biosample' else stream_runs
+    parts = []
+    counts = {}
+    rows = []
+    for row in stream(xmlfile):
+        for k, v in row.items():
+            if v:
+                counts[k] = counts.get(k, 0) + 1
+        rows.append(row)
+        if len(rows) >= batchsize:
+            parts.append(os.path.join(tmpdir, f"{n}.{len(parts)}.parquet"))
+            _write_part(rows, parts[-1])
+            rows = []
+    if rows:
+        parts.append(os.path.join(tmpdir, f"{n}.{len(parts)}.parquet"))
+        _write_part(rows, parts[-1])
+    return xmlfile, parts, counts
+
+
+def xml_table(xmlfiles, outfile, kind='biosample', processes=THREADS, minocc=1, batchsize=100000, tmpdir=None,
+              verbose=False):
+    """
+    Convert lots of BioSample or SRA run xml files into one table, with one row per BioSample or RUN. Each file is
+    read in its own process.
+    :param xmlfiles: the xml files (they can be compressed)
+    :param outfile: the table to write. A .parquet file is written with pyarrow, and anything else is tab separated
+    :param kind: 'biosample' or 'run'
+    :param processes: the number of processes to use
+    :param minocc: only include the attribute columns that have a value in at least this many rows
+    :param batchsize: the number of rows each process keeps in memory before writing them
+    :param tmpdir: the directory for the temporary parquet files. Default: the system temporary directory
+    :param verbose: more output
+    :return: the number of rows we wrote
+    """
+
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    if kind not in KINDS:
+        raise ValueError(f"The kind must be one of {list(KINDS)}, not {kind}")
+    if isinstance(xmlfiles, str):
+        xmlfiles = [xmlfiles]
+
+    with TemporaryDirectory(dir=tmpdir) as tmp:
+        jobs = [(f, kind, tmp, n, batchsize) for n, f in enumerate(xmlfiles)]
+        if processes < 2 or len(jobs) < 2:
+            results = list(map(_table_worker, jobs))
+        else:
+            ctx = multiprocessing.get_context('spawn')
+            with ctx.Pool(min(processes, len(jobs))) as pool:
+                results = []
+                for result in pool.imap(_table_worker, jobs):
+                    if verbose:
+                        sys.stderr.write(f"Read {result[0]}\n")
+                    results.append(result)
+
+        counts = {}
+        for _, _, c in results:
+            for k, v in c.items():
+                counts[k] = counts.get(k, 0) + v
+        first = KINDS[kind][1]
+        columns = first + sorted(c for c in counts if c not in first and counts[c] >= minocc)
+
+        n = 0
+        parquet = None
+        out = None
+        try:
+            # we always write the header (or schema), even if there are no rows
+            if outfile.endswith('.parquet'):
+                parquet = pq.ParquetWriter(outfile, pa.schema([(c, pa.string()) for c in columns]))
+            else:
+                out = open_compressed(outfile, 'wt')
+                out.write("\t".join(columns) + "\n")
+            for _, parts, _ in results:
+                for part in parts:
+                    t = pq.read_table(part)
+                    t = pa.table([t.column(c) if c in t.column_names else pa.nulls(len(t), pa.string())
+                                  for c in columns], names=columns)
+                    if parquet:
+                        parquet.write_table(t)
+                    else:
+                        t.to_pandas().to_csv(out, sep="\t", header=False, index=False)
+                    n += len(t)
+        finally:
+            if parquet:
+                parquet.close()
+            if out:
+                out.close()
+    if verbose:
+        sys.stderr.write(f"Wrote {n:,} rows with {len(columns):,} columns to {outfile}\n")
+    return n
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Convert BioSample or SRA run xml files to a table, ' +
+                                                 'one row per BioSample or RUN')
+    parser.add_argument('-f', help='xml file(s)', nargs='+')
+    parser.add_argument('-d', help='directory of xml files')
+    parser.add_argument('-o', help='output file (.parquet or tab separated)', required=True)
+    parser.add_argument('-k', help='kind of xml (default: biosample)', choices=list(KINDS), default='biosample')
+    parser.add_argument('-m', help='minimum number of rows an attribute has to be in (default: 1)', type=int,
+                        default=1)
+    parser.add_argument('-p', help=f'number of processes (default: {THREADS})', type=int, default=THREADS)
+    parser.add_argument('-v', help='verbose output', action='store_true')
+    args = parser.parse_args()
+
+    files = list(args.f or [])
+    if args.d:
+        files += [os.path.join(args.d, f) for f in sorted(os.listdir(args.d))]
+    if not files:
+        sys.stderr.write("Please provide some xml files (-f) or a directory of them (-d)\n")
+        sys.exit(1)
+    xml_table(files, args.o, args.k, args.p, args.m, verbose=args.v)
@@ -8,5 +8,5 @@ __author__ = 'Rob Edwards'
 
 def ascii_clean(s):
     """Remove non-ascii characters from a string"""
-    return filter(lambda x: x in string.printable, s)
+    return "".join(filter(lambda x: x in string.printable, s))
 
@@ -1,10 +1,26 @@
 
-import sys
-
 """
 Translate and back translate DNA to protein
+
+translate_dna, six_frame_translation and find_orfs all use the same engine: each base is encoded as a 4-bit
+IUPAC mask (A=1, C=2, G=4, T=8, so R=A|G, N=15, etc), and each codon is one of 16^3 = 4096 masks. For each
+NCBI genetic code we make a 4096 entry lookup table of the amino acid for each codon and translate whole
+sequences, or whole batches of sequences, with a single numpy index. Like Biopython, an ambiguous codon that
+could be more than one amino acid is B (D or N), Z (E or Q), J (I or L), or otherwise X.
+
+    translate_dna('ATGAAATAG')                   # MK*
+    translate_dna(seq, code=4)                   # Mycoplasma, where TGA is W
+    six_frame_translation([seq1, seq2])[0][-1]   # the first frame of the reverse complement of seq1
+    find_orfs(seq, code=11, minlen=100)
 """
 
+import sys
+from functools import lru_cache
+import numpy as np
+from .sequences import stream_fasta
+
+__author__ = 'Rob Edwards'
+
 
 aa_1_to_3_letter ={"A" : "Ala", "C" : "Cys", "D" : "Asp", "E" : "Glu", "F" : "Phe", "G" : "Gly", "H" : "His",
                    "I" : "Ile", "K" : "Lys", "L" : "Leu", "M" : "Met", "N" : "Asn", "P" : "Pro", "Q" : "Gln",
@@ -97,26 +113,329 @@ amino_acid_codons_DNA = {
 }
 
 
-def translate_dna(sequence, verbose=False):
+
+# The NCBI genetic codes (https://www.ncbi.nlm.nih.gov/Taxonomy/Utils/wprintgc.cgi). These are the numbers in the
+# genetic_code and mitochondrial_genetic_code columns of the taxonomy nodes.dmp, and in transl_table qualifiers.
+# The amino acids and start codons are in the NCBI order of the codons: TTT TTC TTA TTG TCT ... GGG.
+# In 27, 28 and 31 a stop codon can also be an amino acid, depending on where it is in the gene. NCBI marks
+# those codons with a * in the starts, and like Biopython we translate them as the amino acid.
+NCBI_GENETIC_CODES = {
+    1: ('Standard',
+        'FFLLSSSSYY**CC*WLLLLPPPPHHQQRRRRIIIMTTTTNNKKSSRRVVVVAAAADDEEGGGG',
+        '---M---------------M---------------M----------------------------'),
+    2: ('Vertebrate Mitochondrial',
+        'FFLLSSSSYY**CCWWLLLLPPPPHHQQRRRRIIMMTTTTNNKKSS**VVVVAAAADDEEGGGG',
+        '--------------------------------MMMM---------------M------------'),
+    3: ('Yeast Mitochondrial',
+        'FFLLSSSSYY**CCWWTTTTPPPPHHQQRRRRIIMMTTTTNNKKSSRRVVVVAAAADDEEGGGG',
+        '----------------------------------MM---------------M------------'),
+    4: ('Mold, Protozoan, and Coelenterate Mitochondrial and Mycoplasma/Spiroplasma',
+        'FFLLSSSSYY**CCWWLLLLPPPPHHQQRRRRIIIMTTTTNNKKSSRRVVVVAAAADDEEGGGG',
+        '--MM---------------M------------MMMM---------------M------------'),
+    5: ('Invertebrate Mitochondrial',
+        'FFLLSSSSYY**CCWWLLLLPPPPHHQQRRRRIIMMTTTTNNKKSSSSVVVVAAAADDEEGGGG',
+        '---M----------------------------MMMM---------------M------------'),
+    6: ('Ciliate, Dasycladacean and Hexamita Nuclear',
+        'FFLLSSSSYYQQCC*WLLLLPPPPHHQQRRRRIIIMTTTTNNKKSSRRVVVVAAAADDEEGGGG',
+        '-----------------------------------M----------------------------'),
+    9: ('Echinoderm and Flatworm Mitochondrial',
+        'FFLLSSSSYY**CCWWLLLLPPPPHHQQRRRRIIIMTTTTNNNKSSSSVVVVAAAADDEEGGGG',
+        '-----------------------------------M---------------M------------'),
+    10: ('Euplotid Nuclear',
+         'FFLLSSSSYY**CCCWLLLLPPPPHHQQRRRRIIIMTTTTNNKKSSRRVVVVAAAADDEEGGGG',
+         '-----------------------------------M----------------------------'),
+    11: ('Bacterial, Archaeal and Plant Plastid',
+         'FFLLSSSSYY**CC*WLLLLPPPPHHQQRRRRIIIMTTTTNNKKSSRRVVVVAAAADDEEGGGG',
+         '---M---------------M------------MMMM---------------M------------'),
+    12: ('Alternative Yeast Nuclear',
+         'FFLLSSSSYY**CC*WLLLSPPPPHHQQRRRRIIIMTTTTNNKKSSRRVVVVAAAADDEEGGGG',
+         '-------------------M---------------M----------------------------'),
+    13: ('Ascidian Mitochondrial',
+         'FFLLSSSSYY**CCWWLLLLPPPPHHQQRRRRIIMMTTTTNNKKSSGGVVVVAAAADDEEGGGG',
+         '---M------------------------------MM---------------M------------'),
+    14: ('Alternative Flatworm Mitochondrial',
+         'FFLLSSSSYYY*CCWWLLLLPPPPHHQQRRRRIIIMTTTTNNNKSSSSVVVVAAAADDEEGGGG',
+         '-----------------------------------M----------------------------'),
+    16: ('Chlorophycean Mitochondrial',
+         'FFLLSSSSYY*LCC*WLLLLPPPPHHQQRRRRIIIMTTTTNNKKSSRRVVVVAAAADDEEGGGG',
+         '-----------------------------------M----------------------------'),
+    21: ('Trematode Mitochondrial',
+         'FFLLSSSSYY**CCWWLLLLPPPPHHQQRRRRIIMMTTTTNNNKSSSSVVVVAAAADDEEGGGG',
+         '-----------------------------------M---------------M------------'),
+    22: ('Scenedesmus obliquus Mitochondrial',
+         'FFLLSS*SYY*LCC*WLLLLPPPPHHQQRRRRIIIMTTTTNNKKSSRRVVVVAAAADDEEGGGG',
+         '-----------------------------------M----------------------------'),
+    23: ('Thraustochytrium Mitochondrial',
+         'FF*LSSSSYY**CC*WLLLLPPPPHHQQRRRRIIIMTTTTNNKKSSRRVVVVAAAADDEEGGGG',
+         '--------------------------------M--M---------------M------------'),
+    24: ('Rhabdopleuridae Mitochondrial',
+         'FFLLSSSSYY**CCWWLLLLPPPPHHQQRRRRIIIMTTTTNNKKSSSKVVVVAAAADDEEGGGG',
+         '---M---------------M---------------M---------------M------------'),
+    25: ('Candidate Division SR1 and Gracilibacteria',
+         'FFLLSSSSYY**CCGWLLLLPPPPHHQQRRRRIIIMTTTTNNKKSSRRVVVVAAAADDEEGGGG',
+         '---M-------------------------------M---------------M------------'),
+    26: ('Pachysolen tannophilus Nuclear',
+         'FFLLSSSSYY**CC*WLLLAPPPPHHQQRRRRIIIMTTTTNNKKSSRRVVVVAAAADDEEGGGG',
+         '-------------------M---------------M----------------------------'),
+    27: ('Karyorelict Nuclear',
+         'FFLLSSSSYYQQCCWWLLLLPPPPHHQQRRRRIIIMTTTTNNKKSSRRVVVVAAAADDEEGGGG',
+         '--------------*--------------------M----------------------------'),
+    28: ('Condylostoma Nuclear',
+         'FFLLSSSSYYQQCCWWLLLLPPPPHHQQRRRRIIIMTTTTNNKKSSRRVVVVAAAADDEEGGGG',
+         '----------**--*--------------------M----------------------------'),
+    29: ('Mesodinium Nuclear',
+         'FFLLSSSSYYYYCC*WLLLLPPPPHHQQRRRRIIIMTTTTNNKKSSRRVVVVAAAADDEEGGGG',
+         '-----------------------------------M----------------------------'),
+    30: ('Peritrich Nuclear',
+         'FFLLSSSSYYEECC*WLLLLPPPPHHQQRRRRIIIMTTTTNNKKSSRRVVVVAAAADDEEGGGG',
+         '-----------------------------------M----------------------------'),
+    31: ('Blastocrithidia Nuclear',
+         'FFLLSSSSYYEECCWWLLLLPPPPHHQQRRRRIIIMTTTTNNKKSSRRVVVVAAAADDEEGGGG',
+         '----------**-----------------------M----------------------------'),
+    33: ('Cephalodiscidae Mitochondrial UAA-Tyr',
+         'FFLLSSSSYYY*CCWWLLLLPPPPHHQQRRRRIIIMTTTTNNKKSSSKVVVVAAAADDEEGGGG',
+         '---M---------------M---------------M---------------M------------'),
+}
+
+# the 4-bit mask for each IUPAC base
+IUPAC_MASKS = {'A': 1, 'C': 2, 'G': 4, 'T': 8, 'U': 8, 'R': 5, 'Y': 10, 'S': 6, 'W': 9, 'K': 12, 'M': 3,
+               'B': 14, 'D': 13, 'H': 11, 'V': 7, 'N': 15}
+_MASK = np.zeros(256, dtype=np.uint16)
+for _base, _m in IUPAC_MASKS.items():
+    _MASK[ord(_base)] = _m
+    _MASK[ord(_base.lower())] = _m
+# swap A <-> T and C <-> G
+_COMPLEMENT = np.array([((m & 1) << 3) | ((m & 2) << 1) | ((m & 4) >> 1) | ((m & 8) >> 3) for m in range(16)],
+                       dtype=np.uint16)
+# the position of each base in the NCBI codon order
+_NCBI_ORDER = {1: 2, 2: 1, 4: 3, 8: 0}
+# the letters for ambiguous codons that could be either of two amino acids
+AMBIGUOUS_AMINO_ACIDS = {frozenset('DN'): 'B', frozenset('EQ'): 'Z', frozenset('IL'): 'J'}
+FRAMES = [1, 2, 3, -1, -2, -3]
+
+
+class CodonTable(object):
+    """
+    A lookup table for one of the NCBI genetic codes.
+
+    table[codon] is the amino acid (as a byte) and starts[codon] is True for start codons, where codon is
+    mask1 * 256 + mask2 * 16 + mask3. Ambiguous codons translate if all the codons they could be are the same
+    amino acid, are B, Z or J if they could be either of those pairs of amino acids, and are X otherwise.
+    stop_or_sense[codon] is True for the codons that can be a stop or an amino acid (in codes 27, 28 and 31).
+
+    :param code: the NCBI genetic code number
+    """
+
+    def __init__(self, code=1):
+        if code not in NCBI_GENETIC_CODES:
+            raise ValueError(f"We don't have NCBI genetic code {code}. Use one of {sorted(NCBI_GENETIC_CODES)}")
+        self.code = code
+        self.name, aas, starts = NCBI_GENETIC_CODES[code]
+        bases = {m: [b for b in (1, 2, 4, 8) if m & b] for m in range(16)}
+        self.table = np.full(4096, ord('X'), dtype=np.uint8)
+        self.starts = np.zeros(4096, dtype=bool)
+        self.stop_or_sense = np.zeros(4096, dtype=bool)
+        for m1 in range(1, 16):
+            for m2 in range(1, 16):
+                for m3 in range(1, 16):
+                    positions = [16 * _NCBI_ORDER[a] + 4 * _NCBI_ORDER[b] + _NCBI_ORDER[c]
+                                 for a in bases[m1] for b in bases[m2] for c in bases[m3]]
+                    translations = {aas[p] for p in positions}
+                    codon = m1 * 256 + m2 * 16 + m3
+                    if len(translations) == 1:
+                        self.table[codon] = ord(translations.pop())
+                    elif frozenset(translations) in AMBIGUOUS_AMINO_ACIDS:
+                        self.table[codon] = ord(AMBIGUOUS_AMINO_ACIDS[frozenset(translations)])
+                    self.starts[codon] = all(starts[p] == 'M' for p in positions)
+                    self.stop_or_sense[codon] = any(starts[p] == '*' for p in positions)
+
+    def codons(self, masks):
+        """
+        The codon starting at every position of some encoded bases
+        :param masks: a numpy array of base masks (see encode_bases)
+        :return: a numpy array of len(masks) - 2 codons
+        """
+
+        if len(masks) < 3:
+            return np.zeros(0, dtype=np.uint16)
+        return (masks[:-2] << 8) | (masks[1:-1] << 4) | masks[2:]
+
+
+@lru_cache(maxsize=None)
+def codon_table(code=1):
+    """
+    The CodonTable for an NCBI genetic code. We only make each table once
+    :param code: the NCBI genetic code number
+    :return: the CodonTable
+    """
+
+    return CodonTable(int(code))
+
+
+def encode_bases(sequence):
+    """
+    Encode a DNA sequence as IUPAC base masks
+    :param sequence: the sequence as a str, bytes, or numpy uint8 array
+    :return: a numpy uint16 array of masks (0 for anything that isn't a base)
+    """
+
+    if isinstance(sequence, str):
+        sequence = sequence.encode('ascii', errors='replace')
+    if isinstance(sequence, (bytes, bytearray)):
+        sequence = np.frombuffer(sequence, dtype=np.uint8)
+    return _MASK[sequence]
+
+
+def translate_dna(sequence, verbose=False, code=1):
     """
     Translate a DNA sequence and return a protein string
     :param sequence: The DNA sequence to translate
     :param verbose: More output
+    :param code: the NCBI genetic code (default: 1, the standard code)
     :return: a protein string
     """
 
-    posn=0
-    trans=""
-    while posn < len(sequence)-3:
-        codon = sequence[posn:posn+3]
-        if codon not in genetic_code:
-            sys.stderr.write("Uknown codon: {}\n".format(codon))
-            trans += "X"
-            continue
-        trans += genetic_code[codon]
-        posn += 3
+    ct = codon_table(code)
+    trans = ct.table[ct.codons(encode_bases(sequence))[::3]].tobytes().decode()
+    if verbose and 'X' in trans:
+        sys.stderr.write(f"There were {trans.count('X')} codons that we could not translate\n")
     return trans
 
+
+def translate_batch(sequences, offsets, code=1, frames=FRAMES):
+    """
+    Translate a batch of sequences in several frames at once. The sequences are concatenated into a single
+    buffer (like a SequenceBatch from stream_fasta_batches).
+
+    Frames 1, 2, and 3 start at the first, second, and third base, and frames -1, -2, and -3 start at the first,
+    second, and third base of the reverse complement.
+
+    :param sequences: a numpy uint8 array of the concatenated sequences
+    :param offsets: a numpy array of n+1 offsets. Sequence i is sequences[offsets[i]:offsets[i+1]]
+    :param code: the NCBI genetic code
+    :param frames: the frames to translate
+    :return: a dict of frame and (proteins, protein_offsets): a numpy uint8 array of the concatenated proteins
+    and the n+1 offsets of the proteins
+    """
+
+    ct = codon_table(code)
+    offsets = np.asarray(offsets, dtype=np.int64)
+    masks = encode_bases(sequences)
+    total = len(masks)
+    starts = offsets[:-1]
+    lengths = np.diff(offsets)
+    translated = {}
+    if any(f > 0 for f in frames):
+        translated[1] = ct.table[ct.codons(masks)]
+    if any(f < 0 for f in frames):
+        translated[-1] = ct.table[ct.codons(_COMPLEMENT[masks][::-1])]
+    results = {}
+    for f in frames:
+        if f not in (1, 2, 3, -1, -2, -3):
+            raise ValueError(f"{f} is not a frame. Use one of {FRAMES}")
+        # where each sequence starts in the (reversed) buffer, and how many codons it has in this frame
+        first = starts + abs(f) - 1 if f > 0 else total - offsets[1:] + abs(f) - 1
+        ncodons = np.maximum(0, (lengths - abs(f) + 1) // 3)
+        prot_offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+        np.cumsum(ncodons, out=prot_offsets[1:])
+        # the position of every codon in the buffer
+        positions = np.repeat(first - prot_offsets[:-1] * 3, ncodons) + 3 * np.arange(prot_offsets[-1])
+        results[f] = (translated[1 if f > 0 else -1][positions], prot_offsets)
+    return results
+
+
+def six_frame_translation(sequences, code=1):
+    """
+    Translate some sequences in all six frames
+    :param sequences: a list of DNA sequences
+    :param code: the NCBI genetic code
+    :return: a list with a dict for each sequence of frame (1, 2, 3, -1, -2, -3) and protein string
+    """
+
+    joined = "".join(sequences).encode('ascii', errors='replace')
+    offsets = np.zeros(len(sequences) + 1, dtype=np.int64)
+    np.cumsum([len(s) for s in sequences], out=offsets[1:])
+    results = [{} for _ in sequences]
+    for f, (prots, poff) in translate_batch(np.frombuffer(joined, dtype=np.uint8), offsets, code).items():
+        text = prots.tobytes().decode()
+        poff = poff.tolist()
+        for i in range(len(sequences)):
+            results[i][f] = text[poff[i]:poff[i + 1]]
+    return results
+
+
+def find_orfs(sequence, code=11, minlen=30, start_codon=True, partial=False):
+    """
+    Find the open reading frames in all six frames of a sequence.
+
+    An ORF runs to a stop codon. If start_codon is True it begins at the first start codon (for this genetic code)
+    after the previous stop, and the first amino acid is always M. Otherwise it begins right after the previous stop.
+
+    :param sequence: the DNA sequence
+    :param code: the NCBI genetic code (default: 11, bacteria and archaea)
+    :param minlen: the minimum length of the protein (not counting the stop codon)
+    :param start_codon: begin each ORF at a start codon
+    :param partial: include ORFs that run off the end of the sequence
+    :return: a list of (frame, start, end, protein), sorted by frame and then start. start and end are 1-based
+    positions on the sequence, including the stop codon, so start > end for ORFs on the reverse strand
+    """
+
+    ct = codon_table(code)
+    masks = encode_bases(sequence)
+    length = len(masks)
+    strands = {1: ct.codons(masks), -1: ct.codons(_COMPLEMENT[masks][::-1])}
+    orfs = []
+    for f in FRAMES:
+        codons = strands[1 if f > 0 else -1][abs(f) - 1::3]
+        prot = ct.table[codons]
+        stops = np.flatnonzero(prot == ord('*'))
+        # the segments between the stops. The last one doesn't end in a stop
+        begins = np.concatenate(([0], stops + 1))
+        ends = np.append(stops, len(prot))
+        has_stop = np.arange(len(ends)) < len(stops)
+        if start_codon:
+            starts = np.flatnonzero(ct.starts[codons])
+            first = np.searchsorted(starts, begins)
+            starts = np.append(starts, len(prot))
+            begins = starts[first]
+            keep = begins < ends
+        else:
+            keep = np.ones(len(begins), dtype=bool)
+            if not partial:
+                # the first segment doesn't start after a stop
+                keep[0] = False
+        if not partial:
+            keep &= has_stop
+        keep &= ends - begins >= minlen
+        for b, e, s in zip(begins[keep].tolist(), ends[keep].tolist(), has_stop[keep].tolist()):
+            protein = prot[b:e].tobytes().decode()
+            if start_codon:
+                protein = 'M' + protein[1:]
+            start = abs(f) + 3 * b
+            span = 3 * (e - b) + (3 if s else 0)
+            if f > 0:
+                orfs.append((f, start, start + span - 1, protein))
+            else:
+                orfs.append((f, length - start + 1, length - start - span + 2, protein))
+    return orfs
+
+
+def stream_orfs(fastafile, code=11, minlen=30, start_codon=True, partial=False):
+    """
+    Find the open reading frames in every sequence in a fasta file
+    :param fastafile: the fasta file
+    :param code: the NCBI genetic code (default: 11, bacteria and archaea)
+    :param minlen: the minimum length of the protein (not counting the stop codon)
+    :param start_codon: begin each ORF at a start codon
+    :param partial: include ORFs that run off the end of the sequence
+    :return: a generator of (sequence id, frame, start, end, protein)
+    """
+
+    for seqid, seq in stream_fasta(fastafile, whole_id=False):
+        for orf in find_orfs(seq, code, minlen, start_codon, partial):
+            yield (seqid,) + orf
+
+
 def print_codon_table(ambiguous=False):
     """
     Print the codon usage table
@@ -134,3 +453,24 @@ def print_codon_table(ambiguous=False):
             continue
 
         print("{}\t{}".format(codon, aa_1_to_3_letter[genetic_code[codon]]))
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='Translate DNA sequences, in one or six frames, or find the ORFs')
+    parser.add_argument('-f', help='fasta file of DNA sequences', required=True)
+    parser.add_argument('-c', help='NCBI genetic code (default: 11)', type=int, default=11)
+    parser.add_argument('-s', help='translate all six frames', action='store_true')
+    parser.add_argument('-o', help='find ORFs of at least this many amino acids', type=int)
+    args = parser.parse_args()
+
+    if args.o:
+        for seqid, frame, start, end, protein in stream_orfs(args.f, args.c, args.o):
+            print(f">{seqid}_{start}_{end} [frame={frame}]\n{protein}")
+    else:
+        for seqid, seq in stream_fasta(args.f, whole_id=False):
+            if args.s:
+                for frame, protein in six_frame_translation([seq], args.c)[0].items():
+                    print(f">{seqid} [frame={frame}]\n{protein}")
+            else:
+                print(f">{seqid}\n{translate_dna(seq, code=args.c)}")
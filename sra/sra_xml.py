@@ -55,7 +55,7 @@ Title
 import os
 import sys
 import argparse
-import xml.etree.ElementTree as ET
+from roblib.sra_metadata import iter_elements
 
 # we make a list so that the order is guaranteed, and then make a set for O(1) lookup
 known_attrs = ['id', 'accession', 'last_update', 'access', 'publication_date', 'submission_date']
@@ -280,10 +280,9 @@ if __name__ == '__main__':
     parser.add_argument('-f', help='xml file to parse (e.g. /data/SRA/biosample/crassphage.xml)', required=True)
     args = parser.parse_args()
 
-    tree = ET.parse(args.f)
-    biosampleset = tree.getroot()
+    # read one BioSample at a time so we never have the whole file in memory
     header=0
-    for biosample in biosampleset:
+    for biosample in iter_elements(args.f, 'BioSample'):
         parse_biosample(biosample, header)
         header=header+1
 
@@ -10,7 +10,7 @@ In this version we
 import os
 import sys
 import argparse
-import xml.etree.ElementTree as ET
+from roblib.sra_metadata import iter_elements
 
 # we make a list so that the order is guaranteed, and then make a set for O(1) lookup
 # but later we just resort the sets :)
@@ -271,9 +271,8 @@ if __name__ == '__main__':
 
     data = {}
     for f in os.listdir(args.d):
-        tree = ET.parse(os.path.join(args.d, f))
-        biosampleset = tree.getroot()
-        for biosample in biosampleset:
+        # read one BioSample at a time so we never have the whole file in memory
+        for biosample in iter_elements(os.path.join(args.d, f), 'BioSample'):
             tid, cont = parse_biosample(biosample)
             data[tid] = cont
 
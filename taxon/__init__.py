@@ -3,16 +3,21 @@ import sys
 
 __author__ = 'Rob Edwards'
 from .taxon import read_taxa, read_nodes, extended_names, read_names, read_divisions, read_gi_tax_id, read_tax_id_gi
+from .taxon import gi_taxid_map
+from .taxid_map import TaxidMap, build_taxid_map
 from .config import get_db_dir
 from .load_from_database import get_taxonomy_db, get_taxonomy, connect_to_db, get_taxid_for_name, taxonomy_hierarchy_as_list
 from .load_from_database import all_ids, taxonomy_hierarchy, all_species_ids
+from .load_from_database import get_taxonomies, taxonomy_hierarchies_as_lists, lineage, load_tree
 from .taxonomy import TaxonNode, TaxonName, TaxonDivision
 from .Error import NoNameFoundError, EntryNotInDatabaseError
 
 __all__ = [
     'read_taxa', 'read_nodes', 'extended_names', 'read_names', 'read_divisions', 'read_gi_tax_id', 'read_tax_id_gi',
+    'gi_taxid_map', 'TaxidMap', 'build_taxid_map',
     'get_taxonomy_db', 'get_taxonomy', 'connect_to_db', 'get_db_dir', 'get_taxid_for_name', 'all_ids',
-    'taxonomy_hierarchy', 'taxonomy_hierarchy_as_list'
+    'taxonomy_hierarchy', 'taxonomy_hierarchy_as_list', 'get_taxonomies', 'taxonomy_hierarchies_as_lists',
+    'lineage', 'load_tree'
     ]
 
 
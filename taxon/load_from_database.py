@@ -6,13 +6,42 @@ import os
 import sys
 import sqlite3
 import argparse
+from collections import OrderedDict
+import numpy as np
 
 from .taxonomy import TaxonNode, TaxonName, TaxonDivision
 from .Error import EntryNotInDatabaseError
 from roblib import bcolors
 import time
 
-data = {"node": {}, "name": {}, "division": {}}
+
+class LRUCache(OrderedDict):
+    """
+    A dict that only keeps the maxsize most recently used entries
+    """
+
+    def __init__(self, maxsize=1000000):
+        super().__init__()
+        self.maxsize = maxsize
+
+    def __getitem__(self, key):
+        value = super().__getitem__(key)
+        self.move_to_end(key)
+        return value
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        self.move_to_end(key)
+        if len(self) > self.maxsize:
+            self.popitem(last=False)
+
+
+# the most taxonomy entries and lineages we keep in memory
+CACHESIZE = 1000000
+# sqlite limits the number of ? in a query
+QUERYSIZE = 900
+data = {"node": LRUCache(CACHESIZE), "name": LRUCache(CACHESIZE), "division": {}, "gi2tax": {},
+        "lineage": LRUCache(CACHESIZE), "tree": None}
 default_database = "/raid60/usr/data/NCBI/taxonomy/current/taxonomy.sqlite3"
 conn = None
 #default_database = "/data/ncbi/taxonomy/20180620/taxonomy.sqlite"
@@ -88,6 +117,24 @@ def get_taxid_for_name(name, conn, verbose=False):
         return None
 
 
+def _int_taxid(taxid):
+    """
+    The taxonomy ids are integers in the database, but we often read them from files as strings
+    """
+    try:
+        return int(taxid)
+    except (TypeError, ValueError):
+        return taxid
+
+
+def _chunks(ids):
+    """
+    Split a list of ids into pieces small enough for an sqlite query
+    """
+    for i in range(0, len(ids), QUERYSIZE):
+        yield ids[i:i + QUERYSIZE]
+
+
 def get_taxonomy(taxid, conn, verbose=False):
     """
     Retrieve a TaxonNode object for a given taxonomy ID
@@ -98,12 +145,14 @@ def get_taxonomy(taxid, conn, verbose=False):
     """
 
     global data
-    cur = conn.cursor()
+    taxid = _int_taxid(taxid)
     if taxid in data['node']:
         return data['node'][taxid], data['name'][taxid]
 
+    cur = conn.cursor()
     cur.execute("select * from nodes where tax_id = ?", [taxid])
     p = cur.fetchone()
+    nameid = taxid
     if not p:
         # check the merged database
         cur.execute("select new_tax_id from merged where old_tax_id = ?", [taxid])
@@ -111,6 +160,7 @@ def get_taxonomy(taxid, conn, verbose=False):
         if newid and newid[0]:
             cur.execute("select * from nodes where tax_id = ?", [newid[0]])
             p = cur.fetchone()
+            nameid = newid[0]
         else:
             raise EntryNotInDatabaseError(f"ERROR: {taxid} is not in the database and not merged\n")
 
@@ -118,7 +168,7 @@ def get_taxonomy(taxid, conn, verbose=False):
     data['node'][taxid] = t
 
 
-    cur.execute("select * from names where tax_id = ?", [taxid])
+    cur.execute("select * from names where tax_id = ?", [nameid])
     n = TaxonName(taxid)
     for p in cur.fetchall():
         if p[2]:
@@ -128,6 +178,144 @@ def get_taxonomy(taxid, conn, verbose=False):
     return t, n
 
 
+def get_taxonomies(taxids, conn, verbose=False):
+    """
+    Retrieve the TaxonNode and TaxonName objects for a lot of taxonomy IDs at once. This uses a few
+    queries for the whole batch rather than several queries for each taxonomy ID.
+    :param taxids: an iterable of taxonomy ids
+    :param conn: the database connection
+    :param verbose: more output
+    :return: a dict of taxid: (TaxonNode, TaxonName). IDs that are not in the database are not included
+    """
+
+    global data
+    taxids = {_int_taxid(t) for t in taxids}
+    # keep the batch in a local dict: if there are more than CACHESIZE ids, adding them to the cache evicts some
+    found = {t: (data['node'][t], data['name'][t]) for t in taxids if t in data['node'] and t in data['name']}
+    wanted = [t for t in taxids if t not in found]
+    cur = conn.cursor()
+
+    nodes = {}
+    for chunk in _chunks(wanted):
+        cur.execute("select * from nodes where tax_id in ({})".format(",".join("?" * len(chunk))), chunk)
+        for p in cur.fetchall():
+            nodes[p[0]] = p
+
+    # the ids that have been merged into another id
+    nameid = {t: t for t in nodes}
+    missing = [t for t in wanted if t not in nodes]
+    for chunk in _chunks(missing):
+        cur.execute("select old_tax_id, new_tax_id from merged where old_tax_id in ({})".format(
+            ",".join("?" * len(chunk))), chunk)
+        merged = dict(cur.fetchall())
+        newids = list(set(merged.values()))
+        for newchunk in _chunks(newids):
+            cur.execute("select * from nodes where tax_id in ({})".format(",".join("?" * len(newchunk))), newchunk)
+            newnodes = {p[0]: p for p in cur.fetchall()}
+            for old, new in merged.items():
+                if new in newnodes:
+                    nodes[old] = newnodes[new]
+                    nameid[old] = new
+
+    names = {t: TaxonName(t) for t in nodes}
+    lookup = {}
+    for t in nodes:
+        lookup.setdefault(nameid[t], []).append(t)
+    for chunk in _chunks(list(lookup)):
+        cur.execute("select * from names where tax_id in ({})".format(",".join("?" * len(chunk))), chunk)
+        for p in cur.fetchall():
+            for t in lookup[p[0]]:
+                if p[2]:
+                    names[t].unique = p[2]
+                names[t].set_name(p[3], p[1])
+
+    for t in nodes:
+        found[t] = (TaxonNode(*nodes[t]), names[t])
+        data['node'][t], data['name'][t] = found[t]
+
+    if verbose:
+        sys.stderr.write(f"{bcolors.GREEN}Found {len(nodes)} of {len(wanted)} new taxonomy IDs{bcolors.ENDC}\n")
+
+    return found
+
+
+def load_tree(conn, verbose=False):
+    """
+    Load the parent and rank of every node in the taxonomy into numpy arrays, indexed by taxonomy ID.
+    This takes a few seconds once, and then walking up the taxonomy does not need the database.
+    :param conn: the database connection
+    :param verbose: more output
+    :return: a dict with the parent and rank arrays, the rank names, and the merged ids
+    """
+
+    global data
+    if data['tree']:
+        return data['tree']
+
+    if verbose:
+        sys.stderr.write(f"{bcolors.GREEN}Loading the taxonomy tree{bcolors.ENDC}\n")
+    cur = conn.cursor()
+    maxid = cur.execute("select max(tax_id) from nodes").fetchone()[0] or 0
+    # a parent of 0 means the taxonomy ID is not in the database
+    parent = np.zeros(maxid + 1, dtype=np.int32)
+    rank = np.zeros(maxid + 1, dtype=np.uint8)
+    ranks = {}
+    for tid, par, rk in cur.execute("select tax_id, parent, rank from nodes"):
+        parent[tid] = par
+        rank[tid] = ranks.setdefault(rk, len(ranks))
+    merged = dict(cur.execute("select old_tax_id, new_tax_id from merged").fetchall())
+    data['tree'] = {'parent': parent, 'rank': rank, 'ranks': sorted(ranks, key=ranks.get), 'merged': merged}
+    return data['tree']
+
+
+def _resolve(tid, tree):
+    """
+    The taxonomy ID in the tree, following merged IDs
+    :return: the taxonomy ID or None if it is not in the database
+    """
+    tid = _int_taxid(tid)
+    if not isinstance(tid, int) or tid < 0:
+        return None
+    if tid < len(tree['parent']) and tree['parent'][tid]:
+        return tid
+    new = tree['merged'].get(tid)
+    if new is not None and new < len(tree['parent']) and tree['parent'][new]:
+        return new
+    return None
+
+
+def _walk(node, parent):
+    """
+    The taxonomy IDs from node up to (but not including) the root. We also stop at a node that is not in
+    the tree (no parent), and if we come back to a node we have already seen, so a broken tree can not
+    loop forever
+    :param node: the taxonomy ID in the tree
+    :param parent: the parent array from load_tree
+    :return: yield the taxonomy IDs, starting with node
+    """
+    seen = set()
+    while node and node != 1 and node not in seen and node < len(parent) and parent[node]:
+        seen.add(node)
+        yield node
+        node = int(parent[node])
+
+
+def lineage(tid, conn, verbose=False):
+    """
+    The taxonomy IDs from tid up to (but not including) the root
+    :param tid: the taxonomy id
+    :param conn: the database connection
+    :param verbose: more output
+    :return: a list of taxonomy ids, starting with tid
+    """
+
+    tree = load_tree(conn, verbose)
+    node = _resolve(tid, tree)
+    if node is None:
+        raise EntryNotInDatabaseError(f"ERROR: {tid} is not in the database and not merged\n")
+    return list(_walk(node, tree['parent']))
+
+
 def gi_to_taxonomy(gi, conn, protein=False, verbose=False):
     """
     Convert an NCBI gi to a taxonomy object
@@ -221,60 +409,103 @@ def taxonomy_hierarchy(tid, verbose=False):
     :param verbose: More output
     """
 
-    global data
     global conn
 
-
+    tree = load_tree(conn, verbose)
+    parent = tree['parent']
+    tid = _int_taxid(tid)
+    seen = set()
     while tid != 1:
-        if tid == 1:
+        if tid in seen:
             if verbose:
-                sys.stderr.write(f"{bcolors.RED}Taxonomy ID 1 found{bcolors.ENDC}\n")
+                sys.stderr.write(f"{bcolors.RED}{tid} is its own ancestor. Can not continue{bcolors.ENDC}\n")
             return
+        seen.add(tid)
         if not tid:
             if verbose:
                 sys.stderr.write(f"{bcolors.RED}No tid{bcolors.ENDC}\n")
             return
 
-        if tid not in data['node']:
-            try:
-                get_taxonomy(tid, conn, verbose)
-            except EntryNotInDatabaseError:
-                if verbose:
-                    sys.stderr.write(f"{bcolors.RED}{tid} is not in database. Can not continue{bcolors.ENDC}\n")
-                return
+        node = _resolve(tid, tree)
+        if node is None:
+            if verbose:
+                sys.stderr.write(f"{bcolors.RED}{tid} is not in database. Can not continue{bcolors.ENDC}\n")
+            return
 
         if verbose:
-            sys.stderr.write(f"{bcolors.GREEN}tid: {tid} parent: {data['node'][tid].parent}{bcolors.ENDC}\n")
-        yield data['node'][tid].parent
-        tid = data['node'][tid].parent
+            sys.stderr.write(f"{bcolors.GREEN}tid: {tid} parent: {parent[node]}{bcolors.ENDC}\n")
+        tid = int(parent[node])
+        yield tid
 
-def taxonomy_hierarchy_as_list(conn, tid, verbose=False):
+
+def taxonomy_hierarchies_as_lists(conn, tids, verbose=False):
     """
-    Return the taxonomy hierarchy as a list
+    Return the taxonomy hierarchy as a list for a lot of taxonomy IDs at once. We walk up the
+    taxonomy in memory and then get all the names we need with a few queries.
     :param conn: the database connect
-    :param tid: the taxonomy id
+    :param tids: an iterable of taxonomy ids
     :param verbose: more output
-    :return:
+    :return: a dict of taxid: list. IDs that are not in the database are not included
     """
     wanted_levels = ['superkingdom', 'phylum', 'class', 'order', 'family', 'genus', 'species']
-    taxlist = ["s:", "p:", "c:", "o:", "f:", "g:", "s:"]
 
-    t, n = get_taxonomy(tid, conn)
-    if not t:
-        if verbose:
-            sys.stderr.write("No taxonomy for {}\n".format(tid))
-        return taxlist
-
-    while t.parent != 1 and t.taxid != 1:
-        if t.rank in wanted_levels:
+    global data
+    tree = load_tree(conn, verbose)
+    parent = tree['parent']
+    rank = tree['rank']
+    levels = {tree['ranks'].index(w): i for i, w in enumerate(wanted_levels) if w in tree['ranks']}
+
+    results = {}
+    todo = {}
+    for tid in tids:
+        tid = _int_taxid(tid)
+        if tid in data['lineage']:
+            results[tid] = list(data['lineage'][tid])
+            continue
+        node = _resolve(tid, tree)
+        if node is None:
+            if verbose:
+                sys.stderr.write("No taxonomy for {}\n".format(tid))
+            continue
+        # the nodes at the levels we want. Like the database walk, we stop at a node whose parent is the root
+        found = []
+        for node in _walk(node, parent):
+            if parent[node] == 1:
+                break
+            if rank[node] in levels:
+                found.append((levels[rank[node]], node))
+        todo[tid] = found
+
+    names = get_taxonomies({n for found in todo.values() for _, n in found}, conn, verbose)
+    for tid, found in todo.items():
+        taxlist = ["s:", "p:", "c:", "o:", "f:", "g:", "s:"]
+        for level, node in found:
+            n = names[node][1]
+            r = wanted_levels[level]
             if n.scientific_name:
-                taxlist[wanted_levels.index(t.rank)] = t.rank[0] + ":" + n.scientific_name
+                taxlist[level] = r[0] + ":" + n.scientific_name
             elif n.common_name:
-                taxlist[wanted_levels.index(t.rank)] = t.rank[0] + ":" + n.common_name
+                taxlist[level] = r[0] + ":" + n.common_name[0]
             else:
-                taxlist[wanted_levels.index(t.rank)] = t.rank[0] + ":" + f"[no name] taxid: {tid}"
-        t, n = get_taxonomy(t.parent, conn)
-    return taxlist
+                taxlist[level] = r[0] + ":" + f"[no name] taxid: {tid}"
+        data['lineage'][tid] = tuple(taxlist)
+        results[tid] = taxlist
+    return results
+
+
+def taxonomy_hierarchy_as_list(conn, tid, verbose=False):
+    """
+    Return the taxonomy hierarchy as a list
+    :param conn: the database connect
+    :param tid: the taxonomy id
+    :param verbose: more output
+    :return:
+    """
+
+    result = taxonomy_hierarchies_as_lists(conn, [tid], verbose)
+    if _int_taxid(tid) not in result:
+        raise EntryNotInDatabaseError(f"ERROR: {tid} is not in the database and not merged\n")
+    return result[_int_taxid(tid)]
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description="Get data from the database")
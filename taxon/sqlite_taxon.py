@@ -7,6 +7,7 @@ import sys
 import argparse
 import sqlite3
 import json
+from itertools import islice
 
 from config import get_db_dir
 import gzip
@@ -50,167 +51,102 @@ def disconnect(conn, verbose=False):
     elif verbose:
         sys.stderr.write("There was no database connection!\n")
 
-def create_load(conn, datadir, verbose=False):
-    """
-    Create the databases and load the data.
+# how many rows to insert with each executemany
+BATCHSIZE = 100000
 
-    Note: Initially I wrote a generic version of this, but you need to have the correct
-    number of ?'s for this. We probably could generalize some of this, especially those
-    with two columns, but this works well.
 
+def set_load_pragmas(conn, verbose=False):
+    """
+    Make bulk loading faster. We don't need a journal or to wait for the disk while we build the
+    database: if it fails we just start again.
     :param conn: the database connection
-    :param datadir: the databae directory
+    :param verbose: print addtional output
     """
 
-
-    ## The NODES table
-    dbfile = os.path.join(datadir, "nodes.dmp")
     if verbose:
-        sys.stderr.write("loading NODES table: {}\n".format(dbfile))
-    if not os.path.exists(dbfile):
-        sys.stderr.write("ERROR: {} does not exist\n".format(dbfile))
-        sys.exit(-1)
-    conn.execute("CREATE TABLE nodes (tax_id INTEGER PRIMARY KEY, parent INTEGER, rank TEXT, embl_code TEXT, division_id INTEGER, inherited_div INTEGER, genetic_code INTEGER, inherited_genetic_code INTEGER, mitochondrial_genetic_code INTEGER, inherited_mito_gc INTEGER, genbank_hidden INTEGER, hidden_subtree INTEGER, comments)")
-    conn.commit()
-    with open(dbfile, "r") as f:
-        for l in f:
-            p = l.strip().rstrip("|").split('\t|')
-            p = [x.strip() for x in p]
-            try:
-                conn.execute("INSERT INTO nodes VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", p)
-            except sqlite3.OperationalError as e:
-                sys.stderr.write("{}".format(e))
-                sys.stderr.write("\nWhile insert on: {}\n".format(p))
-                sys.exit()
-    conn.commit()
+        sys.stderr.write("Setting pragmas for bulk loading\n")
+    conn.execute("PRAGMA journal_mode = OFF")
+    conn.execute("PRAGMA synchronous = OFF")
+    conn.execute("PRAGMA temp_store = MEMORY")
+    conn.execute("PRAGMA cache_size = -1000000")
+    return conn
 
 
-    # the NAMES table
-    dbfile = os.path.join(datadir, "names.dmp")
-    if verbose:
-        sys.stderr.write("loading NAMES table: {}\n".format(dbfile))
-    if not os.path.exists(dbfile):
-        sys.stderr.write("ERROR: {} does not exist\n".format(dbfile))
-        sys.exit(-1)
-    conn.execute("CREATE TABLE names (tax_id INTEGER, name TEXT, unique_name TEXT, name_class TEXT)")
-    conn.commit()
-    with open(dbfile, "r") as f:
-        for l in f:
-            p = l.strip().rstrip("|").split('\t|')
-            p = [x.strip() for x in p]
-            try:
-                conn.execute("INSERT INTO names VALUES (?, ?, ?, ?)", p)
-            except sqlite3.OperationalError as e:
-                sys.stderr.write("{}".format(e))
-                sys.stderr.write("\nWhile insert on: {}\n".format(p))
-                sys.exit()
-    conn.commit()
+def read_dmp(dbfile, ncols, separator='\t|'):
+    """
+    Read a taxonomy dump file and yield the rows
+    :param dbfile: the file to read (it can be gzipped)
+    :param ncols: the number of columns we expect. We warn about rows with a different number
+    :param separator: the column separator
+    """
 
-    # the DIVISION table
-    dbfile = os.path.join(datadir, "division.dmp")
-    if verbose:
-        sys.stderr.write("loading DIVISION table: {}\n".format(dbfile))
-    if not os.path.exists(dbfile):
-        sys.stderr.write("ERROR: {} does not exist\n".format(dbfile))
-        sys.exit(-1)
-    conn.execute("CREATE TABLE division (division_id INTEGER PRIMARY KEY, division_code TEXT, division_name TEXT, comments)")
-    conn.commit()
-    with open(dbfile, "r") as f:
+    opener = gzip.open if dbfile.endswith('.gz') else open
+    with opener(dbfile, "rt") as f:
         for l in f:
-            p = l.strip().rstrip("|").split('\t|')
+            p = l.strip().rstrip("|").split(separator)
             p = [x.strip() for x in p]
-            try:
-                conn.execute("INSERT INTO division VALUES (?, ?, ?, ?)", p)
-            except sqlite3.OperationalError as e:
-                sys.stderr.write("{}".format(e))
-                sys.stderr.write("\nWhile insert on: {}\n".format(p))
-                sys.exit()
-    conn.commit()
+            if len(p) != ncols:
+                sys.stderr.write("WARNING: {} has {} columns, not {}: {}\n".format(dbfile, len(p), ncols, p))
+                continue
+            yield p
 
-    # the GENETIC CODE table
-    dbfile = os.path.join(datadir, "gencode.dmp")
-    if verbose:
-        sys.stderr.write("loading GENETIC CODE table: {}\n".format(dbfile))
-    if not os.path.exists(dbfile):
-        sys.stderr.write("ERROR: {} does not exist\n".format(dbfile))
-        sys.exit(-1)
-    conn.execute("CREATE TABLE gencode (genetic_code INTEGER, abbreviation , name TEXT, cde TEXT, starts TEXT)")
-    conn.commit()
-    with open(dbfile, "r") as f:
-        for l in f:
-            p = l.strip().rstrip("|").split('\t|')
-            p = [x.strip() for x in p]
-            try:
-                conn.execute("INSERT INTO gencode VALUES (?, ?, ?, ?, ?)", p)
-            except sqlite3.OperationalError as e:
-                sys.stderr.write("{}".format(e))
-                sys.stderr.write("\nWhile insert on: {}\n".format(p))
-                sys.exit()
-    conn.commit()
 
-    # the MERGED database
-    dbfile = os.path.join(datadir, "merged.dmp")
-    if verbose:
-        sys.stderr.write("loading MERGED table: {}\n".format(dbfile))
-    if not os.path.exists(dbfile):
-        sys.stderr.write("ERROR: {} does not exist\n".format(dbfile))
-        sys.exit(-1)
-    conn.execute("CREATE TABLE merged (old_tax_id INTEGER, new_tax_id INTEGER)")
-    conn.commit()
-    with open(dbfile, "r") as f:
-        for l in f:
-            p = l.strip().rstrip("|").split('\t|')
-            p = [x.strip() for x in p]
-            try:
-                conn.execute("INSERT INTO merged VALUES (?, ?)", p)
-            except sqlite3.OperationalError as e:
-                sys.stderr.write("{}".format(e))
-                sys.stderr.write("\nWhile insert on: {}\n".format(p))
-                sys.exit()
-    conn.commit()
+def load_table(conn, datadir, filename, table, columns, separator='\t|', verbose=False):
+    """
+    Create a table and bulk load it from a dump file, BATCHSIZE rows at a time
+    :param conn: the database connection
+    :param datadir: the database directory
+    :param filename: the dump file name
+    :param table: the table to create
+    :param columns: the column definitions for the table
+    :param separator: the column separator in the file
+    :param verbose: print addtional output
+    """
 
-    # the gi_taxid
-    dbfile = os.path.join(datadir, "gi_taxid_nucl.dmp.gz")
+    dbfile = os.path.join(datadir, filename)
     if verbose:
-        sys.stderr.write("loading GI_TAXID (NUCL) table: {}\n".format(dbfile))
+        sys.stderr.write("loading {} table: {}\n".format(table.upper(), dbfile))
     if not os.path.exists(dbfile):
         sys.stderr.write("ERROR: {} does not exist\n".format(dbfile))
         sys.exit(-1)
-    conn.execute("CREATE TABLE gi_taxid_nucl (gi INTEGER PRIMARY KEY, tax_id INTEGER)")
-    conn.commit()
-    with gzip.open(dbfile, "rt") as f:
-        for l in f:
-            p = l.strip().split('\t')
-            p = [x.strip() for x in p]
-            try:
-                conn.execute("INSERT INTO gi_taxid_nucl VALUES (?, ?)", p)
-            except sqlite3.OperationalError as e:
-                sys.stderr.write("{}".format(e))
-                sys.stderr.write("\nWhile insert on: {}\n".format(p))
-                sys.exit()
-    conn.commit()
 
-    # the gi_taxid
-    dbfile = os.path.join(datadir, "gi_taxid_prot.dmp.gz")
-    if verbose:
-        sys.stderr.write("loading GI_TAXID (PROT) table: {}\n".format(dbfile))
-    if not os.path.exists(dbfile):
-        sys.stderr.write("ERROR: {} does not exist\n".format(dbfile))
-        sys.exit(-1)
-    conn.execute("CREATE TABLE gi_taxid_prot (gi INTEGER PRIMARY KEY, tax_id INTEGER)")
-    conn.commit()
-    with gzip.open(dbfile, "rt") as f:
-        for l in f:
-            p = l.strip().split('\t')
-            p = [x.strip() for x in p]
-            try:
-                conn.execute("INSERT INTO gi_taxid_prot VALUES (?, ?)", p)
-            except sqlite3.OperationalError as e:
-                sys.stderr.write("{}".format(e))
-                sys.stderr.write("\nWhile insert on: {}\n".format(p))
-                sys.exit()
+    ncols = len(columns.split(','))
+    conn.execute("CREATE TABLE {} ({})".format(table, columns))
+    sql = "INSERT INTO {} VALUES ({})".format(table, ", ".join(["?"] * ncols))
+    rows = read_dmp(dbfile, ncols, separator)
+    n = 0
+    while True:
+        batch = list(islice(rows, BATCHSIZE))
+        if not batch:
+            break
+        try:
+            conn.executemany(sql, batch)
+        except sqlite3.Error as e:
+            sys.stderr.write("{}".format(e))
+            sys.stderr.write("\nWhile inserting into {} after row {}\n".format(table, n))
+            sys.exit(-1)
+        n += len(batch)
     conn.commit()
+    if verbose:
+        sys.stderr.write("\tloaded {} rows\n".format(n))
+
+
+def create_load(conn, datadir, verbose=False):
+    """
+    Create the databases and load the data.
+
+    :param conn: the database connection
+    :param datadir: the databae directory
+    """
 
+    set_load_pragmas(conn, verbose)
+    load_table(conn, datadir, "nodes.dmp", "nodes", "tax_id INTEGER PRIMARY KEY, parent INTEGER, rank TEXT, embl_code TEXT, division_id INTEGER, inherited_div INTEGER, genetic_code INTEGER, inherited_genetic_code INTEGER, mitochondrial_genetic_code INTEGER, inherited_mito_gc INTEGER, genbank_hidden INTEGER, hidden_subtree INTEGER, comments", verbose=verbose)
+    load_table(conn, datadir, "names.dmp", "names", "tax_id INTEGER, name TEXT, unique_name TEXT, name_class TEXT", verbose=verbose)
+    load_table(conn, datadir, "division.dmp", "division", "division_id INTEGER PRIMARY KEY, division_code TEXT, division_name TEXT, comments", verbose=verbose)
+    load_table(conn, datadir, "gencode.dmp", "gencode", "genetic_code INTEGER, abbreviation , name TEXT, cde TEXT, starts TEXT", verbose=verbose)
+    load_table(conn, datadir, "merged.dmp", "merged", "old_tax_id INTEGER, new_tax_id INTEGER", verbose=verbose)
+    load_table(conn, datadir, "gi_taxid_nucl.dmp.gz", "gi_taxid_nucl", "gi INTEGER PRIMARY KEY, tax_id INTEGER", separator='\t', verbose=verbose)
+    load_table(conn, datadir, "gi_taxid_prot.dmp.gz", "gi_taxid_prot", "gi INTEGER PRIMARY KEY, tax_id INTEGER", separator='\t', verbose=verbose)
 
     return conn
 
@@ -236,9 +172,11 @@ def create_indices(conn, verbose=False):
         "merged" : {"oldnewidx" : ["old_tax_id", "new_tax_id"]}
     }
 
+    # we make the indices after loading the data, which is much faster than updating them on every insert
     for t in tables:
         for idx in tables[t]:
             conn.execute("CREATE INDEX {ix} ON {tn} ({cn})".format(ix=idx, tn=t, cn=", ".join(tables[t][idx])))
+    conn.execute("ANALYZE")
     conn.commit()
 
     return conn
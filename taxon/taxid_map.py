@@ -0,0 +1,336 @@
+"""
+Map GIs or accessions to taxonomy IDs using a sorted, memory-mapped table.
+
+Convert the NCBI dump once:
+
+    python3 taxid_map.py -i gi_taxid_prot.dmp.gz -o gi_taxid_prot.taxmap
+    python3 taxid_map.py -i prot.accession2taxid.gz -o prot.accession2taxid.taxmap
+
+and then opening the map takes a few milliseconds. The arrays are memory mapped read only, so several
+processes using the same map share it through the page cache.
+
+    m = TaxidMap('gi_taxid_prot.taxmap')
+    m[15674171]                      # one taxid
+    m.lookup(['15674171', 'x'])      # a numpy array of taxids, 0 if we don't know the key
+
+The map file has a small JSON header followed by four arrays: the keys (GIs as uint64, or accessions
+without the version as fixed width strings) sorted, the taxid for each key, and then the same entries
+ordered by taxid so we can find all the keys for a taxid.
+"""
+
+import os
+import sys
+import json
+import argparse
+import tempfile
+import numpy as np
+from roblib import open_compressed, message
+
+__author__ = 'Rob Edwards'
+
+MAGIC = b'ROBTAX01'
+# how much of the dump file we parse at once
+BLOCKSIZE = 64 * 1024 * 1024
+# how many entries we sort or merge in memory at once
+SORT_ENTRIES = 16 * 1024 * 1024
+
+
+def _dump_blocks(dumpfile):
+    """
+    Read a dump file in blocks of whole lines
+    """
+    remainder = b''
+    with open_compressed(dumpfile, 'rb') as f:
+        while True:
+            block = f.read(BLOCKSIZE)
+            if not block:
+                break
+            block = remainder + block
+            cut = block.rfind(b'\n') + 1
+            if cut == 0:
+                remainder = block
+                continue
+            remainder = block[cut:]
+            yield block[:cut]
+    if remainder.strip():
+        yield remainder
+
+
+def _parse_dump(dumpfile):
+    """
+    Parse a gi_taxid dump (gi, taxid) or an accession2taxid file (accession, accession.version, taxid, gi)
+
+    :return: a generator of (keys, taxids) numpy arrays, and whether the keys are accessions
+    """
+
+    accession = None
+    for block in _dump_blocks(dumpfile):
+        if accession is None:
+            first = block[:block.find(b'\n')].split(b'\t')
+            accession = len(first) == 4
+            if first[0] == b'accession':
+                block = block[block.find(b'\n') + 1:]
+        tokens = block.split()
+        if accession:
+            if len(tokens) % 4:
+                raise ValueError(f"{dumpfile} does not look like an accession2taxid file: it should have 4 columns")
+            yield np.array(tokens[0::4]), np.array(tokens[2::4]).astype(np.uint32), True
+        else:
+            if len(tokens) % 2:
+                raise ValueError(f"{dumpfile} does not look like a gi_taxid file: it should have 2 columns")
+            yield np.array(tokens[0::2]).astype(np.uint64), np.array(tokens[1::2]).astype(np.uint32), False
+
+
+def _write_run(rundir, arrays):
+    """
+    Write the arrays of one sorted run to .npy files
+
+    :param rundir: the directory for the run files
+    :param arrays: the arrays, all the same length and sorted on the first one
+    :return: the names of the files
+    """
+    files = []
+    for a in arrays:
+        fd, fname = tempfile.mkstemp(suffix='.npy', dir=rundir)
+        os.close(fd)
+        np.save(fname, a)
+        files.append(fname)
+    return files
+
+
+def _merge_runs(runs, outputs):
+    """
+    Merge sorted runs into (memory mapped) output arrays, holding at most about SORT_ENTRIES entries in memory.
+    Equal keys stay in the order of the runs, so the merge is stable.
+
+    :param runs: a list of runs from _write_run, in order
+    :param outputs: the arrays to write to, one for each array in a run
+    """
+
+    runs = [[np.load(f, mmap_mode='r') for f in r] for r in runs]
+    chunk = max(1024, SORT_ENTRIES // max(len(runs), 1))
+    pos = [0] * len(runs)
+    written = 0
+    while True:
+        live = [i for i in range(len(runs)) if pos[i] < len(runs[i][0])]
+        if not live:
+            break
+        buffers = [[a[pos[i]:pos[i] + chunk] for a in runs[i]] for i in live]
+        # everything up to the smallest last key in the buffers is ready to write. If a run may have more of
+        # that key after its buffer, we hold back that key in the later runs to keep the merge stable
+        threshold = min(b[0][-1] for b in buffers)
+        side = 'right'
+        parts = []
+        for i, b in zip(live, buffers):
+            n = np.searchsorted(b[0], threshold, side=side)
+            if b[0][-1] == threshold:
+                side = 'left'
+            parts.append([a[:n] for a in b])
+            pos[i] += n
+        merged = [np.concatenate([p[j] for p in parts]) for j in range(len(outputs))]
+        order = np.argsort(merged[0], kind='stable')
+        for out, m in zip(outputs, merged):
+            out[written:written + len(order)] = m[order]
+        written += len(order)
+
+
+def build_taxid_map(dumpfile, mapfile, verbose=False, tmpdir=None):
+    """
+    Convert a gi_taxid or accession2taxid dump from NCBI to a map file.
+
+    We sort each block of the dump and write it to disk, and then merge the sorted runs straight into the
+    memory mapped map file, so we never have the whole dump in memory.
+
+    :param dumpfile: the dump file (it can be gzip compressed)
+    :param mapfile: the map file to write
+    :param verbose: more output
+    :param tmpdir: the directory for the sorted runs (default: the directory of the map file)
+    :return: the name of the map file
+    """
+
+    directory = os.path.dirname(os.path.abspath(mapfile))
+    with tempfile.TemporaryDirectory(dir=tmpdir or directory) as rundir:
+        runs = []
+        accession = False
+        width = 1
+        n = 0
+        for k, t, accession in _parse_dump(dumpfile):
+            # the gi dumps are already sorted, so we only sort if we need to
+            if len(k) > 1 and not np.all(k[1:] >= k[:-1]):
+                order = np.argsort(k, kind='stable')
+                k = k[order]
+                t = t[order]
+                del order
+            if accession:
+                width = max(width, k.dtype.itemsize)
+            runs.append(_write_run(rundir, [k, t]))
+            n += len(k)
+            if verbose:
+                message(f"Read {n:,} entries from {dumpfile}", "GREEN")
+
+        key_type = np.dtype(f'S{width}') if accession else np.dtype(np.uint64)
+        columns = [('keys', key_type), ('taxids', np.dtype(np.uint32)), ('rev_order', np.dtype(np.uint64)),
+                   ('rev_taxids', np.dtype(np.uint32))]
+        header = {
+            'key_type': key_type.str,
+            'accession': accession,
+            'records': n,
+            'source': os.path.basename(dumpfile),
+            'columns': [[c, dt.str] for c, dt in columns]
+        }
+        hjson = json.dumps(header).encode()
+        # pad the header so the arrays are 8 byte aligned
+        hjson += b' ' * (-(len(MAGIC) + 8 + len(hjson)) % 8)
+        # write to a temporary file and rename it, so nobody opens a half written map
+        tmp = tempfile.NamedTemporaryFile(dir=directory, delete=False)
+        try:
+            with tmp as out:
+                out.write(MAGIC)
+                out.write(len(hjson).to_bytes(8, 'little'))
+                out.write(hjson)
+                offset = out.tell()
+                out.truncate(offset + sum(n * dt.itemsize + (-n * dt.itemsize % 8) for c, dt in columns))
+            if n:
+                arrays = {}
+                for c, dt in columns:
+                    arrays[c] = np.memmap(tmp.name, dtype=dt, mode='r+', offset=offset, shape=(n,))
+                    offset += n * dt.itemsize
+                    offset += -offset % 8
+                _merge_runs(runs, [arrays['keys'], arrays['taxids']])
+                for f in [f for r in runs for f in r]:
+                    os.remove(f)
+                if verbose:
+                    message(f"Sorted {n:,} entries by key", "GREEN")
+
+                # and the same again to order the entries by taxid
+                runs = []
+                for start in range(0, n, SORT_ENTRIES):
+                    t = np.array(arrays['taxids'][start:start + SORT_ENTRIES])
+                    order = np.argsort(t, kind='stable')
+                    runs.append(_write_run(rundir, [t[order], order.astype(np.uint64) + np.uint64(start)]))
+                _merge_runs(runs, [arrays['rev_taxids'], arrays['rev_order']])
+                for a in arrays.values():
+                    a.flush()
+                del arrays
+            os.replace(tmp.name, mapfile)
+        except BaseException:
+            os.remove(tmp.name)
+            raise
+
+    if verbose:
+        message(f"Wrote {n:,} entries to {mapfile}", "GREEN")
+    return mapfile
+
+
+class TaxidMap(object):
+    """
+    A memory-mapped map from GIs or accessions to taxonomy IDs made by build_taxid_map.
+
+    Unknown keys map to taxid 0.
+    """
+
+    def __init__(self, mapfile):
+        if not os.path.exists(mapfile):
+            sys.stderr.write(f"FATAL: {mapfile} does not exist. Please make it with build_taxid_map\n")
+            sys.exit(-1)
+        self.mapfile = mapfile
+        with open(mapfile, 'rb') as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                sys.stderr.write(f"FATAL: {mapfile} is not a taxid map\n")
+                sys.exit(-1)
+            hlen = int.from_bytes(f.read(8), 'little')
+            self.header = json.loads(f.read(hlen))
+
+        self.accession = self.header['accession']
+        self.key_type = np.dtype(self.header['key_type'])
+        n = self.header['records']
+        offset = len(MAGIC) + 8 + hlen
+        self.columns = {}
+        for c, t in self.header['columns']:
+            dt = np.dtype(t)
+            if n:
+                self.columns[c] = np.memmap(mapfile, dtype=dt, mode='r', offset=offset, shape=(n,))
+            else:
+                self.columns[c] = np.zeros(0, dtype=dt)
+            offset += n * dt.itemsize
+            offset += -offset % 8
+        self.keys = self.columns['keys']
+        self.taxids = self.columns['taxids']
+
+    def __len__(self):
+        return self.header['records']
+
+    def _keys(self, keys):
+        """
+        Convert the keys we are asked about to the type of the keys in the map
+
+        :return: the keys as a numpy array, and a boolean array of the keys that could be in the map
+        """
+        if self.accession:
+            # we store the accessions without the version
+            keys = [k.decode() if isinstance(k, bytes) else str(k) for k in keys]
+            keys = [k.rsplit('.', 1)[0] for k in keys]
+            valid = np.array([len(k) <= self.key_type.itemsize for k in keys], dtype=bool)
+            return np.array(keys, dtype=self.key_type), valid
+        out = np.zeros(len(keys), dtype=np.uint64)
+        valid = np.ones(len(keys), dtype=bool)
+        for i, k in enumerate(keys):
+            try:
+                out[i] = int(k)
+            except (TypeError, ValueError, OverflowError):
+                valid[i] = False
+        return out, valid
+
+    def lookup(self, keys):
+        """
+        Look up a lot of keys at once
+
+        :param keys: an iterable of GIs (int or str) or accessions (with or without the version)
+        :return: a numpy uint32 array of the taxids, with 0 for keys that are not in the map
+        """
+
+        k, valid = self._keys(list(keys))
+        result = np.zeros(len(k), dtype=np.uint32)
+        if not len(self.keys) or not len(k):
+            return result
+        idx = np.searchsorted(self.keys, k)
+        idx[idx == len(self.keys)] = 0
+        found = valid & (self.keys[idx] == k)
+        result[found] = self.taxids[idx[found]]
+        return result
+
+    def __getitem__(self, key):
+        taxid = int(self.lookup([key])[0])
+        if not taxid:
+            raise KeyError(key)
+        return taxid
+
+    def get(self, key, default=None):
+        taxid = int(self.lookup([key])[0])
+        return taxid if taxid else default
+
+    def __contains__(self, key):
+        return bool(self.lookup([key])[0])
+
+    def keys_for_taxid(self, taxid):
+        """
+        All the keys that map to a taxonomy ID
+
+        :param taxid: the taxonomy ID
+        :return: a numpy array of the keys (GIs or accessions)
+        """
+        rev = self.columns['rev_taxids']
+        start = np.searchsorted(rev, taxid, side='left')
+        end = np.searchsorted(rev, taxid, side='right')
+        return self.keys[np.sort(self.columns['rev_order'][start:end]).astype(np.int64)]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Convert a gi_taxid or accession2taxid dump to a memory-mapped taxid map')
+    parser.add_argument('-i', help='gi_taxid or accession2taxid file (can be gzipped)', required=True)
+    parser.add_argument('-o', help='map file to write', required=True)
+    parser.add_argument('-t', help='directory for temporary files while sorting (default: the directory of the map file)')
+    parser.add_argument('-v', help='verbose output', action='store_true')
+    args = parser.parse_args()
+
+    build_taxid_map(args.i, args.o, args.v, args.t)
@@ -3,6 +3,7 @@ import sys
 import os
 
 from taxon.config import get_db_dir
+from taxon.taxid_map import TaxidMap, build_taxid_map
 
 defaultdir = get_db_dir()
 
@@ -186,6 +187,8 @@ def read_gi_tax_id(dtype='nucl', directory=defaultdir):
     (protein).
 
     Returns a hash of gi and taxid
+
+    This reads the whole file into memory. gi_taxid_map() is much faster and uses much less memory.
     """
 
     if not directory:
@@ -235,3 +238,26 @@ def read_tax_id_gi(dtype='nucl', directory=defaultdir):
             tax_id[parts[1]].append(parts[0])
     fin.close()
     return tax_id
+
+
+def gi_taxid_map(dtype='nucl', directory=defaultdir, verbose=False):
+    """
+    A memory-mapped version of gi_taxid.dmp. You can specify the type of database that you
+    want, default is nucl (nucleotide), can also accept prot (protein).
+
+    The first time you call this we convert gi_taxid_{dtype}.dmp.gz to gi_taxid_{dtype}.taxmap in
+    the same directory, and after that we just open that file.
+
+    Returns a TaxidMap: use m[gi] for one gi or m.lookup(gis) for a lot of them.
+    """
+
+    if not directory:
+        directory = defaultdir
+
+    if dtype != 'nucl' and dtype != 'prot':
+        sys.stderr.write("Type must be either nucl or prot, not " + dtype + "\n")
+        sys.exit(-1)
+    mapfile = os.path.join(directory, "gi_taxid_" + dtype + ".taxmap")
+    if not os.path.exists(mapfile):
+        build_taxid_map(os.path.join(directory, "gi_taxid_" + dtype + ".dmp.gz"), mapfile, verbose)
+    return TaxidMap(mapfile)
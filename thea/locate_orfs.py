@@ -5,7 +5,7 @@ Print the locations of the ORFs on the sequence
 import os
 import sys
 import argparse
-from roblib import translate_dna, stream_fasta, rc
+from roblib import six_frame_translation, stream_fasta
 
 __author__ = 'Rob Edwards'
 
@@ -38,16 +38,11 @@ if __name__ == "__main__":
     seqs = {}
     lengths = {}
     for seqid, seq in stream_fasta(args.f, False):
-        seq = seq.upper()
+        seqs[seqid] = seq.upper()
         lengths[seqid] = len(seq)
-        seqs[seqid] = {}
-        seqs[seqid]["f1"] = translate_dna(seq, args.v)
-        seqs[seqid]["f2"] = translate_dna(seq[1:], args.v)
-        seqs[seqid]["f3"] = translate_dna(seq[2:], args.v)
-        rcseq = rc(seq)
-        seqs[seqid]["r1"] = translate_dna(rcseq, args.v)
-        seqs[seqid]["r2"] = translate_dna(rcseq[1:], args.v)
-        seqs[seqid]["r3"] = translate_dna(rcseq[2:], args.v)
+    frames = {"f1": 1, "f2": 2, "f3": 3, "r1": -1, "r2": -2, "r3": -3}
+    for seqid, translation in zip(seqs, six_frame_translation(list(seqs.values()))):
+        seqs[seqid] = {fr: translation[f] for fr, f in frames.items()}
 
     for orfid, orf in stream_fasta(args.o):
         for s in seqs:
@@ -1,53 +1,68 @@
+"""
+Print the distance matrix between all the leaves of a tree, and check a random sample of the distances against
+the sum of the branch lengths between the leaves.
+
+Usage: python3 dist_matrix.py tree.nwk
+   or: python3 dist_matrix.py <number of leaves>   to test on a random tree with random branch lengths
+"""
+
 import sys
-import itertools
-from ete3 import Tree
+import random
+from roblib import read_newick, NewickTree, CopheneticDistances
+from roblib.newick import Node
+
+
+def random_tree(leaves):
+    """
+    Make a random binary tree by splitting random leaves until there are enough of them
+
+    :param leaves: the number of leaves
+    :return: the NewickTree
+    """
+    root = Node(0)
+    tips = [root]
+    while len(tips) < leaves:
+        n = tips.pop(random.randrange(len(tips)))
+        for _ in range(2):
+            c = Node(0)
+            c.distance = random.random()
+            n.children.append(c)
+            tips.append(c)
+    for i, n in enumerate(tips):
+        n.name = f"leaf_{i}"
+    return NewickTree.from_nodes(root)
+
+
+if len(sys.argv) < 2:
+    sys.stderr.write(f"{sys.argv[0]} <tree file or number of leaves>\n")
+    sys.exit(-1)
 
 try:
-    t = Tree()
-    t.populate(int(sys.argv[1]), random_branches=True)
+    t = random_tree(int(sys.argv[1]))
 except ValueError:
-    print >>sys.stderr, 'loading', sys.argv[1]
-    t = Tree(sys.argv[1])
-
-lineages = {}
-for tip in t:
-    lin = []
-    n = tip
-    while n.up:
-        lin.append(n)
-        n = n.up
-    lineages[tip.name] = set(lin)
-
-matrix = {}
-def get_dist(a, b):
-    if a == b:
-        return 0.0
-    try:
-        return matrix[(a, b)]
-    except KeyError:
-        return matrix[(b, a)]
-
-for tip_a, tip_b in itertools.permutations(lineages.keys(), 2):
-    d = sum([n.dist for n in lineages[tip_a] ^ lineages[tip_b]])
-    matrix[(tip_a, tip_b)] = d
-    #if len(matrix) % 10000 == 0:
-    #    print >>sys.stderr, len(matrix)
-
-leaves = t.get_leaf_names()
-print '\t'.join(['#names'] + leaves)
-for tip_a in leaves:
-    row = [tip_a]
-    for tip_b in leaves:
-        row.append(get_dist(tip_a, tip_b))
-    print '\t'.join(map(str, row))
+    sys.stderr.write(f"loading {sys.argv[1]}\n")
+    t = read_newick(sys.argv[1])
+cd = CopheneticDistances(t, t.leaves())
+
+print('\t'.join(['#names'] + cd.names))
+for start, d in cd.blocks():
+    for i, row in enumerate(d.tolist()):
+        print('\t'.join(map(str, [cd.names[start + i]] + row)))
 
 
 # test
 
-import random
-s = random.sample(matrix.keys(), 1000)
-for a,b in s:
-    d0 = get_dist(a, b)
-    d1 = t.get_distance(a, b)
+def lineage(n):
+    lin = set()
+    while t.parent[n] >= 0:
+        lin.add(n)
+        n = t.parent[n]
+    return lin
+
+for _ in range(min(1000, len(cd) ** 2)):
+    a = random.randrange(len(cd))
+    b = random.randrange(len(cd))
+    d0 = cd.distances([a], [b])[0][0]
+    d1 = sum(t.length[n] for n in lineage(cd.nodes[a]) ^ lineage(cd.nodes[b]))
     if round(d0, 8) != round(d1, 8):
-        print >>sys.stderr, a, b, d0, d1
\ No newline at end of file
+        sys.stderr.write(f"{cd.names[a]} {cd.names[b]} {d0} {d1}\n")
@@ -12,51 +12,49 @@ We will identify negative branch lengths, set them to 0 and transfer the remaind
 
 import os
 import sys
-from roblib import Newick_Tree
+import numpy as np
+from roblib import read_newick
 import argparse
 
 
-def find_negative(node):
+def find_negative(tree):
     """
-    Find a negative distance
-    :param node: the node we're at
-    :return:
+    Find the negative distances
+    :param tree: the NewickTree
+    :return: a numpy array of the nodes with a negative branch length
     """
-    if node.distance < 0:
-        sys.stderr.write("Negative distance: {}\n".format(node.distance))
+    nodes = np.flatnonzero(tree.length < 0)
+    for v in nodes:
+        sys.stderr.write("Negative distance: {}\n".format(tree.length[v]))
+    return nodes
 
-    if node.left:
-        find_negative(node.left)
-    if node.right:
-        find_negative(node.right)
 
-
-
-def correct_negative(node):
+def correct_negative(tree):
     """
-    Correct a negative distance at the left or right children of node
-    :param node: the node we're at
-    :return:
+    Correct the negative distances. We set a negative branch length to 0 and add the difference to an adjacent
+    branch: the next child of the same parent, or the previous one for the last child, or the parent's branch
+    if there are no other children. We go down the tree (the nodes are in preorder) so we correct the parent's
+    branch before we get to it.
+    :param tree: the NewickTree
+    :return: the tree
     """
 
-    if node.left and node.left.distance < 0:
-        if node.right:
-            node.right.distance -= node.left.distance  # note that this adds the abs value of dist to node.right
-        else:
-            node.distance -= node.left.distance
-        node.left.distance = 0
-
-    if node.right and node.right.distance < 0:
-        if node.left:
-            node.left.distance -= node.right.distance
-        else:
-            node.distance -= node.right.distance
-        node.right.distance = 0
+    length = tree.length
+    for v in range(len(tree)):
+        kids = list(tree.children(v))
+        for j, c in enumerate(kids):
+            if not length[c] < 0:
+                continue
+            if len(kids) > 1:
+                other = kids[j + 1] if j + 1 < len(kids) else kids[j - 1]
+            else:
+                other = v
+                if np.isnan(length[v]):
+                    length[v] = 0
+            length[other] -= length[c]  # note that this adds the abs value of dist to the other branch
+            length[c] = 0
+    return tree
 
-    if node.left:
-        correct_negative(node.left)
-    if node.right:
-        correct_negative(node.right)
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description='Parse a tree and correct negative branch lengths')
@@ -64,16 +62,9 @@ if __name__ == '__main__':
     parser.add_argument('-v', help='verbose output', action='store_true')
     args = parser.parse_args()
 
-    tre = []
-    with open(args.t, 'r') as f:
-        for l in f:
-            tre.append(l.strip())
-
-    root = Newick_Tree().parse(''.join(tre))
+    tree = read_newick(args.t)
     if args.v:
         sys.stderr.write("NEGATIVE NODES:\n")
-        find_negative(root)
-    correct_negative(root)
-    Newick_Tree().print_tree(root)
-
-
+        find_negative(tree)
+    correct_negative(tree)
+    tree.write(sys.stdout)
@@ -4,7 +4,7 @@ import argparse
 import os
 import string
 import sys
-from roblib import Newick_Tree
+from roblib import read_newick
 
 __author__ = 'Rob Edwards'
 
@@ -15,7 +15,7 @@ Rename tree leaves and print out the tree
 
 
 
-def clean_name(self, name):
+def clean_name(name):
     """
     Just clean out non-allowable characters in the name
 
@@ -28,29 +28,23 @@ def clean_name(self, name):
     allowable = set(string.ascii_letters)
     allowable.update(set(string.digits))
     allowable.update({'_','-',':'})
-    name.replace(' ', '_')
-    return filter(lambda x: x in allowable, name)
+    name = name.replace(' ', '_')
+    return "".join(filter(lambda x: x in allowable, name))
 
-def rename_nodes(self, node, idmap):
+def rename_nodes(tree, idmap):
     """
-    Rename the nodes of a tree based on id map
+    Rename the nodes of a tree based on id map. The names are kept in a table, so we rename each
+    name once rather than walking the tree
 
-    :param root: the root node of the tree
-    :type root: Node
+    :param tree: the tree
+    :type tree: NewickTree
     :param idmap: the id map
     :type idmap: dict
-    :return: the new root node
-    :rtype: Node
+    :return: the renamed tree
+    :rtype: NewickTree
     """
 
-    if node.name and node.name in idmap:
-        node.name = clean_name(idmap[node.name])
-    if node.left:
-        node.left = rename_nodes(node.left, idmap)
-    if node.right:
-        node.right = rename_nodes(node.right, idmap)
-
-    return node
+    return tree.rename({n: clean_name(idmap[n]) for n in tree.names if n in idmap})
 
 
 if __name__ == '__main__':
@@ -65,13 +59,5 @@ if __name__ == '__main__':
             p=l.strip().split("\t")
             idmap[p[0]]=p[1].split()[0]
 
-
-    tre = []
-    with open(args.t, 'r') as f:
-        for l in f:
-            tre.append(l.strip())
-
-    root = Newick_Tree().parse(''.join(tre))
-    root = rename_nodes(root, idmap)
-    Newick_Tree().print_tree(root)
-
+    tree = rename_nodes(read_newick(args.t), idmap)
+    tree.write(sys.stdout)
@@ -6,7 +6,7 @@ import string
 import sys
 
 import re
-from roblib import Newick_Tree
+from roblib import read_newick
 
 __author__ = 'Rob Edwards'
 
@@ -30,33 +30,32 @@ def clean_name(name):
     allowable = set(string.ascii_letters)
     allowable.update(set(string.digits))
     allowable.update({'_','-',':'})
-    name.replace(' ', '_')
-    return filter(lambda x: x in allowable, name)
+    name = name.replace(' ', '_')
+    return "".join(filter(lambda x: x in allowable, name))
 
-def rename_nodes(node, idmap):
+def rename_nodes(tree, idmap):
     """
-    Rename the nodes of a tree based on id map
+    Rename the nodes of a tree based on id map. The names are kept in a table, so we rename each
+    name once rather than walking the tree
 
-    :param root: the root node of the tree
-    :type root: Node
+    :param tree: the tree
+    :type tree: NewickTree
     :param idmap: the id map
     :type idmap: dict
-    :return: the new root node
-    :rtype: Node
+    :return: the renamed tree
+    :rtype: NewickTree
     """
 
-    if node.name.startswith('_R_'):
-        # this was reverse complemented by MAFFT
-        node.name = node.name.replace('_R_', '')
-
-    if node.name and node.name in idmap:
-        node.name = clean_name(idmap[node.name])
-    if node.left:
-        node.left = rename_nodes(node.left, idmap)
-    if node.right:
-        node.right = rename_nodes(node.right, idmap)
-
-    return node
+    newnames = {}
+    for name in tree.names:
+        newname = name
+        if newname.startswith('_R_'):
+            # this was reverse complemented by MAFFT
+            newname = newname.replace('_R_', '')
+        if newname in idmap:
+            newname = clean_name(idmap[newname])
+        newnames[name] = newname
+    return tree.rename(newnames)
 
 
 if __name__ == '__main__':
@@ -91,12 +90,6 @@ if __name__ == '__main__':
                     idmap[p[0]] = p[1].split()[0]
 
 
-    tre = []
-    with open(args.t, 'r') as f:
-        for l in f:
-            tre.append(l.strip())
-
-    root = Newick_Tree().parse(''.join(tre))
-    root = rename_nodes(root, idmap)
-    Newick_Tree().print_tree(root)
+    tree = rename_nodes(read_newick(args.t), idmap)
+    tree.write(sys.stdout)
 
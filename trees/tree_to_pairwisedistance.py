@@ -1,5 +1,5 @@
 """
-Start with a tree file, use ete3 to create a pairwise distance for all nodes. Basically this is the
+Start with a tree file and create a pairwise distance for all nodes. Basically this is the
 distance matrix but as tuples.
 
 if we have a tree like
@@ -23,24 +23,14 @@ d(A,B) = d(y,A) + d(y,B)
 and
 d(A, E) = d(z,A) + d(z, E) = {d(z,y) + d(y,A)} + {d(z,x) + d(x,w) + d(w,E)}
 
-We use an idea inspired by the ete3 team: https://gist.github.com/jhcepas/279f9009f46bf675e3a890c19191158b :
+We used to use an idea inspired by the ete3 team: https://gist.github.com/jhcepas/279f9009f46bf675e3a890c19191158b :
+find the path from each leaf to the root and XOR the paths for every pair of leaves. That is O(n^2 * depth)
+set operations, and took hours for a few thousand leaves.
 
-For each node find its path to the root.
-
-e.g.
-
-A -> A, y, z
-E -> E, w, x,z
-
-and make these orderless sets. Then we XOR the two sets to only find the elements
-that are in one or other sets but not both. In this case A, E, y, x, w.
-
-The distance between the two nodes is the sum of the distances from each of those nodes
-to the parent
-
-One more optimization: since the distances are symmetric, and distance to itself is zero
-we user itertools.combinations rather than itertools.permutations. This cuts our computes from theta(n^2)
-1/2n^2 - n (= O(n^2), which is still not great, but in reality speeds things up for large trees).
+Now we use roblib.CopheneticDistances: we calculate the distance from the root to every node once, and then
+d(A, E) = d(root, A) + d(root, E) - 2 * d(root, z), where z is the last common ancestor of A and E that we
+look up in a sparse table built from an Euler tour of the tree. The matrix is calculated a block of rows at a
+time with numpy, and written a block at a time.
 
 
 """
@@ -48,8 +38,7 @@ we user itertools.combinations rather than itertools.permutations. This cuts our
 import os
 import sys
 import argparse
-from itertools import combinations
-from ete3 import Tree
+from roblib import read_newick, CopheneticDistances
 
 
 def make_dists(treefile, printone, verbose):
@@ -61,41 +50,12 @@ def make_dists(treefile, printone, verbose):
     :return:
     """
 
-    tree = Tree(treefile)
-
-    leaves = tree.get_leaves()
-    paths = {x:set() for x in leaves}
-
-    # get the paths going up the tree
-    # we get all the nodes up to the last one and store them in a set
-    if verbose:
-        sys.stderr.write("Precalculating distances\n")
-    for n in leaves:
-        if n.is_root():
-            continue
-        movingnode = n
-        while not movingnode.is_root():
-            paths[n].add(movingnode)
-            movingnode = movingnode.up
-
-    # now we want to get all pairs of nodes using itertools combinations. We need AB AC etc but don't need BA CA
-
-    leaf_distances = {x.name:{} for x in leaves}
-
+    tree = read_newick(treefile)
+    # keep the leaves in the order they are in the tree
+    cd = CopheneticDistances(tree, tree.leaves())
     if verbose:
-        sys.stderr.write("Iterating over the leaves\n")
-    for (leaf1, leaf2) in combinations(leaves, 2):
-        # figure out the unique nodes in the path
-        uniquenodes = paths[leaf1] ^ paths[leaf2]
-        distance = sum(x.dist for x in uniquenodes)
-        if printone:
-            if leaf1.name < leaf2.name:
-                print("{}\t{}\t{}".format(leaf1.name, leaf2.name, distance))
-            else:
-                print("{}\t{}\t{}".format(leaf2.name, leaf1.name, distance))
-        else:
-            print("{}\t{}\t{}".format(leaf1.name, leaf2.name, distance))
-            print("{}\t{}\t{}".format(leaf2.name, leaf1.name, distance))
+        sys.stderr.write(f"Calculating distances between {len(cd)} leaves\n")
+    cd.write_pairs(sys.stdout, both=not printone, verbose=verbose)
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description='Convert a tree into a distance matrix')
@@ -104,4 +64,4 @@ if __name__ == '__main__':
     parser.add_argument('-v', help='Verbose output. (Mostly progress)', action='store_true')
     args = parser.parse_args()
 
-    make_dists(args.t, args.p, args.v)
\ No newline at end of file
+    make_dists(args.t, args.p, args.v)